@@ -0,0 +1,67 @@
+import statistics
+from contextlib import asynccontextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, time_ns
+from typing import AsyncGenerator, Awaitable, Callable
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config.models import SqliteProfile
+from src.core.database import create_db_and_tables, get_engine, get_session
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.async_sqlalchemy.models import HistoryDb, HistoryItemDb
+from src.history.models import HistoryItemKind
+
+INSERT_BATCH_SIZE = 10_000
+
+
+@asynccontextmanager
+async def temporary_engine(profile: SqliteProfile | None = None) -> AsyncGenerator[AsyncEngine, None]:
+    """A fresh SQLite database in a temporary directory with all tables created."""
+    with TemporaryDirectory() as tmp_dir:
+        engine = get_engine(Path(tmp_dir) / "benchmark.db", profile=profile)
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        try:
+            yield engine
+        finally:
+            await engine.dispose()
+
+
+async def create_history(engine: AsyncEngine, history_id: UUID):
+    async with get_session(engine) as session:
+        session.add(HistoryDb(id=history_id, created_at=time_ns()))
+
+
+def synthetic_history_item_rows(history_id: UUID, start: int, count: int) -> list[dict[str, object]]:
+    """Rows alternating between user prompts and model responses with strictly increasing `created_at`."""
+    rows: list[dict[str, object]] = []
+    for i in range(start, start + count):
+        if i % 2 == 0:
+            kind, content = HistoryItemKind.USER_PROMPT.value, {"prompt": f"synthetic prompt {i}"}
+        else:
+            kind, content = HistoryItemKind.MODEL_RESPONSE.value, {"response": f"synthetic response {i}"}
+        rows.append({"id": uuid4(), "history_id": history_id, "created_at": i, "kind": kind, "content": content})
+    return rows
+
+
+async def insert_synthetic_history_items(engine: AsyncEngine, history_id: UUID, start: int, count: int):
+    """Bulk-inserts `count` synthetic items, bypassing the repo to keep seeding fast."""
+    for batch_start in range(start, start + count, INSERT_BATCH_SIZE):
+        batch_count = min(INSERT_BATCH_SIZE, start + count - batch_start)
+        async with get_session(engine) as session:
+            await session.execute(
+                insert(HistoryItemDb), synthetic_history_item_rows(history_id, batch_start, batch_count)
+            )
+
+
+async def time_async(fn: Callable[[], Awaitable[object]], repeats: int) -> float:
+    """Returns the median wall time of `fn` in milliseconds."""
+    timings: list[float] = []
+    for _ in range(repeats):
+        start = perf_counter()
+        await fn()
+        timings.append((perf_counter() - start) * 1000)
+    return statistics.median(timings)
@@ -0,0 +1,82 @@
+"""Append latency and tail reads of the SQLite and the segment log history repos.
+
+Usage:
+    python -m benchmarks.history_backends [--max-items 100000] [--window 10] [--fsync]
+
+Appends are single items, as written per history item without group commit. Tail reads
+(`get_last_n_items`) should stay flat with the history size for both repos.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import UUID, uuid4
+
+from benchmarks.common import temporary_engine, time_async
+from src.config.models import SqliteProfile
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.models import HistoryItem, ModelResponse, UserPrompt
+from src.history.port import HistoryRepo
+from src.history.segment_log.adapter import SegmentLogHistoryRepo
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+BATCH_SIZE = 10_000
+REPEATS = 50
+
+
+def synthetic_history_items(history_id: UUID, start: int, count: int) -> list[HistoryItem]:
+    history_items: list[HistoryItem] = []
+    for i in range(start, start + count):
+        if i % 2 == 0:
+            history_items.append(UserPrompt(id=uuid4(), history_id=history_id, created_at=i, prompt=f"prompt {i}"))
+        else:
+            history_items.append(
+                ModelResponse(id=uuid4(), history_id=history_id, created_at=i, response=f"response {i}")
+            )
+    return history_items
+
+
+async def benchmark_repo(name: str, repo: HistoryRepo, max_items: int, window: int):
+    history_id = uuid4()
+    await repo.create_history_if_not_exists(history_id)
+    stored = 0
+    for size in [size for size in SIZES if size <= max_items]:
+        for batch_start in range(stored, size, BATCH_SIZE):
+            batch_count = min(BATCH_SIZE, size - batch_start)
+            await repo.add_history_items(synthetic_history_items(history_id, batch_start, batch_count))
+        stored = size
+
+        async def append():
+            nonlocal stored
+            await repo.add_history_item(
+                UserPrompt(id=uuid4(), history_id=history_id, created_at=stored, prompt="appended prompt")
+            )
+            stored += 1
+
+        append_ms = await time_async(append, REPEATS)
+        tail_ms = await time_async(lambda: repo.get_last_n_items(history_id, window), REPEATS)
+        print(f"{name:>12} | {size:>10} | {append_ms:12.3f} | {tail_ms:14.3f}")
+
+
+async def main(max_items: int, window: int, fsync: bool):
+    print(f"{'repo':>12} | {'items':>10} | {'append (ms)':>12} | {'tail read (ms)':>14}")
+    profile = SqliteProfile(synchronous="FULL" if fsync else "NORMAL")
+    async with temporary_engine(profile) as engine:
+        await benchmark_repo("sqlite", AsyncSqlalchemyHistoryRepo(engine=engine), max_items, window)
+
+    with TemporaryDirectory() as tmp_dir:
+        repo = SegmentLogHistoryRepo(Path(tmp_dir), fsync=fsync)
+        try:
+            await benchmark_repo("segment log", repo, max_items, window)
+        finally:
+            repo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-items", type=int, default=100_000)
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--fsync", action="store_true", help="Sync every append (synchronous=FULL for SQLite)")
+    args = parser.parse_args()
+    asyncio.run(main(max_items=args.max_items, window=args.window, fsync=args.fsync))
@@ -0,0 +1,93 @@
+"""Database size and read cost with large tool results stored inline vs. as compressed blobs.
+
+Usage:
+    python -m benchmarks.history_blobs [--turns 5000] [--result-kib 32] [--distinct-results 50]
+
+Every turn holds a user prompt, a large tool result (one of `--distinct-results` payloads) and a
+model response. With blobs, the database shrinks by the compression and deduplication and keyword
+search gets cheaper, as the item rows it scans stay small. Tail reads should stay about the same.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import UUID, uuid4
+
+from benchmarks.common import time_async
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.models import HistoryItem, HistoryItemKind, ModelResponse, ToolResult, UserPrompt
+
+BATCH_SIZE = 1_000
+REPEATS = 20
+
+
+def synthetic_turn(history_id: UUID, i: int, results: list[dict[str, list[str]]]) -> list[HistoryItem]:
+    turn_id = uuid4()
+    return [
+        UserPrompt(id=turn_id, history_id=history_id, created_at=3 * i, prompt=f"prompt {i}", turn_id=turn_id),
+        ToolResult(
+            id=uuid4(),
+            history_id=history_id,
+            created_at=3 * i + 1,
+            tool_call_id=f"call_{i}",
+            tool_name="read_logs",
+            is_retry=False,
+            result=results[i % len(results)],
+            turn_id=turn_id,
+        ),
+        ModelResponse(
+            id=uuid4(), history_id=history_id, created_at=3 * i + 2, response=f"response {i}", turn_id=turn_id
+        ),
+    ]
+
+
+async def benchmark(name: str, blob_threshold_bytes: int | None, turns: int, results: list[dict[str, list[str]]]):
+    history_id = uuid4()
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "benchmark.db"
+        engine = get_engine(path)
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        repo = AsyncSqlalchemyHistoryRepo(engine, blob_threshold_bytes=blob_threshold_bytes)
+        try:
+            await repo.create_history_if_not_exists(history_id)
+            for batch_start in range(0, turns, BATCH_SIZE):
+                items = [
+                    item
+                    for i in range(batch_start, min(batch_start + BATCH_SIZE, turns))
+                    for item in synthetic_turn(history_id, i, results)
+                ]
+                await repo.add_history_items(items)
+
+            text_kinds = [HistoryItemKind.USER_PROMPT, HistoryItemKind.MODEL_RESPONSE]
+            text_tail_ms = await time_async(lambda: repo.get_last_n_turns(history_id, 10, kinds=text_kinds), REPEATS)
+            tail_ms = await time_async(lambda: repo.get_last_n_turns(history_id, 10), REPEATS)
+            search_ms = await time_async(lambda: repo.search_items(history_id, "prompt 42"), REPEATS)
+        finally:
+            await engine.dispose()
+        size_mib = path.stat().st_size / 1024 / 1024
+    print(f"{name:>8} | {size_mib:10.1f} | {text_tail_ms:15.2f} | {tail_ms:15.2f} | {search_ms:11.2f}")
+
+
+async def main(turns: int, result_kib: int, distinct_results: int):
+    # Log lines compress like real tool outputs do, i.e., far better than random bytes
+    results = [
+        {"lines": [f"{d} INFO worker-{i % 8} processed request {i} in {i % 97} ms" for i in range(result_kib * 18)]}
+        for d in range(distinct_results)
+    ]
+    print(
+        f"{'storage':>8} | {'size (MiB)':>10} | {'text tail (ms)':>15} | {'full tail (ms)':>15} | {'search (ms)':>11}"
+    )
+    await benchmark("inline", None, turns, results)
+    await benchmark("blobs", 16 * 1024, turns, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5_000)
+    parser.add_argument("--result-kib", type=int, default=32)
+    parser.add_argument("--distinct-results", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(turns=args.turns, result_kib=args.result_kib, distinct_results=args.distinct_results))
@@ -0,0 +1,56 @@
+"""Rows per second of walking a whole history with `HistoryService.iter_history_items`.
+
+Usage:
+    python -m benchmarks.history_iter [--items 1000000] [--batch-size 1000]
+
+Use `--items 10000000` for the 10M-row case (seeding alone takes several minutes).
+Peak memory stays at one batch, independent of the history size.
+"""
+
+import argparse
+import asyncio
+import tracemalloc
+from time import perf_counter
+from uuid import UUID, uuid4
+
+from benchmarks.common import create_history, insert_synthetic_history_items, temporary_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.service import HistoryService
+
+
+async def _walk(history_service: HistoryService, history_id: UUID, batch_size: int) -> int:
+    n_rows = 0
+    async for batch in history_service.iter_history_items(history_id, batch_size=batch_size):
+        n_rows += len(batch)
+    return n_rows
+
+
+async def main(items: int, batch_sizes: list[int]):
+    history_id = uuid4()
+    async with temporary_engine() as engine:
+        await create_history(engine, history_id)
+        await insert_synthetic_history_items(engine, history_id, start=0, count=items)
+        history_service = HistoryService(history_repo=AsyncSqlalchemyHistoryRepo(engine=engine))
+
+        print(f"{items} stored items")
+        print(f"{'batch size':>10} | {'rows / s':>12} | {'peak memory (MiB)':>18}")
+        for batch_size in batch_sizes:
+            start = perf_counter()
+            n_rows = await _walk(history_service, history_id, batch_size)
+            elapsed = perf_counter() - start
+            assert n_rows == items
+
+            # A second walk for the memory, tracemalloc distorts the timings
+            tracemalloc.start()
+            await _walk(history_service, history_id, batch_size)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{batch_size:>10} | {n_rows / elapsed:12.0f} | {peak / 1024 / 1024:18.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[500, 1000, 5000])
+    args = parser.parse_args()
+    asyncio.run(main(items=args.items, batch_sizes=args.batch_size))
@@ -0,0 +1,56 @@
+"""Items per second of the JSONL export and import (`src.history.jsonl`) of a whole history.
+
+Usage:
+    python -m benchmarks.history_jsonl [--items 1000000] [--batch-size 10000]
+
+Imports go into a fresh database, i.e., they include the full-text index triggers.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from uuid import uuid4
+
+from benchmarks.common import create_history, insert_synthetic_history_items, temporary_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.jsonl import export_history_jsonl, import_history_jsonl
+from src.history.service import HistoryService
+
+
+async def main(items: int, batch_size: int):
+    history_id = uuid4()
+    with TemporaryDirectory() as tmp_dir:
+        async with temporary_engine() as engine:
+            await create_history(engine, history_id)
+            await insert_synthetic_history_items(engine, history_id, start=0, count=items)
+            history_service = HistoryService(history_repo=AsyncSqlalchemyHistoryRepo(engine=engine))
+
+            print(f"{items} stored items")
+            print(f"{'file':>18} | {'export items / s':>16} | {'import items / s':>16} | {'size (MiB)':>10}")
+            for file_name in ["history.jsonl", "history.jsonl.gz"]:
+                path = Path(tmp_dir) / file_name
+                start = perf_counter()
+                n_exported = await export_history_jsonl(history_service, history_id, path, batch_size=batch_size)
+                export_elapsed = perf_counter() - start
+
+                async with temporary_engine() as target_engine:
+                    start = perf_counter()
+                    n_imported = await import_history_jsonl(
+                        AsyncSqlalchemyHistoryRepo(engine=target_engine), path, batch_size=batch_size
+                    )
+                    import_elapsed = perf_counter() - start
+                assert n_exported == n_imported == items
+                print(
+                    f"{file_name:>18} | {items / export_elapsed:16.0f} | {items / import_elapsed:16.0f} | "
+                    f"{path.stat().st_size / 1024 / 1024:10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(main(items=args.items, batch_size=args.batch_size))
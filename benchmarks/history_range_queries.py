@@ -0,0 +1,94 @@
+"""Time-range and kind-filtered history queries (`query_items`) on a large synthetic history.
+
+Usage:
+    python -m benchmarks.history_range_queries [--items 1000000] [--summary-every 1000]
+
+Prompts and responses alternate, every `--summary-every`th item is a ConversationSummary, i.e., a
+rare kind. Every query is timed with the (history_id, kind, created_at) index and again after
+dropping it. Windows should cost the same anywhere in the history, rare kinds should not scan the
+items of the other kinds.
+"""
+
+import argparse
+import asyncio
+from typing import Awaitable, Callable
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from benchmarks.common import INSERT_BATCH_SIZE, create_history, temporary_engine, time_async
+from src.core.database import get_session
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.models import HistoryItemDb
+from src.history.models import HistoryItemKind
+
+REPEATS = 5
+WINDOW = 1000
+
+
+def synthetic_rows(history_id: UUID, start: int, count: int, summary_every: int) -> list[dict[str, object]]:
+    rows: list[dict[str, object]] = []
+    for i in range(start, start + count):
+        content: dict[str, object]
+        if i % summary_every == 0:
+            kind = HistoryItemKind.CONVERSATION_SUMMARY.value
+            content = {"summary": f"synthetic summary {i}", "covers_until": i - 1}
+        elif i % 2 == 0:
+            kind = HistoryItemKind.USER_PROMPT.value
+            content = {"prompt": f"synthetic prompt {i}"}
+        else:
+            kind = HistoryItemKind.MODEL_RESPONSE.value
+            content = {"response": f"synthetic response {i}"}
+        rows.append({"id": uuid4(), "history_id": history_id, "created_at": i, "kind": kind, "content": content})
+    return rows
+
+
+async def seed(engine: AsyncEngine, history_id: UUID, n_items: int, summary_every: int):
+    for batch_start in range(0, n_items, INSERT_BATCH_SIZE):
+        batch_count = min(INSERT_BATCH_SIZE, n_items - batch_start)
+        async with get_session(engine) as session:
+            await session.execute(
+                insert(HistoryItemDb), synthetic_rows(history_id, batch_start, batch_count, summary_every)
+            )
+
+
+async def main(n_items: int, summary_every: int):
+    history_id = uuid4()
+    async with temporary_engine() as engine:
+        await create_history(engine, history_id)
+        await seed(engine, history_id, n_items, summary_every)
+        repo = AsyncSqlalchemyHistoryRepo(engine)
+        summaries = [HistoryItemKind.CONVERSATION_SUMMARY]
+        responses = [HistoryItemKind.MODEL_RESPONSE]
+        queries: dict[str, Callable[[], Awaitable[object]]] = {
+            f"window of {WINDOW}, oldest": lambda: repo.query_items(history_id, since=0, until=WINDOW),
+            f"window of {WINDOW}, newest": lambda: repo.query_items(history_id, since=n_items - WINDOW),
+            f"responses of a {WINDOW} window": lambda: repo.query_items(
+                history_id, kinds=responses, since=n_items // 2, until=n_items // 2 + WINDOW
+            ),
+            "all summaries": lambda: repo.query_items(history_id, kinds=summaries, limit=n_items),
+            "last 10 summaries": lambda: repo.query_items(history_id, kinds=summaries, limit=10, newest_first=True),
+            "last 10 summaries of 1st half": lambda: repo.query_items(
+                history_id, kinds=summaries, until=n_items // 2, limit=10, newest_first=True
+            ),
+        }
+
+        timings = {name: [await time_async(query, REPEATS)] for name, query in queries.items()}
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP INDEX ix_history_items_history_id_kind_created_at"))
+        for name, query in queries.items():
+            timings[name].append(await time_async(query, REPEATS))
+
+        print(f"{n_items} items, median of {REPEATS} runs in ms")
+        print(f"{'query':>32} | {'with index':>12} | {'without':>12}")
+        for name, (with_index_ms, without_index_ms) in timings.items():
+            print(f"{name:>32} | {with_index_ms:12.2f} | {without_index_ms:12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--summary-every", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(n_items=args.items, summary_every=args.summary_every))
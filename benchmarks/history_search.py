@@ -0,0 +1,53 @@
+"""Latency of the FTS5 keyword search (`HistoryService.search_history_items`) by history size.
+
+Usage:
+    python -m benchmarks.history_search [--sizes 10000 100000] [--repeats 20]
+
+The full-text index is filled by the insert triggers while seeding, i.e., seeding is slower
+than for the other benchmarks. Rare terms stay in the low milliseconds regardless of the size,
+a term in every item is the worst case as all of its matches are ranked.
+"""
+
+import argparse
+import asyncio
+from uuid import uuid4
+
+from benchmarks.common import create_history, insert_synthetic_history_items, temporary_engine, time_async
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.service import HistoryService
+
+QUERIES = {
+    "rare term": "4711",
+    "common term": "synthetic",
+    "two terms": "prompt 4712",
+}
+
+
+async def main(sizes: list[int], repeats: int, limit: int):
+    print(f"{'items':>10} | " + " | ".join(f"{name + ' (ms)':>16}" for name in QUERIES))
+    for size in sizes:
+        history_id = uuid4()
+        async with temporary_engine() as engine:
+            await create_history(engine, history_id)
+            await insert_synthetic_history_items(engine, history_id, start=0, count=size)
+            history_service = HistoryService(history_repo=AsyncSqlalchemyHistoryRepo(engine=engine))
+
+            timings: list[float] = []
+            for query in QUERIES.values():
+                hits = await history_service.search_history_items(history_id, query, limit=limit)
+                assert hits
+                timings.append(
+                    await time_async(
+                        lambda: history_service.search_history_items(history_id, query, limit=limit), repeats
+                    )
+                )
+            print(f"{size:>10} | " + " | ".join(f"{timing:16.2f}" for timing in timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(sizes=args.sizes, repeats=args.repeats, limit=args.limit))
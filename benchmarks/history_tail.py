@@ -0,0 +1,48 @@
+"""Per-turn cost of reading the history tail for growing history sizes.
+
+Usage:
+    python -m benchmarks.history_tail [--max-items 1000000] [--window 10] [--eager-up-to 100000]
+
+The bounded tail query (`get_last_n_items`) should stay flat from 1k to 1M stored items,
+while the old eager load (`get_or_create_history` + slicing) grows linearly.
+"""
+
+import argparse
+import asyncio
+from uuid import uuid4
+
+from benchmarks.common import create_history, insert_synthetic_history_items, temporary_engine, time_async
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+REPEATS = 20
+
+
+async def main(max_items: int, window: int, eager_up_to: int):
+    history_id = uuid4()
+    async with temporary_engine() as engine:
+        repo = AsyncSqlalchemyHistoryRepo(engine=engine)
+        await create_history(engine, history_id)
+
+        print(f"{'items':>10} | {'tail query (ms)':>16} | {'eager load (ms)':>16}")
+        stored = 0
+        for size in [size for size in SIZES if size <= max_items]:
+            await insert_synthetic_history_items(engine, history_id, start=stored, count=size - stored)
+            stored = size
+
+            tail_ms = await time_async(lambda: repo.get_last_n_items(history_id, window), REPEATS)
+            if size <= eager_up_to:
+                eager_ms = await time_async(lambda: repo.get_or_create_history(history_id), 3)
+                eager_str = f"{eager_ms:16.2f}"
+            else:
+                eager_str = f"{'skipped':>16}"
+            print(f"{size:>10} | {tail_ms:16.2f} | {eager_str}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-items", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--eager-up-to", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(main(max_items=args.max_items, window=args.window, eager_up_to=args.eager_up_to))
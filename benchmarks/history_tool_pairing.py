@@ -0,0 +1,112 @@
+"""ToolCall/ToolResult pairing in SQL via the typed columns vs. in Python, and the backfill migration.
+
+Usage:
+    python -m benchmarks.history_tool_pairing [--items 1000000] [--orphan-every 100]
+
+Seeds alternating ToolCalls and ToolResults (every `--orphan-every`th call without a result) with
+the typed columns unset, times the in-place backfill, then per-tool statistics and orphan detection
+as SQL queries against loading all items and pairing them in Python.
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from time import perf_counter
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from benchmarks.common import INSERT_BATCH_SIZE, create_history, temporary_engine, time_async
+from src.core.database import create_db_and_tables, get_session
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.async_sqlalchemy.models import HistoryItemDb
+from src.history.models import HistoryItemKind, ToolCall, ToolResult
+from src.history.service import HistoryService
+
+TOOL_NAMES = [f"tool_{i}" for i in range(10)]
+REPEATS = 3
+
+
+def synthetic_tool_rows(history_id: UUID, start: int, count: int, orphan_every: int) -> list[dict[str, object]]:
+    """Rows as written before the typed columns existed, i.e., with all of them unset."""
+    rows: list[dict[str, object]] = []
+    for i in range(start, start + count):
+        n_call, is_result = divmod(i, 2)
+        if is_result and n_call % orphan_every == 0:
+            continue
+        content: dict[str, object] = {"tool_call_id": f"call_{n_call}", "tool_name": TOOL_NAMES[n_call % 10]}
+        if is_result:
+            kind = HistoryItemKind.TOOL_RESULT.value
+            content |= {"is_retry": False, "result": f"result {n_call}"}
+        else:
+            kind = HistoryItemKind.TOOL_CALL.value
+            content |= {"args": {"n": n_call}}
+        rows.append(
+            {
+                "id": uuid4(),
+                "history_id": history_id,
+                "created_at": i,
+                "kind": kind,
+                "tool_call_id": None,
+                "tool_name": None,
+                "content_length": None,
+                "content": content,
+            }
+        )
+    return rows
+
+
+async def seed(engine: AsyncEngine, history_id: UUID, n_items: int, orphan_every: int):
+    for batch_start in range(0, n_items, INSERT_BATCH_SIZE):
+        batch_count = min(INSERT_BATCH_SIZE, n_items - batch_start)
+        async with get_session(engine) as session:
+            rows = synthetic_tool_rows(history_id, batch_start, batch_count, orphan_every)
+            await session.execute(insert(HistoryItemDb), rows)
+
+
+async def pair_in_python(history_service: HistoryService, history_id: UUID) -> Counter[str]:
+    """The orphan ToolCalls per tool, pairing all items in memory."""
+    result_call_ids: set[str] = set()
+    calls: list[ToolCall] = []
+    async for batch in history_service.iter_history_items(history_id, batch_size=10_000):
+        for item in batch:
+            if isinstance(item, ToolResult):
+                result_call_ids.add(item.tool_call_id)
+            elif isinstance(item, ToolCall):
+                calls.append(item)
+    return Counter(call.tool_name for call in calls if call.tool_call_id not in result_call_ids)
+
+
+async def main(n_items: int, orphan_every: int):
+    history_id = uuid4()
+    async with temporary_engine() as engine:
+        await create_history(engine, history_id)
+        await seed(engine, history_id, n_items, orphan_every)
+
+        async with engine.begin() as conn:
+            await conn.execute(text(f"PRAGMA user_version = {len(HISTORY_MIGRATIONS) - 1}"))
+        start = perf_counter()
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        print(f"Backfilled the typed columns of {n_items} items in {perf_counter() - start:.1f}s")
+
+        repo = AsyncSqlalchemyHistoryRepo(engine)
+        stats_ms = await time_async(lambda: repo.get_tool_stats(history_id), REPEATS)
+        orphans_ms = await time_async(lambda: repo.get_orphan_tool_calls(history_id, limit=100), REPEATS)
+        python_ms = await time_async(lambda: pair_in_python(HistoryService(repo), history_id), REPEATS)
+
+        n_orphans = sum(tool_stats.n_orphan_calls for tool_stats in await repo.get_tool_stats(history_id))
+        assert n_orphans == sum((await pair_in_python(HistoryService(repo), history_id)).values())
+        print(f"{'query':>28} | {'ms':>10}")
+        print(f"{'tool stats (SQL)':>28} | {stats_ms:10.1f}")
+        print(f"{'first 100 orphans (SQL)':>28} | {orphans_ms:10.1f}")
+        print(f"{'orphans per tool (Python)':>28} | {python_ms:10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--orphan-every", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(n_items=args.items, orphan_every=args.orphan_every))
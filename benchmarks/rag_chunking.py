@@ -0,0 +1,83 @@
+"""Throughput of the chunkers (see `src/rag/chunking.py`) on synthetic multi-megabyte documents.
+
+Usage:
+    python -m benchmarks.rag_chunking [--sizes-mb 1 4 16] [--max-tokens 6000] [--overlap-tokens 600]
+
+The documents are prose (paragraphs of sentences), code (fenced blocks of short lines), both mixed, and a
+single blob without any whitespace, i.e., the worst case of the `StructureChunker` (split within words only).
+"""
+
+import argparse
+import random
+import statistics
+import string
+from time import perf_counter
+
+from src.rag.chunking import CharChunker, Chunker, StructureChunker
+
+REPEATS = 3
+WORDS = ["the", "agent", "called", "a", "tool", "with", "ERR-4711", "and", "src/main.py", "configuration"]
+
+
+def prose(rng: random.Random, n_chars: int) -> str:
+    paragraphs: list[str] = []
+    size = 0
+    while size < n_chars:
+        sentences = [" ".join(rng.choices(WORDS, k=rng.randint(5, 25))).capitalize() + "." for _ in range(8)]
+        paragraphs.append(" ".join(sentences))
+        size += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)[:n_chars]
+
+
+def code(rng: random.Random, n_chars: int) -> str:
+    blocks: list[str] = []
+    size = 0
+    while size < n_chars:
+        lines = [f"    result_{i} = tool.call({rng.randint(0, 10**6)}, retries={i % 3})" for i in range(40)]
+        blocks.append("\n".join(["```python", *lines, "```"]))
+        size += len(blocks[-1]) + 2
+    return "\n\n".join(blocks)[:n_chars]
+
+
+def mixed(rng: random.Random, n_chars: int) -> str:
+    return "\n\n".join(prose(rng, n_chars // 8) + "\n\n" + code(rng, n_chars // 8) for _ in range(4))
+
+
+def blob(rng: random.Random, n_chars: int) -> str:
+    return "".join(rng.choices(string.ascii_letters + string.digits + "+/", k=n_chars))
+
+
+def time_chunker(chunker: Chunker, text: str) -> tuple[float, int]:
+    """Returns the median MB/s and the number of chunks."""
+    timings: list[float] = []
+    n_chunks = 0
+    for _ in range(REPEATS):
+        start = perf_counter()
+        n_chunks = len(chunker.chunk(text))
+        timings.append(perf_counter() - start)
+    return len(text) / 1e6 / statistics.median(timings), n_chunks
+
+
+def main(sizes_mb: list[float], max_tokens: int, overlap_tokens: int):
+    chunkers: dict[str, Chunker] = {
+        # The characters of the same budget at about 4 characters per token
+        "chars": CharChunker(max_tokens * 4, overlap_tokens * 4),
+        "structure": StructureChunker(max_tokens, overlap_tokens),
+    }
+    print(f"Chunks of {max_tokens} tokens ({overlap_tokens} overlap), median of {REPEATS} runs")
+    print(f"{'MB':>6} | {'document':>8} | {'chunker':>9} | {'MB/s':>8} | {'chunks':>7}")
+    for size_mb in sizes_mb:
+        for name, generate in [("prose", prose), ("code", code), ("mixed", mixed), ("blob", blob)]:
+            text = generate(random.Random(0), int(size_mb * 1e6))
+            for chunker_name, chunker in chunkers.items():
+                mb_per_s, n_chunks = time_chunker(chunker, text)
+                print(f"{size_mb:>6} | {name:>8} | {chunker_name:>9} | {mb_per_s:8.1f} | {n_chunks:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--max-tokens", type=int, default=6000)
+    parser.add_argument("--overlap-tokens", type=int, default=600)
+    args = parser.parse_args()
+    main(sizes_mb=args.sizes_mb, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens)
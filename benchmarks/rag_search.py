@@ -0,0 +1,125 @@
+"""Query latency of the in-process `VectorStore` (see `NumpyRAGService`) vs. Qdrant, top 10 of random vectors.
+
+Usage:
+    python -m benchmarks.rag_search [--sizes 10000 100000 1000000] [--dimensions 384] [--qdrant-url URL]
+
+Without `--qdrant-url`, Qdrant runs in local mode (in the process, brute force as well), which holds every
+point as a Python object, i.e., it is only filled up to `--qdrant-max-vectors`. Against a server, every
+query adds a round trip on top of the search. Only the search is timed, no embedding.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client import models as qdm
+
+from benchmarks.common import time_async
+from src.rag.numpy_index.store import VectorDtype, VectorStore
+
+INSERT_BATCH_SIZE = 10_000
+N_QUERIES = 20
+TOP_K = 10
+
+
+def random_vectors(rng: np.random.Generator, count: int, dimensions: int) -> np.ndarray:
+    return rng.standard_normal((count, dimensions), dtype=np.float32)
+
+
+def payloads(start: int, count: int) -> list[dict[str, object]]:
+    return [
+        {"created_at": i, "kind": "user_prompt", "text": f"synthetic prompt {i}"} for i in range(start, start + count)
+    ]
+
+
+async def time_vector_store(path: Path, n_vectors: int, dimensions: int, dtype: VectorDtype) -> tuple[float, float]:
+    """Returns the seconds to fill the store and the median query latency in milliseconds."""
+    rng = np.random.default_rng(0)
+    store = VectorStore(path / dtype, dimensions=dimensions, dtype=dtype)
+    start = perf_counter()
+    for batch_start in range(0, n_vectors, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, n_vectors - batch_start)
+        store.upsert(
+            [str(i) for i in range(batch_start, batch_start + count)],
+            random_vectors(rng, count, dimensions).tolist(),
+            payloads(batch_start, count),
+        )
+    fill_s = perf_counter() - start
+    queries = iter(random_vectors(rng, N_QUERIES, dimensions).tolist())
+
+    async def search():
+        store.search(next(queries), TOP_K)
+
+    latency_ms = await time_async(search, N_QUERIES)
+    store.close()
+    return fill_s, latency_ms
+
+
+async def time_qdrant(qdrant_client: AsyncQdrantClient, n_vectors: int, dimensions: int) -> tuple[float, float]:
+    rng = np.random.default_rng(0)
+    collection_name = f"benchmark-{n_vectors}"
+    if await qdrant_client.collection_exists(collection_name):
+        await qdrant_client.delete_collection(collection_name)
+    await qdrant_client.create_collection(
+        collection_name, vectors_config=qdm.VectorParams(size=dimensions, distance=qdm.Distance.COSINE)
+    )
+    start = perf_counter()
+    for batch_start in range(0, n_vectors, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, n_vectors - batch_start)
+        await qdrant_client.upsert(
+            collection_name,
+            points=qdm.Batch(
+                ids=list(range(batch_start, batch_start + count)),
+                vectors=random_vectors(rng, count, dimensions).tolist(),
+                payloads=payloads(batch_start, count),
+            ),
+            wait=True,
+        )
+    fill_s = perf_counter() - start
+    queries = iter(random_vectors(rng, N_QUERIES, dimensions).tolist())
+
+    async def search():
+        await qdrant_client.query_points(collection_name, query=next(queries), limit=TOP_K)
+
+    latency_ms = await time_async(search, N_QUERIES)
+    await qdrant_client.delete_collection(collection_name)
+    return fill_s, latency_ms
+
+
+async def main(sizes: list[int], dimensions: int, qdrant_url: str | None, qdrant_max_vectors: int):
+    qdrant_name = "qdrant (server)" if qdrant_url else "qdrant (local)"
+    print(f"Top {TOP_K} of {dimensions} dimensions, median of {N_QUERIES} queries")
+    print(f"{'vectors':>9} | {'index':>15} | {'fill s':>8} | {'query ms':>9}")
+    for n_vectors in sizes:
+        with TemporaryDirectory() as tmp_dir:
+            for dtype in ("float32", "float16"):
+                fill_s, latency_ms = await time_vector_store(Path(tmp_dir), n_vectors, dimensions, dtype)
+                print(f"{n_vectors:>9} | {f'numpy {dtype}':>15} | {fill_s:8.1f} | {latency_ms:9.2f}")
+        if qdrant_url or n_vectors <= qdrant_max_vectors:
+            qdrant_client = AsyncQdrantClient(url=qdrant_url) if qdrant_url else AsyncQdrantClient(location=":memory:")
+            fill_s, latency_ms = await time_qdrant(qdrant_client, n_vectors, dimensions)
+            await qdrant_client.close()
+            print(f"{n_vectors:>9} | {qdrant_name:>15} | {fill_s:8.1f} | {latency_ms:9.2f}")
+        else:
+            print(f"{n_vectors:>9} | {qdrant_name:>15} | {'-':>8} | {'-':>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--qdrant-url", default=None)
+    parser.add_argument("--qdrant-max-vectors", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            sizes=args.sizes,
+            dimensions=args.dimensions,
+            qdrant_url=args.qdrant_url,
+            qdrant_max_vectors=args.qdrant_max_vectors,
+        )
+    )
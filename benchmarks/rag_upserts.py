@@ -0,0 +1,115 @@
+"""Indexing throughput of `QdrantRAGService.add_history_items` against an embedded (local mode) Qdrant.
+
+Usage:
+    python -m benchmarks.rag_upserts [--items 5000] [--dimensions 1536]
+
+Embeddings come from a fake embedder (a fixed pool of random vectors), i.e., only chunking, payload
+mapping and the upserts are timed. "before" is one `PointStruct` request per chunk with random ids.
+Every history is indexed twice, only deterministic ids keep the number of points. Local mode has
+no network round trips and applies every upsert synchronously, i.e., against a server, batching saves
+a round trip per chunk on top and `wait_for_upserts=False` returns before the points are indexed.
+"""
+
+import argparse
+import asyncio
+import random
+from time import perf_counter, time_ns
+from types import SimpleNamespace
+from typing import cast
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+from openai import AsyncOpenAI
+from qdrant_client import AsyncQdrantClient
+from qdrant_client import models as qdm
+
+from src.config.models import EmbedderConfig, QdrantConfig
+from src.history.models import ModelResponse, UserPrompt
+from src.history.service import HistoryService
+from src.rag.port import RAGHistoryItem
+from src.rag.qdrant.models import Embedding, QdrantRAGItem
+from src.rag.qdrant.service import QdrantRAGService
+
+BATCH_SIZES = [1, 64, 256, 1024]
+ITEMS_PER_CALL = 500
+VECTOR_POOL_SIZE = 64
+
+
+class FakeEmbedder:
+    def __init__(self, dimensions: int):
+        self._vectors = [[random.random() for _ in range(dimensions)] for _ in range(VECTOR_POOL_SIZE)]
+        self.embeddings = SimpleNamespace(create=self._create)
+
+    async def _create(self, input: list[str], model: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=self._vectors[i % VECTOR_POOL_SIZE]) for i in range(len(input))]
+        )
+
+
+class PointStructPerChunkRAGService(QdrantRAGService):
+    async def _upsert_rag_docs_and_embeddings(self, rag_docs: list[QdrantRAGItem], embeddings: list[Embedding]):
+        for rag_doc, embedding in zip(rag_docs, embeddings):
+            await self._qdrant_client.upsert(
+                collection_name=self._collection_name,
+                points=[qdm.PointStruct(id=str(uuid4()), vector=embedding, payload=rag_doc.model_dump(mode="json"))],
+            )
+
+
+async def time_indexing(
+    rag_service_type: type[QdrantRAGService], n_items: int, dimensions: int, batch_size: int
+) -> tuple[float, float, int]:
+    """Returns the items per second of the first and of a repeated indexing, and the number of points."""
+    history_id = uuid4()
+    qdrant_client = AsyncQdrantClient(location=":memory:")
+    rag_service = await rag_service_type.create(
+        config=EmbedderConfig(
+            base_url="",
+            api_key="",
+            model_name="fake",
+            chunk_max_chars=16000,
+            chunk_overlap_chars=1600,
+            structure_chunker=None,
+            max_batch_size=2048,
+            max_batch_chars=600_000,
+        ),
+        qdrant_config=QdrantConfig(upsert_batch_size=batch_size, wait_for_upserts=True, hybrid_search=None),
+        qdrant_client=qdrant_client,
+        openai_client=cast(AsyncOpenAI, FakeEmbedder(dimensions)),
+        history_service=cast(HistoryService, AsyncMock()),
+        history_id=history_id,
+    )
+    created_at = time_ns()
+    history_items: list[RAGHistoryItem] = [
+        UserPrompt(id=uuid4(), history_id=history_id, created_at=created_at + i, prompt=f"synthetic prompt {i}")
+        if i % 2 == 0
+        else ModelResponse(id=uuid4(), history_id=history_id, created_at=created_at + i, response=f"response {i}")
+        for i in range(n_items)
+    ]
+
+    items_per_s: list[float] = []
+    for _ in range(2):
+        start = perf_counter()
+        for call_start in range(0, n_items, ITEMS_PER_CALL):
+            await rag_service.add_history_items(history_items[call_start : call_start + ITEMS_PER_CALL])
+        items_per_s.append(n_items / (perf_counter() - start))
+    n_points = (await qdrant_client.count(f"history-{history_id}")).count
+    await qdrant_client.close()
+    return items_per_s[0], items_per_s[1], n_points
+
+
+async def main(n_items: int, dimensions: int):
+    print(f"{n_items} items ({dimensions} dimensions), {ITEMS_PER_CALL} items per call")
+    print(f"{'batch size':>10} | {'items/s':>10} | {'again/s':>10} | {'points':>8}")
+    first, again, n_points = await time_indexing(PointStructPerChunkRAGService, n_items, dimensions, batch_size=1)
+    print(f"{'before':>10} | {first:10.0f} | {again:10.0f} | {n_points:>8}")
+    for batch_size in BATCH_SIZES:
+        first, again, n_points = await time_indexing(QdrantRAGService, n_items, dimensions, batch_size)
+        print(f"{batch_size:>10} | {first:10.0f} | {again:10.0f} | {n_points:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    args = parser.parse_args()
+    asyncio.run(main(n_items=args.items, dimensions=args.dimensions))
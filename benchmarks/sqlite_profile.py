@@ -0,0 +1,91 @@
+"""Append and tail-read throughput under concurrent sessions, with and without the SQLite performance profile.
+
+Usage:
+    python -m benchmarks.sqlite_profile [--writers 4] [--readers 4] [--duration 5] [--seed-items 100000]
+
+"default" is the previous setup: rollback journal, FULL sync and one engine for everything.
+"profile" is `SqliteProfile()` (WAL, synchronous=NORMAL, mmap, cache) with a separate read-only engine.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from time import perf_counter, time_ns
+from uuid import UUID, uuid4
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from benchmarks.common import create_history, insert_synthetic_history_items, temporary_engine
+from src.config.models import SqliteProfile
+from src.core.database import get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.models import UserPrompt
+
+
+async def _append_loop(repo: AsyncSqlalchemyHistoryRepo, history_id: UUID, deadline: float) -> int:
+    n_appends = 0
+    while perf_counter() < deadline:
+        await repo.add_history_item(
+            UserPrompt(id=uuid4(), history_id=history_id, created_at=time_ns(), prompt="benchmark prompt")
+        )
+        n_appends += 1
+    return n_appends
+
+
+async def _tail_read_loop(repo: AsyncSqlalchemyHistoryRepo, history_id: UUID, deadline: float) -> int:
+    n_reads = 0
+    while perf_counter() < deadline:
+        await repo.get_last_n_items(history_id, 10)
+        n_reads += 1
+    return n_reads
+
+
+async def _run(
+    name: str,
+    engine: AsyncEngine,
+    read_engine: AsyncEngine | None,
+    writers: int,
+    readers: int,
+    duration: float,
+    seed_items: int,
+):
+    history_id = uuid4()
+    await create_history(engine, history_id)
+    await insert_synthetic_history_items(engine, history_id, start=0, count=seed_items)
+    repo = AsyncSqlalchemyHistoryRepo(engine=engine, read_engine=read_engine)
+
+    deadline = perf_counter() + duration
+    counts = await asyncio.gather(
+        *[_append_loop(repo, history_id, deadline) for _ in range(writers)],
+        *[_tail_read_loop(repo, history_id, deadline) for _ in range(readers)],
+    )
+    n_appends, n_reads = sum(counts[:writers]), sum(counts[writers:])
+    print(f"{name:>8} | {n_appends / duration:14.1f} | {n_reads / duration:16.1f}")
+
+
+async def main(writers: int, readers: int, duration: float, seed_items: int):
+    print(f"{writers} writer and {readers} reader sessions, {duration}s each, {seed_items} seeded items")
+    print(f"{'setup':>8} | {'appends / s':>14} | {'tail reads / s':>16}")
+
+    async with temporary_engine() as engine:
+        await _run("default", engine, None, writers, readers, duration, seed_items)
+
+    profile = SqliteProfile()
+    async with temporary_engine(profile=profile) as engine:
+        path = engine.url.database
+        assert path is not None
+        read_engine = get_engine(Path(path), profile=profile, read_only=True)
+        try:
+            await _run("profile", engine, read_engine, writers, readers, duration, seed_items)
+        finally:
+            await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--seed-items", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(main(writers=args.writers, readers=args.readers, duration=args.duration, seed_items=args.seed_items))
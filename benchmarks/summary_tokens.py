@@ -0,0 +1,139 @@
+"""Prompt tokens per turn of the context window, with and without a rolling ConversationSummary.
+
+Usage:
+    python -m benchmarks.summary_tokens [--turns 200] [--last-n-turns 5] [--every-n-turns 5]
+
+Compares three context windows over a synthetic conversation:
+    full     - every turn so far, i.e., what it takes to keep all of the conversation visible without summaries
+    tail     - the last `--last-n-turns` turns, anything older is invisible
+    summary  - the unsummarized turns (at most `--last-n-turns + --every-n-turns`) plus one summary prompt
+
+The summaries come from a stub model returning `--summary-chars` characters, no LLM is called.
+Tokens are estimated as characters / 4, i.e., only relative numbers are meaningful.
+"""
+
+import argparse
+import asyncio
+import statistics
+from time import time_ns
+from typing import Sequence
+from uuid import uuid4
+
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from benchmarks.common import create_history, temporary_engine
+from src.ai.models import SystemPrompt
+from src.ai.prompts import PromptsService
+from src.ai.pydantic_ai.summarizer import PydanticAIConversationSummarizer
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.models import HistoryItem, UserPrompt
+from src.history.models import ModelResponse as HistoryModelResponse
+from src.history.service import HistoryService
+
+CHARS_PER_TOKEN = 4
+PROMPT_CHARS = 300
+RESPONSE_CHARS = 1500
+
+
+def _estimate_tokens(items: Sequence[HistoryItem | SystemPrompt]) -> int:
+    n_chars = 0
+    for item in items:
+        match item:
+            case UserPrompt():
+                n_chars += len(item.prompt)
+            case HistoryModelResponse():
+                n_chars += len(item.response)
+            case SystemPrompt():
+                n_chars += len(item.prompt)
+            case _:
+                pass
+    return n_chars // CHARS_PER_TOKEN
+
+
+async def main(turns: int, last_n_turns: int, every_n_turns: int, summary_chars: int):
+    history_id = uuid4()
+    summarization_input_chars: list[int] = []
+
+    def summarize(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        summarization_input_chars.append(len(str(messages)))
+        return ModelResponse(parts=[TextPart(content="s" * summary_chars)])
+
+    async with temporary_engine() as engine:
+        await create_history(engine, history_id)
+        history_service = HistoryService(history_repo=AsyncSqlalchemyHistoryRepo(engine=engine))
+        prompts_service = PromptsService()
+        summarizer = PydanticAIConversationSummarizer(
+            llm=FunctionModel(summarize),
+            history_service=history_service,
+            prompts_service=prompts_service,
+            every_n_turns=every_n_turns,
+        )
+
+        tokens: dict[str, list[int]] = {"full": [], "tail": [], "summary": []}
+        print(f"{'turn':>6} | {'full':>8} | {'tail':>8} | {'summary':>8}")
+        for turn in range(turns):
+            # The context of this turn, before its UserPrompt is written
+            full_items = await history_service.get_last_n_turns(history_id, n_turns=max(turn, 1))
+            tail_items = await history_service.get_last_n_turns(history_id, n_turns=last_n_turns)
+            summary, summary_window = await history_service.get_unsummarized_turns(
+                history_id, max_n_turns=last_n_turns + every_n_turns
+            )
+            summary_items: list[HistoryItem | SystemPrompt] = list(summary_window)
+            if summary:
+                summary_items.insert(0, prompts_service.get_conversation_summary_prompt(summary))
+            tokens["full"].append(_estimate_tokens(full_items))
+            tokens["tail"].append(_estimate_tokens(tail_items))
+            tokens["summary"].append(_estimate_tokens(summary_items))
+            if turn % max(turns // 10, 1) == 0 or turn == turns - 1:
+                print(f"{turn:>6} | {tokens['full'][-1]:>8} | {tokens['tail'][-1]:>8} | {tokens['summary'][-1]:>8}")
+
+            turn_id = uuid4()
+            await history_service.add_history_items(
+                [
+                    UserPrompt(
+                        id=turn_id,
+                        history_id=history_id,
+                        created_at=time_ns(),
+                        prompt="p" * PROMPT_CHARS,
+                        turn_id=turn_id,
+                    ),
+                    HistoryModelResponse(
+                        id=uuid4(),
+                        history_id=history_id,
+                        created_at=time_ns(),
+                        response="r" * RESPONSE_CHARS,
+                        turn_id=turn_id,
+                    ),
+                ]
+            )
+            n_window_turns = sum(isinstance(item, UserPrompt) for item in summary_window)
+            summarizer.schedule_if_due(history_id, last_n_turns, n_unsummarized_turns=n_window_turns + 1)
+            # Waiting keeps the benchmark deterministic, in the app the summary is written in the background
+            await summarizer.wait_for_pending()
+
+        print()
+        print(f"{'window':>8} | {'mean tokens / turn':>18} | {'max tokens / turn':>17}")
+        for window, window_tokens in tokens.items():
+            print(f"{window:>8} | {statistics.mean(window_tokens):18.0f} | {max(window_tokens):17}")
+        print(
+            f"\n{len(summarization_input_chars)} summaries, "
+            f"{sum(summarization_input_chars) / CHARS_PER_TOKEN / turns:.0f} background input tokens / turn"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--last-n-turns", type=int, default=5)
+    parser.add_argument("--every-n-turns", type=int, default=5)
+    parser.add_argument("--summary-chars", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            turns=args.turns,
+            last_n_turns=args.last_n_turns,
+            every_n_turns=args.every_n_turns,
+            summary_chars=args.summary_chars,
+        )
+    )
@@ -2,6 +2,7 @@ from src.ai.port import AIService
 from src.ai.prompts import PromptsService
 from src.ai.pydantic_ai.adapter import PydanticAIService
 from src.ai.pydantic_ai.llm import get_llm
+from src.ai.pydantic_ai.summarizer import PydanticAIConversationSummarizer
 from src.config.models import Config
 from src.history.service import HistoryService
 from src.rag.port import RAGService
@@ -12,13 +13,30 @@ async def get_ai_service(
     history_service: HistoryService,
     rag_service: RAGService | None,
     prompts_service: PromptsService,
+    index_inline: bool = True,
 ) -> AIService:
     llm = await get_llm(config.llm_config)
 
+    summary_cfg = config.chat_config.conversation_summary
+    # Summaries cover the turns older than the window, i.e., they need a turn based window
+    summarizer = (
+        PydanticAIConversationSummarizer(
+            llm=llm,
+            history_service=history_service,
+            prompts_service=prompts_service,
+            every_n_turns=summary_cfg.every_n_turns,
+            max_items_per_summary=summary_cfg.max_items_per_summary,
+        )
+        if summary_cfg and config.chat_config.last_n_turns is not None
+        else None
+    )
+
     return PydanticAIService(
         config=config,
         llm=llm,
         history_service=history_service,
         rag_service=rag_service,
         prompts_service=prompts_service,
+        summarizer=summarizer,
+        index_inline=index_inline,
     )
@@ -1,11 +1,20 @@
 from src.ai.models import SystemPrompt
-from src.history.models import HistoryItem, ModelResponse, ThinkingStep, ToolCall, ToolResult, UserPrompt
+from src.history.models import (
+    HistoryItem,
+    ModelResponse,
+    ToolCall,
+    ToolResult,
+    UserPrompt,
+)
 
 
 def preprocess_history(history: list[HistoryItem | SystemPrompt]) -> list[HistoryItem | SystemPrompt]:
     """Preprocesses the history to remove orphan ToolCalls and ToolResults. Also, ToolResults
     are sorted after the ToolCalls to avoid Pydantic AI from failing to process the history.
 
+    The history is expected to be complete turns of the context kinds (see `HistoryRepo.get_last_n_turns`),
+    i.e., it is walked once and orphans are rare (e.g., ToolCalls of runs cancelled before the group commit).
+
     Args:
         history: list[HistoryItem | SystemPrompt] - The history to preprocess.
 
@@ -13,41 +22,30 @@ def preprocess_history(history: list[HistoryItem | SystemPrompt]) -> list[Histor
         list[HistoryItem | SystemPrompt] - The preprocessed history.
     """
 
-    preprocessed_history: list[HistoryItem | SystemPrompt] = []
-    tool_call_ids_to_results: dict[str, ToolResult] = {}
-
-    for tool_result in history:
-        # Extracting ToolResults up front to avoid having to iterate over the history
-        # for each ToolCall in the second pass through.
-        match tool_result:
-            case ToolResult():
-                tool_call_ids_to_results[tool_result.tool_call_id] = tool_result
-            case _:
-                pass
+    preprocessed_history: list[HistoryItem | SystemPrompt | None] = []
+    # The slot right after each ToolCall, filled by its ToolResult. Otherwise,
+    # Pydantic AI cannot process the history after mapping it in.
+    result_slots: dict[str, int] = {}
 
     for item in history:
         match item:
-            case SystemPrompt():
-                preprocessed_history.append(item)
-            case UserPrompt():
-                preprocessed_history.append(item)
-            case ThinkingStep():
-                # Skipping thinking steps
-                pass
-            case ModelResponse():
+            case SystemPrompt() | UserPrompt() | ModelResponse():
                 preprocessed_history.append(item)
             case ToolCall():
-                tool_call_id = item.tool_call_id
-                if tool_call_id in tool_call_ids_to_results:
-                    result = tool_call_ids_to_results[tool_call_id]
-                    # Only add the ToolCall if there is a result for it
-                    preprocessed_history.append(item)
-                    # Add the ToolResult directly after the ToolCall
-                    # otherwise, Pydantic AI cannot process the
-                    # history after mapping it in.
-                    preprocessed_history.append(result)
+                preprocessed_history.append(item)
+                preprocessed_history.append(None)
+                result_slots[item.tool_call_id] = len(preprocessed_history) - 1
             case ToolResult():
-                # Gets added with the ToolCall
+                # ToolResults without a ToolCall are skipped
+                if (slot := result_slots.get(item.tool_call_id)) is not None:
+                    preprocessed_history[slot] = item
+            case _:
+                # ThinkingSteps and ConversationSummaries (added as a SystemPrompt by the context builder)
                 pass
 
-    return preprocessed_history
+    # ToolCalls without a ToolResult are dropped along with their empty slot
+    return [
+        item
+        for i, item in enumerate(preprocessed_history)
+        if item is not None and not (isinstance(item, ToolCall) and preprocessed_history[i + 1] is None)
+    ]
@@ -27,6 +27,7 @@ class ModelRequestCurrentPart:
     """
 
     history_id: UUID
+    turn_id: UUID | None = None
     id: UUID | None = None
     state: PartState = PartState.NO_STREAM
     content: str = ""
@@ -116,6 +117,7 @@ class ModelRequestCurrentPart:
                     history_id=self.history_id,
                     created_at=time_ns(),
                     thoughts=self.content,
+                    turn_id=self.turn_id,
                 )
             case PartState.TALKING:
                 assert self.id is not None, "flow_item_id must be set when flushing a talking part"
@@ -124,6 +126,7 @@ class ModelRequestCurrentPart:
                     history_id=self.history_id,
                     created_at=time_ns(),
                     response=self.content,
+                    turn_id=self.turn_id,
                 )
             case PartState.TOOL_CALL_PREP:
                 raise ValueError("Tool call prep part should not be flushed")
@@ -12,6 +12,11 @@ class AIService(Protocol):
         last_n_history_items: int = 10,
         n_memory_items: int = 10,
         tool_sets: list[ToolSet] = [],
+        last_n_turns: int | None = None,
     ) -> AsyncIterator[StreamItem]:
         if False:
             yield ...  # Needed for type checking
+
+    async def wait_for_background_tasks(self):
+        """Waits for the work started by the agent runs that outlives them, e.g., conversation summaries."""
+        ...
@@ -1,8 +1,18 @@
 from textwrap import dedent
 from time import time_ns
+from typing import Sequence
 from uuid import UUID, uuid4
 
 from src.ai.models import SystemPrompt
+from src.history.models import (
+    ConversationSummary,
+    HistoryItem,
+    ModelResponse,
+    ThinkingStep,
+    ToolCall,
+    ToolResult,
+    UserPrompt,
+)
 from src.tools.models import ToolSet
 
 
@@ -74,3 +84,60 @@ class PromptsService:
                 {tool_set_system_prompt}
             """).strip(),
         )
+
+    @staticmethod
+    def get_conversation_summary_prompt(summary: ConversationSummary) -> SystemPrompt:
+        return SystemPrompt(
+            id=uuid4(),
+            history_id=summary.history_id,
+            created_at=time_ns(),
+            prompt=dedent("""
+                [# Summary of the Earlier Conversation #]
+
+                The following summarizes the conversation between the user and you (the assistant)
+                before the messages below.
+
+                <conversation_summary>
+            """).strip()
+            + f"\n{summary.summary}\n</conversation_summary>",
+        )
+
+    @staticmethod
+    def get_summarization_instructions() -> str:
+        return dedent("""
+            You maintain a running summary of a long conversation between a user and an assistant.
+            Merge the previous summary (if any) and the new messages into one updated summary.
+            Keep facts about the user, decisions, open tasks and results of tool calls. Drop small talk
+            and details that are superseded by later messages. Answer with the summary only, in at most
+            a few hundred words.
+        """).strip()
+
+    @staticmethod
+    def get_summarization_prompt(
+        previous_summary: ConversationSummary | None,
+        history_items: Sequence[HistoryItem],
+        max_chars_per_item: int = 2000,
+    ) -> str:
+        prompt_texts: list[str] = []
+        if previous_summary:
+            prompt_texts.append(f"<previous_summary>\n{previous_summary.summary}\n</previous_summary>")
+
+        message_texts: list[str] = []
+        for history_item in history_items:
+            match history_item:
+                case UserPrompt():
+                    message_texts.append(f"User: {history_item.prompt[:max_chars_per_item]}")
+                case ModelResponse():
+                    message_texts.append(f"Assistant: {history_item.response[:max_chars_per_item]}")
+                case ToolCall():
+                    message_texts.append(
+                        f"Tool call {history_item.tool_name}: {str(history_item.args)[:max_chars_per_item]}"
+                    )
+                case ToolResult():
+                    message_texts.append(
+                        f"Tool result {history_item.tool_name}: {str(history_item.result)[:max_chars_per_item]}"
+                    )
+                case ThinkingStep() | ConversationSummary():
+                    pass
+        prompt_texts.append("<new_messages>\n" + "\n\n".join(message_texts) + "\n</new_messages>")
+        return "\n\n".join(prompt_texts)
@@ -1,3 +1,4 @@
+from dataclasses import replace
 from time import time_ns
 from typing import AsyncIterator
 from uuid import UUID, uuid4
@@ -17,9 +18,10 @@ from src.ai.models import (
 )
 from src.ai.prompts import PromptsService
 from src.ai.pydantic_ai.mapper import PydanticAiMapper
+from src.ai.pydantic_ai.summarizer import PydanticAIConversationSummarizer
 from src.ai.pydantic_ai.tools import PydanticAIToolProvider
 from src.config.models import Config
-from src.history.models import HistoryItem, UserPrompt
+from src.history.models import HistoryItem, ModelResponse, ThinkingStep, UserPrompt
 from src.history.service import HistoryService
 from src.rag.port import RAGService
 from src.tools.models import ToolSet
@@ -39,21 +41,41 @@ class PydanticAIService:
         history_service: HistoryService,
         rag_service: RAGService | None,
         prompts_service: PromptsService,
+        summarizer: PydanticAIConversationSummarizer | None = None,
+        index_inline: bool = True,
     ):
+        """
+        Args:
+            index_inline: bool - Whether the UserPrompts are indexed by the RAG service before they are
+                streamed. Otherwise, they are indexed from the outbox in the background, see `IndexingOutboxWorker`.
+        """
         self._llm = llm
         self._history_service = history_service
         self._rag_service = rag_service
+        self._index_inline = index_inline
         self._prompts_service = prompts_service
+        self._summarizer = summarizer
+
+    async def wait_for_background_tasks(self):
+        if self._summarizer:
+            await self._summarizer.wait_for_pending()
 
-    async def _handle_user_prompt_node(self, node: UserPromptNode, history_id: UUID) -> AsyncIterator[StreamItem]:  # type: ignore
+    async def _handle_user_prompt_node(
+        self,
+        node: UserPromptNode,  # type: ignore
+        history_id: UUID,
+        turn_id: UUID,
+    ) -> AsyncIterator[StreamItem]:
         user_prompt = PydanticAiMapper.map_user_prompt_out(
             pai_user_prompt=node.user_prompt,
-            id=uuid4(),
+            id=turn_id,
             history_id=history_id,
         )
         if user_prompt:
+            # The UserPrompt starts the turn, i.e., its id is the turn id
+            user_prompt = replace(user_prompt, turn_id=turn_id)
             await self._history_service.add_history_item(user_prompt)
-            if self._rag_service:
+            if self._rag_service and self._index_inline:
                 await self._rag_service.add_history_items([user_prompt])
             yield user_prompt
 
@@ -62,10 +84,26 @@ class PydanticAIService:
         node: ModelRequestNode,  # type: ignore
         run: AgentRun,
         history_id: UUID,
+        turn_id: UUID,
+    ) -> AsyncIterator[StreamItem]:
+        async for item in self._stream_model_request_node(node=node, run=run, history_id=history_id, turn_id=turn_id):  # type: ignore
+            match item:
+                case ModelResponse() | ThinkingStep():
+                    await self._history_service.add_history_item(item)
+                case _:
+                    pass
+            yield item
+
+    async def _stream_model_request_node(
+        self,
+        node: ModelRequestNode,  # type: ignore
+        run: AgentRun,
+        history_id: UUID,
+        turn_id: UUID,
     ) -> AsyncIterator[StreamItem]:
         # A model request node => We can stream tokens from the model's request
         async with node.stream(run.ctx) as request_stream:  # type: ignore
-            current_part = ModelRequestCurrentPart(history_id=history_id)
+            current_part = ModelRequestCurrentPart(history_id=history_id, turn_id=turn_id)
 
             async for event in request_stream:
                 match event:
@@ -134,11 +172,17 @@ class PydanticAIService:
                         # Currently, streaming structured output is not supported, we use the TextPartDeltas directly.
                         pass
 
+            # The last part of the request is not followed by a part of another type, which would flush it
+            if current_part.state != PartState.TOOL_CALL_PREP:
+                if flushed_part := current_part.flush():
+                    yield flushed_part
+
     async def _handle_call_tools_node(
         self,
         node: CallToolsNode,  # type: ignore
         run: AgentRun,
         history_id: UUID,
+        turn_id: UUID,
     ) -> AsyncIterator[StreamItem]:
         # A handle-response node => The model returned some data, potentially calls a tool
         async with node.stream(run.ctx) as handle_stream:  # type: ignore
@@ -149,6 +193,7 @@ class PydanticAIService:
                         id=uuid4(),
                         history_id=history_id,
                     )
+                    tool_call = replace(tool_call, turn_id=turn_id)
                     await self._history_service.add_history_item(tool_call)
                     yield tool_call
                 elif isinstance(event, paim.FunctionToolResultEvent):
@@ -157,10 +202,14 @@ class PydanticAIService:
                         id=uuid4(),
                         history_id=history_id,
                     )
+                    tool_result = replace(tool_result, turn_id=turn_id)
                     await self._history_service.add_history_item(tool_result)
                     yield tool_result
 
     async def _handle_end_node(self, node: EndNode, run: AgentRun, history_id: UUID) -> AsyncIterator[StreamItem]:  # type: ignore
+        # Everything of this run is persisted (in one transaction when group commits are enabled)
+        # before the stream is reported as done.
+        await self._history_service.flush_history_items(final=True)
         yield StreamEnd(id=uuid4(), history_id=history_id, created_at=time_ns())
 
     async def stream_agent_run(
@@ -169,19 +218,37 @@ class PydanticAIService:
         last_n_history_items: int = 10,
         n_memory_items: int = 10,
         tool_sets: list[ToolSet] = [],
+        last_n_turns: int | None = None,
     ) -> AsyncIterator[StreamItem]:
         """
         Stream the agent run, yielding StreamItems that can be consumed by UI services.
+
+        The context window is made of the last `last_n_turns` complete turns if set,
+        otherwise of the last `last_n_history_items` items. With a summarizer, the turns
+        older than the window are replaced by a single ConversationSummary.
         """
         pai_user_prompt = user_prompt.prompt
         history_id = user_prompt.history_id
+        turn_id = user_prompt.id
 
-        history_items: list[HistoryItem | SystemPrompt] = list(
-            await self._history_service.get_last_n_history_items(
+        summary = None
+        if last_n_turns is not None and self._summarizer:
+            summary, window_items = await self._history_service.get_unsummarized_turns(
+                history_id=history_id,
+                max_n_turns=last_n_turns + self._summarizer.every_n_turns,
+            )
+        elif last_n_turns is not None:
+            # Kinds are filtered when reading, no slots are spent on ThinkingSteps
+            window_items = await self._history_service.get_last_n_turns(history_id=history_id, n_turns=last_n_turns)
+        else:
+            window_items = await self._history_service.get_last_n_history_items(
                 history_id=history_id,
                 n=last_n_history_items,
             )
-        )
+        history_items: list[HistoryItem | SystemPrompt] = list(window_items)
+
+        if summary:
+            history_items.insert(0, self._prompts_service.get_conversation_summary_prompt(summary))
 
         main_system_prompt = self._prompts_service.get_system_prompt(
             history_id=history_id,
@@ -203,17 +270,42 @@ class PydanticAIService:
         pai_toolsets = [PydanticAIToolProvider.get_pai_toolset(tool_set) for tool_set in tool_sets]
 
         agent = Agent(model=self._llm, toolsets=pai_toolsets)
-        async with agent.iter(pai_user_prompt, message_history=pai_history) as run:
-            async for node in run:
-                if Agent.is_user_prompt_node(node):
-                    async for item in self._handle_user_prompt_node(node=node, history_id=history_id):  # type: ignore
-                        yield item
-                elif Agent.is_model_request_node(node):
-                    async for item in self._handle_model_request_node(node=node, run=run, history_id=history_id):  # type: ignore
-                        yield item
-                elif Agent.is_call_tools_node(node):
-                    async for item in self._handle_call_tools_node(node=node, run=run, history_id=history_id):  # type: ignore
-                        yield item
-                elif Agent.is_end_node(node):
-                    async for item in self._handle_end_node(node=node, run=run, history_id=history_id):  # type: ignore
-                        yield item
+        try:
+            async with agent.iter(pai_user_prompt, message_history=pai_history) as run:
+                async for node in run:
+                    if Agent.is_user_prompt_node(node):
+                        async for item in self._handle_user_prompt_node(  # type: ignore
+                            node=node,  # type: ignore
+                            history_id=history_id,
+                            turn_id=turn_id,
+                        ):
+                            yield item
+                    elif Agent.is_model_request_node(node):
+                        async for item in self._handle_model_request_node(  # type: ignore
+                            node=node,  # type: ignore
+                            run=run,
+                            history_id=history_id,
+                            turn_id=turn_id,
+                        ):
+                            yield item
+                    elif Agent.is_call_tools_node(node):
+                        async for item in self._handle_call_tools_node(  # type: ignore
+                            node=node,  # type: ignore
+                            run=run,
+                            history_id=history_id,
+                            turn_id=turn_id,
+                        ):
+                            yield item
+                    elif Agent.is_end_node(node):
+                        async for item in self._handle_end_node(node=node, run=run, history_id=history_id):  # type: ignore
+                            yield item
+            if last_n_turns is not None and self._summarizer:
+                n_window_turns = sum(isinstance(item, UserPrompt) for item in window_items)
+                self._summarizer.schedule_if_due(
+                    history_id=history_id,
+                    keep_last_n_turns=last_n_turns,
+                    n_unsummarized_turns=n_window_turns + 1,  # Including this turn
+                )
+        finally:
+            # On errors and cancellations, persist what is complete and drop ToolCalls without ToolResult
+            await self._history_service.flush_history_items(final=True)
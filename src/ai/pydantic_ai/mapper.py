@@ -7,6 +7,7 @@ import pydantic_ai.messages as paim
 from src.ai.models import ModelResponseDelta, StreamItem, SystemPrompt, ThinkingDelta
 from src.core.logging import get_logger
 from src.history.models import (
+    ConversationSummary,
     HistoryItem,
     ModelResponse,
     ThinkingStep,
@@ -354,6 +355,9 @@ class PydanticAiMapper:
                 return PydanticAiMapper._map_tool_result_in(history_item)
             case ModelResponse():
                 return PydanticAiMapper._map_model_response_in(history_item)
+            case ConversationSummary():
+                # Not part of the message history, see `PromptsService.get_conversation_summary_prompt`
+                return None
 
     # History
     # --------------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import deque
+from time import time_ns
+from uuid import UUID, uuid4
+
+from pydantic_ai import Agent
+from pydantic_ai.models import Model
+
+from src.ai.prompts import PromptsService
+from src.history.models import CONTEXT_HISTORY_ITEM_KINDS, HISTORY_ITEM_TYPES_BY_KIND, ConversationSummary, HistoryItem
+from src.history.service import HistoryService
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_HISTORY_ITEM_TYPES = tuple(HISTORY_ITEM_TYPES_BY_KIND[kind] for kind in CONTEXT_HISTORY_ITEM_KINDS)
+
+
+class PydanticAIConversationSummarizer:
+    """Keeps a rolling ConversationSummary of everything older than the context window.
+
+    Once `keep_last_n_turns + every_n_turns` turns are not covered by the summary, the oldest of them
+    are folded into the previous summary in the background, i.e., off the critical path of the agent
+    run. The context window then holds between `keep_last_n_turns` and `keep_last_n_turns + every_n_turns`
+    raw turns, no matter how long the history is.
+    """
+
+    def __init__(
+        self,
+        llm: Model,
+        history_service: HistoryService,
+        prompts_service: PromptsService,
+        every_n_turns: int = 5,
+        max_items_per_summary: int = 500,
+    ):
+        self._llm = llm
+        self._history_service = history_service
+        self._prompts_service = prompts_service
+        self._every_n_turns = every_n_turns
+        self._max_items_per_summary = max_items_per_summary
+        self._tasks: dict[UUID, asyncio.Task[ConversationSummary | None]] = {}
+
+    @property
+    def every_n_turns(self) -> int:
+        return self._every_n_turns
+
+    def schedule_if_due(self, history_id: UUID, keep_last_n_turns: int, n_unsummarized_turns: int) -> bool:
+        """Starts a background summarization if enough turns are not covered by the summary yet.
+        Returns whether one has been started."""
+        if n_unsummarized_turns < keep_last_n_turns + self._every_n_turns:
+            return False
+        if (task := self._tasks.get(history_id)) and not task.done():
+            return False
+        self._tasks[history_id] = asyncio.create_task(self._summarize_in_background(history_id, keep_last_n_turns))
+        return True
+
+    async def wait_for_pending(self):
+        await asyncio.gather(*self._tasks.values())
+
+    async def _summarize_in_background(self, history_id: UUID, keep_last_n_turns: int) -> ConversationSummary | None:
+        try:
+            return await self.summarize(history_id, keep_last_n_turns)
+        except Exception as e:
+            # The turns stay unsummarized and are picked up by the next summarization
+            logger.error(f"Summarizing history {history_id} failed: {e}", exc_info=True)
+            return None
+
+    async def summarize(self, history_id: UUID, keep_last_n_turns: int) -> ConversationSummary | None:
+        """Folds all context items older than the last `keep_last_n_turns` turns that are not covered yet
+        into a new ConversationSummary. Returns `None` if there is nothing to summarize."""
+        previous_summary = await self._history_service.get_last_conversation_summary(history_id)
+        kept_items = await self._history_service.get_last_n_turns(history_id, n_turns=keep_last_n_turns)
+        if not kept_items:
+            return None
+        window_start = kept_items[0].created_at
+
+        # Only the most recent items are kept if a lot has to be summarized, e.g., the first time for
+        # an existing history. Everything before is left to the RAG memory.
+        new_items: deque[HistoryItem] = deque(maxlen=self._max_items_per_summary)
+        since = previous_summary.covers_until + 1 if previous_summary else None
+        async for batch in self._history_service.iter_history_items(history_id, since=since):
+            new_items.extend(
+                item
+                for item in batch
+                if item.created_at < window_start and isinstance(item, CONTEXT_HISTORY_ITEM_TYPES)
+            )
+            if batch[-1].created_at >= window_start:
+                break
+        if not new_items:
+            return None
+
+        agent = Agent(model=self._llm, instructions=self._prompts_service.get_summarization_instructions())
+        result = await agent.run(self._prompts_service.get_summarization_prompt(previous_summary, list(new_items)))
+        summary = ConversationSummary(
+            id=uuid4(),
+            history_id=history_id,
+            created_at=time_ns(),
+            summary=result.output,
+            covers_until=window_start - 1,
+        )
+        await self._history_service.add_history_item(summary)
+        await self._history_service.flush_history_items()
+        return summary
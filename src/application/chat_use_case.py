@@ -4,6 +4,7 @@ from uuid import UUID, uuid4
 
 from src.ai.models import StreamItem
 from src.ai.port import AIService
+from src.application.maintenance_scheduler import MaintenanceScheduler
 from src.history.models import UserPrompt
 from src.tools.models import ToolSet
 
@@ -16,12 +17,16 @@ class ChatUseCase:
         tool_sets: list[ToolSet],
         last_n_history_items: int = 10,
         n_memory_items: int = 10,
+        last_n_turns: int | None = None,
+        maintenance_scheduler: MaintenanceScheduler | None = None,
     ):
         self._ai_service = ai_service
         self._history_id = history_id
         self._tool_sets = tool_sets
         self._last_n_history_items = last_n_history_items
         self._n_memory_items = n_memory_items
+        self._last_n_turns = last_n_turns
+        self._maintenance_scheduler = maintenance_scheduler
 
     async def execute(self, prompt_text: str) -> AsyncIterator[StreamItem]:
         user_prompt = UserPrompt(
@@ -30,9 +35,14 @@ class ChatUseCase:
             created_at=time_ns(),
             prompt=prompt_text,
         )
-        return self._ai_service.stream_agent_run(
+        stream = self._ai_service.stream_agent_run(
             user_prompt,
             last_n_history_items=self._last_n_history_items,
             n_memory_items=self._n_memory_items,
             tool_sets=self._tool_sets,
+            last_n_turns=self._last_n_turns,
         )
+        if self._maintenance_scheduler:
+            # No maintenance job runs while the agent runs, i.e., until the stream is consumed
+            return self._maintenance_scheduler.hold_off_during(stream)
+        return stream
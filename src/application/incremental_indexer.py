@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import TypeGuard
+from uuid import UUID
+
+from src.history.models import HistoryItem, HistoryItemKey, ModelResponse, ToolResult
+from src.history.service import HistoryService
+from src.rag.port import RAGHistoryItem, RAGService
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+
+
+class IncrementalIndexer:
+    """Indexes the ModelResponses (and, optionally, the ToolResults) of a history into the RAG index,
+    walking the history from a persisted high-water mark, i.e., only the items written since the last
+    run. Items are embedded in batches of `batch_size`, the mark is saved after every batch.
+
+    UserPrompts are not walked, they are indexed right away (inline or through the outbox) to be
+    found by the next search.
+    """
+
+    def __init__(
+        self,
+        history_service: HistoryService,
+        rag_service: RAGService,
+        watermarks_path: Path,
+        batch_size: int = 256,
+        index_tool_results: bool = False,
+    ):
+        self._history_service = history_service
+        self._rag_service = rag_service
+        self._watermarks_path = watermarks_path
+        self._batch_size = batch_size
+        self._index_tool_results = index_tool_results
+        self._lock = asyncio.Lock()
+
+    def _load_watermarks(self) -> dict[str, list[int | str]]:
+        if not self._watermarks_path.exists():
+            return {}
+        return json.loads(self._watermarks_path.read_text())
+
+    def get_watermark(self, history_id: UUID) -> HistoryItemKey | None:
+        """The key of the last walked item, everything up to it is indexed."""
+        if watermark := self._load_watermarks().get(str(history_id)):
+            created_at, item_id = watermark
+            return int(created_at), UUID(str(item_id))
+        return None
+
+    def _save_watermark(self, history_id: UUID, watermark: HistoryItemKey | None):
+        watermarks = self._load_watermarks()
+        if watermark is None:
+            watermarks.pop(str(history_id), None)
+        else:
+            watermarks[str(history_id)] = [watermark[0], str(watermark[1])]
+        # Replaced atomically, i.e., a crash leaves the previous mark
+        self._watermarks_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._watermarks_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(watermarks))
+        os.replace(tmp_path, self._watermarks_path)
+
+    def reset(self, history_id: UUID):
+        """The next catch-up walks the whole history again."""
+        self._save_watermark(history_id, None)
+
+    def _is_indexed(self, history_item: HistoryItem) -> TypeGuard[RAGHistoryItem]:
+        if isinstance(history_item, ToolResult):
+            # Retries only hold the error message sent back to the model
+            return self._index_tool_results and not history_item.is_retry
+        return isinstance(history_item, ModelResponse)
+
+    async def catch_up(self, history_id: UUID, max_items: int | None = None) -> int:
+        """Indexes the items written since the last catch-up (up to about `max_items`) and returns their
+        number. Returns right away if a catch-up is running already."""
+        if self._lock.locked():
+            return 0
+        async with self._lock:
+            watermark = self.get_watermark(history_id)
+            batch: list[RAGHistoryItem] = []
+            n_indexed = 0
+            async for page in self._history_service.iter_history_items(
+                history_id, batch_size=PAGE_SIZE, after=watermark
+            ):
+                for history_item in page:
+                    if self._is_indexed(history_item):
+                        batch.append(history_item)
+                    watermark = (history_item.created_at, history_item.id)
+                    if len(batch) >= self._batch_size:
+                        await self._index_batch(history_id, batch, watermark)
+                        n_indexed += len(batch)
+                        batch = []
+                if max_items is not None and n_indexed >= max_items:
+                    break
+            # The rest, and the mark past the trailing items that are not indexed
+            await self._index_batch(history_id, batch, watermark)
+            n_indexed += len(batch)
+        if n_indexed:
+            logger.info(f"RAG: Indexed {n_indexed} items of {history_id} since the last run.")
+        return n_indexed
+
+    async def _index_batch(self, history_id: UUID, batch: list[RAGHistoryItem], watermark: HistoryItemKey | None):
+        if batch:
+            # ToolResults stored as blobs are read deferred (a preview), their summaries need the whole result
+            batch = await self._history_service.resolve_deferred_payloads(batch)
+            # One embedding request for the whole batch
+            await self._rag_service.add_history_items(batch)
+        if watermark is not None:
+            self._save_watermark(history_id, watermark)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from contextlib import suppress
+from dataclasses import dataclass
+from time import time_ns
+
+from src.history.models import IndexingOutboxEntry
+from src.history.port import IndexingOutbox
+from src.rag.port import RAGHistoryItem, RAGService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IndexingOutboxWorkerStats:
+    n_indexed: int = 0
+    n_failed_attempts: int = 0  # Entries of failed batches, counted once per attempt
+
+
+class IndexingOutboxWorker:
+    """Indexes the items of the outbox (see `IndexingOutbox`) in the background, in batches of up to
+    `batch_size` items, i.e., the embedding and upsert of a UserPrompt never delay the streamed response.
+
+    A failed batch is retried with an exponential backoff (from `min_backoff_s` up to `max_backoff_s`),
+    its entries stay in the outbox until they are indexed. The outbox is polled every `poll_interval_s`.
+    """
+
+    def __init__(
+        self,
+        outbox: IndexingOutbox,
+        rag_service: RAGService,
+        batch_size: int = 64,
+        poll_interval_s: float = 1.0,
+        min_backoff_s: float = 1.0,
+        max_backoff_s: float = 300.0,
+    ):
+        self._outbox = outbox
+        self._rag_service = rag_service
+        self._batch_size = batch_size
+        self._poll_interval_s = poll_interval_s
+        self._min_backoff_s = min_backoff_s
+        self._max_backoff_s = max_backoff_s
+        self._task: asyncio.Task[None] | None = None
+        self.stats = IndexingOutboxWorkerStats()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def drain(self):
+        """Indexes the due entries batch by batch until none are left or a batch fails."""
+        while await self._index_batch():
+            pass
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.drain()
+            except Exception:
+                # E.g., a locked database, the entries are still in the outbox on the next poll
+                logger.exception("RAG: Reading the indexing outbox failed.")
+            await asyncio.sleep(self._poll_interval_s)
+
+    def _get_backoff_s(self, entries: list[IndexingOutboxEntry]) -> float:
+        attempts = max(entry.attempts for entry in entries)
+        return min(self._min_backoff_s * 2**attempts, self._max_backoff_s)
+
+    async def _index_batch(self) -> bool:
+        """Returns whether the next batch may follow right away."""
+        entries = await self._outbox.get_outbox_entries(limit=self._batch_size)
+        if not entries:
+            return False
+        history_items = [entry.history_item for entry in entries if isinstance(entry.history_item, RAGHistoryItem)]
+        try:
+            if history_items:
+                await self._rag_service.add_history_items(history_items)
+        except Exception as e:
+            backoff_s = self._get_backoff_s(entries)
+            logger.warning(f"RAG: Indexing {len(entries)} items failed, retrying in {backoff_s:.0f}s: {e}")
+            await self._outbox.retry_outbox_entries(entries, str(e), time_ns() + int(backoff_s * 1e9))
+            self.stats.n_failed_attempts += len(entries)
+            # The other entries likely fail as well, they are attempted on the next poll
+            return False
+        await self._outbox.complete_outbox_entries(entries)
+        self.stats.n_indexed += len(entries)
+        outbox_stats = await self._outbox.get_outbox_stats()
+        lag_s = (time_ns() - outbox_stats.oldest_created_at) / 1e9 if outbox_stats.oldest_created_at else 0.0
+        logger.debug(f"RAG: Indexed {len(entries)} items, {outbox_stats.depth} waiting (lag {lag_s:.1f}s).")
+        return True
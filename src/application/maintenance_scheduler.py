@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass
+from time import monotonic, perf_counter
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class MaintenanceJob:
+    name: str
+    run: Callable[[], Awaitable[object]]  # The result (if not `None`) is logged along with the duration
+    interval_s: float
+
+
+@dataclass(frozen=True)
+class MaintenanceJobRun:
+    name: str
+    duration_ms: float
+    result: object
+    error: str | None = None
+
+
+class MaintenanceScheduler:
+    """Runs maintenance jobs (e.g., ANALYZE, incremental VACUUM, WAL checkpoints) in the idle gaps
+    between agent runs, one at a time. Every job runs in the first idle gap after startup and then
+    every `interval_s`.
+
+    Agent runs are wrapped in `active()` (see `ChatUseCase`). A job only starts once no run has been
+    active for `idle_delay_s`, and a run starting while a job is running waits for it to complete,
+    i.e., jobs and runs never overlap.
+    """
+
+    def __init__(self, jobs: list[MaintenanceJob], idle_delay_s: float = 30.0):
+        self._jobs = jobs
+        self._idle_delay_s = idle_delay_s
+        self._lock = asyncio.Lock()
+        self._last_active_at = monotonic()
+        self._next_run_at = {job.name: 0.0 for job in jobs}
+        self._last_runs: dict[str, MaintenanceJobRun] = {}
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def last_runs(self) -> dict[str, MaintenanceJobRun]:
+        return dict(self._last_runs)
+
+    @asynccontextmanager
+    async def active(self) -> AsyncGenerator[None, None]:
+        """Holds off the jobs, waiting for a running one to complete first."""
+        async with self._lock:
+            try:
+                yield
+            finally:
+                self._last_active_at = monotonic()
+
+    async def hold_off_during(self, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Holds off the jobs until the stream is exhausted (or closed)."""
+        async with self.active():
+            async for item in stream:
+                yield item
+
+    def start(self):
+        if self._task is None and self._jobs:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            job = min(self._jobs, key=lambda job: self._next_run_at[job.name])
+            await asyncio.sleep(max(self._next_run_at[job.name] - monotonic(), 0))
+            await self._wait_until_idle()
+            # No await between the idle check and taking the lock, i.e., no run can start in between
+            async with self._lock:
+                await self._run_job(job)
+
+    async def _wait_until_idle(self):
+        while True:
+            if self._lock.locked():
+                # Until the active run ends, which restarts the idle delay
+                async with self._lock:
+                    pass
+                continue
+            idle_for_s = monotonic() - self._last_active_at
+            if idle_for_s >= self._idle_delay_s:
+                return
+            await asyncio.sleep(self._idle_delay_s - idle_for_s)
+
+    async def _run_job(self, job: MaintenanceJob):
+        start = perf_counter()
+        result: object = None
+        error: str | None = None
+        try:
+            result = await job.run()
+        except Exception as e:
+            # A failing job must not stop the others, it is retried after its interval
+            logger.exception(f"Maintenance: {job.name} failed.")
+            error = str(e)
+        job_run = MaintenanceJobRun(job.name, duration_ms=(perf_counter() - start) * 1000, result=result, error=error)
+        if error is None:
+            result_text = f" ({result})" if result is not None else ""
+            logger.info(f"Maintenance: {job.name} took {job_run.duration_ms:.1f}ms{result_text}.")
+        self._last_runs[job.name] = job_run
+        self._next_run_at[job.name] = monotonic() + job.interval_s
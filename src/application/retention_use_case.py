@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from time import time_ns
+from typing import Sequence
+from uuid import UUID
+
+from src.config.models import RetentionConfig
+from src.history.models import NS_PER_DAY, HistoryItemKey, HistoryItemKind
+from src.history.service import HistoryService
+from src.rag.port import RAGService
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionUseCase:
+    """Applies the retention rules to a history, oldest items first, in batches of `batch_size` items
+    with one transaction each. Every deleted batch is mirrored in the RAG index, i.e., both stay
+    bounded and in sync. Running it again continues where an interrupted run stopped."""
+
+    def __init__(
+        self,
+        history_service: HistoryService,
+        config: RetentionConfig,
+        rag_service: RAGService | None = None,
+        pause_between_batches_s: float = 0.01,
+    ):
+        self._history_service = history_service
+        self._config = config
+        self._rag_service = rag_service
+        self._pause_between_batches_s = pause_between_batches_s
+
+    async def execute(self, history_id: UUID) -> int:
+        """Returns the number of deleted history items."""
+        now = time_ns()
+        n_deleted = 0
+        for rule in self._config.rules:
+            created_before = now - int(rule.max_age_days * NS_PER_DAY)
+            n_deleted += await self._delete_in_batches(history_id, created_before, [HistoryItemKind(rule.kind)])
+
+        if self._config.max_items_per_history is not None:
+            oldest_dropped_key = await self._history_service.get_nth_last_history_item_key(
+                history_id, self._config.max_items_per_history + 1
+            )
+            if oldest_dropped_key:
+                n_deleted += await self._delete_in_batches(
+                    history_id, oldest_dropped_key[0] + 1, kinds=None, up_to=oldest_dropped_key
+                )
+
+        if n_deleted:
+            logger.info(f"Retention: Deleted {n_deleted} history items of {history_id}.")
+        return n_deleted
+
+    async def _delete_in_batches(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None,
+        up_to: HistoryItemKey | None = None,
+    ) -> int:
+        n_deleted = 0
+        while True:
+            deleted_keys = await self._history_service.delete_history_items(
+                history_id, created_before, kinds, limit=self._config.batch_size, up_to=up_to
+            )
+            if deleted_keys and self._rag_service:
+                # Up to the newest deleted item only, i.e., the index never runs ahead of the database
+                await self._rag_service.delete_history_items(history_id, deleted_keys[-1][0] + 1, kinds)
+            n_deleted += len(deleted_keys)
+            if len(deleted_keys) < self._config.batch_size:
+                return n_deleted
+            # Lets the chat (and its writes) proceed between the batches
+            await asyncio.sleep(self._pause_between_batches_s)
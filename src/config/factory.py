@@ -4,7 +4,27 @@ from uuid import UUID, uuid4
 
 from dotenv import load_dotenv
 
-from src.config.models import ChatConfig, Config, EmbedderConfig, LoggingConfig, OllamaConfig, OpenAIConfig
+from src.config.models import (
+    BlobStorageConfig,
+    ChatConfig,
+    Config,
+    ConversationSummaryConfig,
+    DatabaseConfig,
+    EmbedderConfig,
+    EmbeddingCacheConfig,
+    HistoryConfig,
+    HotTailCacheConfig,
+    HybridSearchConfig,
+    IncrementalIndexerConfig,
+    IndexingOutboxConfig,
+    LoggingConfig,
+    MaintenanceConfig,
+    OllamaConfig,
+    OpenAIConfig,
+    QdrantConfig,
+    SqliteProfile,
+    StructureChunkerConfig,
+)
 from src.core.exceptions import InvalidConfigurationError
 
 load_dotenv()
@@ -31,8 +51,43 @@ class InlineConfigProvider:
         return Config(
             # UI
             ui="console",
+            # Database
+            database_config=DatabaseConfig(
+                path=Path("data/database.db"),
+                profile=SqliteProfile(),
+                separate_read_engine=True,
+                shards_path=None,
+                # shards_path=Path("data/history_shards"),
+                shards_search_max=12,
+            ),
             # History
             history_id=InlineConfigProvider._get_history_id(),
+            history_config=HistoryConfig(
+                group_commit_window_s=0.5,
+                hot_tail_cache=HotTailCacheConfig(
+                    max_items_per_history=200,
+                    max_bytes_per_history=4 * 1024 * 1024,
+                    max_histories=8,
+                ),
+                segment_log=None,
+                # segment_log=SegmentLogConfig(
+                #     path=Path("data/history"),
+                #     max_segment_bytes=64 * 1024 * 1024,
+                #     fsync=False,
+                # ),
+                blob_storage=BlobStorageConfig(threshold_bytes=16 * 1024, compression="zlib"),
+                # Deletes items for good, from the database and the RAG index
+                retention=None,
+                # retention=RetentionConfig(
+                #     rules=(
+                #         RetentionRuleConfig(kind="thinking_step", max_age_days=30),
+                #         # ToolCalls are kept, those without results are dropped from the model context
+                #         RetentionRuleConfig(kind="tool_result", max_age_days=90),
+                #     ),
+                #     max_items_per_history=500_000,
+                #     batch_size=500,
+                # ),
+            ),
             # LLM
             # llm_config=ollama_config or openai_config,
             llm_config=openai_config or ollama_config,
@@ -40,12 +95,39 @@ class InlineConfigProvider:
             # ollama_model_name="ministral-3:3b",
             # RAG
             qdrant_url="http://localhost:6333",
+            # Without the container (see scripts/run-qudrant.sh), e.g., Path("data/qdrant_embedded")
+            qdrant_path=None,
+            qdrant_config=QdrantConfig(
+                upsert_batch_size=256,
+                wait_for_upserts=False,
+                hybrid_search=HybridSearchConfig(tokenizer_path=Path("data/qdrant_tokenizers"), prefetch_limit=50),
+            ),
+            # E.g., for a single conversation of up to a few million chunks, without running Qdrant
+            # numpy_index_config=NumpyIndexConfig(path=Path("data/numpy_index"), dtype="float32"),
+            numpy_index_config=None,
             embedder_config=EmbedderConfig(
                 base_url=InlineConfigProvider._get_embedder_base_url(),
                 api_key=InlineConfigProvider._get_embedder_api_key(),
                 model_name="text-embedding-3-small",
                 chunk_max_chars=16000,  # Model can do 8192 tokens, i.e., we should be safe with 16k chars
                 chunk_overlap_chars=1600,
+                # The estimate errs on the high side, i.e., about 6k stays below the 8192 tokens of the model.
+                # Items indexed by the `CharChunker` before keep their chunks until they are indexed again:
+                # python -m src.rag.reindex (replaces their chunks, deleting the stale ones)
+                structure_chunker=StructureChunkerConfig(max_tokens=6000, overlap_tokens=600),
+                max_batch_size=2048,
+                max_batch_chars=600_000,  # About 150k tokens, OpenAI allows 300k per request
+            ),
+            embedding_cache_config=EmbeddingCacheConfig(
+                path=Path("data/embedding_cache"),
+                max_bytes=256 * 1024 * 1024,  # About 43k embeddings of text-embedding-3-small
+            ),
+            indexing_outbox_config=IndexingOutboxConfig(batch_size=64, poll_interval_s=1.0, max_backoff_s=300.0),
+            incremental_indexer_config=IncrementalIndexerConfig(
+                watermarks_path=Path("data/rag_watermarks.json"),
+                batch_size=64,
+                index_tool_results=True,
+                catch_up_interval_s=60.0,
             ),
             # Logging
             logging=LoggingConfig(
@@ -59,7 +141,21 @@ class InlineConfigProvider:
             # Chat
             chat_config=ChatConfig(
                 last_n_history_items=10,
+                last_n_turns=5,
                 n_memory_items=10,
+                conversation_summary=ConversationSummaryConfig(
+                    every_n_turns=5,
+                    max_items_per_summary=500,
+                ),
+            ),
+            # Maintenance
+            maintenance_config=MaintenanceConfig(
+                idle_delay_s=30.0,
+                analyze_interval_s=24 * 60 * 60,
+                vacuum_interval_s=60 * 60,
+                vacuum_max_pages=2048,  # 8 MiB with the default page size
+                wal_checkpoint_interval_s=10 * 60,
+                rag_optimize_interval_s=24 * 60 * 60,
             ),
         )
 
@@ -3,6 +3,8 @@ from pathlib import Path
 from typing import Literal
 from uuid import UUID
 
+from src.core.exceptions import InvalidConfigurationError
+
 
 @dataclass(frozen=True)
 class LoggingConfig:
@@ -31,6 +33,14 @@ class OllamaConfig:
     model_name: str
 
 
+@dataclass(frozen=True)
+class StructureChunkerConfig:
+    """Chunks at the paragraphs, sentences and code blocks of the texts, see `StructureChunker`."""
+
+    max_tokens: int  # Estimated, see `estimate_tokens`
+    overlap_tokens: int
+
+
 @dataclass(frozen=True)
 class EmbedderConfig:
     """Embedder config.
@@ -43,6 +53,178 @@ class EmbedderConfig:
     model_name: str
     chunk_max_chars: int
     chunk_overlap_chars: int
+    # Instead of the fixed `chunk_max_chars` slices. Existing points keep their chunks, i.e., index the history
+    # again after switching (`python -m src.rag.reindex`, which deletes the stale chunks).
+    structure_chunker: StructureChunkerConfig | None
+    # Limits of a single embedding request of the provider, larger batches are split
+    max_batch_size: int  # Inputs
+    max_batch_chars: int  # Characters of all inputs, stands in for the provider's token limit
+
+
+@dataclass(frozen=True)
+class HybridSearchConfig:
+    """Dense plus BM25-style sparse vectors, fused by reciprocal rank (RRF), see `SparseEncoder`."""
+
+    tokenizer_path: Path  # The directory of the tokenizer settings and statistics per collection
+    prefetch_limit: int  # Candidates of each vector that are fused, at least the `top_k` of a search
+
+
+@dataclass(frozen=True)
+class QdrantConfig:
+    """Qdrant (RAG index) config."""
+
+    upsert_batch_size: int  # Points sent per upsert request
+    # Waiting until upserted points are searchable puts the indexing on the latency path of every turn
+    wait_for_upserts: bool
+    # `None` searches the dense vectors only. Applies to new collections, i.e., an existing one is searched
+    # dense-only until it is recreated (`python -m src.rag.reindex --recreate`).
+    hybrid_search: HybridSearchConfig | None
+
+
+@dataclass(frozen=True)
+class NumpyIndexConfig:
+    """In-process RAG index (instead of Qdrant), see `NumpyRAGService`."""
+
+    path: Path  # The directory of the vector file and the payloads per history
+    # float16 halves the memory (and the page cache) per vector, but every query converts the rows to float32,
+    # i.e., takes about 5x as long (see `benchmarks/rag_search.py`)
+    dtype: Literal["float32", "float16"]
+
+
+@dataclass(frozen=True)
+class EmbeddingCacheConfig:
+    """Persistent cache of the embeddings in front of the embedder, see `EmbeddingCache`."""
+
+    path: Path  # The directory of the vector files and their SQLite index
+    max_bytes: int  # Vector bytes kept, the least-recently-used embeddings are evicted beyond
+
+
+@dataclass(frozen=True)
+class IndexingOutboxConfig:
+    """Background indexing of the history into the RAG index, see `IndexingOutboxWorker`."""
+
+    batch_size: int  # Items embedded and upserted at once
+    poll_interval_s: float  # Upper bound of the time until a new item is indexed (plus the group commit window)
+    max_backoff_s: float  # Upper bound of the delay between retries of a failing batch
+
+
+@dataclass(frozen=True)
+class IncrementalIndexerConfig:
+    """Indexing of the ModelResponses (and ToolResults) from a high-water mark, see `IncrementalIndexer`."""
+
+    watermarks_path: Path  # JSON file of the high-water mark per history
+    batch_size: int  # Items embedded per request
+    index_tool_results: bool  # Embeds a compact summary of each ToolResult
+    # Between the catch-ups in the idle gaps (requires `maintenance_config`), one batch each.
+    # At startup, everything since the last run is indexed.
+    catch_up_interval_s: float
+
+
+@dataclass(frozen=True)
+class SqliteProfile:
+    """SQLite pragmas applied once per pooled connection."""
+
+    journal_mode: Literal["WAL", "DELETE"] = "WAL"  # WAL lets readers proceed while the writer commits
+    synchronous: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"  # NORMAL is durable enough in WAL mode
+    mmap_size: int = 256 * 1024 * 1024  # Bytes of the database file to memory-map
+    cache_size: int = -64 * 1024  # Page cache per connection, negative values are KiB
+    # INCREMENTAL lets the maintenance return free pages in small steps. Only takes effect for new
+    # database files, existing ones keep their mode until a full VACUUM.
+    auto_vacuum: Literal["NONE", "INCREMENTAL"] = "INCREMENTAL"
+
+
+@dataclass(frozen=True)
+class DatabaseConfig:
+    """Database config."""
+
+    path: Path
+    profile: SqliteProfile | None  # `None` keeps the SQLite defaults (rollback journal, FULL sync)
+    separate_read_engine: bool  # Reads use their own read-only engine and connection pool
+    # If set, the history is stored in one database file per month in this directory instead of `path`.
+    # Shards always read through a separate read-only engine.
+    shards_path: Path | None
+    shards_search_max: int  # The keyword search covers (opens) the most recent shards only
+
+
+@dataclass(frozen=True)
+class HotTailCacheConfig:
+    """In-memory cache of the most recent history items, see `HotTailCache`."""
+
+    max_items_per_history: int
+    max_bytes_per_history: int
+    max_histories: int
+
+
+@dataclass(frozen=True)
+class BlobStorageConfig:
+    """Large ToolResult and ThinkingStep payloads are stored compressed and deduplicated in a separate table."""
+
+    threshold_bytes: int  # Payloads with more (JSON) bytes are moved out of the item rows
+    compression: Literal["zlib", "zstd"]  # zstd requires the "zstandard" package
+
+
+@dataclass(frozen=True)
+class SegmentLogConfig:
+    """Append-only segment files instead of the database, see `SegmentLogHistoryRepo`."""
+
+    path: Path  # One directory per history below this path
+    max_segment_bytes: int  # A new segment file is started once the current one exceeds this size
+    fsync: bool  # Syncs every append to disk, otherwise an OS crash may lose the last appends
+
+
+@dataclass(frozen=True)
+class RetentionRuleConfig:
+    """Items of `kind` older than `max_age_days` are deleted."""
+
+    kind: Literal["user_prompt", "model_response", "thinking_step", "tool_call", "tool_result", "conversation_summary"]
+    max_age_days: float
+
+
+@dataclass(frozen=True)
+class RetentionConfig:
+    """Pruning of old history items and their RAG points, see `RetentionUseCase`."""
+
+    rules: tuple[RetentionRuleConfig, ...]
+    max_items_per_history: int | None  # Only the most recent items are kept, `None` keeps all
+    batch_size: int  # Items deleted per transaction, keeps the writer lock short
+
+
+@dataclass(frozen=True)
+class HistoryConfig:
+    """History persistence config."""
+
+    # Batches the writes of an agent run into one transaction, flushed at the end of the run
+    # or after this many seconds. `None` writes every history item in its own transaction.
+    group_commit_window_s: float | None
+    hot_tail_cache: HotTailCacheConfig | None  # `None` reads every window from the database
+    segment_log: SegmentLogConfig | None  # `None` stores the history in the database
+    blob_storage: BlobStorageConfig | None  # Database only, `None` stores all payloads inline
+    retention: RetentionConfig | None  # Database only, applied at startup. `None` keeps everything.
+
+    def __post_init__(self):
+        # The segment log is append-only, see `PrunableHistoryRepo`
+        if self.segment_log and self.retention:
+            raise InvalidConfigurationError("Retention is not supported by the segment log, disable one of them.")
+
+
+@dataclass(frozen=True)
+class MaintenanceConfig:
+    """Database and RAG index upkeep in the idle gaps between agent runs, see `MaintenanceScheduler`."""
+
+    idle_delay_s: float  # Jobs only start after this long without an agent run
+    analyze_interval_s: float  # Refreshes the statistics of the query planner
+    vacuum_interval_s: float  # Returns free pages to the file system (`auto_vacuum = INCREMENTAL` only)
+    vacuum_max_pages: int  # Pages returned per run, bounds how long the writer lock is held
+    wal_checkpoint_interval_s: float  # Truncates the WAL file
+    rag_optimize_interval_s: float  # Lets the RAG index compact itself
+
+
+@dataclass(frozen=True)
+class ConversationSummaryConfig:
+    """Rolling summary of the turns older than the context window, see `PydanticAIConversationSummarizer`."""
+
+    every_n_turns: int  # The number of turns that are folded into the summary at once
+    max_items_per_summary: int  # Upper bound of the items sent to the LLM per summary
 
 
 @dataclass(frozen=True)
@@ -50,7 +232,11 @@ class ChatConfig:
     """Chat config."""
 
     last_n_history_items: int  # The number of history items to use for each chat iteration
+    last_n_turns: int | None  # If set, the number of complete turns to use instead of `last_n_history_items`
     n_memory_items: int  # The number of memory items to use for each chat iteration
+    # Requires `last_n_turns`. The window then holds `last_n_turns` to `last_n_turns + every_n_turns`
+    # turns, everything older is covered by the summary. `None` disables summaries.
+    conversation_summary: ConversationSummaryConfig | None
 
 
 @dataclass(frozen=True)
@@ -60,18 +246,34 @@ class Config:
     # UI
     ui: Literal["console"]
 
+    # Database
+    database_config: DatabaseConfig
+
     # History
     history_id: UUID
+    history_config: HistoryConfig
 
     # LLM
     llm_config: OpenAIConfig | OllamaConfig
 
     # RAG
     qdrant_url: str | None
+    # Embedded Qdrant (local mode) in the process instead of the server at `qdrant_url`, a storage directory or
+    # ":memory:" (nothing persisted, e.g., for tests). A directory is locked by one process at a time.
+    qdrant_path: Path | Literal[":memory:"] | None
+    qdrant_config: QdrantConfig
+    numpy_index_config: NumpyIndexConfig | None  # Takes precedence over Qdrant, i.e., no Qdrant is needed
     embedder_config: EmbedderConfig
+    embedding_cache_config: EmbeddingCacheConfig | None  # `None` embeds every text remotely
+    # Database only. `None` indexes every UserPrompt before it is streamed, i.e., on the latency path
+    indexing_outbox_config: IndexingOutboxConfig | None
+    incremental_indexer_config: IncrementalIndexerConfig | None  # `None` only indexes the UserPrompts
 
     # Logging
     logging: LoggingConfig
 
     # Chat
     chat_config: ChatConfig
+
+    # Maintenance, `None` disables it
+    maintenance_config: MaintenanceConfig | None
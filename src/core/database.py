@@ -1,27 +1,171 @@
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Callable, Sequence
 
-from sqlalchemy import text
+from sqlalchemy import Connection, event, text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlmodel import SQLModel
 
+from src.config.models import SqliteProfile
+
 SessionContext = AsyncGenerator[AsyncSession, None]
+# An in-place schema upgrade. Migrations also run on freshly created (already up-to-date)
+# databases, i.e., they have to be idempotent.
+Migration = Callable[[Connection], None]
+
+SYNCHRONOUS_LEVELS = {"OFF": 0, "NORMAL": 1, "FULL": 2}
+AUTO_VACUUM_MODES = {"NONE": 0, "FULL": 1, "INCREMENTAL": 2}
+REPORTED_PRAGMAS = [
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "auto_vacuum",
+    "foreign_keys",
+    "query_only",
+]
+
 
+def _get_connection_pragmas(profile: SqliteProfile | None, read_only: bool) -> list[str]:
+    # Pragmas are per connection (except journal_mode, which is persisted in the database file)
+    pragmas = ["PRAGMA foreign_keys = ON"]
+    if profile:
+        if not read_only:
+            # Only applies to a new database file, i.e., before the journal mode is written to it
+            pragmas.append(f"PRAGMA auto_vacuum = {profile.auto_vacuum}")
+            pragmas.append(f"PRAGMA journal_mode = {profile.journal_mode}")
+        pragmas.append(f"PRAGMA synchronous = {profile.synchronous}")
+        pragmas.append(f"PRAGMA mmap_size = {profile.mmap_size}")
+        pragmas.append(f"PRAGMA cache_size = {profile.cache_size}")
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
 
-def get_engine(path: Path = Path("./data/database.db")) -> AsyncEngine:
-    return create_async_engine(
-        f"sqlite+aiosqlite:///{path}",
+
+def get_engine(
+    path: Path = Path("./data/database.db"),
+    profile: SqliteProfile | None = None,
+    read_only: bool = False,
+) -> AsyncEngine:
+    """Creates an aiosqlite engine.
+
+    Args:
+        path: Path - The path of the SQLite database file.
+        profile: SqliteProfile | None - The pragmas to apply to each new pooled connection.
+        read_only: bool - Open the database read-only (it has to exist already). Use this for
+            a separate reader pool, which (in WAL mode) never waits behind the writer.
+    """
+    url = f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true" if read_only else f"sqlite+aiosqlite:///{path}"
+    engine = create_async_engine(
+        url,
         echo=False,
         pool_pre_ping=True,  # Verify connections are alive before using
         pool_recycle=3600,  # Recycle connections after 1 hour
         connect_args={"timeout": 30},  # Connection timeout
     )
 
+    pragmas = _get_connection_pragmas(profile=profile, read_only=read_only)
+
+    # Applied once per pooled connection instead of once per session
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection: Any, connection_record: Any):  # type: ignore[reportUnusedFunction]
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+async def get_sqlite_pragmas(engine: AsyncEngine) -> dict[str, Any]:
+    """Reports the pragmas that are active on a pooled connection of the engine."""
+    pragmas: dict[str, Any] = {}
+    async with engine.connect() as conn:
+        for pragma in REPORTED_PRAGMAS:
+            result = await conn.execute(text(f"PRAGMA {pragma}"))
+            pragmas[pragma] = result.scalar_one_or_none()
+    return pragmas
+
+
+def get_sqlite_profile_mismatches(pragmas: dict[str, Any], profile: SqliteProfile) -> dict[str, tuple[Any, Any]]:
+    """Compares the active pragmas with the profile, returning `{pragma: (expected, active)}`."""
+    expected: dict[str, Any] = {
+        "journal_mode": profile.journal_mode.lower(),
+        "synchronous": SYNCHRONOUS_LEVELS[profile.synchronous],
+        "mmap_size": profile.mmap_size,
+        "cache_size": profile.cache_size,
+        "auto_vacuum": AUTO_VACUUM_MODES[profile.auto_vacuum],
+    }
+    return {pragma: (value, pragmas.get(pragma)) for pragma, value in expected.items() if pragmas.get(pragma) != value}
+
+
+async def analyze_database(engine: AsyncEngine, analysis_limit: int = 1000):
+    """Refreshes the statistics of the query planner, sampling about `analysis_limit` rows per index
+    (`0` reads all rows). Plans are otherwise based on the table sizes at the time of the last ANALYZE."""
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql(f"PRAGMA analysis_limit = {analysis_limit}")
+        await conn.exec_driver_sql("ANALYZE")
+        await conn.commit()
+
+
+async def vacuum_database_incrementally(engine: AsyncEngine, max_pages: int) -> int:
+    """Returns up to `max_pages` free pages to the file system and the number of returned pages.
+    A no-op for databases that were not created with `auto_vacuum = INCREMENTAL`."""
+    async with engine.connect() as conn:
+        if (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar_one() != AUTO_VACUUM_MODES["INCREMENTAL"]:
+            return 0
+        n_free_pages = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar_one()
+        # Frees one page per step of the statement, i.e., all its (empty) rows have to be fetched
+        driver_conn = (await conn.get_raw_connection()).driver_connection
+        assert driver_conn is not None
+        cursor = await driver_conn.execute(f"PRAGMA incremental_vacuum({max_pages})")
+        await cursor.fetchall()
+        await conn.commit()
+        return n_free_pages - (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar_one()
+
+
+async def checkpoint_database_wal(engine: AsyncEngine) -> bool:
+    """Copies the WAL into the database file and truncates it, returns whether it completed, i.e.,
+    was not blocked by active readers. Automatic checkpoints never shrink the WAL file."""
+    async with engine.connect() as conn:
+        is_busy, _, _ = (await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")).one()
+        await conn.commit()
+        return not is_busy
+
+
+def _create_missing_indexes(conn: Connection):
+    # `create_all` only creates indexes together with new tables, so indexes added to
+    # existing tables later on would otherwise never reach databases created before.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _run_migrations(conn: Connection, migrations: Sequence[Migration]):
+    # The schema version is tracked in SQLite's `user_version`, i.e., the number of applied migrations.
+    # Every migration is committed together with its version. Long ones may commit in between as well,
+    # i.e., an interrupted migration is run again and continues where it stopped.
+    schema_version = conn.exec_driver_sql("PRAGMA user_version").scalar_one()
+    for version, migration in enumerate(migrations[schema_version:], start=schema_version + 1):
+        migration(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+        conn.commit()
+
+
+async def get_schema_version(engine: AsyncEngine) -> int:
+    """The number of migrations applied to the database, see `create_db_and_tables`."""
+    async with engine.connect() as conn:
+        return (await conn.exec_driver_sql("PRAGMA user_version")).scalar_one()
+
 
-async def create_db_and_tables(engine: AsyncEngine):
-    async with engine.begin() as conn:
+async def create_db_and_tables(engine: AsyncEngine, migrations: Sequence[Migration] = ()):
+    """Creates missing tables, upgrades existing ones with the pending `migrations` and creates missing indexes."""
+    async with engine.connect() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.commit()
+        await conn.run_sync(_run_migrations, migrations)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.commit()
 
 
 @asynccontextmanager
@@ -33,9 +177,6 @@ async def get_session(engine: AsyncEngine) -> SessionContext:
     )
     try:
         await session.begin()
-        # Enable foreign key constraints in SQLite for each session
-        if engine.dialect.name == "sqlite":
-            await session.execute(text("PRAGMA foreign_keys = ON"))
         yield session
         await session.commit()
     except Exception as e:
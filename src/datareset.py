@@ -5,15 +5,16 @@ from shutil import rmtree
 from sqlalchemy import delete
 
 from src.core.database import create_db_and_tables, get_engine, get_session
-from src.history.async_sqlalchemy.models import HistoryDb, HistoryItemDb
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.async_sqlalchemy.models import HistoryBlobDb, HistoryDb, HistoryItemDb
 
 # Order matters because of foreign key constraints
-DBMODELS_TO_DELETE = [HistoryItemDb, HistoryDb]
+DBMODELS_TO_DELETE = [HistoryItemDb, HistoryBlobDb, HistoryDb]
 
 
 async def reset_database():
     engine = get_engine()
-    await create_db_and_tables(engine)
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
 
     async with get_session(engine) as session:
         for model in DBMODELS_TO_DELETE:
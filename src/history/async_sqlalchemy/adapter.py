@@ -1,23 +1,124 @@
 from time import time_ns
+from typing import Iterable, Sequence, cast
 from uuid import UUID
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncEngine
-from sqlalchemy.orm import joinedload
+from sqlalchemy import Float, String, case, column, delete, exists, func, insert, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import aliased, joinedload
 from sqlmodel import col
 
 from src.core.database import get_session
-from src.history.async_sqlalchemy.mapper import map_history_item_to_db, map_history_item_to_domain
-from src.history.async_sqlalchemy.models import HistoryDb
-from src.history.models import History, HistoryItem
+from src.history.async_sqlalchemy.blobs import (
+    BlobCompression,
+    decompress_blob,
+    defer_blob_payload,
+    get_blob_hash,
+    get_deferred_payload,
+    move_large_payloads_to_blobs,
+    resolve_deferred_payload,
+)
+from src.history.async_sqlalchemy.mapper import (
+    HistoryItemColumns,
+    map_history_item_to_domain,
+    map_history_items_to_db_rows,
+)
+from src.history.async_sqlalchemy.migrations import create_rag_outbox_trigger, drop_rag_outbox_trigger
+from src.history.async_sqlalchemy.models import HistoryBlobDb, HistoryDb, HistoryItemDb, RagOutboxDb
+from src.history.models import (
+    CONTEXT_HISTORY_ITEM_KINDS,
+    History,
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    HistorySearchHit,
+    IndexingOutboxEntry,
+    IndexingOutboxStats,
+    ToolCall,
+    ToolStats,
+)
+
+
+def _select_history_item_rows():
+    # Plain Core rows, building ORM instances would dominate the cost of reading many items
+    return select(
+        col(HistoryItemDb.id),
+        col(HistoryItemDb.history_id),
+        col(HistoryItemDb.created_at),
+        col(HistoryItemDb.turn_id),
+        col(HistoryItemDb.kind),
+        col(HistoryItemDb.content),
+    )
+
+
+def _to_fts5_query(query: str) -> str:
+    # Every term is quoted, i.e., FTS5 operators and punctuation in identifiers, error codes and file
+    # names are matched literally instead of being parsed as query syntax. Any term may match, BM25
+    # ranks the items matching more (and rarer) terms first.
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def _map_history_item_rows_to_domain(rows: Sequence[HistoryItemColumns]) -> list[HistoryItem]:
+    # Payloads moved to blobs are deferred, i.e., reading (scanning, searching, exporting) many items
+    # never reads nor decompresses their blobs
+    return [
+        map_history_item_to_domain(row, defer_blob_payload(row.kind, row.content))
+        if get_blob_hash(row.kind, row.content)
+        else map_history_item_to_domain(row)
+        for row in rows
+    ]
+
+
+async def _resolve_deferred_payloads(session: AsyncSession, history_items: Sequence[HistoryItem]) -> list[HistoryItem]:
+    # The blobs of the given items only, in one query
+    blob_hashes = {payload.ref for history_item in history_items if (payload := get_deferred_payload(history_item))}
+    if not blob_hashes:
+        return list(history_items)
+    query = select(col(HistoryBlobDb.hash), col(HistoryBlobDb.compression), col(HistoryBlobDb.data)).where(
+        col(HistoryBlobDb.hash).in_(blob_hashes)
+    )
+    result = await session.execute(query)
+    blobs = {blob.hash: decompress_blob(blob.data, blob.compression) for blob in result.all()}
+    return [
+        resolve_deferred_payload(history_item, blobs[payload.ref])
+        if (payload := get_deferred_payload(history_item))
+        else history_item
+        for history_item in history_items
+    ]
+
+
+async def _delete_unreferenced_blobs(session: AsyncSession, blob_hashes: Iterable[str]):
+    # Via the primary key, the `ref_count` of a blob is kept by triggers on `history_items`
+    await session.execute(
+        delete(HistoryBlobDb).where(col(HistoryBlobDb.hash).in_(blob_hashes), col(HistoryBlobDb.ref_count) <= 0)
+    )
 
 
 class AsyncSqlalchemyHistoryRepo:
-    def __init__(self, engine: AsyncEngine):
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        read_engine: AsyncEngine | None = None,
+        blob_threshold_bytes: int | None = None,
+        blob_compression: BlobCompression = "zlib",
+    ):
+        """
+        Args:
+            blob_threshold_bytes: int | None - ToolResults and ThinkingSteps with larger (JSON) payloads are
+                stored compressed in `history_blobs`, identical payloads once. `None` stores all payloads inline.
+        """
         self._engine = engine
+        # A separate (read-only) engine keeps reads from waiting behind the writer
+        self._read_engine = read_engine or engine
+        self._blob_threshold_bytes = blob_threshold_bytes
+        self._blob_compression: BlobCompression = blob_compression
+
+    @property
+    def writer_engines(self) -> list[AsyncEngine]:
+        """The engines of the database files, e.g., for their maintenance."""
+        return [self._engine]
 
     async def _find_history_db_by_id_eager(self, history_id: UUID) -> History | None:
-        async with get_session(self._engine) as session:
+        async with get_session(self._read_engine) as session:
             query = select(HistoryDb).where(col(HistoryDb.id) == history_id).options(joinedload(HistoryDb.items))  # type: ignore
             result = await session.execute(query)
             history_db = result.unique().scalar_one_or_none()
@@ -26,9 +127,18 @@ class AsyncSqlalchemyHistoryRepo:
             return History(
                 id=history_db.id,
                 created_at=history_db.created_at,
-                items=[map_history_item_to_domain(item) for item in history_db.items],
+                items=_map_history_item_rows_to_domain(history_db.items),
             )
 
+    async def get_history(self, history_id: UUID) -> History | None:
+        """Returns the history with all of its items if it exists, without creating it."""
+        return await self._find_history_db_by_id_eager(history_id)
+
+    async def count_items(self, history_id: UUID) -> int:
+        async with get_session(self._read_engine) as session:
+            query = select(func.count()).where(col(HistoryItemDb.history_id) == history_id)
+            return (await session.execute(query)).scalar_one()
+
     async def _add_history(self, history_db: HistoryDb):
         async with get_session(self._engine) as session:
             session.add(history_db)
@@ -45,7 +155,374 @@ class AsyncSqlalchemyHistoryRepo:
             await self._add_history(history_db)
         return history
 
+    async def create_history_if_not_exists(self, history_id: UUID) -> None:
+        async with get_session(self._engine) as session:
+            query = select(col(HistoryDb.id)).where(col(HistoryDb.id) == history_id)
+            result = await session.execute(query)
+            if result.scalar_one_or_none() is None:
+                session.add(HistoryDb(id=history_id, created_at=time_ns()))
+
+    async def get_last_n_items(self, history_id: UUID, n: int) -> list[HistoryItem]:
+        if n <= 0:
+            return []
+        async with get_session(self._read_engine) as session:
+            # Served by the (history_id, created_at) index, i.e., independent of the total history size
+            query = (
+                _select_history_item_rows()
+                .where(col(HistoryItemDb.history_id) == history_id)
+                .order_by(col(HistoryItemDb.created_at).desc(), col(HistoryItemDb.id).desc())
+                .limit(n)
+            )
+            result = await session.execute(query)
+            rows = cast(list[HistoryItemColumns], result.all())
+            # The tail is mapped into the model context, i.e., with its payloads
+            return await _resolve_deferred_payloads(session, _map_history_item_rows_to_domain(rows[::-1]))
+
+    async def get_last_n_turns(
+        self,
+        history_id: UUID,
+        n_turns: int,
+        kinds: Sequence[HistoryItemKind] = CONTEXT_HISTORY_ITEM_KINDS,
+    ) -> list[HistoryItem]:
+        if n_turns <= 0:
+            return []
+        async with get_session(self._read_engine) as session:
+            # A turn starts with its UserPrompt, whose id is the turn id
+            last_turn_ids = (
+                select(col(HistoryItemDb.id))
+                .where(
+                    col(HistoryItemDb.history_id) == history_id,
+                    col(HistoryItemDb.kind) == HistoryItemKind.USER_PROMPT.value,
+                )
+                .order_by(col(HistoryItemDb.created_at).desc())
+                .limit(n_turns)
+            )
+            query = (
+                _select_history_item_rows()
+                .where(
+                    col(HistoryItemDb.history_id) == history_id,
+                    col(HistoryItemDb.turn_id).in_(last_turn_ids),
+                    col(HistoryItemDb.kind).in_([kind.value for kind in kinds]),
+                )
+                .order_by(col(HistoryItemDb.created_at), col(HistoryItemDb.id))
+            )
+            result = await session.execute(query)
+            history_items = _map_history_item_rows_to_domain(cast(list[HistoryItemColumns], result.all()))
+            # The turns are mapped into the model context, i.e., with their payloads
+            return await _resolve_deferred_payloads(session, history_items)
+
+    async def get_last_item_of_kind(self, history_id: UUID, kind: HistoryItemKind) -> HistoryItem | None:
+        async with get_session(self._read_engine) as session:
+            # Seeks to the end of the kind's range in the (history_id, kind, created_at) index
+            query = (
+                _select_history_item_rows()
+                .where(col(HistoryItemDb.history_id) == history_id, col(HistoryItemDb.kind) == kind.value)
+                .order_by(col(HistoryItemDb.created_at).desc(), col(HistoryItemDb.id).desc())
+                .limit(1)
+            )
+            result = await session.execute(query)
+            rows = cast(list[HistoryItemColumns], result.all())
+            items = _map_history_item_rows_to_domain(rows)
+            return items[0] if items else None
+
+    async def get_items_page(
+        self,
+        history_id: UUID,
+        after: HistoryItemKey | None = None,
+        since: int | None = None,
+        limit: int = 1000,
+    ) -> list[HistoryItem]:
+        async with get_session(self._read_engine) as session:
+            query = _select_history_item_rows().where(col(HistoryItemDb.history_id) == history_id)
+            if since is not None:
+                query = query.where(col(HistoryItemDb.created_at) >= since)
+            if after is not None:
+                # Keyset pagination: seeks via the (history_id, created_at) index instead of skipping OFFSET rows
+                after_created_at, after_id = after
+                # (The redundant `>=` lets SQLite use the index for a range seek despite the OR)
+                query = query.where(
+                    col(HistoryItemDb.created_at) >= after_created_at,
+                    or_(col(HistoryItemDb.created_at) > after_created_at, col(HistoryItemDb.id) > after_id),
+                )
+            query = query.order_by(col(HistoryItemDb.created_at), col(HistoryItemDb.id)).limit(limit)
+            result = await session.execute(query)
+            return _map_history_item_rows_to_domain(cast(list[HistoryItemColumns], result.all()))
+
+    async def resolve_deferred_payloads(self, history_items: Sequence[HistoryItem]) -> list[HistoryItem]:
+        async with get_session(self._read_engine) as session:
+            return await _resolve_deferred_payloads(session, history_items)
+
+    async def query_items(
+        self,
+        history_id: UUID,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        limit: int = 1000,
+        newest_first: bool = False,
+    ) -> list[HistoryItem]:
+        if limit <= 0:
+            return []
+        async with get_session(self._read_engine) as session:
+            # A range seek in the (history_id, kind, created_at) index per kind, or in the
+            # (history_id, created_at) one for all kinds
+            query = _select_history_item_rows().where(col(HistoryItemDb.history_id) == history_id)
+            if kinds is not None:
+                query = query.where(col(HistoryItemDb.kind).in_([kind.value for kind in kinds]))
+            if since is not None:
+                query = query.where(col(HistoryItemDb.created_at) >= since)
+            if until is not None:
+                query = query.where(col(HistoryItemDb.created_at) < until)
+            if newest_first:
+                query = query.order_by(col(HistoryItemDb.created_at).desc(), col(HistoryItemDb.id).desc())
+            else:
+                query = query.order_by(col(HistoryItemDb.created_at), col(HistoryItemDb.id))
+            result = await session.execute(query.limit(limit))
+            return _map_history_item_rows_to_domain(cast(list[HistoryItemColumns], result.all()))
+
+    async def search_items(self, history_id: UUID, query: str, limit: int = 10) -> list[HistorySearchHit]:
+        fts5_query = _to_fts5_query(query)
+        if not fts5_query or limit <= 0:
+            return []
+        async with get_session(self._read_engine) as session:
+            # The full-text index is kept in sync by triggers, see `migrations._add_history_items_fts`.
+            # Its hidden `rank` column is BM25, ordering by it is cheaper than by `bm25()`.
+            search_query = text(
+                """
+                SELECT items.id, items.history_id, items.created_at, items.turn_id, items.kind, items.content,
+                    history_items_fts.rank AS rank,
+                    snippet(history_items_fts, 0, '[', ']', '...', 24) AS snippet
+                FROM history_items_fts
+                JOIN history_items AS items ON items.rowid = history_items_fts.rowid
+                WHERE history_items_fts MATCH :query AND history_items_fts.history_id = :history_id
+                ORDER BY history_items_fts.rank
+                LIMIT :limit
+                """
+            ).columns(
+                col(HistoryItemDb.id),
+                col(HistoryItemDb.history_id),
+                col(HistoryItemDb.created_at),
+                col(HistoryItemDb.turn_id),
+                col(HistoryItemDb.kind),
+                col(HistoryItemDb.content),
+                column("rank", Float),
+                column("snippet", String),
+            )
+            result = await session.execute(
+                search_query,
+                {"query": fts5_query, "history_id": history_id.hex, "limit": limit},
+            )
+            rows = result.all()
+            items = _map_history_item_rows_to_domain(cast(list[HistoryItemColumns], rows))
+            return [HistorySearchHit(item=item, rank=row.rank, snippet=row.snippet) for item, row in zip(items, rows)]
+
     async def add_history_item(self, history_item: HistoryItem):
+        await self.add_history_items([history_item])
+
+    async def add_history_items(self, history_items: Sequence[HistoryItem], skip_existing: bool = False):
+        if not history_items:
+            return
+        statement = insert(HistoryItemDb)
+        if skip_existing:
+            statement = statement.prefix_with("OR IGNORE")
+        rows = map_history_items_to_db_rows(history_items)
+        blob_rows = (
+            move_large_payloads_to_blobs(rows, self._blob_threshold_bytes, self._blob_compression)
+            if self._blob_threshold_bytes is not None
+            else []
+        )
+        async with get_session(self._engine) as session:
+            if blob_rows:
+                # Content-addressed, i.e., a stored blob holds the same payload already. The references are
+                # counted by triggers on `history_items`, see `migrations._count_blob_references`.
+                await session.execute(insert(HistoryBlobDb).prefix_with("OR IGNORE"), blob_rows)
+            # A single Core `executemany` insert in a single transaction, i.e., a single commit (fsync)
+            await session.execute(statement, rows)
+            if blob_rows and skip_existing:
+                # The blobs of skipped items only, which no item references
+                await _delete_unreferenced_blobs(session, [blob_row["hash"] for blob_row in blob_rows])
+
+    async def get_nth_last_item_key(self, history_id: UUID, n: int) -> HistoryItemKey | None:
+        if n <= 0:
+            return None
+        async with get_session(self._read_engine) as session:
+            # Walks the (history_id, created_at) index backwards, i.e., costs `n` index entries
+            query = (
+                select(col(HistoryItemDb.created_at), col(HistoryItemDb.id))
+                .where(col(HistoryItemDb.history_id) == history_id)
+                .order_by(col(HistoryItemDb.created_at).desc(), col(HistoryItemDb.id).desc())
+                .offset(n - 1)
+                .limit(1)
+            )
+            row = (await session.execute(query)).one_or_none()
+            return (row.created_at, row.id) if row else None
+
+    async def delete_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        limit: int = 1000,
+        up_to: HistoryItemKey | None = None,
+    ) -> list[HistoryItemKey]:
+        if limit <= 0:
+            return []
+        oldest_ids = (
+            select(col(HistoryItemDb.id))
+            .where(col(HistoryItemDb.history_id) == history_id, col(HistoryItemDb.created_at) < created_before)
+            .order_by(col(HistoryItemDb.created_at), col(HistoryItemDb.id))
+            .limit(limit)
+        )
+        if up_to is not None:
+            # Items created at the same ns are ordered by their ids
+            up_to_created_at, up_to_id = up_to
+            oldest_ids = oldest_ids.where(
+                col(HistoryItemDb.created_at) <= up_to_created_at,
+                or_(col(HistoryItemDb.created_at) < up_to_created_at, col(HistoryItemDb.id) <= up_to_id),
+            )
+        if kinds is not None:
+            oldest_ids = oldest_ids.where(col(HistoryItemDb.kind).in_([kind.value for kind in kinds]))
+        statement = (
+            delete(HistoryItemDb)
+            .where(col(HistoryItemDb.id).in_(oldest_ids))
+            .returning(
+                col(HistoryItemDb.created_at),
+                col(HistoryItemDb.id),
+                col(HistoryItemDb.kind),
+                col(HistoryItemDb.content),
+            )
+        )
+        async with get_session(self._engine) as session:
+            # The full-text index is cleaned up by its delete trigger
+            deleted_rows = (await session.execute(statement)).all()
+            # Blobs are shared by all items with the same payload, i.e., only the ones of the deleted items that
+            # are not referenced anymore are deleted
+            blob_hashes = {blob_hash for row in deleted_rows if (blob_hash := get_blob_hash(row.kind, row.content))}
+            if blob_hashes:
+                await _delete_unreferenced_blobs(session, blob_hashes)
+        return sorted((row.created_at, row.id) for row in deleted_rows)
+
+    async def get_tool_stats(self, history_id: UUID) -> list[ToolStats]:
+        """Calls, results and orphans per tool, most called first. Pairs the items via the
+        (history_id, tool_call_id) index, i.e., without loading them."""
+        calls = aliased(HistoryItemDb, name="calls")
+        results = aliased(HistoryItemDb, name="results")
+        query = (
+            select(
+                col(calls.tool_name),
+                func.count(col(calls.id).distinct()).label("n_calls"),
+                func.count(col(results.id)).label("n_results"),
+                func.sum(case((col(results.id).is_(None), 1), else_=0)).label("n_orphan_calls"),
+                func.avg(col(results.content_length)).label("mean_result_length"),
+            )
+            .outerjoin(
+                results,
+                (col(results.history_id) == col(calls.history_id))
+                & (col(results.tool_call_id) == col(calls.tool_call_id))
+                & (col(results.kind) == HistoryItemKind.TOOL_RESULT.value),
+            )
+            .where(col(calls.history_id) == history_id, col(calls.kind) == HistoryItemKind.TOOL_CALL.value)
+            .group_by(col(calls.tool_name))
+            .order_by(func.count(col(calls.id).distinct()).desc())
+        )
+        async with get_session(self._read_engine) as session:
+            result = await session.execute(query)
+            return [
+                ToolStats(
+                    tool_name=row.tool_name,
+                    n_calls=row.n_calls,
+                    n_results=row.n_results,
+                    n_orphan_calls=row.n_orphan_calls,
+                    mean_result_length=row.mean_result_length,
+                )
+                for row in result.all()
+            ]
+
+    async def get_orphan_tool_calls(
+        self, history_id: UUID, limit: int = 100, since: int | None = None
+    ) -> list[ToolCall]:
+        """The oldest ToolCalls (created at or after `since`) without any ToolResult."""
+        results = aliased(HistoryItemDb, name="results")
+        has_result = exists().where(
+            col(results.history_id) == col(HistoryItemDb.history_id),
+            col(results.tool_call_id) == col(HistoryItemDb.tool_call_id),
+            col(results.kind) == HistoryItemKind.TOOL_RESULT.value,
+        )
+        query = (
+            _select_history_item_rows()
+            .where(
+                col(HistoryItemDb.history_id) == history_id,
+                col(HistoryItemDb.kind) == HistoryItemKind.TOOL_CALL.value,
+                ~has_result,
+            )
+            .order_by(col(HistoryItemDb.created_at), col(HistoryItemDb.id))
+            .limit(limit)
+        )
+        if since is not None:
+            query = query.where(col(HistoryItemDb.created_at) >= since)
+        async with get_session(self._read_engine) as session:
+            result = await session.execute(query)
+            rows = cast(list[HistoryItemColumns], result.all())
+            return [item for item in _map_history_item_rows_to_domain(rows) if isinstance(item, ToolCall)]
+
+    async def get_tool_result_lengths(self, history_id: UUID, tool_call_ids: Sequence[str]) -> dict[str, list[int]]:
+        """The `content_length` of the ToolResults of the given calls, by `tool_call_id`."""
+        query = select(col(HistoryItemDb.tool_call_id), col(HistoryItemDb.content_length)).where(
+            col(HistoryItemDb.history_id) == history_id,
+            col(HistoryItemDb.tool_call_id).in_(tool_call_ids),
+            col(HistoryItemDb.kind) == HistoryItemKind.TOOL_RESULT.value,
+        )
+        lengths: dict[str, list[int]] = {}
+        async with get_session(self._read_engine) as session:
+            for row in (await session.execute(query)).all():
+                lengths.setdefault(row.tool_call_id, []).append(row.content_length or 0)
+        return lengths
+
+    async def set_outbox_enabled(self, is_enabled: bool) -> None:
+        async with self._engine.begin() as conn:
+            if is_enabled:
+                await conn.run_sync(create_rag_outbox_trigger)
+            else:
+                await conn.run_sync(drop_rag_outbox_trigger)
+                # Nothing drains them, i.e., they would pile up
+                await conn.execute(delete(RagOutboxDb))
+
+    async def get_outbox_entries(self, limit: int = 100) -> list[IndexingOutboxEntry]:
+        query = (
+            _select_history_item_rows()
+            .add_columns(col(RagOutboxDb.attempts))
+            .join(RagOutboxDb, col(RagOutboxDb.history_item_id) == col(HistoryItemDb.id))
+            .where(col(RagOutboxDb.next_attempt_at) <= time_ns())
+            .order_by(col(RagOutboxDb.created_at))
+            .limit(limit)
+        )
+        async with get_session(self._read_engine) as session:
+            rows = (await session.execute(query)).all()
+            history_items = _map_history_item_rows_to_domain(cast(list[HistoryItemColumns], rows))
+            return [
+                IndexingOutboxEntry(history_item=history_item, attempts=row.attempts)
+                for history_item, row in zip(history_items, rows)
+            ]
+
+    async def complete_outbox_entries(self, entries: Sequence[IndexingOutboxEntry]) -> None:
+        history_item_ids = [entry.history_item.id for entry in entries]
         async with get_session(self._engine) as session:
-            history_item_db = map_history_item_to_db(history_item)
-            session.add(history_item_db)
+            await session.execute(delete(RagOutboxDb).where(col(RagOutboxDb.history_item_id).in_(history_item_ids)))
+
+    async def retry_outbox_entries(
+        self, entries: Sequence[IndexingOutboxEntry], error: str, next_attempt_at: int
+    ) -> None:
+        history_item_ids = [entry.history_item.id for entry in entries]
+        statement = (
+            update(RagOutboxDb)
+            .where(col(RagOutboxDb.history_item_id).in_(history_item_ids))
+            .values(attempts=col(RagOutboxDb.attempts) + 1, last_error=error, next_attempt_at=next_attempt_at)
+        )
+        async with get_session(self._engine) as session:
+            await session.execute(statement)
+
+    async def get_outbox_stats(self) -> IndexingOutboxStats:
+        query = select(func.count(), func.min(col(RagOutboxDb.created_at)))
+        async with get_session(self._read_engine) as session:
+            depth, oldest_created_at = (await session.execute(query)).one()
+            return IndexingOutboxStats(depth=depth, oldest_created_at=oldest_created_at)
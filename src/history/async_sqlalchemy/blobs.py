@@ -0,0 +1,103 @@
+import hashlib
+import json
+import zlib
+from dataclasses import replace
+from typing import Any, Literal, Sequence
+
+from src.history.models import DeferredPayload, HistoryItem, HistoryItemKind, ThinkingStep, ToolResult
+
+BlobCompression = Literal["zlib", "zstd"]
+
+# The payload field of the kinds that may grow large. Above the threshold, the `content` of the item holds
+# `<field>_blob` (the SHA-256 of the payload) and a `<field>_preview` for the full-text index instead.
+BLOB_FIELDS_BY_KIND = {
+    HistoryItemKind.TOOL_RESULT.value: "result",
+    HistoryItemKind.THINKING_STEP.value: "thoughts",
+}
+BLOB_PREVIEW_CHARS = 2000
+
+
+def _compress(data: bytes, compression: BlobCompression) -> bytes:
+    match compression:
+        case "zlib":
+            return zlib.compress(data, level=6)
+        case "zstd":
+            try:
+                import zstandard  # type: ignore
+            except ImportError as e:
+                raise ImportError('zstd compression requires the "zstandard" package, use zlib otherwise.') from e
+            return zstandard.ZstdCompressor().compress(data)  # type: ignore
+
+
+def decompress_blob(data: bytes, compression: str) -> bytes:
+    match compression:
+        case "zlib":
+            return zlib.decompress(data)
+        case "zstd":
+            import zstandard  # type: ignore
+
+            return zstandard.ZstdDecompressor().decompress(data)  # type: ignore
+        case _:
+            raise ValueError(f"Unexpected blob compression: {compression}")
+
+
+def move_large_payloads_to_blobs(
+    rows: Sequence[dict[str, Any]], threshold_bytes: int, compression: BlobCompression
+) -> list[dict[str, Any]]:
+    """Replaces the payloads above `threshold_bytes` in the `content` of the item rows by their hash
+    and returns the (deduplicated) blob rows to insert."""
+    blob_rows: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        field = BLOB_FIELDS_BY_KIND.get(row["kind"])
+        if field is None:
+            continue
+        payload = row["content"][field]
+        data = json.dumps(payload).encode()
+        if len(data) <= threshold_bytes:
+            continue
+        blob_hash = hashlib.sha256(data).hexdigest()
+        if blob_hash not in blob_rows:
+            blob_rows[blob_hash] = {
+                "hash": blob_hash,
+                "compression": compression,
+                "size": len(data),
+                "data": _compress(data, compression),
+            }
+        content = {key: value for key, value in row["content"].items() if key != field}
+        content[f"{field}_blob"] = blob_hash
+        content[f"{field}_preview"] = (payload if isinstance(payload, str) else data.decode())[:BLOB_PREVIEW_CHARS]
+        row["content"] = content
+    return list(blob_rows.values())
+
+
+def get_blob_hash(kind: str, content: dict[str, Any]) -> str | None:
+    field = BLOB_FIELDS_BY_KIND.get(kind)
+    return content.get(f"{field}_blob") if field else None
+
+
+def defer_blob_payload(kind: str, content: dict[str, Any]) -> dict[str, Any]:
+    """The `content` of an item with its blob replaced by a `DeferredPayload` of the preview, i.e., without
+    reading the blob."""
+    field = BLOB_FIELDS_BY_KIND[kind]
+    deferred = {key: value for key, value in content.items() if key not in (f"{field}_blob", f"{field}_preview")}
+    deferred[field] = DeferredPayload(content[f"{field}_preview"], ref=content[f"{field}_blob"])
+    return deferred
+
+
+def get_deferred_payload(history_item: HistoryItem) -> DeferredPayload | None:
+    match history_item:
+        case ToolResult(result=DeferredPayload() as payload) | ThinkingStep(thoughts=DeferredPayload() as payload):
+            return payload
+        case _:
+            return None
+
+
+def resolve_deferred_payload(history_item: HistoryItem, data: bytes) -> HistoryItem:
+    """The item with its deferred payload replaced by the (decompressed) blob."""
+    match history_item:
+        case ToolResult():
+            return replace(history_item, result=json.loads(data))
+        case ThinkingStep():
+            return replace(history_item, thoughts=json.loads(data))
+        case _:
+            raise ValueError(f"Unexpected history item with a deferred payload: {history_item}")
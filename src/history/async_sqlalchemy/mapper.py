@@ -1,5 +1,9 @@
+from typing import Any, Protocol, Sequence
+from uuid import UUID
+
 from src.history.async_sqlalchemy.models import HistoryItemDb
 from src.history.models import (
+    ConversationSummary,
     HistoryItem,
     HistoryItemKind,
     ModelResponse,
@@ -7,103 +11,163 @@ from src.history.models import (
     ToolCall,
     ToolResult,
     UserPrompt,
+    get_payload_length,
 )
 
 
-def map_history_item_to_db(history_item: HistoryItem) -> HistoryItemDb:
+class HistoryItemColumns(Protocol):
+    """The columns of a `HistoryItemDb`, i.e., either an ORM instance or a plain Core row."""
+
+    @property
+    def id(self) -> UUID: ...
+    @property
+    def history_id(self) -> UUID: ...
+    @property
+    def created_at(self) -> int: ...
+    @property
+    def turn_id(self) -> UUID | None: ...
+    @property
+    def kind(self) -> str: ...
+    @property
+    def content(self) -> dict[str, Any]: ...
+
+
+def _map_history_item_kind_and_content_to_db(history_item: HistoryItem) -> tuple[HistoryItemKind, dict[str, Any]]:
     match history_item:
         case UserPrompt():
-            return HistoryItemDb(
-                id=history_item.id,
-                history_id=history_item.history_id,
-                created_at=history_item.created_at,
-                kind=HistoryItemKind.USER_PROMPT.value,
-                content={"prompt": history_item.prompt},
-            )
+            return HistoryItemKind.USER_PROMPT, {"prompt": history_item.prompt}
         case ModelResponse():
-            return HistoryItemDb(
-                id=history_item.id,
-                history_id=history_item.history_id,
-                created_at=history_item.created_at,
-                kind=HistoryItemKind.MODEL_RESPONSE.value,
-                content={"response": history_item.response},
-            )
+            return HistoryItemKind.MODEL_RESPONSE, {"response": history_item.response}
         case ThinkingStep():
-            return HistoryItemDb(
-                id=history_item.id,
-                history_id=history_item.history_id,
-                created_at=history_item.created_at,
-                kind=HistoryItemKind.THINKING_STEP.value,
-                content={"thoughts": history_item.thoughts},
-            )
+            return HistoryItemKind.THINKING_STEP, {"thoughts": history_item.thoughts}
         case ToolCall():
-            return HistoryItemDb(
-                id=history_item.id,
-                history_id=history_item.history_id,
-                created_at=history_item.created_at,
-                kind=HistoryItemKind.TOOL_CALL.value,
-                content={
-                    "tool_call_id": history_item.tool_call_id,
-                    "tool_name": history_item.tool_name,
-                    "args": history_item.args,
-                },
-            )
+            return HistoryItemKind.TOOL_CALL, {
+                "tool_call_id": history_item.tool_call_id,
+                "tool_name": history_item.tool_name,
+                "args": history_item.args,
+            }
         case ToolResult():
-            return HistoryItemDb(
-                id=history_item.id,
-                history_id=history_item.history_id,
-                created_at=history_item.created_at,
-                kind=HistoryItemKind.TOOL_RESULT.value,
-                content={
-                    "tool_call_id": history_item.tool_call_id,
-                    "tool_name": history_item.tool_name,
-                    "is_retry": history_item.is_retry,
-                    "result": history_item.result,
-                },
-            )
+            return HistoryItemKind.TOOL_RESULT, {
+                "tool_call_id": history_item.tool_call_id,
+                "tool_name": history_item.tool_name,
+                "is_retry": history_item.is_retry,
+                "result": history_item.result,
+            }
+        case ConversationSummary():
+            return HistoryItemKind.CONVERSATION_SUMMARY, {
+                "summary": history_item.summary,
+                "covers_until": history_item.covers_until,
+            }
 
 
-def map_history_item_to_domain(history_item_db: HistoryItemDb) -> HistoryItem:
+def _map_history_item_columns_to_db(history_item: HistoryItem) -> dict[str, Any]:
+    match history_item:
+        case UserPrompt():
+            return {"content_length": len(history_item.prompt)}
+        case ModelResponse():
+            return {"content_length": len(history_item.response)}
+        case ThinkingStep():
+            return {"content_length": len(history_item.thoughts)}
+        case ToolCall():
+            return {
+                "tool_call_id": history_item.tool_call_id,
+                "tool_name": history_item.tool_name,
+                "content_length": get_payload_length(history_item.args),
+            }
+        case ToolResult():
+            return {
+                "tool_call_id": history_item.tool_call_id,
+                "tool_name": history_item.tool_name,
+                "content_length": get_payload_length(history_item.result),
+            }
+        case ConversationSummary():
+            return {"content_length": len(history_item.summary)}
+
+
+def map_history_item_to_db(history_item: HistoryItem) -> HistoryItemDb:
+    return HistoryItemDb(**map_history_item_to_db_row(history_item))
+
+
+def map_history_item_to_db_row(history_item: HistoryItem) -> dict[str, Any]:
+    """Maps the item to a plain column dict for Core inserts, without building (and validating) an ORM instance."""
+    kind, content = _map_history_item_kind_and_content_to_db(history_item)
+    return {
+        "id": history_item.id,
+        "history_id": history_item.history_id,
+        "created_at": history_item.created_at,
+        "turn_id": history_item.turn_id,
+        "kind": kind.value,
+        "tool_call_id": None,
+        "tool_name": None,
+        **_map_history_item_columns_to_db(history_item),
+        "content": content,
+    }
+
+
+def map_history_items_to_db_rows(history_items: Sequence[HistoryItem]) -> list[dict[str, Any]]:
+    """Maps the items to plain column dicts for Core (`executemany`) inserts."""
+    return [map_history_item_to_db_row(history_item) for history_item in history_items]
+
+
+def map_history_item_to_domain(
+    history_item_db: HistoryItemColumns, content: dict[str, Any] | None = None
+) -> HistoryItem:
+    """Maps a row to its domain item. `content` overrides the one of the row, e.g., with a blob payload restored."""
+    content = history_item_db.content if content is None else content
     match history_item_db.kind:
         case HistoryItemKind.USER_PROMPT.value:
             return UserPrompt(
                 id=history_item_db.id,
                 history_id=history_item_db.history_id,
                 created_at=history_item_db.created_at,
-                prompt=history_item_db.content["prompt"],
+                turn_id=history_item_db.turn_id,
+                prompt=content["prompt"],
             )
         case HistoryItemKind.MODEL_RESPONSE.value:
             return ModelResponse(
                 id=history_item_db.id,
                 history_id=history_item_db.history_id,
                 created_at=history_item_db.created_at,
-                response=history_item_db.content["response"],
+                turn_id=history_item_db.turn_id,
+                response=content["response"],
             )
         case HistoryItemKind.THINKING_STEP.value:
             return ThinkingStep(
                 id=history_item_db.id,
                 history_id=history_item_db.history_id,
                 created_at=history_item_db.created_at,
-                thoughts=history_item_db.content["thoughts"],
+                turn_id=history_item_db.turn_id,
+                thoughts=content["thoughts"],
             )
         case HistoryItemKind.TOOL_CALL.value:
             return ToolCall(
                 id=history_item_db.id,
                 history_id=history_item_db.history_id,
                 created_at=history_item_db.created_at,
-                tool_call_id=history_item_db.content["tool_call_id"],
-                tool_name=history_item_db.content["tool_name"],
-                args=history_item_db.content["args"],
+                turn_id=history_item_db.turn_id,
+                tool_call_id=content["tool_call_id"],
+                tool_name=content["tool_name"],
+                args=content["args"],
             )
         case HistoryItemKind.TOOL_RESULT.value:
             return ToolResult(
                 id=history_item_db.id,
                 history_id=history_item_db.history_id,
                 created_at=history_item_db.created_at,
-                tool_call_id=history_item_db.content["tool_call_id"],
-                tool_name=history_item_db.content["tool_name"],
-                is_retry=history_item_db.content["is_retry"],
-                result=history_item_db.content["result"],
+                turn_id=history_item_db.turn_id,
+                tool_call_id=content["tool_call_id"],
+                tool_name=content["tool_name"],
+                is_retry=content["is_retry"],
+                result=content["result"],
+            )
+        case HistoryItemKind.CONVERSATION_SUMMARY.value:
+            return ConversationSummary(
+                id=history_item_db.id,
+                history_id=history_item_db.history_id,
+                created_at=history_item_db.created_at,
+                turn_id=history_item_db.turn_id,
+                summary=content["summary"],
+                covers_until=content["covers_until"],
             )
         case _:
             raise ValueError(f"Unexpected history item: {history_item_db}")
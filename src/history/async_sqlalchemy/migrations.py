@@ -0,0 +1,257 @@
+import json
+
+from sqlalchemy import Connection
+
+from src.core.database import Migration
+from src.history.async_sqlalchemy.blobs import BLOB_FIELDS_BY_KIND, decompress_blob, get_blob_hash
+from src.history.models import HistoryItemKind, get_payload_length
+
+
+def _get_column_names(conn: Connection, table_name: str) -> set[str]:
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table_name})")}
+
+
+def _add_turn_id(conn: Connection):
+    if "turn_id" not in _get_column_names(conn, "history_items"):
+        conn.exec_driver_sql("ALTER TABLE history_items ADD COLUMN turn_id CHAR(32)")
+    # Items written before turns were tracked belong to the turn of the latest UserPrompt before them
+    conn.exec_driver_sql(
+        f"""
+        UPDATE history_items SET turn_id = (
+            SELECT prompt.id FROM history_items AS prompt
+            WHERE prompt.history_id = history_items.history_id
+                AND prompt.kind = '{HistoryItemKind.USER_PROMPT.value}'
+                AND prompt.created_at <= history_items.created_at
+            ORDER BY prompt.created_at DESC
+            LIMIT 1
+        )
+        WHERE turn_id IS NULL
+        """
+    )
+
+
+# The text of the searchable items, held in the JSON `content` column. Of results moved to a blob,
+# the preview is indexed (see `blobs.move_large_payloads_to_blobs`).
+_SEARCHABLE_TEXT_SQL = f"""
+    CASE {{item}}.kind
+        WHEN '{HistoryItemKind.USER_PROMPT.value}' THEN json_extract({{item}}.content, '$.prompt')
+        WHEN '{HistoryItemKind.MODEL_RESPONSE.value}' THEN json_extract({{item}}.content, '$.response')
+        WHEN '{HistoryItemKind.TOOL_RESULT.value}' THEN coalesce(
+            json_extract({{item}}.content, '$.result'), json_extract({{item}}.content, '$.result_preview')
+        )
+    END
+"""
+_SEARCHABLE_KINDS_SQL = ", ".join(
+    f"'{kind.value}'"
+    for kind in [HistoryItemKind.USER_PROMPT, HistoryItemKind.MODEL_RESPONSE, HistoryItemKind.TOOL_RESULT]
+)
+
+
+def rebuild_history_items_fts(conn: Connection):
+    """Refills the full-text index from `history_items`. The index is keyed by the rowid of the
+    items, i.e., it has to be rebuilt if a `VACUUM` ever renumbers them."""
+    conn.exec_driver_sql("DELETE FROM history_items_fts")
+    conn.exec_driver_sql(
+        f"""
+        INSERT INTO history_items_fts (rowid, text, history_id)
+        SELECT rowid, {_SEARCHABLE_TEXT_SQL.format(item="history_items")}, history_id FROM history_items
+        WHERE kind IN ({_SEARCHABLE_KINDS_SQL})
+        """
+    )
+
+
+def _create_history_items_fts_triggers(conn: Connection):
+    # Kept in sync by triggers, i.e., every write path (repo, bulk imports, retention) is covered
+    conn.exec_driver_sql(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS history_items_fts_insert AFTER INSERT ON history_items
+        WHEN new.kind IN ({_SEARCHABLE_KINDS_SQL})
+        BEGIN
+            INSERT INTO history_items_fts (rowid, text, history_id)
+            VALUES (new.rowid, {_SEARCHABLE_TEXT_SQL.format(item="new")}, new.history_id);
+        END
+        """
+    )
+    conn.exec_driver_sql(
+        """
+        CREATE TRIGGER IF NOT EXISTS history_items_fts_delete AFTER DELETE ON history_items
+        BEGIN
+            DELETE FROM history_items_fts WHERE rowid = old.rowid;
+        END
+        """
+    )
+    conn.exec_driver_sql(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS history_items_fts_update AFTER UPDATE OF kind, content ON history_items
+        BEGIN
+            DELETE FROM history_items_fts WHERE rowid = old.rowid;
+            INSERT INTO history_items_fts (rowid, text, history_id)
+            SELECT new.rowid, {_SEARCHABLE_TEXT_SQL.format(item="new")}, new.history_id
+            WHERE new.kind IN ({_SEARCHABLE_KINDS_SQL});
+        END
+        """
+    )
+
+
+def _add_history_items_fts(conn: Connection):
+    conn.exec_driver_sql(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_items_fts
+        USING fts5(text, history_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')
+        """
+    )
+    _create_history_items_fts_triggers(conn)
+    rebuild_history_items_fts(conn)
+
+
+def _index_blob_previews(conn: Connection):
+    # The `history_blobs` table itself is created by `create_all`, the triggers have to index the
+    # previews of the results moved to it
+    for trigger in ["history_items_fts_insert", "history_items_fts_update"]:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    _create_history_items_fts_triggers(conn)
+
+
+BACKFILL_BATCH_SIZE = 10_000
+
+# The length of the inline payload of the existing items, matching `mapper._map_history_item_columns_to_db`.
+# Payloads moved to blobs are measured in Python, see `_backfill_blob_content_lengths`.
+_CONTENT_LENGTH_SQL = f"""
+    CASE kind
+        WHEN '{HistoryItemKind.USER_PROMPT.value}' THEN length(json_extract(content, '$.prompt'))
+        WHEN '{HistoryItemKind.MODEL_RESPONSE.value}' THEN length(json_extract(content, '$.response'))
+        WHEN '{HistoryItemKind.THINKING_STEP.value}' THEN length(json_extract(content, '$.thoughts'))
+        WHEN '{HistoryItemKind.TOOL_CALL.value}' THEN length(json_extract(content, '$.args'))
+        WHEN '{HistoryItemKind.TOOL_RESULT.value}' THEN length(json_extract(content, '$.result'))
+        WHEN '{HistoryItemKind.CONVERSATION_SUMMARY.value}' THEN length(json_extract(content, '$.summary'))
+    END
+"""
+_HAS_BLOB_SQL = " OR ".join(
+    f"(kind = '{kind}' AND json_extract(content, '$.{field}_blob') IS NOT NULL)"
+    for kind, field in BLOB_FIELDS_BY_KIND.items()
+)
+
+
+def _backfill_blob_content_lengths(conn: Connection, start_rowid: int, end_rowid: int):
+    # The payloads have to be decompressed, i.e., measured with the same function as new items
+    rows = conn.exec_driver_sql(
+        f"""
+        SELECT rowid, kind, content FROM history_items
+        WHERE rowid > {start_rowid} AND rowid <= {end_rowid} AND content_length IS NULL AND ({_HAS_BLOB_SQL})
+        """
+    ).all()
+    blob_hashes_by_rowid = {rowid: get_blob_hash(kind, json.loads(content)) for rowid, kind, content in rows}
+    blob_hashes = sorted({blob_hash for blob_hash in blob_hashes_by_rowid.values() if blob_hash})
+    if not blob_hashes:
+        return
+    blobs = conn.exec_driver_sql(
+        f"SELECT hash, compression, data FROM history_blobs WHERE hash IN ({', '.join('?' * len(blob_hashes))})",
+        tuple(blob_hashes),
+    ).all()
+    lengths = {
+        blob_hash: get_payload_length(json.loads(decompress_blob(data, compression)))
+        for blob_hash, compression, data in blobs
+    }
+    updates = [(lengths[blob_hash], rowid) for rowid, blob_hash in blob_hashes_by_rowid.items() if blob_hash in lengths]
+    if updates:
+        conn.exec_driver_sql("UPDATE history_items SET content_length = ? WHERE rowid = ?", updates)
+
+
+def _add_typed_columns(conn: Connection):
+    column_names = _get_column_names(conn, "history_items")
+    for column_name, column_type in [
+        ("tool_call_id", "VARCHAR"),
+        ("tool_name", "VARCHAR"),
+        ("content_length", "INTEGER"),
+    ]:
+        if column_name not in column_names:
+            conn.exec_driver_sql(f"ALTER TABLE history_items ADD COLUMN {column_name} {column_type}")
+    conn.commit()
+    # In rowid ranges, i.e., every statement touches a bounded number of rows and finds them via the
+    # primary key. The full-text trigger only fires on updates of `kind` and `content`. Every batch is
+    # committed, i.e., the writer lock is released in between and an interrupted backfill continues
+    # with the rows that are still missing their `content_length`.
+    tool_kinds_sql = f"'{HistoryItemKind.TOOL_CALL.value}', '{HistoryItemKind.TOOL_RESULT.value}'"
+    max_rowid = conn.exec_driver_sql("SELECT max(rowid) FROM history_items").scalar_one() or 0
+    for start_rowid in range(0, max_rowid, BACKFILL_BATCH_SIZE):
+        end_rowid = start_rowid + BACKFILL_BATCH_SIZE
+        conn.exec_driver_sql(
+            f"""
+            UPDATE history_items SET
+                tool_call_id = CASE WHEN kind IN ({tool_kinds_sql}) THEN json_extract(content, '$.tool_call_id') END,
+                tool_name = CASE WHEN kind IN ({tool_kinds_sql}) THEN json_extract(content, '$.tool_name') END,
+                content_length = CASE WHEN NOT ({_HAS_BLOB_SQL}) THEN coalesce({_CONTENT_LENGTH_SQL}, 0) END
+            WHERE rowid > {start_rowid} AND rowid <= {end_rowid} AND content_length IS NULL
+            """
+        )
+        _backfill_blob_content_lengths(conn, start_rowid, end_rowid)
+        conn.commit()
+
+
+# The kinds indexed by the RAG service
+RAG_OUTBOX_KINDS = [HistoryItemKind.USER_PROMPT]
+
+
+def create_rag_outbox_trigger(conn: Connection):
+    """Enqueues the items to index in `rag_outbox`, see `AsyncSqlalchemyHistoryRepo.set_outbox_enabled`."""
+    # The `rag_outbox` table itself is created by `create_all`. Like the full-text index, kept in sync by
+    # a trigger, i.e., an item and its outbox entry are committed (or lost) together. Deleted items take
+    # their entries with them (`ON DELETE CASCADE`).
+    kinds_sql = ", ".join(f"'{kind.value}'" for kind in RAG_OUTBOX_KINDS)
+    conn.exec_driver_sql(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS rag_outbox_insert AFTER INSERT ON history_items
+        WHEN new.kind IN ({kinds_sql})
+        BEGIN
+            INSERT OR IGNORE INTO rag_outbox (history_item_id, created_at, attempts, next_attempt_at)
+            VALUES (new.id, new.created_at, 0, 0);
+        END
+        """
+    )
+
+
+def drop_rag_outbox_trigger(conn: Connection):
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS rag_outbox_insert")
+
+
+def _count_blob_references(conn: Connection):
+    # Kept by triggers like the full-text index, i.e., deleting items finds the blobs to delete with them
+    # via the primary key instead of scanning all items for the remaining references
+    if "ref_count" not in _get_column_names(conn, "history_blobs"):
+        conn.exec_driver_sql("ALTER TABLE history_blobs ADD COLUMN ref_count INTEGER NOT NULL DEFAULT 0")
+    for kind, field in BLOB_FIELDS_BY_KIND.items():
+        for event, item, change in [("insert", "new", "+ 1"), ("delete", "old", "- 1")]:
+            conn.exec_driver_sql(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS history_blobs_ref_count_{event}_{field}
+                AFTER {event.upper()} ON history_items
+                WHEN {item}.kind = '{kind}' AND json_extract({item}.content, '$.{field}_blob') IS NOT NULL
+                BEGIN
+                    UPDATE history_blobs SET ref_count = ref_count {change}
+                    WHERE hash = json_extract({item}.content, '$.{field}_blob');
+                END
+                """
+            )
+    referenced_hashes_sql = " UNION ALL ".join(
+        f"SELECT json_extract(content, '$.{field}_blob') AS hash FROM history_items WHERE kind = '{kind}'"
+        for kind, field in BLOB_FIELDS_BY_KIND.items()
+    )
+    # Counted once, grouped by hash, instead of a scan of the items per blob
+    conn.exec_driver_sql(
+        f"""
+        UPDATE history_blobs SET ref_count = refs.n
+        FROM (SELECT hash, count(*) AS n FROM ({referenced_hashes_sql}) GROUP BY hash) AS refs
+        WHERE refs.hash = history_blobs.hash
+        """
+    )
+
+
+# Append only, the position of a migration is its schema version
+HISTORY_MIGRATIONS: list[Migration] = [
+    _add_turn_id,
+    _add_history_items_fts,
+    _index_blob_previews,
+    _add_typed_columns,
+    create_rag_outbox_trigger,
+    _count_blob_references,
+]
@@ -2,16 +2,33 @@ from time import time_ns
 from typing import Any
 from uuid import UUID, uuid4
 
-from sqlmodel import JSON, Column, Field, Relationship, SQLModel  # type: ignore
+from sqlalchemy import Index
+from sqlmodel import JSON, Column, Field, LargeBinary, Relationship, SQLModel  # type: ignore
 
 
 class HistoryItemDb(SQLModel, table=True):
     __tablename__ = "history_items"  # type: ignore
+    __table_args__ = (
+        # Serves the tail queries (`ORDER BY created_at DESC LIMIT n`) without scanning the whole history
+        Index("ix_history_items_history_id_created_at", "history_id", "created_at"),
+        # Serves the turn-aware windows (`turn_id IN (<last k turns>)`)
+        Index("ix_history_items_history_id_turn_id", "history_id", "turn_id"),
+        # Pairs ToolCalls with their ToolResults in SQL
+        Index("ix_history_items_history_id_tool_call_id", "history_id", "tool_call_id"),
+        # Serves the time ranges of given kinds (`kind = ? AND created_at BETWEEN ...`) and the last item of a kind
+        Index("ix_history_items_history_id_kind_created_at", "history_id", "kind", "created_at"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     history_id: UUID = Field(foreign_key="history.id", nullable=False, index=True)
     created_at: int = Field(default_factory=time_ns, nullable=False, index=True)
     kind: str = Field(nullable=False, index=True)
+    turn_id: UUID | None = Field(default=None, nullable=True)
+    # Typed copies of the content of ToolCalls and ToolResults, i.e., filterable and joinable in SQL
+    tool_call_id: str | None = Field(default=None, nullable=True)
+    tool_name: str | None = Field(default=None, nullable=True)
+    # Characters of the payload (prompt, response, thoughts, summary, or the tool args or result as compact JSON)
+    content_length: int | None = Field(default=None, nullable=True)
     content: dict[str, Any] = Field(sa_column=Column(JSON, nullable=False))
 
     history: "HistoryDb" = Relationship(back_populates="items")
@@ -24,3 +41,30 @@ class HistoryDb(SQLModel, table=True):
     created_at: int = Field(default_factory=time_ns, nullable=False, index=True)
 
     items: list["HistoryItemDb"] = Relationship(back_populates="history")
+
+
+class RagOutboxDb(SQLModel, table=True):
+    """The history items waiting to be indexed by the RAG service. Filled by a trigger on `history_items`,
+    i.e., in the transaction of the item, and emptied by the `IndexingOutboxWorker`."""
+
+    __tablename__ = "rag_outbox"  # type: ignore
+    __table_args__ = (Index("ix_rag_outbox_next_attempt_at", "next_attempt_at"),)
+
+    history_item_id: UUID = Field(foreign_key="history_items.id", ondelete="CASCADE", primary_key=True)
+    created_at: int = Field(nullable=False)  # Of the item
+    attempts: int = Field(default=0, nullable=False)
+    next_attempt_at: int = Field(default=0, nullable=False)
+    last_error: str | None = Field(default=None, nullable=True)
+
+
+class HistoryBlobDb(SQLModel, table=True):
+    """Compressed large payloads of history items, shared by all items with the same payload."""
+
+    __tablename__ = "history_blobs"  # type: ignore
+
+    hash: str = Field(primary_key=True)  # SHA-256 of the uncompressed (JSON) payload
+    compression: str = Field(nullable=False)
+    size: int = Field(nullable=False)  # Uncompressed bytes
+    # The items referencing the blob, kept by triggers on `history_items` (see `migrations._count_blob_references`)
+    ref_count: int = Field(default=0, nullable=False)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
@@ -0,0 +1,472 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from time import time_ns
+from typing import Sequence
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config.models import SqliteProfile
+from src.core.database import create_db_and_tables, get_engine, get_schema_version
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.blobs import BlobCompression
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS, RAG_OUTBOX_KINDS
+from src.history.models import (
+    CONTEXT_HISTORY_ITEM_KINDS,
+    HISTORY_ITEM_TYPES_BY_KIND,
+    History,
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    HistorySearchHit,
+    IndexingOutboxEntry,
+    IndexingOutboxStats,
+    ToolCall,
+    ToolStats,
+)
+
+SHARD_FILE_PREFIX = "history-"
+SHARD_FILE_SUFFIX = ".db"
+PAGE_SIZE = 1000
+_OUTBOX_ITEM_TYPES = tuple(HISTORY_ITEM_TYPES_BY_KIND[kind] for kind in RAG_OUTBOX_KINDS)
+
+
+def get_shard_name(created_at: int) -> str:
+    """The month (UTC) of a timestamp (ns), e.g., "2025-01"."""
+    return datetime.fromtimestamp(created_at // 1_000_000_000, tz=timezone.utc).strftime("%Y-%m")
+
+
+@dataclass
+class _Shard:
+    repo: AsyncSqlalchemyHistoryRepo
+    engines: list[AsyncEngine]  # The writer first, if the shard was opened for writing
+    is_writable: bool
+    # The histories that have a row in this shard, i.e., items can be added without checking first
+    history_ids: set[UUID]
+
+
+class ShardedAsyncSqlalchemyHistoryRepo:
+    """A HistoryRepo storing the items in one SQLite file per month (by `created_at`, UTC), i.e.,
+    indexes, VACUUMs and backups of old months stay untouched while a conversation keeps growing.
+
+    Shards are opened on first access, through a read-only, memory-mapped engine only. A writer engine is
+    added (and the shard created or migrated) once a shard is written, usually the current month's only.
+    Tail queries walk the shards from the newest one and usually stop there, range queries are routed
+    by `created_at`. Writes spanning several months are one transaction per shard.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        profile: SqliteProfile | None = None,
+        blob_threshold_bytes: int | None = None,
+        blob_compression: BlobCompression = "zlib",
+        search_max_shards: int = 12,
+    ):
+        """
+        Args:
+            search_max_shards: int - The keyword search covers the most recent shards only, i.e., opens
+                at most this many.
+        """
+        self._path = path
+        self._profile = profile
+        self._blob_threshold_bytes = blob_threshold_bytes
+        self._blob_compression: BlobCompression = blob_compression
+        self._search_max_shards = search_max_shards
+        self._path.mkdir(parents=True, exist_ok=True)
+        # Sorted oldest first, "YYYY-MM" names sort chronologically
+        self._shard_names = sorted(
+            shard_path.name.removeprefix(SHARD_FILE_PREFIX).removesuffix(SHARD_FILE_SUFFIX)
+            for shard_path in self._path.glob(f"{SHARD_FILE_PREFIX}*{SHARD_FILE_SUFFIX}")
+        )
+        self._shards: dict[str, _Shard] = {}
+        # Opening a shard awaits, i.e., concurrent first accesses would open it twice otherwise
+        self._open_lock = asyncio.Lock()
+        # As created by the migrations, see `set_outbox_enabled`
+        self._is_outbox_enabled = True
+        # The shards that (may) hold outbox entries, i.e., a poll does not open every month. Found by one
+        # scan of all shards, afterwards writes mark their shard.
+        self._outbox_shard_names: set[str] = set()
+        self._is_outbox_scanned = False
+
+    @property
+    def shard_names(self) -> list[str]:
+        return list(self._shard_names)
+
+    @property
+    def writer_engines(self) -> list[AsyncEngine]:
+        """The engines of the shards opened for writing, e.g., for their maintenance. Other shards have
+        not changed either."""
+        return [shard.engines[0] for shard in self._shards.values() if shard.is_writable]
+
+    def _get_shard_path(self, shard_name: str) -> Path:
+        return self._path / f"{SHARD_FILE_PREFIX}{shard_name}{SHARD_FILE_SUFFIX}"
+
+    def _create_repo(self, engine: AsyncEngine, read_engine: AsyncEngine) -> AsyncSqlalchemyHistoryRepo:
+        return AsyncSqlalchemyHistoryRepo(
+            engine=engine,
+            read_engine=read_engine,
+            blob_threshold_bytes=self._blob_threshold_bytes,
+            blob_compression=self._blob_compression,
+        )
+
+    async def _get_shard(self, shard_name: str) -> AsyncSqlalchemyHistoryRepo:
+        """Opens an existing shard read-only on first access. Shards written by an older schema version
+        are migrated first, i.e., opened for writing."""
+        if shard := self._shards.get(shard_name):
+            return shard.repo
+        async with self._open_lock:
+            if shard := self._shards.get(shard_name):
+                return shard.repo
+            read_engine = get_engine(self._get_shard_path(shard_name), profile=self._profile, read_only=True)
+            if await get_schema_version(read_engine) < len(HISTORY_MIGRATIONS):
+                return await self._open_shard_for_writing(shard_name, read_engine)
+            # Writes fail on the read-only engine (`query_only`) instead of going unnoticed
+            repo = self._create_repo(engine=read_engine, read_engine=read_engine)
+            self._shards[shard_name] = _Shard(repo=repo, engines=[read_engine], is_writable=False, history_ids=set())
+            return repo
+
+    async def _get_writable_shard(self, shard_name: str) -> AsyncSqlalchemyHistoryRepo:
+        """Opens (and creates or migrates) a shard for writing on first write access."""
+        if (shard := self._shards.get(shard_name)) and shard.is_writable:
+            return shard.repo
+        async with self._open_lock:
+            shard = self._shards.get(shard_name)
+            if shard and shard.is_writable:
+                return shard.repo
+            # The read-only engine of a shard opened for reading keeps serving its reads
+            return await self._open_shard_for_writing(shard_name, shard.engines[0] if shard else None)
+
+    async def _open_shard_for_writing(
+        self, shard_name: str, read_engine: AsyncEngine | None
+    ) -> AsyncSqlalchemyHistoryRepo:
+        shard_path = self._get_shard_path(shard_name)
+        engine = get_engine(shard_path, profile=self._profile)
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        read_engine = read_engine or get_engine(shard_path, profile=self._profile, read_only=True)
+        repo = self._create_repo(engine=engine, read_engine=read_engine)
+        await repo.set_outbox_enabled(self._is_outbox_enabled)
+        self._shards[shard_name] = _Shard(repo=repo, engines=[engine, read_engine], is_writable=True, history_ids=set())
+        if shard_name not in self._shard_names:
+            self._shard_names = sorted([*self._shard_names, shard_name])
+        return repo
+
+    async def _get_shard_for_writing(self, shard_name: str, history_id: UUID) -> AsyncSqlalchemyHistoryRepo:
+        repo = await self._get_writable_shard(shard_name)
+        history_ids = self._shards[shard_name].history_ids
+        if history_id not in history_ids:
+            # Every shard holds its own history row for the foreign keys of its items
+            await repo.create_history_if_not_exists(history_id)
+            history_ids.add(history_id)
+        return repo
+
+    def _shard_names_from(self, created_at: int) -> list[str]:
+        first_shard_name = get_shard_name(created_at)
+        return [shard_name for shard_name in self._shard_names if shard_name >= first_shard_name]
+
+    async def get_or_create_history(self, history_id: UUID) -> History:
+        history: History | None = None
+        for shard_name in self._shard_names:
+            shard_history = await (await self._get_shard(shard_name)).get_history(history_id)
+            if shard_history is None:
+                continue
+            if history is None:
+                history = shard_history
+            else:
+                history.items.extend(shard_history.items)
+        if history is None:
+            return await (
+                await self._get_shard_for_writing(get_shard_name(time_ns()), history_id)
+            ).get_or_create_history(history_id)
+        history.items.sort(key=lambda item: (item.created_at, item.id))
+        return history
+
+    async def create_history_if_not_exists(self, history_id: UUID) -> None:
+        await self._get_shard_for_writing(get_shard_name(time_ns()), history_id)
+
+    async def add_history_item(self, history_item: HistoryItem) -> None:
+        await self.add_history_items([history_item])
+
+    async def add_history_items(self, history_items: Sequence[HistoryItem], skip_existing: bool = False) -> None:
+        items_by_shard: dict[tuple[str, UUID], list[HistoryItem]] = {}
+        for history_item in history_items:
+            shard_key = (get_shard_name(history_item.created_at), history_item.history_id)
+            items_by_shard.setdefault(shard_key, []).append(history_item)
+        for (shard_name, history_id), shard_items in items_by_shard.items():
+            repo = await self._get_shard_for_writing(shard_name, history_id)
+            await repo.add_history_items(shard_items, skip_existing=skip_existing)
+            if self._is_outbox_enabled and any(isinstance(item, _OUTBOX_ITEM_TYPES) for item in shard_items):
+                self._outbox_shard_names.add(shard_name)
+
+    async def get_last_n_items(self, history_id: UUID, n: int) -> list[HistoryItem]:
+        items: list[HistoryItem] = []
+        for shard_name in reversed(self._shard_names):
+            if len(items) >= n:
+                break
+            shard_items = await (await self._get_shard(shard_name)).get_last_n_items(history_id, n - len(items))
+            items = shard_items + items
+        return items
+
+    async def get_last_n_turns(
+        self,
+        history_id: UUID,
+        n_turns: int,
+        kinds: Sequence[HistoryItemKind] = CONTEXT_HISTORY_ITEM_KINDS,
+    ) -> list[HistoryItem]:
+        if n_turns <= 0:
+            return []
+        # The UserPrompts starting the last turns first, a turn may continue in the next month's shard
+        prompts: list[HistoryItem] = []
+        for shard_name in reversed(self._shard_names):
+            if len(prompts) >= n_turns:
+                break
+            shard = await self._get_shard(shard_name)
+            shard_prompts = await shard.get_last_n_turns(
+                history_id, n_turns - len(prompts), kinds=[HistoryItemKind.USER_PROMPT]
+            )
+            prompts = shard_prompts + prompts
+        if not prompts:
+            return []
+
+        turn_ids = {prompt.id for prompt in prompts}
+        kind_types = tuple(HISTORY_ITEM_TYPES_BY_KIND[kind] for kind in kinds)
+        items = [
+            item
+            async for item in self._iter_items(history_id, since=prompts[0].created_at)
+            if item.turn_id in turn_ids and isinstance(item, kind_types)
+        ]
+        # The turns are mapped into the model context, i.e., with their payloads
+        return await self.resolve_deferred_payloads(items)
+
+    async def resolve_deferred_payloads(self, history_items: Sequence[HistoryItem]) -> list[HistoryItem]:
+        # An item's blob is stored in the shard of the item
+        items_by_shard: dict[str, list[HistoryItem]] = {}
+        for history_item in history_items:
+            items_by_shard.setdefault(get_shard_name(history_item.created_at), []).append(history_item)
+        resolved_items: dict[UUID, HistoryItem] = {}
+        for shard_name, shard_items in items_by_shard.items():
+            for history_item in await (await self._get_shard(shard_name)).resolve_deferred_payloads(shard_items):
+                resolved_items[history_item.id] = history_item
+        return [resolved_items[history_item.id] for history_item in history_items]
+
+    async def get_last_item_of_kind(self, history_id: UUID, kind: HistoryItemKind) -> HistoryItem | None:
+        for shard_name in reversed(self._shard_names):
+            if item := await (await self._get_shard(shard_name)).get_last_item_of_kind(history_id, kind):
+                return item
+        return None
+
+    async def _iter_items(self, history_id: UUID, since: int):
+        after: HistoryItemKey | None = None
+        while page := await self.get_items_page(history_id, after=after, since=since, limit=PAGE_SIZE):
+            for item in page:
+                yield item
+            after = (page[-1].created_at, page[-1].id)
+
+    async def get_items_page(
+        self,
+        history_id: UUID,
+        after: HistoryItemKey | None = None,
+        since: int | None = None,
+        limit: int = 1000,
+    ) -> list[HistoryItem]:
+        start = max(after[0] if after else 0, since or 0)
+        items: list[HistoryItem] = []
+        for shard_name in self._shard_names_from(start):
+            if len(items) >= limit:
+                break
+            shard = await self._get_shard(shard_name)
+            items.extend(await shard.get_items_page(history_id, after=after, since=since, limit=limit - len(items)))
+        return items
+
+    async def query_items(
+        self,
+        history_id: UUID,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        limit: int = 1000,
+        newest_first: bool = False,
+    ) -> list[HistoryItem]:
+        shard_names = self._shard_names_from(since or 0)
+        if until is not None:
+            last_shard_name = get_shard_name(until - 1)
+            shard_names = [shard_name for shard_name in shard_names if shard_name <= last_shard_name]
+        items: list[HistoryItem] = []
+        for shard_name in reversed(shard_names) if newest_first else shard_names:
+            if len(items) >= limit:
+                break
+            shard = await self._get_shard(shard_name)
+            items.extend(await shard.query_items(history_id, kinds, since, until, limit - len(items), newest_first))
+        return items
+
+    async def search_items(self, history_id: UUID, query: str, limit: int = 10) -> list[HistorySearchHit]:
+        # Every shard has its own full-text index. BM25 is only comparable across them approximately,
+        # as the term frequencies are per shard.
+        hits: list[HistorySearchHit] = []
+        for shard_name in self._shard_names[-self._search_max_shards :]:
+            hits.extend(await (await self._get_shard(shard_name)).search_items(history_id, query, limit))
+        return sorted(hits, key=lambda hit: hit.rank)[:limit]
+
+    async def get_nth_last_item_key(self, history_id: UUID, n: int) -> HistoryItemKey | None:
+        for shard_name in reversed(self._shard_names):
+            if n <= 0:
+                return None
+            shard = await self._get_shard(shard_name)
+            if key := await shard.get_nth_last_item_key(history_id, n):
+                return key
+            n -= await shard.count_items(history_id)
+        return None
+
+    async def delete_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        limit: int = 1000,
+        up_to: HistoryItemKey | None = None,
+    ) -> list[HistoryItemKey]:
+        # Oldest shards first, i.e., in chronological order across the shards as well
+        deleted_keys: list[HistoryItemKey] = []
+        for shard_name in self._shard_names:
+            if len(deleted_keys) >= limit or shard_name > get_shard_name(created_before - 1):
+                break
+            shard = await self._get_writable_shard(shard_name)
+            deleted_keys.extend(
+                await shard.delete_items(history_id, created_before, kinds, limit - len(deleted_keys), up_to)
+            )
+        return deleted_keys
+
+    async def _get_results_in_next_shard(
+        self, history_id: UUID, shard: AsyncSqlalchemyHistoryRepo, next_shard: AsyncSqlalchemyHistoryRepo
+    ) -> list[tuple[ToolCall, list[int]]]:
+        """The orphan ToolCalls of a shard whose results are in the next shard, with the lengths of these.
+        Only the last turn of a shard may continue in the next one."""
+        last_prompt = await shard.get_last_item_of_kind(history_id, HistoryItemKind.USER_PROMPT)
+        if last_prompt is None:
+            return []
+        tool_calls = await shard.get_orphan_tool_calls(history_id, limit=PAGE_SIZE, since=last_prompt.created_at)
+        if not tool_calls:
+            return []
+        lengths = await next_shard.get_tool_result_lengths(history_id, [call.tool_call_id for call in tool_calls])
+        return [(call, lengths[call.tool_call_id]) for call in tool_calls if call.tool_call_id in lengths]
+
+    async def get_tool_stats(self, history_id: UUID) -> list[ToolStats]:
+        # Summed over the shards, then corrected by the calls paired across a month boundary
+        n_calls: dict[str, int] = {}
+        n_results: dict[str, int] = {}
+        n_orphan_calls: dict[str, int] = {}
+        total_result_lengths: dict[str, float] = {}
+        shards = [await self._get_shard(shard_name) for shard_name in self._shard_names]
+        for shard in shards:
+            for tool_stats in await shard.get_tool_stats(history_id):
+                name = tool_stats.tool_name
+                n_calls[name] = n_calls.get(name, 0) + tool_stats.n_calls
+                n_results[name] = n_results.get(name, 0) + tool_stats.n_results
+                n_orphan_calls[name] = n_orphan_calls.get(name, 0) + tool_stats.n_orphan_calls
+                total_result_lengths[name] = (
+                    total_result_lengths.get(name, 0) + (tool_stats.mean_result_length or 0) * tool_stats.n_results
+                )
+        for shard, next_shard in zip(shards, shards[1:]):
+            for tool_call, result_lengths in await self._get_results_in_next_shard(history_id, shard, next_shard):
+                name = tool_call.tool_name
+                n_results[name] += len(result_lengths)
+                n_orphan_calls[name] -= 1
+                total_result_lengths[name] += sum(result_lengths)
+        all_tool_stats = [
+            ToolStats(
+                tool_name=name,
+                n_calls=n_calls[name],
+                n_results=n_results[name],
+                n_orphan_calls=n_orphan_calls[name],
+                mean_result_length=total_result_lengths[name] / n_results[name] if n_results[name] else None,
+            )
+            for name in n_calls
+        ]
+        return sorted(all_tool_stats, key=lambda tool_stats: tool_stats.n_calls, reverse=True)
+
+    async def get_orphan_tool_calls(self, history_id: UUID, limit: int = 100) -> list[ToolCall]:
+        tool_calls: list[ToolCall] = []
+        for shard_name, next_shard_name in zip(self._shard_names, [*self._shard_names[1:], None]):
+            if len(tool_calls) >= limit:
+                break
+            shard = await self._get_shard(shard_name)
+            shard_tool_calls = await shard.get_orphan_tool_calls(history_id, limit=limit - len(tool_calls))
+            if shard_tool_calls and next_shard_name:
+                # Only the newest ones (of the last turn) may be paired, i.e., no orphans are left out by the limit
+                next_shard = await self._get_shard(next_shard_name)
+                paired_ids = {
+                    call.id for call, _ in await self._get_results_in_next_shard(history_id, shard, next_shard)
+                }
+                shard_tool_calls = [call for call in shard_tool_calls if call.id not in paired_ids]
+            tool_calls.extend(shard_tool_calls)
+        return tool_calls
+
+    def _group_by_shard(self, entries: Sequence[IndexingOutboxEntry]) -> dict[str, list[IndexingOutboxEntry]]:
+        # Every entry is stored in the shard of its item
+        entries_by_shard: dict[str, list[IndexingOutboxEntry]] = {}
+        for entry in entries:
+            entries_by_shard.setdefault(get_shard_name(entry.history_item.created_at), []).append(entry)
+        return entries_by_shard
+
+    async def _get_outbox_shard_names(self) -> list[str]:
+        if not self._is_outbox_scanned:
+            for shard_name in self._shard_names:
+                if (await (await self._get_shard(shard_name)).get_outbox_stats()).depth:
+                    self._outbox_shard_names.add(shard_name)
+            self._is_outbox_scanned = True
+        return sorted(self._outbox_shard_names)
+
+    async def set_outbox_enabled(self, is_enabled: bool) -> None:
+        self._is_outbox_enabled = is_enabled
+        # Shards opened for writing later on are set up when they are opened
+        for shard in list(self._shards.values()):
+            if shard.is_writable:
+                await shard.repo.set_outbox_enabled(is_enabled)
+        if not is_enabled:
+            # The entries left over in the other shards
+            for shard_name in await self._get_outbox_shard_names():
+                await self._get_writable_shard(shard_name)
+            self._outbox_shard_names.clear()
+
+    async def get_outbox_entries(self, limit: int = 100) -> list[IndexingOutboxEntry]:
+        entries: list[IndexingOutboxEntry] = []
+        for shard_name in await self._get_outbox_shard_names():
+            if len(entries) >= limit:
+                break
+            entries.extend(await (await self._get_shard(shard_name)).get_outbox_entries(limit - len(entries)))
+        return entries
+
+    async def complete_outbox_entries(self, entries: Sequence[IndexingOutboxEntry]) -> None:
+        for shard_name, shard_entries in self._group_by_shard(entries).items():
+            await (await self._get_writable_shard(shard_name)).complete_outbox_entries(shard_entries)
+
+    async def retry_outbox_entries(
+        self, entries: Sequence[IndexingOutboxEntry], error: str, next_attempt_at: int
+    ) -> None:
+        for shard_name, shard_entries in self._group_by_shard(entries).items():
+            await (await self._get_writable_shard(shard_name)).retry_outbox_entries(
+                shard_entries, error, next_attempt_at
+            )
+
+    async def get_outbox_stats(self) -> IndexingOutboxStats:
+        shard_stats: list[IndexingOutboxStats] = []
+        for shard_name in await self._get_outbox_shard_names():
+            # Unmarked before the query, i.e., a write committed meanwhile marks the shard again
+            self._outbox_shard_names.discard(shard_name)
+            stats = await (await self._get_shard(shard_name)).get_outbox_stats()
+            if stats.depth:
+                self._outbox_shard_names.add(shard_name)
+            shard_stats.append(stats)
+        oldest_created_ats = [stats.oldest_created_at for stats in shard_stats if stats.oldest_created_at is not None]
+        return IndexingOutboxStats(
+            depth=sum(stats.depth for stats in shard_stats),
+            oldest_created_at=min(oldest_created_ats, default=None),
+        )
+
+    async def close(self):
+        for shard in self._shards.values():
+            for engine in shard.engines:
+                await engine.dispose()
+        self._shards = {}
@@ -0,0 +1,38 @@
+"""Exports a history as (compressed) JSONL, see `src.history.jsonl`.
+
+Usage:
+    python -m src.history.export <history_id> <output.jsonl[.gz|.zst]> [--db data/database.db]
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from time import perf_counter
+from uuid import UUID
+
+from src.core.database import get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.jsonl import export_history_jsonl
+from src.history.service import HistoryService
+
+
+async def main(history_id: UUID, path: Path, db_path: Path, batch_size: int):
+    engine = get_engine(db_path, read_only=True)
+    try:
+        history_service = HistoryService(history_repo=AsyncSqlalchemyHistoryRepo(engine=engine))
+        start = perf_counter()
+        n_items = await export_history_jsonl(history_service, history_id, path, batch_size=batch_size)
+        elapsed = perf_counter() - start
+        print(f"Exported {n_items} items to {path} in {elapsed:.1f}s ({n_items / max(elapsed, 1e-9):.0f} items/s)")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("history_id", type=UUID)
+    parser.add_argument("path", type=Path, help="The compression follows the suffix (.gz, .zst)")
+    parser.add_argument("--db", type=Path, default=Path("data/database.db"))
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(main(history_id=args.history_id, path=args.path, db_path=args.db, batch_size=args.batch_size))
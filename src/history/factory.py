@@ -0,0 +1,54 @@
+from src.config.models import Config
+from src.core.database import create_db_and_tables, get_engine, get_sqlite_pragmas, get_sqlite_profile_mismatches
+from src.core.logging import get_logger
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.async_sqlalchemy.sharded import ShardedAsyncSqlalchemyHistoryRepo
+from src.history.port import HistoryRepo
+from src.history.segment_log.adapter import SegmentLogHistoryRepo
+
+logger = get_logger("Startup: ", output="console", simple_format=True)
+
+
+async def get_history_repo(config: Config) -> HistoryRepo:
+    if segment_log_cfg := config.history_config.segment_log:
+        return SegmentLogHistoryRepo(
+            path=segment_log_cfg.path,
+            max_segment_bytes=segment_log_cfg.max_segment_bytes,
+            fsync=segment_log_cfg.fsync,
+        )
+    return await get_sqlalchemy_history_repo(config)
+
+
+async def get_sqlalchemy_history_repo(config: Config) -> HistoryRepo:
+    db_cfg = config.database_config
+    blob_cfg = config.history_config.blob_storage
+    if db_cfg.shards_path:
+        return ShardedAsyncSqlalchemyHistoryRepo(
+            path=db_cfg.shards_path,
+            profile=db_cfg.profile,
+            blob_threshold_bytes=blob_cfg.threshold_bytes if blob_cfg else None,
+            blob_compression=blob_cfg.compression if blob_cfg else "zlib",
+            search_max_shards=db_cfg.shards_search_max,
+        )
+
+    engine = get_engine(path=db_cfg.path, profile=db_cfg.profile)
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    read_engine = (
+        get_engine(path=db_cfg.path, profile=db_cfg.profile, read_only=True) if db_cfg.separate_read_engine else None
+    )
+    for engine_name, checked_engine in [("writer", engine), ("reader", read_engine)]:
+        if not checked_engine:
+            continue
+        pragmas = await get_sqlite_pragmas(checked_engine)
+        logger.info(f"Database: Active pragmas of the {engine_name} {pragmas}")
+        if db_cfg.profile:
+            for pragma, (expected, active) in get_sqlite_profile_mismatches(pragmas, db_cfg.profile).items():
+                logger.warning(f"Database: {pragma} of the {engine_name} is {active}, expected {expected}.")
+
+    return AsyncSqlalchemyHistoryRepo(
+        engine=engine,
+        read_engine=read_engine,
+        blob_threshold_bytes=blob_cfg.threshold_bytes if blob_cfg else None,
+        blob_compression=blob_cfg.compression if blob_cfg else "zlib",
+    )
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from bisect import bisect_left
+
+from src.history.models import HistoryItem, ToolCall, ToolResult
+from src.history.port import HistoryRepo
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitHistoryWriter:
+    """Collects the history items written during an agent run and writes them in as few
+    transactions as possible, i.e., at the end of the run or after a short time window.
+
+    A ToolCall is held back until its ToolResult arrives and both are written in the same
+    transaction. Hence, a crash or a cancellation never leaves a ToolCall persisted without
+    its ToolResult. The items newer than a held back ToolCall wait for it as well, i.e., the
+    items are written in chronological order across the flushes (as the segment log expects).
+    """
+
+    def __init__(self, history_repo: HistoryRepo, flush_window_s: float = 0.5):
+        self._history_repo = history_repo
+        self._flush_window_s = flush_window_s
+        self._buffer: list[HistoryItem] = []
+        self._pending_tool_calls: dict[str, ToolCall] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: asyncio.Task[None] | None = None
+        self._flush_timer_sleeping = False  # Cancelling is safe until the timer starts its flush
+
+    @property
+    def n_buffered_items(self) -> int:
+        return len(self._buffer) + len(self._pending_tool_calls)
+
+    async def add(self, history_item: HistoryItem):
+        match history_item:
+            case ToolCall():
+                self._pending_tool_calls[history_item.tool_call_id] = history_item
+            case ToolResult():
+                if tool_call := self._pending_tool_calls.pop(history_item.tool_call_id, None):
+                    self._buffer.append(tool_call)
+                self._buffer.append(history_item)
+            case _:
+                self._buffer.append(history_item)
+
+        if self._flush_timer is None or self._flush_timer.done():
+            self._flush_timer_sleeping = True
+            self._flush_timer = asyncio.create_task(self._flush_after_window())
+            self._flush_timer.add_done_callback(self._log_flush_timer_error)
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self._flush_window_s)
+        self._flush_timer_sleeping = False
+        await self.flush()
+
+    @staticmethod
+    def _log_flush_timer_error(flush_timer: asyncio.Task[None]):
+        # The items stay buffered, i.e., the next flush writes them
+        if not flush_timer.cancelled() and (error := flush_timer.exception()):
+            logger.error(f"Flushing the history items after the window failed: {error!r}")
+
+    async def flush(self, final: bool = False) -> list[ToolCall]:
+        """Writes the buffered items in a single transaction, up to the oldest held back ToolCall.
+        Returns the discarded ToolCalls, e.g., to drop them from a cache written through.
+
+        Args:
+            final: bool - Whether the agent run is over. ToolCalls still waiting for their
+                ToolResult are then discarded instead of being kept for the next flush.
+        """
+        # A timer that is flushing already holds the lock, i.e., it is waited for instead. Cancelling it could
+        # interrupt it after its commit and write its items again.
+        if final and self._flush_timer and self._flush_timer_sleeping:
+            self._flush_timer.cancel()
+
+        async with self._flush_lock:
+            items = sorted(self._buffer, key=lambda item: (item.created_at, item.id))
+            discarded_tool_calls: list[ToolCall] = []
+            if final and self._pending_tool_calls:
+                logger.warning(f"Discarding {len(self._pending_tool_calls)} ToolCalls without ToolResult.")
+                discarded_tool_calls = list(self._pending_tool_calls.values())
+                self._pending_tool_calls = {}
+            if self._pending_tool_calls:
+                oldest_pending_key = min((call.created_at, call.id) for call in self._pending_tool_calls.values())
+                n_items = bisect_left(items, oldest_pending_key, key=lambda item: (item.created_at, item.id))
+                items, self._buffer = items[:n_items], items[n_items:]
+            else:
+                self._buffer = []
+            if not items:
+                return discarded_tool_calls
+            try:
+                await self._history_repo.add_history_items(items)
+            except BaseException:
+                # Keep the items for the next flush, nothing of them has been committed
+                self._buffer = items + self._buffer
+                raise
+            return discarded_tool_calls
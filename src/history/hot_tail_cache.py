@@ -0,0 +1,166 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Sequence
+from uuid import UUID
+
+from src.history.models import (
+    HISTORY_ITEM_TYPES_BY_KIND,
+    ConversationSummary,
+    HistoryItem,
+    HistoryItemKind,
+    ModelResponse,
+    ThinkingStep,
+    ToolCall,
+    ToolResult,
+    UserPrompt,
+)
+
+ITEM_OVERHEAD_BYTES = 200  # Rough size of the dataclass, ids and timestamps besides the text payload
+
+
+def estimate_history_item_size(history_item: HistoryItem) -> int:
+    """A cheap estimate of the memory held by an item, dominated by its text payload."""
+    match history_item:
+        case UserPrompt():
+            payload_size = len(history_item.prompt)
+        case ModelResponse():
+            payload_size = len(history_item.response)
+        case ThinkingStep():
+            payload_size = len(history_item.thoughts)
+        case ToolCall():
+            payload_size = len(str(history_item.args))
+        case ToolResult():
+            payload_size = len(str(history_item.result))
+        case ConversationSummary():
+            payload_size = len(history_item.summary)
+    return ITEM_OVERHEAD_BYTES + payload_size
+
+
+@dataclass
+class HotTailCacheStats:
+    hits: int = 0
+    misses: int = 0
+    warmups: int = 0
+    evicted_histories: int = 0
+
+
+@dataclass
+class _HistoryTail:
+    items: deque[HistoryItem] = field(default_factory=deque[HistoryItem])
+    n_bytes: int = 0
+    # Whether the tail holds the complete history, i.e., windows larger than the tail can still be served
+    is_complete: bool = False
+
+
+class HotTailCache:
+    """An in-memory ring buffer of the most recent items per history, bounded by item count and by bytes.
+    Histories are evicted least-recently-used first once more than `max_histories` are active."""
+
+    def __init__(self, max_items_per_history: int, max_bytes_per_history: int, max_histories: int):
+        self._max_items_per_history = max_items_per_history
+        self._max_bytes_per_history = max_bytes_per_history
+        self._max_histories = max_histories
+        self._tails: OrderedDict[UUID, _HistoryTail] = OrderedDict()
+        self.stats = HotTailCacheStats()
+
+    @property
+    def max_items_per_history(self) -> int:
+        return self._max_items_per_history
+
+    def is_warm(self, history_id: UUID) -> bool:
+        return history_id in self._tails
+
+    def warm(self, history_id: UUID, last_items: Sequence[HistoryItem]):
+        """Fills the tail of a history from a single tail query of `max_items_per_history` items."""
+        tail = _HistoryTail(is_complete=len(last_items) < self._max_items_per_history)
+        self._tails[history_id] = tail
+        self._tails.move_to_end(history_id)
+        self.stats.warmups += 1
+        for history_item in last_items:
+            self._append_to_tail(tail, history_item)
+        self._evict_histories()
+
+    def append(self, history_item: HistoryItem):
+        """Write-through of a new item. Cold histories are skipped, they get warmed on their next read."""
+        tail = self._tails.get(history_item.history_id)
+        if tail is not None:
+            self._append_to_tail(tail, history_item)
+
+    def remove(self, history_items: Sequence[HistoryItem]):
+        """Drops items that were appended but never written, e.g., discarded ToolCalls."""
+        removed_ids = {history_item.id for history_item in history_items}
+        for history_id in {history_item.history_id for history_item in history_items}:
+            tail = self._tails.get(history_id)
+            if tail is None:
+                continue
+            kept_items: deque[HistoryItem] = deque()
+            for item in tail.items:
+                if item.id in removed_ids:
+                    tail.n_bytes -= estimate_history_item_size(item)
+                else:
+                    kept_items.append(item)
+            tail.items = kept_items
+
+    def invalidate(self, history_id: UUID):
+        """Drops the tail of a history, e.g., after items have been deleted. It gets warmed again on the next read."""
+        self._tails.pop(history_id, None)
+
+    def get_last_n(self, history_id: UUID, n: int, record_stats: bool = True) -> list[HistoryItem] | None:
+        """Returns the last `n` items if the window fits into the cached tail, `None` otherwise."""
+        tail = self._tails.get(history_id)
+        if tail is None or (n > len(tail.items) and not tail.is_complete):
+            self.stats.misses += record_stats
+            return None
+        self.stats.hits += record_stats
+        self._tails.move_to_end(history_id)
+        if n <= 0:
+            return []
+        return list(tail.items)[-n:]
+
+    def get_last_n_turns(
+        self,
+        history_id: UUID,
+        n_turns: int,
+        kinds: Sequence[HistoryItemKind],
+        record_stats: bool = True,
+    ) -> list[HistoryItem] | None:
+        """Returns the items of the last `n_turns` turns (filtered by `kinds`) if all of them are
+        fully cached, `None` otherwise."""
+        tail = self._tails.get(history_id)
+        if tail is None:
+            self.stats.misses += record_stats
+            return None
+
+        # Walking back to the UserPrompt starting the oldest requested turn
+        items = list(tail.items)
+        start = len(items)
+        n_found_turns = 0
+        while n_found_turns < n_turns and start > 0:
+            start -= 1
+            if isinstance(items[start], UserPrompt):
+                n_found_turns += 1
+        if n_found_turns < n_turns and not tail.is_complete:
+            self.stats.misses += record_stats
+            return None
+        if n_found_turns == 0:
+            start = len(items)
+
+        self.stats.hits += record_stats
+        self._tails.move_to_end(history_id)
+        kind_types = tuple(HISTORY_ITEM_TYPES_BY_KIND[kind] for kind in kinds)
+        return [item for item in items[start:] if isinstance(item, kind_types)]
+
+    def _append_to_tail(self, tail: _HistoryTail, history_item: HistoryItem):
+        tail.items.append(history_item)
+        tail.n_bytes += estimate_history_item_size(history_item)
+        while len(tail.items) > 1 and (
+            len(tail.items) > self._max_items_per_history or tail.n_bytes > self._max_bytes_per_history
+        ):
+            evicted_item = tail.items.popleft()
+            tail.n_bytes -= estimate_history_item_size(evicted_item)
+            tail.is_complete = False
+
+    def _evict_histories(self):
+        while len(self._tails) > self._max_histories:
+            self._tails.popitem(last=False)
+            self.stats.evicted_histories += 1
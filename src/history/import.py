@@ -0,0 +1,37 @@
+"""Imports histories from (compressed) JSONL, see `src.history.jsonl`. Items that exist already are skipped.
+
+Usage:
+    python -m src.history.import <input.jsonl[.gz|.zst]> [--db data/database.db]
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from time import perf_counter
+
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.jsonl import import_history_jsonl
+
+
+async def main(path: Path, db_path: Path, batch_size: int):
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    engine = get_engine(db_path)
+    try:
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        start = perf_counter()
+        n_items = await import_history_jsonl(AsyncSqlalchemyHistoryRepo(engine=engine), path, batch_size=batch_size)
+        elapsed = perf_counter() - start
+        print(f"Imported {n_items} items from {path} in {elapsed:.1f}s ({n_items / max(elapsed, 1e-9):.0f} items/s)")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", type=Path, help="The compression follows the suffix (.gz, .zst)")
+    parser.add_argument("--db", type=Path, default=Path("data/database.db"))
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(main(path=args.path, db_path=args.db, batch_size=args.batch_size))
@@ -0,0 +1,132 @@
+import gzip
+import io
+import json
+from contextlib import contextmanager
+from dataclasses import fields
+from pathlib import Path
+from typing import Any, Generator, Literal, TextIO, cast
+from uuid import UUID
+
+from src.history.models import HISTORY_ITEM_TYPES_BY_KIND, HistoryItem
+from src.history.port import HistoryRepo
+from src.history.service import HistoryService
+
+JsonlCompression = Literal["none", "gzip", "zstd"]
+
+HISTORY_ITEM_KINDS_BY_TYPE = {item_type: kind for kind, item_type in HISTORY_ITEM_TYPES_BY_KIND.items()}
+_HISTORY_ITEM_TYPES_BY_KIND_VALUE = {kind.value: item_type for kind, item_type in HISTORY_ITEM_TYPES_BY_KIND.items()}
+# Looked up once, `dataclasses.asdict` would deep-copy every item
+_FIELD_NAMES_BY_TYPE = {
+    item_type: [field.name for field in fields(item_type)] for item_type in HISTORY_ITEM_KINDS_BY_TYPE
+}
+_UUID_FIELD_NAMES = ["id", "history_id", "turn_id"]
+
+
+def get_compression_for_path(path: Path) -> JsonlCompression:
+    match path.suffix:
+        case ".gz":
+            return "gzip"
+        case ".zst":
+            return "zstd"
+        case _:
+            return "none"
+
+
+@contextmanager
+def open_jsonl(
+    path: Path, mode: Literal["r", "w"], compression: JsonlCompression | None = None
+) -> Generator[TextIO, None, None]:
+    """Opens a (compressed) JSONL file as a text stream. The compression defaults to the one of the file suffix."""
+    compression = compression or get_compression_for_path(path)
+    match compression:
+        case "none":
+            with open(path, mode, encoding="utf-8") as file:
+                yield file
+        case "gzip":
+            # A low level, most of the time goes into compressing otherwise
+            with gzip.open(path, f"{mode}t", encoding="utf-8", compresslevel=3) as file:
+                yield cast(TextIO, file)
+        case "zstd":
+            try:
+                import zstandard  # type: ignore
+            except ImportError as e:
+                raise ImportError('zstd compression requires the "zstandard" package, use gzip otherwise.') from e
+            with open(path, f"{mode}b") as raw_file:
+                if mode == "w":
+                    binary_stream = zstandard.ZstdCompressor().stream_writer(raw_file)  # type: ignore
+                else:
+                    binary_stream = zstandard.ZstdDecompressor().stream_reader(raw_file)  # type: ignore
+                with io.TextIOWrapper(binary_stream, encoding="utf-8") as file:  # type: ignore
+                    yield file
+
+
+def history_item_to_json_dict(history_item: HistoryItem) -> dict[str, Any]:
+    item_type = type(history_item)
+    json_dict: dict[str, Any] = {"kind": HISTORY_ITEM_KINDS_BY_TYPE[item_type].value}
+    for field_name in _FIELD_NAMES_BY_TYPE[item_type]:
+        json_dict[field_name] = getattr(history_item, field_name)
+    for field_name in _UUID_FIELD_NAMES:
+        if json_dict[field_name] is not None:
+            json_dict[field_name] = json_dict[field_name].hex
+    return json_dict
+
+
+def history_item_from_json_dict(json_dict: dict[str, Any]) -> HistoryItem:
+    item_type = _HISTORY_ITEM_TYPES_BY_KIND_VALUE[json_dict["kind"]]
+    kwargs: dict[str, Any] = {field_name: json_dict.get(field_name) for field_name in _FIELD_NAMES_BY_TYPE[item_type]}
+    for field_name in _UUID_FIELD_NAMES:
+        if kwargs[field_name] is not None:
+            kwargs[field_name] = UUID(kwargs[field_name])
+    return item_type(**kwargs)
+
+
+async def export_history_jsonl(
+    history_service: HistoryService,
+    history_id: UUID,
+    path: Path,
+    compression: JsonlCompression | None = None,
+    batch_size: int = 10_000,
+) -> int:
+    """Streams all items of a history into a JSONL file, one item per line in chronological order.
+    Only one batch of items is held in memory. Returns the number of exported items."""
+    n_items = 0
+    with open_jsonl(path, "w", compression) as file:
+        async for batch in history_service.iter_history_items(history_id, batch_size=batch_size):
+            batch = await history_service.resolve_deferred_payloads(batch)
+            file.write("".join(json.dumps(history_item_to_json_dict(item)) + "\n" for item in batch))
+            n_items += len(batch)
+    return n_items
+
+
+async def import_history_jsonl(
+    history_repo: HistoryRepo,
+    path: Path,
+    compression: JsonlCompression | None = None,
+    batch_size: int = 10_000,
+) -> int:
+    """Streams the items of a JSONL file into the repo, one transaction per `batch_size` items.
+    Items that are stored already (by id) are skipped, i.e., an import can be repeated or resumed.
+    Returns the number of read items."""
+    n_items = 0
+    history_ids: set[UUID] = set()
+    batch: list[HistoryItem] = []
+
+    async def add_batch():
+        for history_id in {item.history_id for item in batch} - history_ids:
+            await history_repo.create_history_if_not_exists(history_id)
+            history_ids.add(history_id)
+        await history_repo.add_history_items(batch, skip_existing=True)
+
+    with open_jsonl(path, "r", compression) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            batch.append(history_item_from_json_dict(json.loads(line)))
+            if len(batch) >= batch_size:
+                await add_batch()
+                n_items += len(batch)
+                batch = []
+        if batch:
+            await add_batch()
+            n_items += len(batch)
+    return n_items
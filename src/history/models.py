@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any
 from uuid import UUID
@@ -10,6 +11,30 @@ class HistoryItemKind(Enum):
     THINKING_STEP = "thinking_step"
     TOOL_CALL = "tool_call"
     TOOL_RESULT = "tool_result"
+    CONVERSATION_SUMMARY = "conversation_summary"
+
+
+# The kinds that are mapped into the model context as they are. ThinkingSteps are not,
+# ConversationSummaries are added separately as a system prompt.
+CONTEXT_HISTORY_ITEM_KINDS = [
+    HistoryItemKind.USER_PROMPT,
+    HistoryItemKind.MODEL_RESPONSE,
+    HistoryItemKind.TOOL_CALL,
+    HistoryItemKind.TOOL_RESULT,
+]
+
+
+class DeferredPayload(str):
+    """A large payload (a ToolResult's result or a ThinkingStep's thoughts) that was read without loading it,
+    i.e., only its beginning. Works as that text wherever a preview does (search, summaries, embeddings),
+    `HistoryRepo.resolve_deferred_payloads` loads the payload itself."""
+
+    ref: str  # Of the payload in its repo, e.g., a blob hash
+
+    def __new__(cls, preview: str, ref: str):
+        payload = super().__new__(cls, preview)
+        payload.ref = ref
+        return payload
 
 
 @dataclass(frozen=True)
@@ -17,6 +42,8 @@ class BaseHistoryItem:
     id: UUID
     history_id: UUID
     created_at: int
+    # The id of the UserPrompt that started the turn (agent run) this item was written in
+    turn_id: UUID | None = field(default=None, kw_only=True)
 
 
 @dataclass(frozen=True)
@@ -31,7 +58,7 @@ class ModelResponse(BaseHistoryItem):
 
 @dataclass(frozen=True)
 class ThinkingStep(BaseHistoryItem):
-    thoughts: str
+    thoughts: str  # Possibly a `DeferredPayload`
 
 
 @dataclass(frozen=True)
@@ -46,10 +73,74 @@ class ToolResult(BaseHistoryItem):
     tool_call_id: str
     tool_name: str
     is_retry: bool
-    result: Any
+    result: Any  # Possibly a `DeferredPayload`
+
+
+@dataclass(frozen=True)
+class ConversationSummary(BaseHistoryItem):
+    """A rolling summary of the conversation, covering all items created until `covers_until`
+    (including the previous summary)."""
+
+    summary: str
+    covers_until: int
+
+
+HistoryItem = UserPrompt | ModelResponse | ThinkingStep | ToolCall | ToolResult | ConversationSummary
+
+HISTORY_ITEM_TYPES_BY_KIND: dict[HistoryItemKind, type[HistoryItem]] = {
+    HistoryItemKind.USER_PROMPT: UserPrompt,
+    HistoryItemKind.MODEL_RESPONSE: ModelResponse,
+    HistoryItemKind.THINKING_STEP: ThinkingStep,
+    HistoryItemKind.TOOL_CALL: ToolCall,
+    HistoryItemKind.TOOL_RESULT: ToolResult,
+    HistoryItemKind.CONVERSATION_SUMMARY: ConversationSummary,
+}
+
+# Total order of the items of a history: (created_at, id)
+HistoryItemKey = tuple[int, UUID]
+
+# Timestamps (`created_at`) are in ns
+NS_PER_DAY = 24 * 60 * 60 * 1_000_000_000
 
 
-HistoryItem = UserPrompt | ModelResponse | ThinkingStep | ToolCall | ToolResult
+@dataclass(frozen=True)
+class HistorySearchHit:
+    item: HistoryItem
+    rank: float  # BM25 relevance, lower is better
+    snippet: str  # The matching part of the item's text, matches are wrapped in [brackets]
+
+
+@dataclass(frozen=True)
+class ToolStats:
+    tool_name: str
+    n_calls: int
+    n_results: int  # Including retries
+    n_orphan_calls: int  # ToolCalls without any ToolResult, e.g., of cancelled runs
+    mean_result_length: float | None  # Characters, see `get_payload_length`
+
+
+def get_payload_length(payload: Any) -> int:
+    """The length of a ToolCall's args or a ToolResult's result: the characters of a string, otherwise of its
+    compact JSON as stored (non-ASCII escaped), i.e., as returned by SQLite's `json_extract`."""
+    if payload is None:
+        return 0
+    if isinstance(payload, str):
+        return len(payload)
+    return len(json.dumps(payload, separators=(",", ":")))
+
+
+@dataclass(frozen=True)
+class IndexingOutboxEntry:
+    """A history item waiting to be indexed by the RAG service."""
+
+    history_item: HistoryItem
+    attempts: int  # Failed indexing attempts so far
+
+
+@dataclass(frozen=True)
+class IndexingOutboxStats:
+    depth: int  # Entries waiting to be indexed, including those waiting for a retry
+    oldest_created_at: int | None  # Of the oldest waiting item, i.e., the indexing lag
 
 
 @dataclass(frozen=True)
@@ -1,7 +1,18 @@
-from typing import Protocol
+from typing import Protocol, Sequence, runtime_checkable
 from uuid import UUID
 
-from src.history.models import History, HistoryItem
+from src.history.models import (
+    CONTEXT_HISTORY_ITEM_KINDS,
+    History,
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    HistorySearchHit,
+    IndexingOutboxEntry,
+    IndexingOutboxStats,
+    ToolCall,
+    ToolStats,
+)
 
 
 class HistoryRepo(Protocol):
@@ -9,4 +20,117 @@ class HistoryRepo(Protocol):
 
     async def get_or_create_history(self, history_id: UUID) -> History: ...
 
+    async def create_history_if_not_exists(self, history_id: UUID) -> None: ...
+
     async def add_history_item(self, history_item: HistoryItem) -> None: ...
+
+    async def add_history_items(self, history_items: Sequence[HistoryItem], skip_existing: bool = False) -> None:
+        """Adds all items in a single transaction. With `skip_existing`, items whose id is
+        already stored are skipped instead of failing the transaction."""
+        ...
+
+    async def get_last_n_items(self, history_id: UUID, n: int) -> list[HistoryItem]:
+        """Returns the last `n` items of the history in chronological order."""
+        ...
+
+    async def get_last_n_turns(
+        self,
+        history_id: UUID,
+        n_turns: int,
+        kinds: Sequence[HistoryItemKind] = CONTEXT_HISTORY_ITEM_KINDS,
+    ) -> list[HistoryItem]:
+        """Returns the items of the last `n_turns` turns in chronological order, only of the given `kinds`."""
+        ...
+
+    async def get_last_item_of_kind(self, history_id: UUID, kind: HistoryItemKind) -> HistoryItem | None:
+        """Returns the most recent item of the given `kind`, if any."""
+        ...
+
+    async def get_items_page(
+        self,
+        history_id: UUID,
+        after: HistoryItemKey | None = None,
+        since: int | None = None,
+        limit: int = 1000,
+    ) -> list[HistoryItem]:
+        """Returns up to `limit` items in chronological order, starting after the key `after`
+        and not earlier than `since` (created_at)."""
+        ...
+
+    async def resolve_deferred_payloads(self, history_items: Sequence[HistoryItem]) -> list[HistoryItem]:
+        """Returns the items with their `DeferredPayload`s loaded. Only the context-window reads
+        (`get_last_n_items`, `get_last_n_turns`) load them by themselves."""
+        ...
+
+    async def query_items(
+        self,
+        history_id: UUID,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        limit: int = 1000,
+        newest_first: bool = False,
+    ) -> list[HistoryItem]:
+        """Returns up to `limit` items created in `[since, until)`, only of the given `kinds` (all if `None`),
+        in chronological order, or the most recent ones first with `newest_first`."""
+        ...
+
+    async def search_items(self, history_id: UUID, query: str, limit: int = 10) -> list[HistorySearchHit]:
+        """Ranked keyword search over the text of the prompts, responses and tool results,
+        best matches first."""
+        ...
+
+    async def get_nth_last_item_key(self, history_id: UUID, n: int) -> HistoryItemKey | None:
+        """Returns the key of the `n`th most recent item (`n=1` is the latest), if the history has that many."""
+        ...
+
+    async def get_tool_stats(self, history_id: UUID) -> list[ToolStats]:
+        """Returns the calls, results and orphan calls per tool, most called first."""
+        ...
+
+    async def get_orphan_tool_calls(self, history_id: UUID, limit: int = 100) -> list[ToolCall]:
+        """Returns up to `limit` of the oldest ToolCalls without any ToolResult, e.g., of cancelled runs."""
+        ...
+
+
+@runtime_checkable
+class PrunableHistoryRepo(Protocol):
+    """The HistoryRepos that can delete items, i.e., support the retention. Not the segment log, which is
+    append-only."""
+
+    async def delete_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        limit: int = 1000,
+        up_to: HistoryItemKey | None = None,
+    ) -> list[HistoryItemKey]:
+        """Deletes up to `limit` of the oldest items created before `created_before` (and not after the key
+        `up_to`, if given), only of the given `kinds` (all if `None`), in a single transaction. Returns the
+        keys of the deleted items in chronological order."""
+        ...
+
+
+class IndexingOutbox(Protocol):
+    """The items written to the history that still have to be indexed by the RAG service. Entries are
+    added in the transaction of their item, i.e., none are lost if the indexing fails or the process dies."""
+
+    async def set_outbox_enabled(self, is_enabled: bool) -> None:
+        """Starts or stops enqueuing new items, i.e., only while something drains the outbox. Stopping
+        also drops the entries left over."""
+        ...
+
+    async def get_outbox_entries(self, limit: int = 100) -> list[IndexingOutboxEntry]:
+        """Returns up to `limit` entries that are due for (another) attempt, oldest items first."""
+        ...
+
+    async def complete_outbox_entries(self, entries: Sequence[IndexingOutboxEntry]) -> None: ...
+
+    async def retry_outbox_entries(
+        self, entries: Sequence[IndexingOutboxEntry], error: str, next_attempt_at: int
+    ) -> None:
+        """Counts a failed attempt, the entries are due again at `next_attempt_at` (ns)."""
+        ...
+
+    async def get_outbox_stats(self) -> IndexingOutboxStats: ...
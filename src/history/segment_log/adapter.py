@@ -0,0 +1,424 @@
+import asyncio
+import heapq
+import json
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import time_ns
+from typing import Iterator, Sequence
+from uuid import UUID
+
+from src.history.jsonl import history_item_from_json_dict, history_item_to_json_dict
+from src.history.models import (
+    CONTEXT_HISTORY_ITEM_KINDS,
+    HISTORY_ITEM_TYPES_BY_KIND,
+    History,
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    HistorySearchHit,
+    ModelResponse,
+    ToolCall,
+    ToolResult,
+    ToolStats,
+    UserPrompt,
+    get_payload_length,
+)
+from src.history.segment_log.log import RecordPosition, SegmentLog
+
+HISTORY_METADATA_FILENAME = "history.json"
+SNIPPET_CONTEXT_CHARS = 60
+
+
+def _encode_history_item(history_item: HistoryItem) -> bytes:
+    return json.dumps(history_item_to_json_dict(history_item)).encode()
+
+
+def _decode_history_item(payload: bytes) -> HistoryItem:
+    return history_item_from_json_dict(json.loads(payload))
+
+
+def _get_searchable_text(history_item: HistoryItem) -> str | None:
+    match history_item:
+        case UserPrompt():
+            return history_item.prompt
+        case ModelResponse():
+            return history_item.response
+        case ToolResult():
+            return history_item.result if isinstance(history_item.result, str) else json.dumps(history_item.result)
+        case _:
+            return None
+
+
+def _get_snippet(text: str, terms: list[str]) -> str:
+    lowered_text = text.lower()
+    match_start = min((index for term in terms if (index := lowered_text.find(term)) >= 0), default=0)
+    match_end = next(match_start + len(term) for term in terms if lowered_text.startswith(term, match_start))
+    start = max(match_start - SNIPPET_CONTEXT_CHARS, 0)
+    end = min(match_end + SNIPPET_CONTEXT_CHARS, len(text))
+    return (
+        ("..." if start > 0 else "")
+        + f"{text[start:match_start]}[{text[match_start:match_end]}]{text[match_end:end]}"
+        + ("..." if end < len(text) else "")
+    )
+
+
+@dataclass
+class _HistoryLog:
+    log: SegmentLog
+    created_at: int
+    n_records: int = 0
+    # (created_at, position) of every `index_every_n_records`th record, i.e., in chronological order
+    sparse_index: list[tuple[int, RecordPosition]] = field(default_factory=list[tuple[int, RecordPosition]])
+    # The ids of all items, only built once `skip_existing` is used
+    item_ids: set[UUID] | None = None
+    # Appends run in a worker thread with `fsync`, one at a time
+    append_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SegmentLogHistoryRepo:
+    """A HistoryRepo storing every history as an append-only log of JSON records in rotating segment
+    files (see `SegmentLog`), one directory per history.
+
+    Items are appended in chronological order (batches are sorted before appending), i.e., items must
+    not be added to a history after newer ones, reads return them in append order. Tail reads walk
+    the log backwards from its end, page reads seek via a sparse in-memory index that is rebuilt from
+    the log when a history is first accessed. Histories are expected to be written by a single process.
+
+    The reads, scans and searches run in worker threads, i.e., they do not block the event loop. They
+    see the appends that are complete, see `SegmentLog`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False,
+        index_every_n_records: int = 1024,
+    ):
+        self._path = path
+        self._max_segment_bytes = max_segment_bytes
+        self._fsync = fsync
+        self._index_every_n_records = index_every_n_records
+        self._history_logs: dict[UUID, _HistoryLog] = {}
+        self._open_lock = threading.Lock()  # A history is opened by the first of the threads reading it
+        self._path.mkdir(parents=True, exist_ok=True)
+
+    def _history_path(self, history_id: UUID) -> Path:
+        return self._path / history_id.hex
+
+    def _get_history_log(self, history_id: UUID) -> _HistoryLog | None:
+        if history_log := self._history_logs.get(history_id):
+            return history_log
+        with self._open_lock:
+            return self._open_history_log(history_id)
+
+    def _open_history_log(self, history_id: UUID) -> _HistoryLog | None:
+        if history_log := self._history_logs.get(history_id):
+            return history_log
+        metadata_path = self._history_path(history_id) / HISTORY_METADATA_FILENAME
+        if not metadata_path.exists():
+            return None
+        metadata = json.loads(metadata_path.read_text())
+        history_log = _HistoryLog(
+            log=SegmentLog(self._history_path(history_id), self._max_segment_bytes, self._fsync),
+            created_at=metadata["created_at"],
+        )
+        for position, payload in history_log.log.iter_forward():
+            if history_log.n_records % self._index_every_n_records == 0:
+                history_log.sparse_index.append((_decode_history_item(payload).created_at, position))
+            history_log.n_records += 1
+        self._history_logs[history_id] = history_log
+        return history_log
+
+    def _get_existing_history_log(self, history_id: UUID) -> _HistoryLog:
+        history_log = self._get_history_log(history_id)
+        if history_log is None:
+            # Same as the foreign key of the SQL adapter
+            raise ValueError(f"History {history_id} does not exist.")
+        return history_log
+
+    def _iter_items_backward(self, history_id: UUID) -> Iterator[HistoryItem]:
+        if history_log := self._get_history_log(history_id):
+            for _, payload in history_log.log.iter_backward():
+                yield _decode_history_item(payload)
+
+    def _iter_items_forward(self, history_id: UUID, since: int | None = None) -> Iterator[HistoryItem]:
+        history_log = self._get_history_log(history_id)
+        if history_log is None:
+            return
+        start: RecordPosition | None = None
+        if since is not None and history_log.sparse_index:
+            # The last indexed record before `since`, items at exactly `since` may follow it
+            index = bisect_left(history_log.sparse_index, since, key=lambda entry: entry[0])
+            start = history_log.sparse_index[index - 1][1] if index > 0 else None
+        for _, payload in history_log.log.iter_forward(start):
+            yield _decode_history_item(payload)
+
+    def _get_or_create_history(self, history_id: UUID) -> History:
+        self._create_history_if_not_exists(history_id)
+        history_log = self._get_existing_history_log(history_id)
+        return History(
+            id=history_id,
+            created_at=history_log.created_at,
+            items=list(self._iter_items_forward(history_id)),
+        )
+
+    async def get_or_create_history(self, history_id: UUID) -> History:
+        return await asyncio.to_thread(self._get_or_create_history, history_id)
+
+    def _create_history_if_not_exists(self, history_id: UUID) -> None:
+        if self._get_history_log(history_id):
+            return
+        history_path = self._history_path(history_id)
+        history_path.mkdir(parents=True, exist_ok=True)
+        metadata = {"id": history_id.hex, "created_at": time_ns()}
+        (history_path / HISTORY_METADATA_FILENAME).write_text(json.dumps(metadata))
+
+    async def create_history_if_not_exists(self, history_id: UUID) -> None:
+        await asyncio.to_thread(self._create_history_if_not_exists, history_id)
+
+    async def add_history_item(self, history_item: HistoryItem) -> None:
+        await self.add_history_items([history_item])
+
+    async def add_history_items(self, history_items: Sequence[HistoryItem], skip_existing: bool = False) -> None:
+        items_by_history_id: dict[UUID, list[HistoryItem]] = {}
+        for history_item in history_items:
+            items_by_history_id.setdefault(history_item.history_id, []).append(history_item)
+
+        for history_id, items in items_by_history_id.items():
+            history_log = self._history_logs.get(history_id) or await asyncio.to_thread(
+                self._get_existing_history_log, history_id
+            )
+            async with history_log.append_lock:
+                await self._append_history_items(history_log, history_id, items, skip_existing)
+
+    async def _append_history_items(
+        self, history_log: _HistoryLog, history_id: UUID, items: list[HistoryItem], skip_existing: bool
+    ):
+        if skip_existing:
+            if history_log.item_ids is None:
+                history_log.item_ids = await asyncio.to_thread(
+                    lambda: {item.id for item in self._iter_items_forward(history_id)}
+                )
+            items = [item for item in items if item.id not in history_log.item_ids]
+        items.sort(key=lambda item: (item.created_at, item.id))
+        if not items:
+            return
+
+        payloads = [_encode_history_item(item) for item in items]
+        if self._fsync:
+            positions = await asyncio.to_thread(history_log.log.append, payloads)
+        else:
+            # Into the page cache only, i.e., quicker than the hop to a thread
+            positions = history_log.log.append(payloads)
+
+        for item, position in zip(items, positions):
+            if history_log.n_records % self._index_every_n_records == 0:
+                history_log.sparse_index.append((item.created_at, position))
+            history_log.n_records += 1
+        if history_log.item_ids is not None:
+            history_log.item_ids.update(item.id for item in items)
+
+    def _get_last_n_items(self, history_id: UUID, n: int) -> list[HistoryItem]:
+        items: list[HistoryItem] = []
+        for item in self._iter_items_backward(history_id):
+            items.append(item)
+            if len(items) >= n:
+                break
+        return items[::-1]
+
+    async def get_last_n_items(self, history_id: UUID, n: int) -> list[HistoryItem]:
+        if n <= 0:
+            return []
+        return await asyncio.to_thread(self._get_last_n_items, history_id, n)
+
+    def _get_last_n_turns(self, history_id: UUID, n_turns: int, kinds: Sequence[HistoryItemKind]) -> list[HistoryItem]:
+        kind_types = tuple(HISTORY_ITEM_TYPES_BY_KIND[kind] for kind in kinds)
+        items: list[HistoryItem] = []
+        turn_ids: set[UUID] = set()
+        for item in self._iter_items_backward(history_id):
+            if isinstance(item, UserPrompt):
+                turn_ids.add(item.id)
+            if item.turn_id is not None and isinstance(item, kind_types):
+                items.append(item)
+            if len(turn_ids) >= n_turns:
+                break
+        # Items of a turn can only follow its UserPrompt, i.e., all of them have been read by now
+        return [item for item in reversed(items) if item.turn_id in turn_ids]
+
+    async def get_last_n_turns(
+        self,
+        history_id: UUID,
+        n_turns: int,
+        kinds: Sequence[HistoryItemKind] = CONTEXT_HISTORY_ITEM_KINDS,
+    ) -> list[HistoryItem]:
+        if n_turns <= 0:
+            return []
+        return await asyncio.to_thread(self._get_last_n_turns, history_id, n_turns, kinds)
+
+    def _get_last_item_of_kind(self, history_id: UUID, kind: HistoryItemKind) -> HistoryItem | None:
+        kind_type = HISTORY_ITEM_TYPES_BY_KIND[kind]
+        return next((item for item in self._iter_items_backward(history_id) if isinstance(item, kind_type)), None)
+
+    async def get_last_item_of_kind(self, history_id: UUID, kind: HistoryItemKind) -> HistoryItem | None:
+        return await asyncio.to_thread(self._get_last_item_of_kind, history_id, kind)
+
+    def _get_items_page(
+        self, history_id: UUID, after: HistoryItemKey | None, since: int | None, limit: int
+    ) -> list[HistoryItem]:
+        start_created_at = max(after[0] if after else 0, since or 0)
+        items: list[HistoryItem] = []
+        for item in self._iter_items_forward(history_id, since=start_created_at or None):
+            if len(items) >= limit:
+                break
+            if since is not None and item.created_at < since:
+                continue
+            if after is not None and (item.created_at, item.id) <= after:
+                continue
+            items.append(item)
+        return items
+
+    async def get_items_page(
+        self,
+        history_id: UUID,
+        after: HistoryItemKey | None = None,
+        since: int | None = None,
+        limit: int = 1000,
+    ) -> list[HistoryItem]:
+        return await asyncio.to_thread(self._get_items_page, history_id, after, since, limit)
+
+    async def resolve_deferred_payloads(self, history_items: Sequence[HistoryItem]) -> list[HistoryItem]:
+        # Payloads are stored (and read) inline, i.e., never deferred
+        return list(history_items)
+
+    def _query_items(
+        self,
+        history_id: UUID,
+        kinds: Sequence[HistoryItemKind] | None,
+        since: int | None,
+        until: int | None,
+        limit: int,
+        newest_first: bool,
+    ) -> list[HistoryItem]:
+        kind_types = tuple(
+            HISTORY_ITEM_TYPES_BY_KIND[kind] for kind in (kinds if kinds is not None else HistoryItemKind)
+        )
+        items: list[HistoryItem] = []
+        if newest_first:
+            # From the end of the log, i.e., reads everything newer than `until` as well
+            for item in self._iter_items_backward(history_id):
+                if since is not None and item.created_at < since:
+                    break
+                if (until is None or item.created_at < until) and isinstance(item, kind_types):
+                    items.append(item)
+                    if len(items) >= limit:
+                        break
+            return items
+        for item in self._iter_items_forward(history_id, since=since):
+            if until is not None and item.created_at >= until:
+                break
+            if (since is None or item.created_at >= since) and isinstance(item, kind_types):
+                items.append(item)
+                if len(items) >= limit:
+                    break
+        return items
+
+    async def query_items(
+        self,
+        history_id: UUID,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        limit: int = 1000,
+        newest_first: bool = False,
+    ) -> list[HistoryItem]:
+        if limit <= 0:
+            return []
+        return await asyncio.to_thread(self._query_items, history_id, kinds, since, until, limit, newest_first)
+
+    def _search_items(self, history_id: UUID, terms: list[str], limit: int) -> list[HistorySearchHit]:
+        # A full scan, counting the occurrences of the terms. The SQL adapter keeps a full-text index instead.
+        hits: list[tuple[float, int, HistorySearchHit]] = []
+        for n_item, item in enumerate(self._iter_items_forward(history_id)):
+            text = _get_searchable_text(item)
+            if text is None:
+                continue
+            lowered_text = text.lower()
+            score = sum(lowered_text.count(term) for term in terms)
+            if score:
+                # Lower ranks are better, as for BM25 in FTS5
+                hit = HistorySearchHit(item=item, rank=-score, snippet=_get_snippet(text, terms))
+                hits.append((-score, n_item, hit))
+        return [hit for _, _, hit in heapq.nsmallest(limit, hits)]
+
+    async def search_items(self, history_id: UUID, query: str, limit: int = 10) -> list[HistorySearchHit]:
+        terms = [term.lower() for term in query.split()]
+        if not terms or limit <= 0:
+            return []
+        return await asyncio.to_thread(self._search_items, history_id, terms, limit)
+
+    def _get_tool_calls_and_result_lengths(self, history_id: UUID) -> tuple[list[ToolCall], dict[str, list[int]]]:
+        # A full scan, the SQL adapter pairs via its (history_id, tool_call_id) index instead
+        tool_calls: list[ToolCall] = []
+        result_lengths: dict[str, list[int]] = {}
+        for item in self._iter_items_forward(history_id):
+            match item:
+                case ToolCall():
+                    tool_calls.append(item)
+                case ToolResult():
+                    result_lengths.setdefault(item.tool_call_id, []).append(get_payload_length(item.result))
+                case _:
+                    pass
+        return tool_calls, result_lengths
+
+    def _get_tool_stats(self, history_id: UUID) -> list[ToolStats]:
+        tool_calls, result_lengths = self._get_tool_calls_and_result_lengths(history_id)
+        lengths_by_tool: dict[str, list[int]] = {}
+        n_calls: dict[str, int] = {}
+        n_orphan_calls: dict[str, int] = {}
+        for tool_call in tool_calls:
+            name = tool_call.tool_name
+            n_calls[name] = n_calls.get(name, 0) + 1
+            n_orphan_calls[name] = n_orphan_calls.get(name, 0) + (tool_call.tool_call_id not in result_lengths)
+            lengths_by_tool.setdefault(name, []).extend(result_lengths.get(tool_call.tool_call_id, []))
+        all_tool_stats = [
+            ToolStats(
+                tool_name=name,
+                n_calls=n_calls[name],
+                n_results=len(lengths_by_tool[name]),
+                n_orphan_calls=n_orphan_calls[name],
+                mean_result_length=sum(lengths_by_tool[name]) / len(lengths_by_tool[name])
+                if lengths_by_tool[name]
+                else None,
+            )
+            for name in n_calls
+        ]
+        return sorted(all_tool_stats, key=lambda tool_stats: tool_stats.n_calls, reverse=True)
+
+    async def get_tool_stats(self, history_id: UUID) -> list[ToolStats]:
+        return await asyncio.to_thread(self._get_tool_stats, history_id)
+
+    def _get_orphan_tool_calls(self, history_id: UUID, limit: int) -> list[ToolCall]:
+        tool_calls, result_lengths = self._get_tool_calls_and_result_lengths(history_id)
+        return [tool_call for tool_call in tool_calls if tool_call.tool_call_id not in result_lengths][:limit]
+
+    async def get_orphan_tool_calls(self, history_id: UUID, limit: int = 100) -> list[ToolCall]:
+        return await asyncio.to_thread(self._get_orphan_tool_calls, history_id, limit)
+
+    def _get_nth_last_item_key(self, history_id: UUID, n: int) -> HistoryItemKey | None:
+        for n_item, item in enumerate(self._iter_items_backward(history_id), start=1):
+            if n_item == n:
+                return (item.created_at, item.id)
+        return None
+
+    async def get_nth_last_item_key(self, history_id: UUID, n: int) -> HistoryItemKey | None:
+        if n <= 0:
+            return None
+        return await asyncio.to_thread(self._get_nth_last_item_key, history_id, n)
+
+    def close(self):
+        for history_log in self._history_logs.values():
+            history_log.log.close()
+        self._history_logs = {}
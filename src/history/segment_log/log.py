@@ -0,0 +1,148 @@
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, Sequence
+
+logger = logging.getLogger(__name__)
+
+# [length][crc32 of the payload][payload][length]. The trailing length lets tail reads walk backwards.
+RECORD_HEADER = struct.Struct("<II")
+RECORD_TRAILER = struct.Struct("<I")
+RECORD_OVERHEAD = RECORD_HEADER.size + RECORD_TRAILER.size
+SEGMENT_SUFFIX = ".log"
+
+# (segment number, byte offset of the record in the segment)
+RecordPosition = tuple[int, int]
+
+
+def _encode_record(payload: bytes) -> bytes:
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload + RECORD_TRAILER.pack(len(payload))
+
+
+def _read_valid_record(file: BinaryIO, offset: int, file_size: int) -> bytes | None:
+    """Reads the record at `offset` if it is complete and its checksum matches."""
+    if offset + RECORD_OVERHEAD > file_size:
+        return None
+    file.seek(offset)
+    length, crc = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+    if offset + RECORD_OVERHEAD + length > file_size:
+        return None
+    payload = file.read(length)
+    (trailing_length,) = RECORD_TRAILER.unpack(file.read(RECORD_TRAILER.size))
+    if trailing_length != length or zlib.crc32(payload) != crc:
+        return None
+    return payload
+
+
+class SegmentLog:
+    """An append-only log of length-prefixed, checksummed records in rotating segment files.
+
+    Only the last segment is ever written to. On opening, it is checked record by record and cut
+    after the last complete one, i.e., a crash in the middle of an append loses that append only.
+
+    A single writer, but readers in any thread: they only read up to the end published after the last
+    complete append, i.e., never a record that is still being written.
+    """
+
+    def __init__(self, path: Path, max_segment_bytes: int = 64 * 1024 * 1024, fsync: bool = False):
+        self._path = path
+        self._max_segment_bytes = max_segment_bytes
+        self._fsync = fsync
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._segment_numbers = sorted(int(segment.stem) for segment in self._path.glob(f"*{SEGMENT_SUFFIX}"))
+        if not self._segment_numbers:
+            self._segment_numbers = [1]
+            self._segment_path(1).touch()
+        self._recover_last_segment()
+        self._writer = open(self._segment_path(self._segment_numbers[-1]), "ab")
+        self._published_lock = threading.Lock()
+        self._published_segment_numbers = list(self._segment_numbers)
+        self._published_end = self._writer.tell()  # Of the last segment, the others are sealed
+
+    def _segment_path(self, segment_number: int) -> Path:
+        return self._path / f"{segment_number:08d}{SEGMENT_SUFFIX}"
+
+    def _recover_last_segment(self):
+        segment_path = self._segment_path(self._segment_numbers[-1])
+        file_size = segment_path.stat().st_size
+        offset = 0
+        with open(segment_path, "rb") as file:
+            while (payload := _read_valid_record(file, offset, file_size)) is not None:
+                offset += RECORD_OVERHEAD + len(payload)
+        if offset < file_size:
+            logger.warning(f"Truncating {segment_path} from {file_size} to {offset} bytes after an incomplete write.")
+            os.truncate(segment_path, offset)
+
+    def append(self, payloads: Sequence[bytes]) -> list[RecordPosition]:
+        """Appends the records with a single write and returns their positions."""
+        segment_number = self._segment_numbers[-1]
+        offset = self._writer.tell()
+        positions: list[RecordPosition] = []
+        records: list[bytes] = []
+        for payload in payloads:
+            positions.append((segment_number, offset))
+            record = _encode_record(payload)
+            records.append(record)
+            offset += len(record)
+        self._writer.write(b"".join(records))
+        self._writer.flush()
+        if self._fsync:
+            os.fsync(self._writer.fileno())
+        if offset >= self._max_segment_bytes:
+            self._rotate()
+        with self._published_lock:
+            self._published_segment_numbers = list(self._segment_numbers)
+            self._published_end = self._writer.tell()
+        return positions
+
+    def _get_published_segments(self) -> list[tuple[int, int | None]]:
+        """The segments and the end of the readable records in each (`None` up to the end of a sealed one)."""
+        with self._published_lock:
+            segment_numbers, end = self._published_segment_numbers, self._published_end
+        segments: list[tuple[int, int | None]] = [(segment_number, None) for segment_number in segment_numbers[:-1]]
+        segments.append((segment_numbers[-1], end))
+        return segments
+
+    def _rotate(self):
+        self._writer.close()
+        self._segment_numbers.append(self._segment_numbers[-1] + 1)
+        self._writer = open(self._segment_path(self._segment_numbers[-1]), "ab")
+
+    def iter_forward(self, start: RecordPosition | None = None) -> Iterator[tuple[RecordPosition, bytes]]:
+        """Yields the records from `start` (or the first record) to the end of the log."""
+        segments = self._get_published_segments()
+        start_segment, start_offset = start or (segments[0][0], 0)
+        for segment_number, end in segments:
+            if segment_number < start_segment:
+                continue
+            offset = start_offset if segment_number == start_segment else 0
+            with open(self._segment_path(segment_number), "rb") as file:
+                if end is None:
+                    end = file.seek(0, os.SEEK_END)
+                file.seek(offset)
+                while offset < end:
+                    length, _ = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+                    payload = file.read(length)
+                    file.seek(RECORD_TRAILER.size, os.SEEK_CUR)
+                    yield (segment_number, offset), payload
+                    offset += RECORD_OVERHEAD + length
+
+    def iter_backward(self) -> Iterator[tuple[RecordPosition, bytes]]:
+        """Yields the records from the end of the log backwards, i.e., reading the tail is independent of the log size."""
+        for segment_number, end in reversed(self._get_published_segments()):
+            with open(self._segment_path(segment_number), "rb") as file:
+                if end is None:
+                    end = file.seek(0, os.SEEK_END)
+                while end > 0:
+                    file.seek(end - RECORD_TRAILER.size)
+                    (length,) = RECORD_TRAILER.unpack(file.read(RECORD_TRAILER.size))
+                    offset = end - RECORD_OVERHEAD - length
+                    file.seek(offset + RECORD_HEADER.size)
+                    yield (segment_number, offset), file.read(length)
+                    end = offset
+
+    def close(self):
+        self._writer.close()
@@ -1,21 +1,240 @@
-from typing import Sequence
+from typing import AsyncIterator, Sequence, TypeVar, cast
 from uuid import UUID
 
 from src.ai.models import SystemPrompt
-from src.history.models import History, HistoryItem
-from src.history.port import HistoryRepo
+from src.history.group_commit import GroupCommitHistoryWriter
+from src.history.hot_tail_cache import HotTailCache, HotTailCacheStats
+from src.history.models import (
+    CONTEXT_HISTORY_ITEM_KINDS,
+    ConversationSummary,
+    History,
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    HistorySearchHit,
+    ToolCall,
+    ToolStats,
+)
+from src.history.port import HistoryRepo, PrunableHistoryRepo
+
+T = TypeVar("T", bound=HistoryItem)
 
 
 class HistoryService:
-    def __init__(self, history_repo: HistoryRepo):
+    def __init__(
+        self,
+        history_repo: HistoryRepo,
+        group_commit_window_s: float | None = None,
+        hot_tail_cache: HotTailCache | None = None,
+    ):
         self._history_repo = history_repo
+        # Optional write-through cache of the most recent items, see `HotTailCache`
+        self._hot_tail_cache = hot_tail_cache
+        # Optional write batching, see `GroupCommitHistoryWriter`
+        self._group_commit_writer = (
+            GroupCommitHistoryWriter(history_repo, flush_window_s=group_commit_window_s)
+            if group_commit_window_s is not None
+            else None
+        )
+        # The latest ConversationSummary per history (`None` if there is none yet), read once per history
+        self._conversation_summaries: dict[UUID, ConversationSummary | None] = {}
 
     async def get_or_create_history_by_id(self, history_id: UUID) -> History:
         return await self._history_repo.get_or_create_history(history_id)
 
+    async def create_history_if_not_exists(self, history_id: UUID):
+        await self._history_repo.create_history_if_not_exists(history_id)
+
+    @property
+    def hot_tail_cache_stats(self) -> HotTailCacheStats | None:
+        return self._hot_tail_cache.stats if self._hot_tail_cache else None
+
     async def add_history_item(self, history_item: HistoryItem):
-        await self._history_repo.add_history_item(history_item)
+        if self._hot_tail_cache:
+            self._hot_tail_cache.append(history_item)
+        if isinstance(history_item, ConversationSummary):
+            self._conversation_summaries[history_item.history_id] = history_item
+        if self._group_commit_writer:
+            await self._group_commit_writer.add(history_item)
+        else:
+            await self._history_repo.add_history_item(history_item)
+
+    async def add_history_items(self, history_items: Sequence[HistoryItem]):
+        if self._hot_tail_cache:
+            for history_item in history_items:
+                self._hot_tail_cache.append(history_item)
+        for history_item in history_items:
+            if isinstance(history_item, ConversationSummary):
+                self._conversation_summaries[history_item.history_id] = history_item
+        if self._group_commit_writer:
+            for history_item in history_items:
+                await self._group_commit_writer.add(history_item)
+        else:
+            await self._history_repo.add_history_items(history_items)
+
+    async def flush_history_items(self, final: bool = False):
+        """Writes the items buffered by the group commit writer (if enabled).
+
+        Args:
+            final: bool - Whether the agent run is over, see `GroupCommitHistoryWriter.flush`.
+        """
+        if self._group_commit_writer:
+            discarded_tool_calls = await self._group_commit_writer.flush(final=final)
+            # They were written through to the cache already
+            if discarded_tool_calls and self._hot_tail_cache:
+                self._hot_tail_cache.remove(discarded_tool_calls)
 
     async def get_last_n_history_items(self, history_id: UUID, n: int) -> Sequence[HistoryItem | SystemPrompt]:
-        history = await self.get_or_create_history_by_id(history_id)
-        return history.items[-n:]
+        if self._hot_tail_cache:
+            if (cached_items := self._hot_tail_cache.get_last_n(history_id, n)) is not None:
+                return cached_items
+            if not self._hot_tail_cache.is_warm(history_id):
+                await self._warm_hot_tail_cache(history_id)
+                if (cached_items := self._hot_tail_cache.get_last_n(history_id, n, record_stats=False)) is not None:
+                    return cached_items
+
+        await self.flush_history_items()
+        return await self._history_repo.get_last_n_items(history_id, n)
+
+    async def get_last_n_turns(
+        self,
+        history_id: UUID,
+        n_turns: int,
+        kinds: Sequence[HistoryItemKind] = CONTEXT_HISTORY_ITEM_KINDS,
+    ) -> Sequence[HistoryItem | SystemPrompt]:
+        """Returns the items of the last `n_turns` complete turns, by default only the kinds that
+        are mapped into the model context, i.e., without ThinkingSteps."""
+        if self._hot_tail_cache:
+            if (cached_items := self._hot_tail_cache.get_last_n_turns(history_id, n_turns, kinds)) is not None:
+                return cached_items
+            if not self._hot_tail_cache.is_warm(history_id):
+                await self._warm_hot_tail_cache(history_id)
+                cached_items = self._hot_tail_cache.get_last_n_turns(history_id, n_turns, kinds, record_stats=False)
+                if cached_items is not None:
+                    return cached_items
+
+        await self.flush_history_items()
+        return await self._history_repo.get_last_n_turns(history_id, n_turns, kinds)
+
+    async def get_last_conversation_summary(self, history_id: UUID) -> ConversationSummary | None:
+        if history_id not in self._conversation_summaries:
+            summary = await self._history_repo.get_last_item_of_kind(history_id, HistoryItemKind.CONVERSATION_SUMMARY)
+            self._conversation_summaries[history_id] = summary if isinstance(summary, ConversationSummary) else None
+        return self._conversation_summaries[history_id]
+
+    async def get_unsummarized_turns(
+        self,
+        history_id: UUID,
+        max_n_turns: int,
+    ) -> tuple[ConversationSummary | None, list[HistoryItem | SystemPrompt]]:
+        """Returns the latest ConversationSummary and the context items of the (at most `max_n_turns`)
+        last turns that are not covered by it yet."""
+        summary = await self.get_last_conversation_summary(history_id)
+        items = list(await self.get_last_n_turns(history_id, n_turns=max_n_turns))
+        if summary:
+            items = [item for item in items if item.created_at > summary.covers_until]
+        return summary, items
+
+    async def query_items(
+        self,
+        history_id: UUID,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        limit: int = 1000,
+        newest_first: bool = False,
+    ) -> list[HistoryItem]:
+        """Returns up to `limit` items of the given `kinds` (all if `None`) created in a time range,
+        without loading the rest of the history.
+
+        Args:
+            history_id: UUID - The history to query.
+            kinds: Sequence[HistoryItemKind] | None - Only items of these kinds.
+            since: int | None - Only items created at or after this timestamp (ns).
+            until: int | None - Only items created before this timestamp (ns).
+            limit: int - The maximum number of items.
+            newest_first: bool - Whether to return the most recent items of the range first,
+                instead of the oldest ones in chronological order.
+        """
+        await self.flush_history_items()
+        return await self._history_repo.query_items(history_id, kinds, since, until, limit, newest_first)
+
+    async def search_history_items(self, history_id: UUID, query: str, limit: int = 10) -> list[HistorySearchHit]:
+        """Ranked keyword search over the whole history, served locally by the repo's full-text index."""
+        await self.flush_history_items()
+        return await self._history_repo.search_items(history_id, query, limit)
+
+    async def get_tool_stats(self, history_id: UUID) -> list[ToolStats]:
+        """Calls, results and orphan calls per tool over the whole history, most called first. Paired by the repo,
+        i.e., without loading the items (in SQL)."""
+        await self.flush_history_items()
+        return await self._history_repo.get_tool_stats(history_id)
+
+    async def get_orphan_tool_calls(self, history_id: UUID, limit: int = 100) -> list[ToolCall]:
+        """The oldest ToolCalls without any ToolResult, e.g., of cancelled runs."""
+        await self.flush_history_items()
+        return await self._history_repo.get_orphan_tool_calls(history_id, limit)
+
+    async def resolve_deferred_payloads(self, history_items: Sequence[T]) -> list[T]:
+        """Loads the large payloads that reads outside of the context window defer, see `DeferredPayload`.
+        The items keep their types."""
+        return cast(list[T], await self._history_repo.resolve_deferred_payloads(history_items))
+
+    async def get_nth_last_history_item_key(self, history_id: UUID, n: int) -> HistoryItemKey | None:
+        await self.flush_history_items()
+        return await self._history_repo.get_nth_last_item_key(history_id, n)
+
+    async def delete_history_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+        limit: int = 1000,
+        up_to: HistoryItemKey | None = None,
+    ) -> list[HistoryItemKey]:
+        """Deletes up to `limit` of the oldest items created before `created_before` (of the given `kinds`,
+        all if `None`) and returns their keys in chronological order, see `PrunableHistoryRepo.delete_items`."""
+        if not isinstance(self._history_repo, PrunableHistoryRepo):
+            raise NotImplementedError(f"{type(self._history_repo).__name__} does not support deleting items.")
+        await self.flush_history_items()
+        deleted_keys = await self._history_repo.delete_items(history_id, created_before, kinds, limit, up_to)
+        if deleted_keys:
+            # Deleted items may still be cached, both get read again on demand
+            if self._hot_tail_cache:
+                self._hot_tail_cache.invalidate(history_id)
+            self._conversation_summaries.pop(history_id, None)
+        return deleted_keys
+
+    async def _warm_hot_tail_cache(self, history_id: UUID):
+        assert self._hot_tail_cache is not None
+        # Pending writes are already in the cache (write-through) but are only part
+        # of the tail query once flushed.
+        await self.flush_history_items()
+        last_items = await self._history_repo.get_last_n_items(history_id, self._hot_tail_cache.max_items_per_history)
+        self._hot_tail_cache.warm(history_id, last_items)
+
+    async def iter_history_items(
+        self,
+        history_id: UUID,
+        since: int | None = None,
+        batch_size: int = 1000,
+        after: HistoryItemKey | None = None,
+    ) -> AsyncIterator[list[HistoryItem]]:
+        """Walks the whole history (or everything since `since`) in chronological order, in batches
+        of at most `batch_size` items. Only one batch is held in memory at a time.
+
+        Args:
+            history_id: UUID - The history to walk.
+            since: int | None - Only items created at or after this timestamp (ns).
+            batch_size: int - The number of items fetched per (keyset paginated) query.
+            after: HistoryItemKey | None - Only items after this key, e.g., the last one of an earlier walk.
+        """
+        await self.flush_history_items()
+        while True:
+            batch = await self._history_repo.get_items_page(history_id, after=after, since=since, limit=batch_size)
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            after = (batch[-1].created_at, batch[-1].id)
@@ -1,25 +1,91 @@
 import asyncio
+from contextlib import suppress
+from functools import partial
+from uuid import UUID
 
 from dotenv import load_dotenv
 
 from src.ai.factory import get_ai_service
 from src.ai.prompts import PromptsService
 from src.application.chat_use_case import ChatUseCase
+from src.application.incremental_indexer import IncrementalIndexer
+from src.application.indexing_outbox_worker import IndexingOutboxWorker
+from src.application.maintenance_scheduler import MaintenanceJob, MaintenanceScheduler
+from src.application.retention_use_case import RetentionUseCase
 from src.config.factory import get_config
-from src.core.database import get_engine
+from src.config.models import MaintenanceConfig
+from src.core.database import (
+    analyze_database,
+    checkpoint_database_wal,
+    vacuum_database_incrementally,
+)
 from src.core.exceptions import InvalidConfigurationError, ResourceNotAvailableError
 from src.core.logging import configure_module_logging, get_logger
 from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.sharded import ShardedAsyncSqlalchemyHistoryRepo
+from src.history.factory import get_history_repo
+from src.history.hot_tail_cache import HotTailCache
+from src.history.port import HistoryRepo
 from src.history.service import HistoryService
-from src.rag.factory import get_rag_service_or_none
+from src.rag.factory import get_embedding_cache_or_none, get_rag_service_or_none
+from src.rag.numpy_index.service import NumpyRAGService
+from src.rag.port import RAGService
 from src.tools.factories.dumcp import create_dumcp_tool_set  # type: ignore # noqa: F401
 from src.tools.factories.dumcp_remote import create_dumcp_remote_tool_set  # type: ignore # noqa: F401
 from src.tools.factories.dummy_tool import create_dummy_tool_set
+from src.tools.factories.history_search import create_history_search_tool_set
 from src.ui.console.adapter import ConsoleAdapter
 
 logger = get_logger("Startup: ", output="console", simple_format=True)
 
 
+def get_maintenance_jobs(
+    config: MaintenanceConfig,
+    history_repo: HistoryRepo,
+    rag_service: RAGService | None,
+) -> list[MaintenanceJob]:
+    jobs: list[MaintenanceJob] = []
+    if isinstance(history_repo, AsyncSqlalchemyHistoryRepo | ShardedAsyncSqlalchemyHistoryRepo):
+        sql_history_repo = history_repo
+
+        async def analyze():
+            for engine in sql_history_repo.writer_engines:
+                await analyze_database(engine)
+
+        async def vacuum() -> str:
+            n_pages = 0
+            for engine in sql_history_repo.writer_engines:
+                n_pages += await vacuum_database_incrementally(engine, config.vacuum_max_pages)
+            return f"{n_pages} pages freed"
+
+        async def checkpoint_wal() -> str | None:
+            for engine in sql_history_repo.writer_engines:
+                if not await checkpoint_database_wal(engine):
+                    return "blocked by readers"
+            return None
+
+        jobs += [
+            MaintenanceJob("ANALYZE", analyze, config.analyze_interval_s),
+            MaintenanceJob("Incremental VACUUM", vacuum, config.vacuum_interval_s),
+            MaintenanceJob("WAL checkpoint", checkpoint_wal, config.wal_checkpoint_interval_s),
+        ]
+    if rag_service:
+        jobs.append(MaintenanceJob("RAG index optimization", rag_service.optimize, config.rag_optimize_interval_s))
+    return jobs
+
+
+async def catch_up_rag_index(
+    incremental_indexer: IncrementalIndexer, history_id: UUID, retention_task: asyncio.Task[int] | None
+):
+    # After the retention, which would not delete the points of the items indexed in the meantime
+    if retention_task:
+        await asyncio.wait([retention_task])
+    try:
+        await incremental_indexer.catch_up(history_id)
+    except Exception as exc:
+        logger.error(f"RAG: Catching up failed, continuing in the idle gaps: {exc}")
+
+
 async def main():
     try:
         config = get_config()
@@ -29,34 +95,108 @@ async def main():
 
     configure_module_logging(config)
 
-    history_repo = AsyncSqlalchemyHistoryRepo(engine=get_engine())
-    history_service = HistoryService(history_repo=history_repo)
+    history_repo = await get_history_repo(config)
 
+    cache_cfg = config.history_config.hot_tail_cache
+    history_service = HistoryService(
+        history_repo=history_repo,
+        group_commit_window_s=config.history_config.group_commit_window_s,
+        hot_tail_cache=HotTailCache(
+            max_items_per_history=cache_cfg.max_items_per_history,
+            max_bytes_per_history=cache_cfg.max_bytes_per_history,
+            max_histories=cache_cfg.max_histories,
+        )
+        if cache_cfg
+        else None,
+    )
+    # Creating the history once at startup keeps the per-turn reads free of writes
+    await history_service.create_history_if_not_exists(config.history_id)
+
+    embedding_cache = get_embedding_cache_or_none(config)
     try:
         rag_service = await get_rag_service_or_none(
             config=config,
             history_service=history_service,
+            embedding_cache=embedding_cache,
         )
+    except ResourceNotAvailableError as exc:
+        logger.error(exc)
+        return
+
+    indexing_outbox_worker: IndexingOutboxWorker | None = None
+    if rag_service and (outbox_cfg := config.indexing_outbox_config):
+        if isinstance(history_repo, AsyncSqlalchemyHistoryRepo | ShardedAsyncSqlalchemyHistoryRepo):
+            indexing_outbox_worker = IndexingOutboxWorker(
+                outbox=history_repo,
+                rag_service=rag_service,
+                batch_size=outbox_cfg.batch_size,
+                poll_interval_s=outbox_cfg.poll_interval_s,
+                max_backoff_s=outbox_cfg.max_backoff_s,
+            )
+        else:
+            logger.warning("RAG: The indexing outbox is not supported by the segment log, indexing inline.")
+    if isinstance(history_repo, AsyncSqlalchemyHistoryRepo | ShardedAsyncSqlalchemyHistoryRepo):
+        # Items are enqueued only while the worker drains the outbox
+        await history_repo.set_outbox_enabled(indexing_outbox_worker is not None)
+    if indexing_outbox_worker:
+        # Also indexes what was left over from the last run
+        indexing_outbox_worker.start()
+
+    try:
         ai_service = await get_ai_service(
             config=config,
             history_service=history_service,
             rag_service=rag_service,
             prompts_service=PromptsService(),
+            index_inline=indexing_outbox_worker is None,
         )
     except ResourceNotAvailableError as exc:
         logger.error(exc)
         return
 
+    retention_task: asyncio.Task[int] | None = None
+    if retention_cfg := config.history_config.retention:
+        retention_use_case = RetentionUseCase(history_service, retention_cfg, rag_service=rag_service)
+        # In the background, i.e., the chat starts right away while old items are pruned batch by batch
+        retention_task = asyncio.create_task(retention_use_case.execute(config.history_id))
+
+    incremental_indexer: IncrementalIndexer | None = None
+    catch_up_task: asyncio.Task[None] | None = None
+    if rag_service and (indexer_cfg := config.incremental_indexer_config):
+        incremental_indexer = IncrementalIndexer(
+            history_service=history_service,
+            rag_service=rag_service,
+            watermarks_path=indexer_cfg.watermarks_path,
+            batch_size=indexer_cfg.batch_size,
+            index_tool_results=indexer_cfg.index_tool_results,
+        )
+        catch_up_task = asyncio.create_task(catch_up_rag_index(incremental_indexer, config.history_id, retention_task))
+
+    maintenance_scheduler: MaintenanceScheduler | None = None
+    if maintenance_cfg := config.maintenance_config:
+        maintenance_jobs = get_maintenance_jobs(maintenance_cfg, history_repo, rag_service)
+        if incremental_indexer and (indexer_cfg := config.incremental_indexer_config):
+            catch_up = partial(incremental_indexer.catch_up, config.history_id, max_items=indexer_cfg.batch_size)
+            maintenance_jobs.append(MaintenanceJob("RAG catch-up", catch_up, indexer_cfg.catch_up_interval_s))
+        maintenance_scheduler = MaintenanceScheduler(
+            jobs=maintenance_jobs,
+            idle_delay_s=maintenance_cfg.idle_delay_s,
+        )
+        maintenance_scheduler.start()
+
     chat_use_case = ChatUseCase(
         ai_service=ai_service,
         history_id=config.history_id,
         tool_sets=[
             create_dummy_tool_set(),
             create_dumcp_tool_set(),
+            create_history_search_tool_set(history_service, config.history_id),
             # create_dumcp_remote_tool_set(),
         ],
         last_n_history_items=config.chat_config.last_n_history_items,
         n_memory_items=config.chat_config.n_memory_items,
+        last_n_turns=config.chat_config.last_n_turns,
+        maintenance_scheduler=maintenance_scheduler,
     )
 
     if config.ui == "console":
@@ -67,6 +207,38 @@ async def main():
 
     await console_adapter.run()
 
+    if maintenance_scheduler:
+        await maintenance_scheduler.stop()
+
+    if indexing_outbox_worker:
+        # The remaining entries are indexed on the next startup
+        await indexing_outbox_worker.stop()
+        logger.info(f"RAG: Indexing outbox {indexing_outbox_worker.stats}")
+
+    # A summary that is still running would be dropped, i.e., its turns summarized again on the next startup
+    await ai_service.wait_for_background_tasks()
+
+    for task in [catch_up_task, retention_task]:
+        if not task:
+            continue
+        # An interrupted run continues on the next startup
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    if cache_stats := history_service.hot_tail_cache_stats:
+        logger.info(f"History: Hot tail cache {cache_stats}")
+
+    if embedding_cache:
+        logger.info(
+            f"RAG: Embedding cache {embedding_cache.stats} ({embedding_cache.stats.hit_rate:.0%} hits, "
+            f"{embedding_cache.n_bytes / 2**20:.1f} MiB)"
+        )
+        embedding_cache.close()
+
+    if isinstance(rag_service, NumpyRAGService):
+        rag_service.close()
+
 
 if __name__ == "__main__":
     load_dotenv()
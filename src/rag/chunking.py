@@ -0,0 +1,223 @@
+import asyncio
+import re
+from typing import Protocol
+from uuid import UUID, uuid5
+
+from src.config.models import EmbedderConfig
+from src.rag.qdrant.models import QdrantRAGItem
+
+# Documents of more characters (all of a call) are chunked in a worker thread, i.e., the event loop keeps serving
+# the UI meanwhile. The `StructureChunker` does about 10 MB/s (see `benchmarks/rag_chunking.py`), and holds the
+# GIL, i.e., it is not faster there, just out of the way.
+THREAD_MIN_CHARS = 256_000
+
+# A word counts one token per started `CHARS_PER_WORD_TOKEN` characters, every other non-space character one.
+# Errs on the high side for prose, and stays close for code, identifiers and numbers.
+CHARS_PER_WORD_TOKEN = 6
+_TOKEN_PATTERN = re.compile(rf"\w{{1,{CHARS_PER_WORD_TOKEN}}}|[^\w\s]")
+
+# Fenced code blocks (``` or ~~~ up to a bare closing fence, or the end of the text) are kept whole if they fit
+_CODE_BLOCK_PATTERN = re.compile(r"^[ \t]*(```|~~~).*?(?:^[ \t]*\1[ \t]*$|\Z)", re.MULTILINE | re.DOTALL)
+# Split points, the whitespace stays with the text before it
+_PARAGRAPH_END = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+_LINE_END = re.compile(r"\n\s*")
+_WORD_END = re.compile(r"\s+")
+_PROSE_SEPARATORS = [_SENTENCE_END, _LINE_END, _WORD_END]
+_CODE_SEPARATORS = [_LINE_END, _WORD_END]
+
+Span = tuple[int, int]
+
+
+def get_point_id(history_item_id: UUID, chunk_index: int) -> UUID:
+    """Deterministic, i.e., indexing an item again overwrites its points instead of adding duplicates."""
+    return uuid5(history_item_id, str(chunk_index))
+
+
+def estimate_tokens(text: str) -> int:
+    """A rough count of the tokens of the embedding model, without its tokenizer. Counting the parts of a text
+    never gives less than counting the whole, i.e., parts that fit a budget fit it together as well."""
+    # Counting the substitutions skips creating a string per match
+    return _TOKEN_PATTERN.subn("", text)[1]
+
+
+class Chunker(Protocol):
+    def chunk(self, text: str) -> list[str]:
+        """Splits the text into chunks in order, each overlapping the one before. Together, they cover all of
+        it, a text that fits a single chunk is returned as is."""
+        ...
+
+
+class CharChunker:
+    """Chunks of up to `max_chars` characters, regardless of the structure of the text."""
+
+    def __init__(self, max_chars: int, overlap_chars: int):
+        if not 0 <= overlap_chars < max_chars:
+            raise ValueError(f"The overlap ({overlap_chars}) must be less than the chunks ({max_chars})")
+        self._max_chars = max_chars
+        self._overlap_chars = overlap_chars
+
+    def chunk(self, text: str) -> list[str]:
+        # Offsets instead of slicing off the rest after every chunk, which copies it
+        chunks: list[str] = []
+        start = 0
+        while len(text) - start > self._max_chars:
+            chunks.append(text[start : start + self._max_chars])
+            start += self._max_chars - self._overlap_chars
+        # The rest (beyond the overlap) of the text after the last full chunk
+        if not chunks or len(text) - start > self._overlap_chars:
+            chunks.append(text[start:])
+        return chunks
+
+
+class StructureChunker:
+    """Chunks of up to `max_tokens` (see `estimate_tokens`) that end at the paragraphs and fenced code blocks of
+    the text. What does not fit is split at its sentences (at its lines for code), then at its lines, at its
+    words, and only then within a word.
+
+    A chunk starts with the last pieces of the one before, up to `overlap_tokens` of them, i.e., the overlap
+    is whole sentences (or lines, or words) instead of a cut-off part of one.
+    """
+
+    def __init__(self, max_tokens: int, overlap_tokens: int):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"The overlap ({overlap_tokens}) must be less than the chunks ({max_tokens})")
+        self._max_tokens = max_tokens
+        self._overlap_tokens = overlap_tokens
+
+    def chunk(self, text: str) -> list[str]:
+        return [text[start:end] for start, end in self.get_spans(text)]
+
+    def get_spans(self, text: str) -> list[Span]:
+        """The chunks as (start, end) offsets into the text."""
+        # A character is at most one token. Longer texts are estimated by their blocks only, a text that fits
+        # is merged back into a single chunk.
+        if len(text) <= self._max_tokens:
+            return [(0, len(text))]
+        pieces: list[tuple[int, int, int]] = []  # start, end, tokens
+        for start, end, is_code in self._split_blocks(text):
+            pieces.extend(self._split(text, start, end, _CODE_SEPARATORS if is_code else _PROSE_SEPARATORS))
+        return self._merge(pieces)
+
+    def _split_blocks(self, text: str) -> list[tuple[int, int, bool]]:
+        """The paragraphs and the code blocks, i.e., (start, end, is_code) that cover the text without gaps."""
+        blocks: list[tuple[int, int, bool]] = []
+
+        def add_paragraphs(start: int, end: int):
+            for paragraph_start, paragraph_end in _split_at(_PARAGRAPH_END, text, start, end):
+                blocks.append((paragraph_start, paragraph_end, False))
+
+        position = 0
+        for match in _CODE_BLOCK_PATTERN.finditer(text):
+            if match.start() > position:
+                add_paragraphs(position, match.start())
+            # The line break (and blank lines) after the closing fence stay with the block, i.e., the indentation
+            # of a fence right after it may be taken already
+            end = _WORD_END.match(text, match.end())
+            block_end = end.end() if end else match.end()
+            blocks.append((max(match.start(), position), block_end, True))
+            position = block_end
+        if position < len(text):
+            add_paragraphs(position, len(text))
+        return blocks
+
+    def _split(
+        self, text: str, start: int, end: int, separators: list[re.Pattern[str]], n_tokens: int | None = None
+    ) -> list[tuple[int, int, int]]:
+        if n_tokens is None:
+            n_tokens = estimate_tokens(text[start:end])
+        if n_tokens <= self._max_tokens:
+            return [(start, end, n_tokens)]
+        if not separators:
+            return self._split_within_words(text, start, end)
+        parts = _split_at(separators[0], text, start, end)
+        if len(parts) == 1:
+            # E.g., a paragraph of a single sentence, which is not estimated again
+            return self._split(text, start, end, separators[1:], n_tokens)
+        # The finer separators only apply to the parts that are still too large
+        pieces: list[tuple[int, int, int]] = []
+        for part_start, part_end in parts:
+            pieces.extend(self._split(text, part_start, part_end, separators[1:]))
+        return pieces
+
+    def _split_within_words(self, text: str, start: int, end: int) -> list[tuple[int, int, int]]:
+        """Slices that fit, e.g., of a minified line or an encoded blob. A character is at most one token."""
+        pieces: list[tuple[int, int, int]] = []
+        while start < end:
+            size = min(end - start, self._max_tokens * CHARS_PER_WORD_TOKEN)
+            n_tokens = estimate_tokens(text[start : start + size])
+            while n_tokens > self._max_tokens:
+                size = max(min(size - 1, size * self._max_tokens // n_tokens), 1)
+                n_tokens = estimate_tokens(text[start : start + size])
+            pieces.append((start, start + size, n_tokens))
+            start += size
+        return pieces
+
+    def _merge(self, pieces: list[tuple[int, int, int]]) -> list[Span]:
+        """Packs the consecutive pieces into chunks, each starting with the overlap of the one before."""
+        spans: list[Span] = []
+        first = 0  # The first piece of the current chunk
+        n_tokens = 0
+        for i, (_, _, piece_tokens) in enumerate(pieces):
+            if n_tokens + piece_tokens <= self._max_tokens:
+                n_tokens += piece_tokens
+                continue
+            previous_first = first
+            spans.append((pieces[previous_first][0], pieces[i - 1][1]))
+            # The trailing pieces of the chunk before, as long as they are within the overlap and the piece fits
+            first, n_overlap_tokens = i, 0
+            while first - 1 > previous_first:
+                n_tokens = n_overlap_tokens + pieces[first - 1][2]
+                if n_tokens > self._overlap_tokens or n_tokens + piece_tokens > self._max_tokens:
+                    break
+                first -= 1
+                n_overlap_tokens = n_tokens
+            n_tokens = n_overlap_tokens + piece_tokens
+        spans.append((pieces[first][0], pieces[-1][1]))
+        return spans
+
+
+def _split_at(separator: re.Pattern[str], text: str, start: int, end: int) -> list[Span]:
+    """The parts of text[start:end] that end at the matches of the separator, i.e., without gaps."""
+    parts: list[Span] = []
+    for match in separator.finditer(text, start, end):
+        if match.end() > start and match.end() < end:
+            parts.append((start, match.end()))
+            start = match.end()
+    parts.append((start, end))
+    return parts
+
+
+def get_chunker(config: EmbedderConfig) -> Chunker:
+    if config.structure_chunker:
+        return StructureChunker(config.structure_chunker.max_tokens, config.structure_chunker.overlap_tokens)
+    return CharChunker(config.chunk_max_chars, config.chunk_overlap_chars)
+
+
+def chunk_rag_doc(rag_doc: QdrantRAGItem, chunker: Chunker) -> list[QdrantRAGItem]:
+    chunks = chunker.chunk(rag_doc.text)
+    if len(chunks) == 1:
+        return [rag_doc]
+    return [rag_doc.model_copy(update={"text": chunk, "chunk_index": i}) for i, chunk in enumerate(chunks)]
+
+
+def count_chunks(chunked_rag_docs: list[QdrantRAGItem]) -> dict[UUID, int]:
+    """The chunks per history item, i.e., points of an item from this `chunk_index` on are stale, e.g., of a
+    chunking that split its text into more chunks."""
+    n_chunks: dict[UUID, int] = {}
+    for rag_doc in chunked_rag_docs:
+        n_chunks[rag_doc.history_item_id] = max(n_chunks.get(rag_doc.history_item_id, 0), rag_doc.chunk_index + 1)
+    return n_chunks
+
+
+def chunk_rag_docs(rag_docs: list[QdrantRAGItem], chunker: Chunker) -> list[QdrantRAGItem]:
+    chunked_rag_docs: list[QdrantRAGItem] = []
+    for rag_doc in rag_docs:
+        chunked_rag_docs.extend(chunk_rag_doc(rag_doc, chunker))
+    return chunked_rag_docs
+
+
+async def chunk_rag_docs_async(rag_docs: list[QdrantRAGItem], chunker: Chunker) -> list[QdrantRAGItem]:
+    if sum(len(rag_doc.text) for rag_doc in rag_docs) < THREAD_MIN_CHARS:
+        return chunk_rag_docs(rag_docs, chunker)
+    return await asyncio.to_thread(chunk_rag_docs, rag_docs, chunker)
@@ -0,0 +1,41 @@
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+from src.config.models import EmbedderConfig
+from src.rag.embedding_cache import EmbeddingCacheClient
+from src.rag.qdrant.models import Embedding
+
+
+class Embedder:
+    """Embeds texts with the OpenAI-compatible client of the embedder, within the request limits of the
+    provider (`max_batch_size`, `max_batch_chars`), i.e., larger inputs are split into several requests."""
+
+    def __init__(self, config: EmbedderConfig, openai_client: AsyncAzureOpenAI | AsyncOpenAI | EmbeddingCacheClient):
+        self._openai_client = openai_client
+        self._model_name = config.model_name
+        self._max_batch_size = config.max_batch_size
+        self._max_batch_chars = config.max_batch_chars
+
+    async def get_dimensions(self) -> int:
+        sample_embedding = await self._openai_client.embeddings.create(input="test", model=self._model_name)
+        return len(sample_embedding.data[0].embedding)
+
+    def _split_into_batches(self, texts: list[str]) -> list[list[str]]:
+        batches: list[list[str]] = [[]]
+        n_batch_chars = 0
+        for text in texts:
+            if batches[-1] and (
+                len(batches[-1]) >= self._max_batch_size or n_batch_chars + len(text) > self._max_batch_chars
+            ):
+                batches.append([])
+                n_batch_chars = 0
+            batches[-1].append(text)
+            n_batch_chars += len(text)
+        return batches
+
+    async def embed(self, texts: list[str]) -> list[Embedding]:
+        embeddings: list[Embedding] = []
+        # Usually a single request
+        for batch in self._split_into_batches(texts):
+            ebd_results = await self._openai_client.embeddings.create(input=batch, model=self._model_name)
+            embeddings.extend(ebd_result.embedding for ebd_result in ebd_results.data)
+        return embeddings
@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import mmap
+import sqlite3
+import threading
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from time import time_ns
+
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from openai.types import CreateEmbeddingResponse
+from openai.types import Embedding as OpenAIEmbedding
+from openai.types.create_embedding_response import Usage
+
+FLOAT32_BYTES = 4
+MIN_VECTOR_FILE_ROWS = 1024  # The vector files grow by doubling, starting at this many rows
+MAX_QUERY_PARAMETERS = 500  # Text hashes per lookup, below SQLite's limit of bound parameters
+MAX_PENDING_HITS = 1000  # Hits kept in memory before their last use is written to the index
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS models (
+        name TEXT PRIMARY KEY,
+        dimensions INTEGER NOT NULL,
+        file_name TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS embeddings (
+        model TEXT NOT NULL,
+        text_hash TEXT NOT NULL,
+        row INTEGER NOT NULL,
+        last_used_at INTEGER NOT NULL,
+        PRIMARY KEY (model, text_hash)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used_at ON embeddings (last_used_at)",
+]
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@dataclass
+class EmbeddingCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        n_lookups = self.hits + self.misses
+        return self.hits / n_lookups if n_lookups else 0.0
+
+
+class _VectorFile:
+    """Fixed-size float32 rows of one model in a memory-mapped file."""
+
+    def __init__(self, path: Path, dimensions: int):
+        self._row_bytes = dimensions * FLOAT32_BYTES
+        self._file = open(path, "a+b")
+        if self._file.seek(0, 2) == 0:
+            self._file.truncate(MIN_VECTOR_FILE_ROWS * self._row_bytes)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self._mmap) // self._row_bytes
+
+    def read(self, row: int) -> list[float]:
+        offset = row * self._row_bytes
+        return array("f", self._mmap[offset : offset + self._row_bytes]).tolist()
+
+    def write(self, row: int, vector: list[float]):
+        if row >= self.n_rows:
+            self._mmap.resize(max(row + 1, 2 * self.n_rows) * self._row_bytes)
+        offset = row * self._row_bytes
+        self._mmap[offset : offset + self._row_bytes] = array("f", vector).tobytes()
+
+    def flush(self):
+        self._mmap.flush()
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+@dataclass
+class _Model:
+    dimensions: int
+    vectors: _VectorFile
+    free_rows: list[int]  # Rows of evicted embeddings, reused before the file grows
+    n_rows_used: int
+
+
+class EmbeddingCache:
+    """A persistent cache of embeddings keyed by (model name, SHA-256 of the text).
+
+    The vectors are float32 rows in one memory-mapped file per model, an SQLite index maps the keys
+    to their rows. Once the vectors exceed `max_bytes`, the least-recently-used ones are evicted and
+    their rows reused, i.e., the files do not grow beyond `max_bytes` (plus one doubling).
+
+    The methods block (on SQLite and the files), the embedder calls them in a worker thread, i.e., they are
+    serialized by a lock. Hits are marked as recently used in memory, and written to the index in batches.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self._path / "index.db", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        self._models: dict[str, _Model] = {}
+        for name, dimensions, file_name in self._db.execute("SELECT name, dimensions, file_name FROM models"):
+            self._models[name] = self._open_model(name, dimensions, file_name)
+        self._pending_hits: dict[tuple[str, str], int] = {}  # (model, text hash) -> last used at
+        self.stats = EmbeddingCacheStats()
+
+    @property
+    def n_bytes(self) -> int:
+        return sum(model.n_rows_used * model.dimensions * FLOAT32_BYTES for model in self._models.values())
+
+    def _open_model(self, name: str, dimensions: int, file_name: str) -> _Model:
+        vectors = _VectorFile(self._path / file_name, dimensions)
+        used_rows = {row for (row,) in self._db.execute("SELECT row FROM embeddings WHERE model = ?", (name,))}
+        n_rows = max(used_rows, default=-1) + 1
+        return _Model(
+            dimensions=dimensions,
+            vectors=vectors,
+            free_rows=sorted(set(range(n_rows)) - used_rows, reverse=True),
+            n_rows_used=len(used_rows),
+        )
+
+    def _get_or_create_model(self, name: str, dimensions: int) -> _Model:
+        if model := self._models.get(name):
+            if model.dimensions != dimensions:
+                raise ValueError(f"Embeddings of {name} have {model.dimensions} dimensions, got {dimensions}")
+            return model
+        file_name = f"{get_text_hash(name)[:16]}.f32"
+        self._db.execute(
+            "INSERT INTO models (name, dimensions, file_name) VALUES (?, ?, ?)", (name, dimensions, file_name)
+        )
+        self._models[name] = self._open_model(name, dimensions, file_name)
+        return self._models[name]
+
+    def _get_rows(self, model_name: str, text_hashes: list[str]) -> dict[str, int]:
+        rows: dict[str, int] = {}
+        for start in range(0, len(text_hashes), MAX_QUERY_PARAMETERS):
+            chunk = text_hashes[start : start + MAX_QUERY_PARAMETERS]
+            rows.update(
+                self._db.execute(
+                    "SELECT text_hash, row FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({', '.join('?' * len(chunk))})",
+                    (model_name, *chunk),
+                ).fetchall()
+            )
+        return rows
+
+    def get_many(self, model_name: str, texts: list[str]) -> list[list[float] | None]:
+        """The cached embeddings of the texts (`None` for misses), marking the hits as recently used."""
+        with self._lock:
+            model = self._models.get(model_name)
+            text_hashes = [get_text_hash(text) for text in texts]
+            rows = self._get_rows(model_name, text_hashes) if model else {}
+            now = time_ns()
+            for text_hash in rows:
+                self._pending_hits[(model_name, text_hash)] = now
+            if len(self._pending_hits) >= MAX_PENDING_HITS:
+                self._write_pending_hits()
+                self._db.commit()
+            embeddings = [
+                model.vectors.read(rows[text_hash]) if model and text_hash in rows else None
+                for text_hash in text_hashes
+            ]
+        n_hits = sum(embedding is not None for embedding in embeddings)
+        self.stats.hits += n_hits
+        self.stats.misses += len(texts) - n_hits
+        return embeddings
+
+    def put_many(self, model_name: str, texts: list[str], embeddings: list[list[float]]):
+        if not texts:
+            return
+        with self._lock:
+            model = self._get_or_create_model(model_name, len(embeddings[0]))
+            embeddings_by_hash = {get_text_hash(text): embedding for text, embedding in zip(texts, embeddings)}
+            cached_rows = self._get_rows(model_name, list(embeddings_by_hash))
+            now = time_ns()
+            new_rows: list[tuple[str, str, int, int]] = []
+            for text_hash, embedding in embeddings_by_hash.items():
+                if text_hash in cached_rows:
+                    continue
+                row = model.free_rows.pop() if model.free_rows else model.n_rows_used
+                model.vectors.write(row, embedding)
+                model.n_rows_used += 1
+                new_rows.append((model_name, text_hash, row, now))
+            # The vectors are on disk before their rows are committed, i.e., the index never points to a missing one
+            model.vectors.flush()
+            self._db.executemany(
+                "INSERT INTO embeddings (model, text_hash, row, last_used_at) VALUES (?, ?, ?, ?)", new_rows
+            )
+            # The eviction goes by the last use, i.e., including the hits not written yet
+            self._write_pending_hits()
+            self._evict()
+            self._db.commit()
+
+    def _write_pending_hits(self):
+        self._db.executemany(
+            "UPDATE embeddings SET last_used_at = ? WHERE model = ? AND text_hash = ?",
+            [(last_used_at, name, text_hash) for (name, text_hash), last_used_at in self._pending_hits.items()],
+        )
+        self._pending_hits = {}
+
+    def _evict(self):
+        n_bytes = self.n_bytes
+        if n_bytes <= self._max_bytes:
+            return
+        evicted: list[tuple[str, str]] = []
+        for name, text_hash, row in self._db.execute(
+            "SELECT model, text_hash, row FROM embeddings ORDER BY last_used_at"
+        ):
+            if n_bytes <= self._max_bytes:
+                break
+            model = self._models[name]
+            model.free_rows.append(row)
+            model.n_rows_used -= 1
+            n_bytes -= model.dimensions * FLOAT32_BYTES
+            evicted.append((name, text_hash))
+        self._db.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", evicted)
+        self.stats.evictions += len(evicted)
+
+    def close(self):
+        with self._lock:
+            self._write_pending_hits()
+            self._db.commit()
+            for model in self._models.values():
+                model.vectors.close()
+            self._models = {}
+            self._db.close()
+
+
+class _CachedEmbeddings:
+    def __init__(self, client: AsyncAzureOpenAI | AsyncOpenAI, cache: EmbeddingCache):
+        self._client = client
+        self._cache = cache
+
+    async def create(self, input: str | list[str], model: str) -> CreateEmbeddingResponse:
+        texts = [input] if isinstance(input, str) else input
+        embeddings = await asyncio.to_thread(self._cache.get_many, model, texts)
+        missing_texts = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        usage = Usage(prompt_tokens=0, total_tokens=0)
+        if missing_texts:
+            response = await self._client.embeddings.create(input=missing_texts, model=model)
+            usage = response.usage
+            missing_embeddings = [result.embedding for result in response.data]
+            await asyncio.to_thread(self._cache.put_many, model, missing_texts, missing_embeddings)
+            embeddings_by_text = dict(zip(missing_texts, missing_embeddings))
+            embeddings = [
+                embeddings_by_text[text] if embedding is None else embedding
+                for text, embedding in zip(texts, embeddings)
+            ]
+        return CreateEmbeddingResponse(
+            data=[
+                OpenAIEmbedding(embedding=embedding or [], index=index, object="embedding")
+                for index, embedding in enumerate(embeddings)
+            ],
+            model=model,
+            object="list",
+            usage=usage,  # Of the misses only
+        )
+
+
+class EmbeddingCacheClient:
+    """Stands in for the OpenAI client of the embedder: `embeddings.create` serves the cached
+    embeddings and sends only the misses (deduplicated) to the wrapped client."""
+
+    def __init__(self, client: AsyncAzureOpenAI | AsyncOpenAI, cache: EmbeddingCache):
+        self.embeddings = _CachedEmbeddings(client, cache)
+        self.cache = cache
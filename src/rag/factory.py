@@ -1,25 +1,63 @@
+from openai import AsyncOpenAI
+from qdrant_client import AsyncQdrantClient
+
 from src.config.models import Config
 from src.core.logging import get_logger
 from src.history.service import HistoryService
+from src.rag.embedding_cache import EmbeddingCache, EmbeddingCacheClient
+from src.rag.numpy_index.service import NumpyRAGService
 from src.rag.port import RAGService
-from src.rag.qdrant.clients import get_openai_client, get_qdrant_client
+from src.rag.qdrant.clients import get_embedded_qdrant_client, get_openai_client, get_qdrant_client
 from src.rag.qdrant.service import QdrantRAGService
 
 logger = get_logger(__name__, output="console")
 
 
-async def get_rag_service_or_none(config: Config, history_service: HistoryService) -> RAGService | None:
-    if not config.qdrant_url:
-        logger.warning("Qdrant URL is not set, running without RAG-memory.")
+def get_embedding_cache_or_none(config: Config) -> EmbeddingCache | None:
+    has_index = config.qdrant_url or config.qdrant_path or config.numpy_index_config
+    if not has_index or not (cache_cfg := config.embedding_cache_config):
         return None
+    return EmbeddingCache(path=cache_cfg.path, max_bytes=cache_cfg.max_bytes)
+
+
+async def get_qdrant_client_or_none(config: Config) -> AsyncQdrantClient | None:
+    if config.qdrant_path:
+        return get_embedded_qdrant_client(config.qdrant_path)
+    if config.qdrant_url:
+        return await get_qdrant_client(config.qdrant_url)
+    return None
+
 
-    qdrant_client = await get_qdrant_client(config.qdrant_url)
+async def _get_embedding_client(
+    config: Config, embedding_cache: EmbeddingCache | None
+) -> AsyncOpenAI | EmbeddingCacheClient:
     openai_client = await get_openai_client(config.embedder_config)
+    return EmbeddingCacheClient(openai_client, embedding_cache) if embedding_cache else openai_client
+
+
+async def get_rag_service_or_none(
+    config: Config,
+    history_service: HistoryService,
+    embedding_cache: EmbeddingCache | None = None,
+) -> RAGService | None:
+    if numpy_index_cfg := config.numpy_index_config:
+        return await NumpyRAGService.create(
+            config=config.embedder_config,
+            numpy_index_config=numpy_index_cfg,
+            openai_client=await _get_embedding_client(config, embedding_cache),
+            history_id=config.history_id,
+        )
+
+    qdrant_client = await get_qdrant_client_or_none(config)
+    if not qdrant_client:
+        logger.warning("Neither a Qdrant URL nor path is set, running without RAG-memory.")
+        return None
 
     return await QdrantRAGService.create(
         config=config.embedder_config,
+        qdrant_config=config.qdrant_config,
         qdrant_client=qdrant_client,
-        openai_client=openai_client,
+        openai_client=await _get_embedding_client(config, embedding_cache),
         history_service=history_service,
         history_id=config.history_id,
     )
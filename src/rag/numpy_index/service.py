@@ -0,0 +1,100 @@
+import asyncio
+from typing import Sequence
+from uuid import UUID
+
+from openai import AsyncOpenAI
+
+from src.ai.models import SystemPrompt
+from src.config.models import EmbedderConfig, NumpyIndexConfig
+from src.history.models import HistoryItemKind, UserPrompt
+from src.rag.chunking import Chunker, chunk_rag_docs_async, count_chunks, get_chunker, get_point_id
+from src.rag.embedder import Embedder
+from src.rag.embedding_cache import EmbeddingCacheClient
+from src.rag.numpy_index.store import VectorStore
+from src.rag.port import RAG_HISTORY_ITEM_KINDS, RAGHistoryItem
+from src.rag.prompts import get_rag_system_prompt
+from src.rag.qdrant.mapper import QdrantRAGMapper
+from src.rag.qdrant.models import QdrantRAGItem
+
+
+class NumpyRAGService:
+    """The RAGService on a `VectorStore` in the process, i.e., without the network hop to (and the operation
+    of) a Qdrant server. The chunks, point ids and payloads are the ones of `QdrantRAGService`.
+
+    The search is exact and scans all vectors, i.e., it fits a single conversation of up to a few million
+    chunks (see `benchmarks/rag_search.py`). The store runs in a worker thread, i.e., a scan or an upsert does not
+    block the event loop.
+    """
+
+    _store: VectorStore
+    _embedder: Embedder
+    _history_id: UUID
+    _chunker: Chunker
+
+    @classmethod
+    async def create(
+        cls,
+        config: EmbedderConfig,
+        numpy_index_config: NumpyIndexConfig,
+        openai_client: AsyncOpenAI | EmbeddingCacheClient,
+        history_id: UUID,
+    ):
+        self = cls()
+        self._embedder = Embedder(config, openai_client)
+        self._history_id = history_id
+        self._chunker = get_chunker(config)
+        self._store = VectorStore(
+            path=numpy_index_config.path / f"history-{history_id}",
+            dimensions=await self._embedder.get_dimensions(),
+            dtype=numpy_index_config.dtype,
+        )
+        return self
+
+    async def _chunk_rag_docs(self, rag_docs: list[QdrantRAGItem]) -> list[QdrantRAGItem]:
+        return await chunk_rag_docs_async(rag_docs, self._chunker)
+
+    async def add_history_items(self, history_items: list[RAGHistoryItem]):
+        rag_docs = await self._chunk_rag_docs(QdrantRAGMapper.map_history_items_to_rag_items(history_items))
+        if not rag_docs:
+            return
+        embeddings = await self._embedder.embed([rag_doc.text for rag_doc in rag_docs])
+        await asyncio.to_thread(
+            self._store.upsert,
+            point_ids=[str(get_point_id(rag_doc.history_item_id, rag_doc.chunk_index)) for rag_doc in rag_docs],
+            vectors=embeddings,
+            payloads=[rag_doc.model_dump(mode="json") for rag_doc in rag_docs],
+        )
+        n_chunks = {str(history_item_id): n for history_item_id, n in count_chunks(rag_docs).items()}
+        await asyncio.to_thread(self._store.delete_stale_chunks, n_chunks)
+
+    async def delete_history_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+    ):
+        # One store per history, like the collections of Qdrant
+        if history_id != self._history_id:
+            return
+        kind_values: list[str] | None = None
+        if kinds is not None:
+            kind_values = [kind.value for kind in kinds if kind in RAG_HISTORY_ITEM_KINDS]
+            if not kind_values:
+                return
+        await asyncio.to_thread(self._store.delete, created_before, kind_values)
+
+    async def optimize(self):
+        await asyncio.to_thread(self._store.compact)
+
+    async def search_for_user_prompt(self, user_prompt: UserPrompt, top_k: int = 10) -> SystemPrompt:
+        rag_doc = QdrantRAGMapper.map_history_item_to_rag_item(user_prompt)
+        max_len_search_rag_doc = (await self._chunk_rag_docs([rag_doc]))[0]
+        embeddings = await self._embedder.embed([max_len_search_rag_doc.text])
+        payloads = await asyncio.to_thread(self._store.search, embeddings[0], top_k)
+        history_items = [
+            QdrantRAGMapper.map_point_to_history_item(QdrantRAGItem.model_validate(payload)) for payload in payloads
+        ]
+        return get_rag_system_prompt(user_prompt.history_id, history_items)
+
+    def close(self):
+        self._store.close()
@@ -0,0 +1,255 @@
+import heapq
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+
+MIN_ROWS = 1024  # The vector file grows by doubling, starting at this many rows
+SCAN_BLOCK_ROWS = 8192  # Rows scored at a time, keeps the float32 copy of a float16 block in the cache
+MAX_QUERY_PARAMETERS = 500  # Per lookup, below SQLite's limit of bound parameters
+
+VectorDtype = Literal["float32", "float16"]
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS points (
+        row INTEGER PRIMARY KEY,
+        point_id TEXT NOT NULL UNIQUE,
+        created_at INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_points_created_at ON points (created_at)",
+    # Stores created before get it as well, the queries use the same expression
+    "CREATE INDEX IF NOT EXISTS ix_points_history_item_id ON points (json_extract(payload, '$.history_item_id'))",
+]
+
+
+class VectorStore:
+    """Normalized embeddings as rows of a memory-mapped matrix (`vectors.<dtype>`), their payloads in an SQLite
+    sidecar (`points.db`) that maps the point ids to their rows. A search is an exact top-k over all rows, i.e.,
+    a dot product per row (the cosine similarity) and a partial sort.
+
+    Every upsert writes its rows before it commits them, i.e., a crash never leaves a point without its vector.
+    Deleted rows are reused by the next upserts (the lowest first), `compact` moves the last rows into the gaps.
+
+    The methods block (on SQLite and the file), the service calls them in a worker thread, i.e., they are
+    serialized by a lock.
+    """
+
+    def __init__(self, path: Path, dimensions: int, dtype: VectorDtype = "float32"):
+        self._path = path
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self._path / "points.db", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        if meta and (int(meta["dimensions"]), meta["dtype"]) != (dimensions, dtype):
+            raise ValueError(
+                f"The vectors in {path} have {meta['dimensions']} dimensions ({meta['dtype']}), "
+                f"got {dimensions} ({dtype}), index the history into a new path"
+            )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", [("dimensions", dimensions), ("dtype", dtype)]
+        )
+        self._db.commit()
+
+        self._dimensions = dimensions
+        self._dtype = np.dtype(dtype)
+        self._vectors_path = self._path / f"vectors.{dtype}"
+        if not self._vectors_path.exists():
+            self._resize_file(MIN_ROWS)
+        self._vectors = self._open_vectors()
+        used_rows = np.array([row for (row,) in self._db.execute("SELECT row FROM points")], dtype=np.int64)
+        self._n_rows: int = int(used_rows.max()) + 1 if len(used_rows) else 0
+        self._used = np.zeros(len(self._vectors), dtype=bool)
+        self._used[used_rows] = True
+        # A min-heap of the rows below `_n_rows` without a point
+        self._free_rows: list[int] = np.flatnonzero(~self._used[: self._n_rows]).tolist()
+
+    @property
+    def n_points(self) -> int:
+        return self._n_rows - len(self._free_rows)
+
+    def _resize_file(self, n_rows: int):
+        with open(self._vectors_path, "ab") as file:
+            file.truncate(n_rows * self._dimensions * self._dtype.itemsize)
+
+    def _open_vectors(self) -> np.memmap[Any, np.dtype[Any]]:
+        n_bytes = self._vectors_path.stat().st_size
+        n_rows = n_bytes // (self._dimensions * self._dtype.itemsize)
+        return np.memmap(self._vectors_path, dtype=self._dtype, mode="r+", shape=(n_rows, self._dimensions))
+
+    def _grow(self, n_rows: int):
+        if n_rows <= len(self._vectors):
+            return
+        capacity = max(n_rows, 2 * len(self._vectors))
+        self._vectors.flush()
+        del self._vectors
+        self._resize_file(capacity)
+        self._vectors = self._open_vectors()
+        self._used = np.concatenate([self._used, np.zeros(capacity - len(self._used), dtype=bool)])
+
+    def _get_rows(self, point_ids: list[str]) -> dict[str, int]:
+        rows: dict[str, int] = {}
+        for start in range(0, len(point_ids), MAX_QUERY_PARAMETERS):
+            chunk = point_ids[start : start + MAX_QUERY_PARAMETERS]
+            rows.update(
+                self._db.execute(
+                    f"SELECT point_id, row FROM points WHERE point_id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            )
+        return rows
+
+    def get_existing_point_ids(self, point_ids: list[str]) -> set[str]:
+        with self._lock:
+            return set(self._get_rows(point_ids))
+
+    def upsert(self, point_ids: list[str], vectors: list[list[float]], payloads: list[dict[str, Any]]):
+        """Inserts the points, or overwrites them if their ids exist already. The payloads need a `created_at`
+        and a `kind` (the fields of the deletes), and a `history_item_id` and `chunk_index` for
+        `delete_stale_chunks`."""
+        if not point_ids:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.shape[1] != self._dimensions:
+            raise ValueError(f"The vectors have {self._dimensions} dimensions, got {matrix.shape[1]}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1.0)
+
+        with self._lock:
+            existing_rows = self._get_rows(point_ids)
+            n_rows = self._n_rows
+            reused_rows: list[int] = []
+            rows: list[int] = []
+            for point_id in point_ids:
+                if point_id in existing_rows:
+                    rows.append(existing_rows[point_id])
+                elif self._free_rows:
+                    reused_rows.append(heapq.heappop(self._free_rows))
+                    rows.append(reused_rows[-1])
+                else:
+                    rows.append(n_rows)
+                    n_rows += 1
+                # A duplicate id within the call overwrites the earlier one
+                existing_rows[point_id] = rows[-1]
+            try:
+                self._grow(n_rows)
+                self._vectors[rows] = matrix
+                self._vectors.flush()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO points (row, point_id, created_at, kind, payload) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (row, point_id, payload["created_at"], payload["kind"], json.dumps(payload))
+                        for row, point_id, payload in zip(rows, point_ids, payloads)
+                    ],
+                )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                for row in reused_rows:
+                    heapq.heappush(self._free_rows, row)
+                raise
+            self._n_rows = n_rows
+            self._used[rows] = True
+
+    def search(self, vector: list[float], top_k: int) -> list[dict[str, Any]]:
+        """The payloads of the `top_k` most similar points, most similar first."""
+        with self._lock:
+            n_points = self.n_points
+            if top_k <= 0 or n_points == 0:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+            scores = np.empty(self._n_rows, dtype=np.float32)
+            for start in range(0, self._n_rows, SCAN_BLOCK_ROWS):
+                stop = min(start + SCAN_BLOCK_ROWS, self._n_rows)
+                scores[start:stop] = self._vectors[start:stop].astype(np.float32, copy=False) @ query
+            scores[~self._used[: self._n_rows]] = -np.inf
+
+            k = min(top_k, n_points)
+            top_rows = np.argpartition(-scores, k - 1)[:k]
+            top_rows = top_rows[np.argsort(-scores[top_rows], kind="stable")]
+            payloads_by_row = dict(
+                self._db.execute(
+                    f"SELECT row, payload FROM points WHERE row IN ({', '.join('?' * len(top_rows))})",
+                    top_rows.tolist(),
+                ).fetchall()
+            )
+        return [json.loads(payloads_by_row[row]) for row in top_rows.tolist()]
+
+    def delete(self, created_before: int, kinds: list[str] | None = None):
+        """Deletes the points created before `created_before`, only of the given `kinds` (all if `None`)."""
+        query = "SELECT row FROM points WHERE created_at < ?"
+        parameters: list[int | str] = [created_before]
+        if kinds is not None:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            parameters += kinds
+        with self._lock:
+            self._delete_rows([row for (row,) in self._db.execute(query, parameters)])
+
+    def delete_stale_chunks(self, n_chunks: dict[str, int]):
+        """Deletes the points of the items (by `history_item_id`) from their `chunk_index` `n_chunks` on, e.g., of
+        an item indexed again after the chunking changed."""
+        history_item_ids = list(n_chunks)
+        with self._lock:
+            rows: list[int] = []
+            for start in range(0, len(history_item_ids), MAX_QUERY_PARAMETERS):
+                chunk = history_item_ids[start : start + MAX_QUERY_PARAMETERS]
+                for row, history_item_id, chunk_index in self._db.execute(
+                    "SELECT row, json_extract(payload, '$.history_item_id'), json_extract(payload, '$.chunk_index') "
+                    f"FROM points WHERE json_extract(payload, '$.history_item_id') IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    if (chunk_index or 0) >= n_chunks[history_item_id]:
+                        rows.append(row)
+            self._delete_rows(rows)
+
+    def _delete_rows(self, rows: list[int]):
+        if not rows:
+            return
+        self._db.executemany("DELETE FROM points WHERE row = ?", [(row,) for row in rows])
+        self._db.commit()
+        self._used[rows] = False
+        self._free_rows.extend(rows)
+        heapq.heapify(self._free_rows)
+
+    def compact(self):
+        """Moves the last rows of the points into the gaps of deleted points, and shrinks the vector file
+        accordingly. The gaps are free, i.e., a crash before the moves are committed leaves the points at
+        their old rows, which are still intact."""
+        with self._lock:
+            n_points = self.n_points
+            if n_points == self._n_rows and len(self._vectors) <= max(MIN_ROWS, 2 * self._n_rows):
+                return
+            gaps = np.flatnonzero(~self._used[:n_points])
+            moved_rows = np.flatnonzero(self._used[n_points : self._n_rows]) + n_points
+            self._vectors[gaps] = self._vectors[moved_rows]
+            self._vectors.flush()
+            self._db.executemany("UPDATE points SET row = ? WHERE row = ?", zip(gaps.tolist(), moved_rows.tolist()))
+            self._db.commit()
+
+            self._n_rows = n_points
+            self._free_rows = []
+            capacity = max(MIN_ROWS, self._n_rows)
+            del self._vectors
+            with open(self._vectors_path, "r+b") as file:
+                file.truncate(capacity * self._dimensions * self._dtype.itemsize)
+            self._vectors = self._open_vectors()
+            self._used = np.zeros(capacity, dtype=bool)
+            self._used[: self._n_rows] = True
+
+    def close(self):
+        with self._lock:
+            self._vectors.flush()
+            del self._vectors
+            self._db.close()
@@ -1,7 +1,13 @@
-from typing import Protocol
+from typing import Protocol, Sequence
+from uuid import UUID
 
 from src.ai.models import SystemPrompt
-from src.history.models import ModelResponse, UserPrompt
+from src.history.models import HistoryItemKind, ModelResponse, ToolResult, UserPrompt
+
+# The items that can be indexed
+RAGHistoryItem = UserPrompt | ModelResponse | ToolResult
+# ToolResults are embedded as a compact summary, see `QdrantRAGMapper`
+RAG_HISTORY_ITEM_KINDS = [HistoryItemKind.USER_PROMPT, HistoryItemKind.MODEL_RESPONSE, HistoryItemKind.TOOL_RESULT]
 
 
 class RAGService(Protocol):
@@ -9,4 +15,17 @@ class RAGService(Protocol):
 
     async def search_for_user_prompt(self, user_prompt: UserPrompt, top_k: int = 10) -> SystemPrompt: ...
 
-    async def add_history_items(self, history_items: list[UserPrompt | ModelResponse]) -> None: ...
+    async def add_history_items(self, history_items: list[RAGHistoryItem]) -> None: ...
+
+    async def delete_history_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+    ) -> None:
+        """Deletes the indexed items created before `created_before`, only of the given `kinds` (all if `None`)."""
+        ...
+
+    async def optimize(self) -> None:
+        """Lets the index compact itself, e.g., merge small segments and drop deleted points."""
+        ...
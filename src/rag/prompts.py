@@ -0,0 +1,62 @@
+from textwrap import dedent
+from time import time_ns
+from uuid import UUID, uuid4
+
+from src.ai.models import SystemPrompt
+from src.history.models import NS_PER_DAY, HistoryItem, ModelResponse, ToolResult, UserPrompt
+
+
+def _format_days_ago(created_at: int, now: int) -> str:
+    days_ago = (now - created_at) // NS_PER_DAY
+    if days_ago <= 0:
+        return "today"
+    if days_ago == 1:
+        return "yesterday"
+    return f"{days_ago} days ago"
+
+
+def get_rag_system_prompt(history_id: UUID, history_items: list[HistoryItem]) -> SystemPrompt:
+    """The found items as the system prompt of the relevant previous interactions."""
+    if len(history_items) == 0:
+        return SystemPrompt(
+            id=uuid4(),
+            history_id=history_id,
+            created_at=time_ns(),
+            prompt=dedent("""
+                [# Relevant Previous Interactions #]
+
+                No relevant previous interactions between the user and you (the assistant) have been found.
+            """),
+        )
+    prompt = dedent("""
+        [# Relevant Previous Interactions #]
+
+        Via a semantic search, the following previous messages between the user and you (the assistant) have been found to be relevant to the current user prompt.
+
+        <previous_interactions>
+
+    """).strip()
+
+    # TODO: Improve formatting
+    now = time_ns()
+    for history_item in history_items:
+        when = _format_days_ago(history_item.created_at, now)
+        if isinstance(history_item, UserPrompt):
+            prompt += f'\n\t<user_prompt when="{when}">\n\t{history_item.prompt}\n\t</user_prompt>\n'
+        elif isinstance(history_item, ModelResponse):
+            prompt += f'\n\t<model_response when="{when}">\n\t{history_item.response}\n\t</model_response>\n'
+        elif isinstance(history_item, ToolResult):
+            prompt += (
+                f'\n\t<tool_result tool="{history_item.tool_name}" when="{when}">\n\t{history_item.result}'
+                "\n\t</tool_result>\n"
+            )
+        else:
+            raise NotImplementedError(f"Unexpected history item: {history_item} to construct RAG system prompt")
+
+    prompt += "\n\n</previous_interactions>"
+    return SystemPrompt(
+        id=uuid4(),
+        history_id=history_id,
+        created_at=time_ns(),
+        prompt=prompt,
+    )
@@ -1,4 +1,6 @@
 from functools import lru_cache
+from pathlib import Path
+from typing import Literal
 
 from openai import AsyncOpenAI
 from qdrant_client import AsyncQdrantClient
@@ -24,6 +26,15 @@ async def get_qdrant_client(qdrant_url: str) -> AsyncQdrantClient:
     return client
 
 
+def get_embedded_qdrant_client(qdrant_path: Path | Literal[":memory:"]) -> AsyncQdrantClient:
+    """Qdrant in the process (local mode), i.e., there is no server to ping."""
+    if qdrant_path == ":memory:":
+        logger.info("Qdrant: Running embedded in memory, nothing is persisted.")
+        return AsyncQdrantClient(location=":memory:")
+    logger.info(f"Qdrant: Running embedded on {qdrant_path}.")
+    return AsyncQdrantClient(path=str(qdrant_path))
+
+
 @lru_cache
 async def get_openai_client(cfg: EmbedderConfig) -> AsyncOpenAI:
     client = AsyncOpenAI(
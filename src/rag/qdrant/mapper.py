@@ -1,10 +1,24 @@
-from src.history.models import HistoryItem, HistoryItemKind, ModelResponse, UserPrompt
+import json
+
+from src.history.models import HistoryItem, HistoryItemKind, ModelResponse, ToolResult, UserPrompt
+from src.rag.port import RAGHistoryItem
 from src.rag.qdrant.models import QdrantRAGItem
 
+# ToolResults may be large (logs, files), only their beginning is embedded
+TOOL_RESULT_SUMMARY_CHARS = 2000
+
+
+def summarize_tool_result(tool_result: ToolResult) -> str:
+    result = tool_result.result
+    result_text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    if len(result_text) > TOOL_RESULT_SUMMARY_CHARS:
+        result_text = f"{result_text[:TOOL_RESULT_SUMMARY_CHARS]} [... {len(result_text)} characters in total]"
+    return f"{tool_result.tool_name} returned: {result_text}"
+
 
 class QdrantRAGMapper:
     @staticmethod
-    def map_history_item_to_rag_item(history_item: UserPrompt | ModelResponse) -> QdrantRAGItem:
+    def map_history_item_to_rag_item(history_item: RAGHistoryItem) -> QdrantRAGItem:
         if isinstance(history_item, UserPrompt):
             return QdrantRAGItem(
                 history_item_id=history_item.id,
@@ -13,7 +27,7 @@ class QdrantRAGMapper:
                 text=history_item.prompt,
                 kind=HistoryItemKind.USER_PROMPT,
             )
-        elif isinstance(history_item, ModelResponse):  # type: ignore - staying explicit
+        elif isinstance(history_item, ModelResponse):
             return QdrantRAGItem(
                 history_item_id=history_item.id,
                 history_id=history_item.history_id,
@@ -21,6 +35,16 @@ class QdrantRAGMapper:
                 text=history_item.response,
                 kind=HistoryItemKind.MODEL_RESPONSE,
             )
+        elif isinstance(history_item, ToolResult):  # type: ignore - staying explicit
+            return QdrantRAGItem(
+                history_item_id=history_item.id,
+                history_id=history_item.history_id,
+                created_at=history_item.created_at,
+                text=summarize_tool_result(history_item),
+                kind=HistoryItemKind.TOOL_RESULT,
+                tool_call_id=history_item.tool_call_id,
+                tool_name=history_item.tool_name,
+            )
         else:
             raise NotImplementedError(f"Unexpected history item: {history_item} to map to plain text for embedding")
 
@@ -40,9 +64,20 @@ class QdrantRAGMapper:
                 created_at=rag_item.created_at,
                 response=rag_item.text,
             )
+        elif rag_item.kind == HistoryItemKind.TOOL_RESULT:
+            # The summary stands in for the result
+            return ToolResult(
+                id=rag_item.history_item_id,
+                history_id=rag_item.history_id,
+                created_at=rag_item.created_at,
+                tool_call_id=rag_item.tool_call_id or "",
+                tool_name=rag_item.tool_name or "",
+                is_retry=False,
+                result=rag_item.text,
+            )
         else:
             raise NotImplementedError(f"Unexpected history item: {rag_item} to map to history item")
 
     @staticmethod
-    def map_history_items_to_rag_items(history_items: list[UserPrompt | ModelResponse]) -> list[QdrantRAGItem]:
+    def map_history_items_to_rag_items(history_items: list[RAGHistoryItem]) -> list[QdrantRAGItem]:
         return [QdrantRAGMapper.map_history_item_to_rag_item(item) for item in history_items]
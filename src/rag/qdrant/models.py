@@ -11,6 +11,10 @@ class QdrantRAGItem(BaseModel):
     created_at: int
     text: str
     kind: HistoryItemKind
+    chunk_index: int = 0  # Of the chunks of the item's text, points indexed before were not chunked
+    # ToolResults only, their text is a compact summary of the result
+    tool_call_id: str | None = None
+    tool_name: str | None = None
 
 
 Embedding = list[float]
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, TypeGuard
+from uuid import UUID
+
+from src.history.models import HistoryItem, HistoryItemKey, ModelResponse, ToolResult, UserPrompt
+from src.history.service import HistoryService
+from src.rag.port import RAGHistoryItem
+from src.rag.qdrant.service import QdrantRAGService
+
+DEFAULT_CHECKPOINT_PATH = Path("data/rag_reindex_checkpoint.json")
+CHECKPOINT_INTERVAL_S = 5.0  # The checkpoint is saved at most this often while indexing, and when a run stops
+
+Checkpoints = dict[str, list[int | str]]  # History id -> [created_at, item id] of the last indexed item
+
+
+@dataclass
+class ReindexStats:
+    n_items: int = 0  # Walked, including the ones that are not indexed
+    n_indexed_items: int = 0
+    n_embedded_chunks: int = 0  # Without the existing ones skipped
+    elapsed_s: float = 0.0
+
+    @property
+    def items_per_s(self) -> float:
+        return self.n_items / max(self.elapsed_s, 1e-9)
+
+
+def _read_checkpoints(path: Path) -> Checkpoints:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_checkpoints(path: Path, checkpoints: Checkpoints):
+    # Replaced atomically, i.e., a crash leaves the previous checkpoint
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(checkpoints))
+    os.replace(tmp_path, path)
+
+
+def _get_checkpoint(checkpoints: Checkpoints, history_id: UUID) -> HistoryItemKey | None:
+    if checkpoint := checkpoints.get(str(history_id)):
+        created_at, item_id = checkpoint
+        return int(created_at), UUID(str(item_id))
+    return None
+
+
+def load_checkpoint(path: Path, history_id: UUID) -> HistoryItemKey | None:
+    return _get_checkpoint(_read_checkpoints(path), history_id)
+
+
+def save_checkpoint(path: Path, history_id: UUID, checkpoint: HistoryItemKey | None):
+    checkpoints = _read_checkpoints(path)
+    if checkpoint is None:
+        checkpoints.pop(str(history_id), None)
+    else:
+        checkpoints[str(history_id)] = [checkpoint[0], str(checkpoint[1])]
+    _write_checkpoints(path, checkpoints)
+
+
+def is_indexed(history_item: HistoryItem, index_tool_results: bool) -> TypeGuard[RAGHistoryItem]:
+    if isinstance(history_item, ToolResult):
+        return index_tool_results and not history_item.is_retry
+    return isinstance(history_item, UserPrompt | ModelResponse)
+
+
+async def reindex_history(
+    history_service: HistoryService,
+    rag_service: QdrantRAGService,
+    history_id: UUID,
+    checkpoint_path: Path,
+    page_size: int = 512,
+    concurrency: int = 4,
+    skip_existing: bool = False,
+    index_tool_results: bool = True,
+    on_progress: Callable[[ReindexStats], None] | None = None,
+) -> ReindexStats:
+    """Indexes the history from the checkpoint on. The pages are indexed concurrently, the checkpoint only
+    moves past a page once all pages before it are indexed as well, i.e., no item is skipped on resume.
+    `on_progress` is called after every page."""
+    stats = ReindexStats()
+    start = perf_counter()
+    pending: deque[tuple[HistoryItemKey, int, asyncio.Task[int]]] = deque()
+    # Read once, the checkpoints of the other histories are written back as they were
+    checkpoints = await asyncio.to_thread(_read_checkpoints, checkpoint_path)
+    saved_checkpoint = _get_checkpoint(checkpoints, history_id)
+    checkpoint = saved_checkpoint
+    saved_at = start
+
+    async def save():
+        nonlocal saved_checkpoint, saved_at
+        if checkpoint == saved_checkpoint or checkpoint is None:
+            return
+        checkpoints[str(history_id)] = [checkpoint[0], str(checkpoint[1])]
+        await asyncio.to_thread(_write_checkpoints, checkpoint_path, dict(checkpoints))
+        saved_checkpoint, saved_at = checkpoint, perf_counter()
+
+    async def complete_first_page():
+        nonlocal checkpoint
+        page_end, n_items, task = pending.popleft()
+        stats.n_embedded_chunks += await task
+        stats.n_items += n_items
+        stats.elapsed_s = perf_counter() - start
+        checkpoint = page_end
+        if perf_counter() - saved_at >= CHECKPOINT_INTERVAL_S:
+            await save()
+        if on_progress:
+            on_progress(stats)
+
+    try:
+        async for page in history_service.iter_history_items(history_id, batch_size=page_size, after=checkpoint):
+            rag_items = [history_item for history_item in page if is_indexed(history_item, index_tool_results)]
+            # ToolResults stored as blobs are read deferred (a preview), their summaries need the whole result
+            rag_items = await history_service.resolve_deferred_payloads(rag_items)
+            stats.n_indexed_items += len(rag_items)
+            task = asyncio.create_task(rag_service.index_history_items(rag_items, skip_existing=skip_existing))
+            pending.append(((page[-1].created_at, page[-1].id), len(page), task))
+            while pending and (len(pending) >= concurrency or pending[0][2].done()):
+                await complete_first_page()
+        while pending:
+            await complete_first_page()
+    finally:
+        # E.g., after a failed page, the checkpoint stays before it
+        for _, _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, _, task in pending), return_exceptions=True)
+        await save()
+    stats.elapsed_s = perf_counter() - start
+    return stats
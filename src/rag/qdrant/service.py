@@ -1,51 +1,73 @@
-from textwrap import dedent
-from time import time_ns
-from uuid import UUID, uuid4
+import asyncio
+import logging
+import warnings
+from pathlib import Path
+from typing import Sequence
+from uuid import UUID
 
-from openai import AsyncAzureOpenAI, AsyncOpenAI
+from openai import AsyncOpenAI
 from qdrant_client import AsyncQdrantClient
 from qdrant_client import models as qdm
+from qdrant_client.conversions.common_types import PointId
 
 from src.ai.models import SystemPrompt
-from src.config.models import EmbedderConfig
-from src.history.models import HistoryItem, ModelResponse, UserPrompt
+from src.config.models import EmbedderConfig, HybridSearchConfig, QdrantConfig
+from src.history.models import HistoryItem, HistoryItemKind, UserPrompt
 from src.history.service import HistoryService
+from src.rag.chunking import Chunker, chunk_rag_docs_async, count_chunks, get_chunker, get_point_id
+from src.rag.embedder import Embedder
+from src.rag.embedding_cache import EmbeddingCacheClient
+from src.rag.port import RAG_HISTORY_ITEM_KINDS, RAGHistoryItem
+from src.rag.prompts import get_rag_system_prompt
 from src.rag.qdrant.mapper import QdrantRAGMapper
 from src.rag.qdrant.models import Embedding, QdrantRAGItem
+from src.rag.qdrant.sparse import SparseEncoder
+
+logger = logging.getLogger(__name__)
+
+DENSE_VECTOR_NAME = "dense"
+SPARSE_VECTOR_NAME = "sparse"
+SCROLL_PAGE_SIZE = 1000  # Points read at a time, e.g., the texts of deleted points
 
 
 class QdrantRAGService:
     _qdrant_client: AsyncQdrantClient
-    _openai_client: AsyncAzureOpenAI | AsyncOpenAI
+    _embedder: Embedder
     _history_service: HistoryService
     _history_id: UUID
     _collection_name: str
-    _embedding_model_name: str
     _embedding_dimensions: int
-    _embedding_chunk_max_chars: int
-    _embedding_chunk_overlap_chars: int
+    _chunker: Chunker
+    _upsert_batch_size: int
+    _wait_for_upserts: bool
+    _hybrid_search_config: HybridSearchConfig | None
+    # The layout of the collection, collections created before the hybrid search have a single unnamed vector
+    _dense_vector_name: str | None
+    _sparse_encoder: SparseEncoder | None
 
     @classmethod
     async def create(
         cls,
         config: EmbedderConfig,
+        qdrant_config: QdrantConfig,
         qdrant_client: AsyncQdrantClient,
-        openai_client: AsyncOpenAI,
+        openai_client: AsyncOpenAI | EmbeddingCacheClient,
         history_service: HistoryService,
         history_id: UUID,
     ):
         self = cls()
         self._qdrant_client = qdrant_client
-        self._openai_client = openai_client
+        self._embedder = Embedder(config, openai_client)
         self._history_service = history_service
         self._history_id = history_id
         self._collection_name = f"history-{history_id}"
-        self._embedding_model_name = config.model_name
-        self._embedding_chunk_max_chars = config.chunk_max_chars
-        self._embedding_chunk_overlap_chars = config.chunk_overlap_chars
+        self._chunker = get_chunker(config)
+        self._upsert_batch_size = qdrant_config.upsert_batch_size
+        self._wait_for_upserts = qdrant_config.wait_for_upserts
+        self._hybrid_search_config = qdrant_config.hybrid_search
 
         # Setting up the embedding model
-        await self._store_embedding_dimensions()
+        self._embedding_dimensions = await self._embedder.get_dimensions()
         await self._create_collection_if_not_exists()
         return self
 
@@ -54,87 +76,245 @@ class QdrantRAGService:
             raise ValueError("Embedding dimensions are not set")
         if not self._collection_name:
             raise ValueError("Collection name is not set")
+        dense_vector_params = qdm.VectorParams(size=self._embedding_dimensions, distance=qdm.Distance.COSINE)
         if not await self._qdrant_client.collection_exists(self._collection_name):
-            await self._qdrant_client.create_collection(
-                collection_name=self._collection_name,
-                vectors_config=qdm.VectorParams(size=self._embedding_dimensions, distance=qdm.Distance.COSINE),
-            )
-
-    async def _store_embedding_dimensions(self):
-        sample_embedding = await self._openai_client.embeddings.create(
-            input="test",
-            model=self._embedding_model_name,
-        )
-        self._embedding_dimensions = len(sample_embedding.data[0].embedding)
-
-    def _chunk_rag_doc(self, rag_doc: QdrantRAGItem) -> list[QdrantRAGItem]:
-        text = rag_doc.text
-        chunked_rag_docs: list[QdrantRAGItem] = []
-
-        if len(text) <= self._embedding_chunk_max_chars:
-            return [rag_doc]
-
-        def _create_rag_item(text: str) -> QdrantRAGItem:
-            return QdrantRAGItem(
-                history_item_id=rag_doc.history_item_id,
-                history_id=rag_doc.history_id,
-                created_at=rag_doc.created_at,
-                text=text,
-                kind=rag_doc.kind,
-            )
+            if self._hybrid_search_config:
+                await self._qdrant_client.create_collection(
+                    collection_name=self._collection_name,
+                    vectors_config={DENSE_VECTOR_NAME: dense_vector_params},
+                    sparse_vectors_config={SPARSE_VECTOR_NAME: qdm.SparseVectorParams(modifier=qdm.Modifier.IDF)},
+                )
+            else:
+                await self._qdrant_client.create_collection(
+                    collection_name=self._collection_name,
+                    vectors_config=dense_vector_params,
+                )
+        await self._load_collection_layout()
+        # Serve the filtered searches, the filter-based deletes of the retention rules and of stale chunks. Creating an
+        # existing index is a no-op, i.e., collections created before get them as well.
+        for field_name, field_schema in [
+            ("history_id", qdm.PayloadSchemaType.KEYWORD),
+            ("history_item_id", qdm.PayloadSchemaType.KEYWORD),
+            ("created_at", qdm.PayloadSchemaType.INTEGER),
+            ("kind", qdm.PayloadSchemaType.KEYWORD),
+        ]:
+            # The embedded Qdrant (local mode) scans instead, and warns about every index
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+                await self._qdrant_client.create_payload_index(
+                    collection_name=self._collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema,
+                )
 
-        while len(text) > self._embedding_chunk_max_chars:
-            chunked_rag_docs.append(_create_rag_item(text[: self._embedding_chunk_max_chars]))
-            text = text[self._embedding_chunk_max_chars - self._embedding_chunk_overlap_chars :]
+    def _get_tokenizer_path(self, hybrid_search_config: HybridSearchConfig) -> Path:
+        return hybrid_search_config.tokenizer_path / f"{self._collection_name}.json"
 
-        return chunked_rag_docs
+    async def _load_collection_layout(self):
+        collection_params = (await self._qdrant_client.get_collection(self._collection_name)).config.params
+        self._dense_vector_name = DENSE_VECTOR_NAME if isinstance(collection_params.vectors, dict) else None
+        self._sparse_encoder = None
+        if not self._hybrid_search_config:
+            return
+        if SPARSE_VECTOR_NAME in (collection_params.sparse_vectors or {}):
+            self._sparse_encoder = SparseEncoder(self._get_tokenizer_path(self._hybrid_search_config))
+        else:
+            logger.warning(
+                f"Qdrant: {self._collection_name} has no sparse vectors, searching the dense ones only. "
+                "Recreate it for the hybrid search: python -m src.rag.reindex --recreate"
+            )
 
-    def _chunk_rag_docs(self, rag_docs: list[QdrantRAGItem]) -> list[QdrantRAGItem]:
-        chunked_rag_docs: list[QdrantRAGItem] = []
-        for rag_doc in rag_docs:
-            chunked_rag_docs.extend(self._chunk_rag_doc(rag_doc))
-        return chunked_rag_docs
+    async def _chunk_rag_docs(self, rag_docs: list[QdrantRAGItem]) -> list[QdrantRAGItem]:
+        return await chunk_rag_docs_async(rag_docs, self._chunker)
 
     async def _embed_rag_docs(self, rag_docs: list[QdrantRAGItem]) -> list[Embedding]:
-        ebd_results = await self._openai_client.embeddings.create(
-            input=[rag_doc.text for rag_doc in rag_docs],
-            model=self._embedding_model_name,
+        return await self._embedder.embed([rag_doc.text for rag_doc in rag_docs])
+
+    async def _get_existing_point_ids(self, rag_docs: list[QdrantRAGItem]) -> set[str]:
+        points = await self._qdrant_client.retrieve(
+            collection_name=self._collection_name,
+            ids=[str(get_point_id(rag_doc.history_item_id, rag_doc.chunk_index)) for rag_doc in rag_docs],
+            with_payload=False,
+            with_vectors=False,
         )
-        return [ebd_result.embedding for ebd_result in ebd_results.data]
+        return {str(point.id) for point in points}
 
     async def _upsert_rag_docs_and_embeddings(self, rag_docs: list[QdrantRAGItem], embeddings: list[Embedding]):
-        for rag_doc, embedding in zip(rag_docs, embeddings):
+        # One request per batch instead of one per chunk. Without waiting, Qdrant acknowledges a batch once
+        # it is received, i.e., it may not be searchable right away.
+        for batch_start in range(0, len(rag_docs), self._upsert_batch_size):
+            batch_rag_docs = rag_docs[batch_start : batch_start + self._upsert_batch_size]
+            batch_embeddings = embeddings[batch_start : batch_start + self._upsert_batch_size]
+            vectors: qdm.BatchVectorStruct = batch_embeddings
+            if self._dense_vector_name:
+                named_vectors: dict[str, list[qdm.Vector]] = {self._dense_vector_name: list(batch_embeddings)}
+                if self._sparse_encoder:
+                    # Points that exist already are in the length statistics of the sparse vectors
+                    existing_point_ids = await self._get_existing_point_ids(batch_rag_docs)
+                    is_new = [
+                        str(get_point_id(rag_doc.history_item_id, rag_doc.chunk_index)) not in existing_point_ids
+                        for rag_doc in batch_rag_docs
+                    ]
+                    texts = [rag_doc.text for rag_doc in batch_rag_docs]
+                    named_vectors[SPARSE_VECTOR_NAME] = list(self._sparse_encoder.encode_documents(texts, is_new))
+                vectors = named_vectors
             await self._qdrant_client.upsert(
                 collection_name=self._collection_name,
-                points=[
-                    qdm.PointStruct(
-                        id=str(uuid4()),
-                        vector=embedding,
-                        payload=rag_doc.model_dump(mode="json"),
+                # Column-wise instead of `PointStruct`s, which the client inspects float by float
+                points=qdm.Batch(
+                    ids=[str(get_point_id(rag_doc.history_item_id, rag_doc.chunk_index)) for rag_doc in batch_rag_docs],
+                    vectors=vectors,
+                    payloads=[rag_doc.model_dump(mode="json") for rag_doc in batch_rag_docs],
+                ),
+                wait=self._wait_for_upserts,
+            )
+
+    async def add_history_items(self, history_items: list[RAGHistoryItem]):
+        await self.index_history_items(history_items)
+
+    async def index_history_items(self, history_items: list[RAGHistoryItem], skip_existing: bool = False) -> int:
+        """Embeds and upserts the chunks of the items, returns the number of embedded chunks. With `skip_existing`,
+        chunks whose point exists already are neither embedded nor upserted, e.g., to complete a partial index.
+        Points of the items beyond their current chunks are deleted."""
+        rag_docs = QdrantRAGMapper.map_history_items_to_rag_items(history_items)
+        chunked_rag_docs = await self._chunk_rag_docs(rag_docs)
+        n_chunks = count_chunks(chunked_rag_docs)
+        if skip_existing and chunked_rag_docs:
+            existing_point_ids = await self._get_existing_point_ids(chunked_rag_docs)
+            chunked_rag_docs = [
+                rag_doc
+                for rag_doc in chunked_rag_docs
+                if str(get_point_id(rag_doc.history_item_id, rag_doc.chunk_index)) not in existing_point_ids
+            ]
+        if chunked_rag_docs:
+            embeddings = await self._embed_rag_docs(chunked_rag_docs)
+            await self._upsert_rag_docs_and_embeddings(chunked_rag_docs, embeddings)
+        if n_chunks:
+            await self._delete_stale_chunks(n_chunks)
+        if self._sparse_encoder:
+            await asyncio.to_thread(self._sparse_encoder.save)
+        return len(chunked_rag_docs)
+
+    async def _delete_stale_chunks(self, n_chunks: dict[UUID, int]):
+        """Deletes the points of the items beyond their current chunks, e.g., of an item indexed again after the
+        chunking changed, in a single filter-based delete."""
+        item_ids_by_n_chunks: dict[int, list[str]] = {}
+        for history_item_id, n in n_chunks.items():
+            item_ids_by_n_chunks.setdefault(n, []).append(str(history_item_id))
+        await self._delete_points(
+            qdm.Filter(
+                must=[qdm.FieldCondition(key="history_id", match=qdm.MatchValue(value=str(self._history_id)))],
+                should=[
+                    qdm.Filter(
+                        must=[
+                            qdm.FieldCondition(key="history_item_id", match=qdm.MatchAny(any=item_ids)),
+                            qdm.FieldCondition(key="chunk_index", range=qdm.Range(gte=n)),
+                        ]
                     )
+                    for n, item_ids in item_ids_by_n_chunks.items()
                 ],
             )
+        )
 
-    async def add_history_items(self, history_items: list[UserPrompt | ModelResponse]):
-        rag_docs = QdrantRAGMapper.map_history_items_to_rag_items(history_items)
-        chunked_rag_docs = self._chunk_rag_docs(rag_docs)
-        embeddings = await self._embed_rag_docs(chunked_rag_docs)
-        await self._upsert_rag_docs_and_embeddings(chunked_rag_docs, embeddings)
+    async def recreate_collection(self):
+        """Drops all points, e.g., to index the history again after the chunking changed."""
+        await self._qdrant_client.delete_collection(self._collection_name)
+        if self._hybrid_search_config:
+            # The length statistics of the sparse vectors start over as well
+            self._get_tokenizer_path(self._hybrid_search_config).unlink(missing_ok=True)
+        await self._create_collection_if_not_exists()
+
+    async def delete_history_items(
+        self,
+        history_id: UUID,
+        created_before: int,
+        kinds: Sequence[HistoryItemKind] | None = None,
+    ):
+        conditions: list[qdm.Condition] = [
+            qdm.FieldCondition(key="history_id", match=qdm.MatchValue(value=str(history_id))),
+            qdm.FieldCondition(key="created_at", range=qdm.Range(lt=created_before)),
+        ]
+        if kinds is not None:
+            kind_values = [kind.value for kind in kinds if kind in RAG_HISTORY_ITEM_KINDS]
+            if not kind_values:
+                return
+            conditions.append(qdm.FieldCondition(key="kind", match=qdm.MatchAny(any=kind_values)))
+        # A single filter-based delete covers all chunks of the items
+        await self._delete_points(qdm.Filter(must=conditions))
+        if self._sparse_encoder:
+            await asyncio.to_thread(self._sparse_encoder.save)
 
-    async def _search_for_embedding(self, embedding: Embedding, top_k: int) -> list[HistoryItem]:
-        results = await self._qdrant_client.query_points(
+    async def _delete_points(self, points_filter: qdm.Filter):
+        if self._sparse_encoder:
+            await self._remove_from_sparse_statistics(points_filter)
+        await self._qdrant_client.delete(
             collection_name=self._collection_name,
-            query_filter=qdm.Filter(
-                must=[
-                    qdm.FieldCondition(
-                        key="history_id",
-                        match=qdm.MatchValue(value=str(self._history_id)),
-                    )
-                ]
-            ),
-            query=embedding,
-            limit=top_k,
+            points_selector=qdm.FilterSelector(filter=points_filter),
         )
+
+    async def _remove_from_sparse_statistics(self, points_filter: qdm.Filter):
+        """Takes the points that are about to be deleted out of the length statistics of the sparse vectors."""
+        if not self._sparse_encoder:
+            return
+        offset: PointId | None = None
+        while True:
+            points, offset = await self._qdrant_client.scroll(
+                collection_name=self._collection_name,
+                scroll_filter=points_filter,
+                limit=SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=["text"],
+                with_vectors=False,
+            )
+            self._sparse_encoder.remove_documents([str((point.payload or {})["text"]) for point in points])
+            if offset is None:
+                break
+
+    async def optimize(self):
+        # Qdrant optimizes in the background on its own, an (empty) config update re-checks its segments
+        # right away, e.g., after the retention deleted many points
+        await self._qdrant_client.update_collection(
+            collection_name=self._collection_name,
+            optimizers_config=qdm.OptimizersConfigDiff(),
+        )
+
+    async def _search(self, text: str, embedding: Embedding, top_k: int) -> list[HistoryItem]:
+        history_filter = qdm.Filter(
+            must=[
+                qdm.FieldCondition(
+                    key="history_id",
+                    match=qdm.MatchValue(value=str(self._history_id)),
+                )
+            ]
+        )
+        if self._sparse_encoder and self._hybrid_search_config:
+            # Both candidate lists are fused by their ranks within the same request, i.e., exact tokens (IDs,
+            # names, numbers) the embedding misses still make it into a small `top_k`
+            prefetch_limit = max(self._hybrid_search_config.prefetch_limit, top_k)
+            results = await self._qdrant_client.query_points(
+                collection_name=self._collection_name,
+                prefetch=[
+                    qdm.Prefetch(
+                        query=embedding, using=self._dense_vector_name, filter=history_filter, limit=prefetch_limit
+                    ),
+                    qdm.Prefetch(
+                        query=self._sparse_encoder.encode_query(text),
+                        using=SPARSE_VECTOR_NAME,
+                        filter=history_filter,
+                        limit=prefetch_limit,
+                    ),
+                ],
+                query=qdm.FusionQuery(fusion=qdm.Fusion.RRF),
+                limit=top_k,
+            )
+        else:
+            results = await self._qdrant_client.query_points(
+                collection_name=self._collection_name,
+                query_filter=history_filter,
+                query=embedding,
+                using=self._dense_vector_name,
+                limit=top_k,
+            )
         points = results.points
 
         history_items: list[HistoryItem] = []
@@ -147,46 +327,10 @@ class QdrantRAGService:
 
     async def search_for_user_prompt(self, user_prompt: UserPrompt, top_k: int = 10) -> SystemPrompt:
         rag_doc = QdrantRAGMapper.map_history_item_to_rag_item(user_prompt)
-        max_len_search_rag_doc = self._chunk_rag_docs([rag_doc])[0]
+        max_len_search_rag_doc = (await self._chunk_rag_docs([rag_doc]))[0]
         embeddings = await self._embed_rag_docs([max_len_search_rag_doc])
-        history_items = await self._search_for_embedding(embeddings[0], top_k)
-        if len(history_items) == 0:
-            return SystemPrompt(
-                id=uuid4(),
-                history_id=user_prompt.history_id,
-                created_at=time_ns(),
-                prompt=dedent("""
-                    [# Relevant Previous Interactions #]
-
-                    No relevant previous interactions between the user and you (the assistant) have been found.
-                """),
-            )
-        # TODO: Add "days ago"
-        prompt = dedent("""
-            [# Relevant Previous Interactions #]
-
-            Via a semantic search, the following previous messages between the user and you (the assistant) have been found to be relevant to the current user prompt.
-
-            <previous_interactions>
-
-        """).strip()
-
-        # TODO: Improve formatting
-        for history_item in history_items:
-            if isinstance(history_item, UserPrompt):
-                prompt += f"\n\t<user_prompt>\n\t{history_item.prompt}\n\t</user_prompt>\n"
-            elif isinstance(history_item, ModelResponse):
-                prompt += f"\n\t<model_response>\n\t{history_item.response}\n\t</model_response>\n"
-            else:
-                raise NotImplementedError(f"Unexpected history item: {history_item} to construct RAG system prompt")
-
-        prompt += "\n\n</previous_interactions>"
-        return SystemPrompt(
-            id=uuid4(),
-            history_id=user_prompt.history_id,
-            created_at=time_ns(),
-            prompt=prompt,
-        )
+        history_items = await self._search(max_len_search_rag_doc.text, embeddings[0], top_k)
+        return get_rag_system_prompt(user_prompt.history_id, history_items)
 
     # TODO: Tests
     # TODO: Long term explicit memory via tool
@@ -0,0 +1,109 @@
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from qdrant_client import models as qdm
+
+# Words, and compounds such as "ERR-4711", "v1.2.3" or "src/main.py" as a whole
+TOKEN_PATTERN = r"\w+(?:[-./:]\w+)*"
+PART_PATTERN = r"\w+"
+
+
+class SparseEncoder:
+    """BM25-style sparse vectors of texts, computed locally. The term frequencies are saturated (`k1`) and
+    normalized by the document length (`b`) relative to the average length indexed so far. Qdrant applies the
+    IDF (`Modifier.IDF`) at query time, i.e., it follows the collection without a vocabulary on this side.
+
+    Tokens are the lowercased words, compounds also as their parts, hashed (CRC32) into the sparse indices.
+    The tokenizer settings and the length statistics are persisted as JSON alongside the collection, i.e.,
+    documents and queries are encoded alike across restarts, even if the defaults here change. The statistics
+    change in memory, `save` writes them (if changed), e.g., in a worker thread once per indexing call.
+    """
+
+    def __init__(self, path: Path, k1: float = 1.2, b: float = 0.75):
+        self._path = path
+        state: dict[str, Any] = json.loads(path.read_text()) if path.exists() else {}
+        self._token_pattern = re.compile(str(state.get("token_pattern", TOKEN_PATTERN)))
+        self._part_pattern = re.compile(str(state.get("part_pattern", PART_PATTERN)))
+        self._k1 = float(state.get("k1", k1))
+        self._b = float(state.get("b", b))
+        self._n_docs = int(state.get("n_docs", 0))
+        self._n_tokens = int(state.get("n_tokens", 0))
+        self._is_changed = not path.exists()
+        self._save_lock = threading.Lock()
+
+    def save(self):
+        with self._save_lock:
+            if not self._is_changed:
+                return
+            self._is_changed = False
+            state = {
+                "token_pattern": self._token_pattern.pattern,
+                "part_pattern": self._part_pattern.pattern,
+                "k1": self._k1,
+                "b": self._b,
+                "n_docs": self._n_docs,
+                "n_tokens": self._n_tokens,
+            }
+            # Replaced atomically, i.e., a crash leaves the previous state
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(state))
+            os.replace(tmp_path, self._path)
+
+    def tokenize(self, text: str) -> list[str]:
+        tokens: list[str] = []
+        for match in self._token_pattern.finditer(text.lower()):
+            token = match.group()
+            tokens.append(token)
+            parts = self._part_pattern.findall(token)
+            if len(parts) > 1:
+                tokens.extend(parts)
+        return tokens
+
+    @staticmethod
+    def _get_index(token: str) -> int:
+        return zlib.crc32(token.encode())
+
+    def _to_sparse_vector(self, weights: dict[int, float]) -> qdm.SparseVector:
+        indices = sorted(weights)
+        return qdm.SparseVector(indices=indices, values=[weights[index] for index in indices])
+
+    def encode_documents(self, texts: list[str], is_new: list[bool] | None = None) -> list[qdm.SparseVector]:
+        """Only the new documents (all if `is_new` is `None`) count towards the length statistics, i.e.,
+        upserting a point again does not count it twice."""
+        token_lists = [self.tokenize(text) for text in texts]
+        new_token_lists = token_lists if is_new is None else [tokens for tokens, new in zip(token_lists, is_new) if new]
+        if new_token_lists:
+            self._n_docs += len(new_token_lists)
+            self._n_tokens += sum(len(tokens) for tokens in new_token_lists)
+            self._is_changed = True
+        avg_doc_tokens = self._n_tokens / max(self._n_docs, 1)
+
+        sparse_vectors: list[qdm.SparseVector] = []
+        for tokens in token_lists:
+            length_norm = self._k1 * (1 - self._b + self._b * len(tokens) / max(avg_doc_tokens, 1.0))
+            weights: dict[int, float] = {}
+            for token, tf in Counter(tokens).items():
+                index = self._get_index(token)
+                # Colliding tokens add up
+                weights[index] = weights.get(index, 0.0) + tf * (self._k1 + 1) / (tf + length_norm)
+            sparse_vectors.append(self._to_sparse_vector(weights))
+        return sparse_vectors
+
+    def remove_documents(self, texts: list[str]):
+        """Takes the documents of deleted points out of the length statistics."""
+        if not texts:
+            return
+        self._n_docs = max(self._n_docs - len(texts), 0)
+        self._n_tokens = max(self._n_tokens - sum(len(self.tokenize(text)) for text in texts), 0)
+        self._is_changed = True
+
+    def encode_query(self, text: str) -> qdm.SparseVector:
+        # Each distinct token once, weighted by its IDF in Qdrant
+        return self._to_sparse_vector({self._get_index(token): 1.0 for token in self.tokenize(text)})
@@ -0,0 +1,94 @@
+"""Indexes a whole history into its Qdrant collection again, e.g., after the chunking or the embedder changed,
+or to complete a partial index (`--skip-existing`). The history is streamed in pages, up to `--concurrency`
+pages are embedded and upserted at a time. A checkpoint is saved every few seconds and when the run stops,
+i.e., an interrupted run resumes where it stopped.
+
+Usage:
+    python -m src.rag.reindex [--recreate | --skip-existing] [--concurrency 4] [--page-size 512]
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.config.factory import get_config
+from src.history.factory import get_history_repo
+from src.history.service import HistoryService
+from src.rag.embedding_cache import EmbeddingCacheClient
+from src.rag.factory import get_embedding_cache_or_none, get_qdrant_client_or_none
+from src.rag.qdrant.clients import get_openai_client
+from src.rag.qdrant.reindexer import DEFAULT_CHECKPOINT_PATH, ReindexStats, reindex_history, save_checkpoint
+from src.rag.qdrant.service import QdrantRAGService
+
+
+def print_progress(stats: ReindexStats):
+    print(
+        f"{stats.n_items} items, {stats.n_indexed_items} indexed, {stats.n_embedded_chunks} chunks embedded "
+        f"({stats.items_per_s:.0f} items/s)"
+    )
+
+
+async def main(checkpoint_path: Path, page_size: int, concurrency: int, recreate: bool, skip_existing: bool):
+    load_dotenv()
+    config = get_config()
+    qdrant_client = await get_qdrant_client_or_none(config)
+    if not qdrant_client:
+        print("Neither a Qdrant URL nor path is set, nothing to index.")
+        return
+    history_service = HistoryService(await get_history_repo(config))
+    embedding_cache = get_embedding_cache_or_none(config)
+    openai_client = await get_openai_client(config.embedder_config)
+    rag_service = await QdrantRAGService.create(
+        config=config.embedder_config,
+        qdrant_config=config.qdrant_config,
+        qdrant_client=qdrant_client,
+        openai_client=EmbeddingCacheClient(openai_client, embedding_cache) if embedding_cache else openai_client,
+        history_service=history_service,
+        history_id=config.history_id,
+    )
+    if recreate:
+        await rag_service.recreate_collection()
+        save_checkpoint(checkpoint_path, config.history_id, None)
+
+    indexer_cfg = config.incremental_indexer_config
+    try:
+        stats = await reindex_history(
+            history_service,
+            rag_service,
+            config.history_id,
+            checkpoint_path=checkpoint_path,
+            page_size=page_size,
+            concurrency=concurrency,
+            skip_existing=skip_existing,
+            index_tool_results=indexer_cfg.index_tool_results if indexer_cfg else False,
+            on_progress=print_progress,
+        )
+        print(
+            f"Indexed {stats.n_indexed_items} of {stats.n_items} items ({stats.n_embedded_chunks} chunks embedded) "
+            f"in {stats.elapsed_s:.1f}s ({stats.items_per_s:.0f} items/s)"
+        )
+    finally:
+        if embedding_cache:
+            embedding_cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--recreate", action="store_true", help="Drops the collection and starts from scratch")
+    mode.add_argument("--skip-existing", action="store_true", help="Only embeds the chunks without a point")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--page-size", type=int, default=512, help="Items read (and indexed) at a time")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pages embedded and upserted at a time")
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            checkpoint_path=args.checkpoint,
+            page_size=args.page_size,
+            concurrency=args.concurrency,
+            recreate=args.recreate,
+            skip_existing=args.skip_existing,
+        )
+    )
@@ -0,0 +1,142 @@
+from datetime import datetime
+from time import time_ns
+from uuid import UUID
+
+from src.history.models import NS_PER_DAY, HistoryItem, HistoryItemKind, ModelResponse, ToolResult, UserPrompt
+from src.history.service import HistoryService
+from src.tools.models import FunctionTool, FunctionToolSet
+
+MAX_WINDOW_ITEM_CHARS = 500
+
+
+def _get_author(history_item: HistoryItem) -> str:
+    match history_item:
+        case UserPrompt():
+            return "user"
+        case ModelResponse():
+            return "assistant"
+        case ToolResult():
+            return f"tool result of {history_item.tool_name}"
+        case _:
+            return "other"
+
+
+def _format_timestamp(created_at: int) -> str:
+    return datetime.fromtimestamp(created_at / 1e9).strftime("%Y-%m-%d %H:%M")
+
+
+def create_history_search_tool_set(history_service: HistoryService, history_id: UUID) -> FunctionToolSet:
+    async def search_conversation_history(query: str, limit: int = 10) -> str:
+        """Keyword search over the whole conversation history, best matches first.
+
+        Args:
+            query: The keywords to search for, e.g., an identifier, an error code or a file name.
+                Items matching more of the keywords rank higher.
+            limit: The maximum number of matches to return.
+        """
+        hits = await history_service.search_history_items(history_id, query, limit=limit)
+        if not hits:
+            return f"No messages found for: {query}"
+
+        return "\n".join(
+            f"- [{_format_timestamp(hit.item.created_at)}] {_get_author(hit.item)}: {hit.snippet}" for hit in hits
+        )
+
+    async def read_conversation_history(since_days_ago: float, until_days_ago: float = 0, limit: int = 20) -> str:
+        """The messages between the user and the assistant of a time window, oldest first.
+
+        Args:
+            since_days_ago: The start of the window in days before now, e.g., 7 for the last week.
+            until_days_ago: The end of the window in days before now, 0 is now.
+            limit: The maximum number of messages to return, the oldest ones of the window are returned.
+        """
+        now = time_ns()
+        history_items = await history_service.query_items(
+            history_id,
+            kinds=[HistoryItemKind.USER_PROMPT, HistoryItemKind.MODEL_RESPONSE],
+            since=now - int(since_days_ago * NS_PER_DAY),
+            until=now - int(until_days_ago * NS_PER_DAY),
+            limit=limit,
+        )
+        if not history_items:
+            return f"No messages found between {since_days_ago} and {until_days_ago} days ago."
+
+        lines: list[str] = []
+        for history_item in history_items:
+            match history_item:
+                case UserPrompt():
+                    text = history_item.prompt
+                case ModelResponse():
+                    text = history_item.response
+                case _:
+                    continue
+            if len(text) > MAX_WINDOW_ITEM_CHARS:
+                text = text[:MAX_WINDOW_ITEM_CHARS] + "..."
+            lines.append(f"- [{_format_timestamp(history_item.created_at)}] {_get_author(history_item)}: {text}")
+        return "\n".join(lines)
+
+    async def get_tool_usage(max_unanswered_calls: int = 10) -> str:
+        """How often each tool was called over the whole conversation, how large its results were, and the
+        calls that never got a result, e.g., of interrupted runs.
+
+        Args:
+            max_unanswered_calls: The maximum number of calls without a result to list, the oldest ones first.
+        """
+        all_tool_stats = await history_service.get_tool_stats(history_id)
+        if not all_tool_stats:
+            return "No tools were called yet."
+
+        lines: list[str] = []
+        for tool_stats in all_tool_stats:
+            mean_result_length = (
+                f", {tool_stats.mean_result_length:.0f} characters per result on average"
+                if tool_stats.mean_result_length is not None
+                else ""
+            )
+            lines.append(
+                f"- {tool_stats.tool_name}: {tool_stats.n_calls} calls, {tool_stats.n_results} results, "
+                f"{tool_stats.n_orphan_calls} without a result{mean_result_length}"
+            )
+        if max_unanswered_calls > 0 and any(tool_stats.n_orphan_calls for tool_stats in all_tool_stats):
+            orphan_tool_calls = await history_service.get_orphan_tool_calls(history_id, limit=max_unanswered_calls)
+            lines.append("Oldest calls without a result:")
+            lines.extend(
+                f"- [{_format_timestamp(tool_call.created_at)}] {tool_call.tool_name}: "
+                f"{str(tool_call.args)[:MAX_WINDOW_ITEM_CHARS]}"
+                for tool_call in orphan_tool_calls
+            )
+        return "\n".join(lines)
+
+    return FunctionToolSet(
+        name="history_search_tool_set",
+        system_prompt=(
+            "Searches the whole conversation with the user by keywords or reads it by time window, locally and "
+            "fast, and reports how the tools were used. Prefer it over the relevant previous interactions for "
+            "exact terms like identifiers, error codes or file names, or for what was discussed on a given day."
+        ),
+        tools=[
+            FunctionTool(
+                name="search_conversation_history",
+                function=search_conversation_history,
+                system_prompt=(
+                    "Returns the best matching messages with their date and a snippet, matches are in [brackets]."
+                ),
+            ),
+            FunctionTool(
+                name="read_conversation_history",
+                function=read_conversation_history,
+                system_prompt=(
+                    "Returns the messages of a time window (in days before now), e.g., to recap what was "
+                    "discussed yesterday or last week."
+                ),
+            ),
+            FunctionTool(
+                name="get_tool_usage",
+                function=get_tool_usage,
+                system_prompt=(
+                    "Returns the calls, results and unanswered calls per tool, e.g., to check whether a tool "
+                    "keeps failing or which calls were interrupted."
+                ),
+            ),
+        ],
+    )
@@ -11,7 +11,7 @@ from src.ai.models import (
     SystemPrompt,
     ThinkingDelta,
 )
-from src.history.models import ModelResponse, ThinkingStep, ToolCall, ToolResult, UserPrompt
+from src.history.models import ConversationSummary, ModelResponse, ThinkingStep, ToolCall, ToolResult, UserPrompt
 
 
 class ConsoleService:
@@ -46,7 +46,7 @@ class ConsoleService:
                     pass
                 case ModelResponse() | ThinkingStep():
                     self._console.print()
-                case UserPrompt() | SystemPrompt():
+                case UserPrompt() | SystemPrompt() | ConversationSummary():
                     pass
 
     def _handle_part_start(self, label: str, style: str = "bold cyan"):
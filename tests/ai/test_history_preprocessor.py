@@ -0,0 +1,46 @@
+from time import time_ns
+from uuid import uuid4
+
+from src.ai.history_preprocessor import preprocess_history
+from src.ai.models import SystemPrompt
+from src.history.models import HistoryItem, ToolCall, ToolResult, UserPrompt
+
+HISTORY_ID = uuid4()
+
+
+def test_tool_results_follow_their_calls_and_orphans_are_dropped():
+    # Setup - two parallel calls, a call without result (cancelled) and a result without call
+    created_at = time_ns()
+
+    def tool_call(i: int) -> ToolCall:
+        return ToolCall(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + i,
+            tool_call_id=f"call-{i}",
+            tool_name="tool",
+            args=None,
+        )
+
+    def tool_result(i: int, call: int) -> ToolResult:
+        return ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + i,
+            tool_call_id=f"call-{call}",
+            tool_name="tool",
+            is_retry=False,
+            result=f"result {call}",
+        )
+
+    system_prompt = SystemPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, prompt="system prompt")
+    user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, prompt="prompt")
+    calls = [tool_call(1), tool_call(2), tool_call(3)]
+    results = [tool_result(4, call=2), tool_result(5, call=1), tool_result(6, call=9)]
+    history: list[HistoryItem | SystemPrompt] = [system_prompt, user_prompt, *calls, *results]
+
+    # Execute
+    preprocessed_history = preprocess_history(history)
+
+    # Assert
+    assert preprocessed_history == [system_prompt, user_prompt, calls[0], results[1], calls[1], results[0]]
@@ -0,0 +1,142 @@
+from time import time_ns
+from uuid import uuid4
+
+import pytest
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from src.ai.prompts import PromptsService
+from src.ai.pydantic_ai.summarizer import PydanticAIConversationSummarizer
+from src.history.models import ConversationSummary, HistoryItem, ThinkingStep, UserPrompt
+from src.history.models import ModelResponse as HistoryModelResponse
+from src.history.port import HistoryRepo
+from src.history.service import HistoryService
+from tests.conftest import as_mock
+
+HISTORY_ID = uuid4()
+
+
+def create_turns(n_turns: int, created_at: int) -> list[list[HistoryItem]]:
+    turns: list[list[HistoryItem]] = []
+    for i in range(n_turns):
+        turn_id = uuid4()
+        turns.append(
+            [
+                UserPrompt(
+                    id=turn_id,
+                    history_id=HISTORY_ID,
+                    created_at=created_at + 3 * i,
+                    prompt=f"prompt {i}",
+                    turn_id=turn_id,
+                ),
+                ThinkingStep(
+                    id=uuid4(),
+                    history_id=HISTORY_ID,
+                    created_at=created_at + 3 * i + 1,
+                    thoughts=f"thoughts {i}",
+                    turn_id=turn_id,
+                ),
+                HistoryModelResponse(
+                    id=uuid4(),
+                    history_id=HISTORY_ID,
+                    created_at=created_at + 3 * i + 2,
+                    response=f"response {i}",
+                    turn_id=turn_id,
+                ),
+            ]
+        )
+    return turns
+
+
+@pytest.fixture
+def summarization_prompts() -> list[str]:
+    return []
+
+
+@pytest.fixture
+def summarizer(mock_history_repo: HistoryRepo, summarization_prompts: list[str]):
+    def summarize(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        request = messages[-1]
+        assert isinstance(request, ModelRequest)
+        for part in request.parts:
+            if isinstance(part, UserPromptPart):
+                summarization_prompts.append(str(part.content))
+        return ModelResponse(parts=[TextPart(content="test summary")])
+
+    return PydanticAIConversationSummarizer(
+        llm=FunctionModel(summarize),
+        history_service=HistoryService(history_repo=mock_history_repo),
+        prompts_service=PromptsService(),
+        every_n_turns=2,
+    )
+
+
+async def test_summarize_folds_turns_older_than_the_window(
+    summarizer: PydanticAIConversationSummarizer,
+    mock_history_repo: HistoryRepo,
+    summarization_prompts: list[str],
+):
+    # Setup - three turns, the last one is kept
+    turns = create_turns(3, created_at=time_ns())
+    kept_turn = [turns[2][0], turns[2][2]]
+    as_mock(mock_history_repo.get_last_item_of_kind).return_value = None
+    as_mock(mock_history_repo.get_last_n_turns).return_value = kept_turn
+    as_mock(mock_history_repo.get_items_page).return_value = [item for turn in turns for item in turn]
+
+    # Execute
+    summary = await summarizer.summarize(HISTORY_ID, keep_last_n_turns=1)
+
+    # Assert - the first two turns are summarized, without their ThinkingSteps
+    assert summary is not None
+    assert summary.summary == "test summary"
+    assert summary.covers_until == kept_turn[0].created_at - 1
+    as_mock(mock_history_repo.add_history_item).assert_called_once_with(summary)
+    assert len(summarization_prompts) == 1
+    assert "prompt 0" in summarization_prompts[0] and "response 1" in summarization_prompts[0]
+    assert "thoughts" not in summarization_prompts[0] and "prompt 2" not in summarization_prompts[0]
+
+
+async def test_summarize_continues_the_previous_summary(
+    summarizer: PydanticAIConversationSummarizer,
+    mock_history_repo: HistoryRepo,
+    summarization_prompts: list[str],
+):
+    # Setup - the first turn is covered by the previous summary
+    turns = create_turns(3, created_at=time_ns())
+    previous_summary = ConversationSummary(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        summary="previous summary",
+        covers_until=turns[0][-1].created_at,
+    )
+    as_mock(mock_history_repo.get_last_item_of_kind).return_value = previous_summary
+    as_mock(mock_history_repo.get_last_n_turns).return_value = turns[2]
+    as_mock(mock_history_repo.get_items_page).return_value = turns[1] + turns[2]
+
+    # Execute
+    summary = await summarizer.summarize(HISTORY_ID, keep_last_n_turns=1)
+
+    # Assert
+    assert summary is not None
+    assert as_mock(mock_history_repo.get_items_page).call_args.kwargs["since"] == previous_summary.covers_until + 1
+    assert "previous summary" in summarization_prompts[0] and "prompt 1" in summarization_prompts[0]
+
+
+async def test_schedule_if_due(
+    summarizer: PydanticAIConversationSummarizer,
+    mock_history_repo: HistoryRepo,
+):
+    # Setup
+    turns = create_turns(3, created_at=time_ns())
+    as_mock(mock_history_repo.get_last_item_of_kind).return_value = None
+    as_mock(mock_history_repo.get_last_n_turns).return_value = turns[2]
+    as_mock(mock_history_repo.get_items_page).return_value = [item for turn in turns for item in turn]
+
+    # Execute & Assert - due once `keep_last_n_turns + every_n_turns` turns are not summarized
+    assert not summarizer.schedule_if_due(HISTORY_ID, keep_last_n_turns=1, n_unsummarized_turns=2)
+    assert summarizer.schedule_if_due(HISTORY_ID, keep_last_n_turns=1, n_unsummarized_turns=3)
+    # Only one summarization runs per history at a time
+    assert not summarizer.schedule_if_due(HISTORY_ID, keep_last_n_turns=1, n_unsummarized_turns=3)
+    await summarizer.wait_for_pending()
+    as_mock(mock_history_repo.add_history_item).assert_called_once()
@@ -0,0 +1,112 @@
+from pathlib import Path
+from time import time_ns
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+from src.application.incremental_indexer import IncrementalIndexer
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.models import HistoryItem, ModelResponse, ThinkingStep, ToolResult, UserPrompt
+from src.history.service import HistoryService
+from src.rag.port import RAGService
+
+HISTORY_ID = uuid4()
+
+
+def create_turn(created_at: int) -> list[HistoryItem]:
+    return [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, prompt="prompt"),
+        ThinkingStep(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, thoughts="thoughts"),
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 2,
+            tool_call_id="call_1",
+            tool_name="read_logs",
+            is_retry=True,
+            result="Unknown argument, try again.",
+        ),
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 3,
+            tool_call_id="call_2",
+            tool_name="read_logs",
+            is_retry=False,
+            result={"lines": ["ERR-4711"]},
+        ),
+        ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 4, response="response"),
+    ]
+
+
+async def test_catches_up_from_the_watermark(tmp_path: Path):
+    # Setup
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_service = HistoryService(AsyncSqlalchemyHistoryRepo(engine))
+    await history_service.create_history_if_not_exists(HISTORY_ID)
+    rag_service = AsyncMock(spec=RAGService)
+    watermarks_path = tmp_path / "rag_watermarks.json"
+    indexer = IncrementalIndexer(
+        history_service, rag_service, watermarks_path=watermarks_path, batch_size=3, index_tool_results=True
+    )
+    created_at = time_ns()
+    first_turns = create_turn(created_at) + create_turn(created_at + 10)
+    await history_service.add_history_items(first_turns)
+
+    try:
+        # Execute - a first run, and a second one (e.g., after a restart) with a new turn
+        n_first = await indexer.catch_up(HISTORY_ID)
+        new_turn = create_turn(created_at + 20)
+        await history_service.add_history_items(new_turn)
+        restarted_indexer = IncrementalIndexer(
+            history_service, rag_service, watermarks_path=watermarks_path, batch_size=3, index_tool_results=True
+        )
+        n_second = await restarted_indexer.catch_up(HISTORY_ID)
+        n_third = await restarted_indexer.catch_up(HISTORY_ID)
+
+        # Assert - ToolResults (but retries) and ModelResponses, in batches, each item once
+        batches = [call.args[0] for call in rag_service.add_history_items.await_args_list]
+        assert [[item.id for item in batch] for batch in batches] == [
+            [first_turns[3].id, first_turns[4].id, first_turns[8].id],
+            [first_turns[9].id],
+            [new_turn[3].id, new_turn[4].id],
+        ]
+        assert (n_first, n_second, n_third) == (4, 2, 0)
+        assert restarted_indexer.get_watermark(HISTORY_ID) == (new_turn[-1].created_at, new_turn[-1].id)
+    finally:
+        await engine.dispose()
+
+
+async def test_indexes_the_whole_results_stored_as_blobs(tmp_path: Path):
+    # Setup
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_service = HistoryService(AsyncSqlalchemyHistoryRepo(engine, blob_threshold_bytes=1024))
+    await history_service.create_history_if_not_exists(HISTORY_ID)
+    rag_service = AsyncMock(spec=RAGService)
+    indexer = IncrementalIndexer(
+        history_service, rag_service, watermarks_path=tmp_path / "rag_watermarks.json", index_tool_results=True
+    )
+    result = {"lines": ["ERR-4711 ü"] * 1000}
+    tool_result = ToolResult(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        tool_call_id="call_1",
+        tool_name="read_logs",
+        is_retry=False,
+        result=result,
+    )
+    await history_service.add_history_items([tool_result])
+
+    try:
+        # Execute
+        await indexer.catch_up(HISTORY_ID)
+
+        # Assert - the result is loaded from its blob, not the (truncated) preview
+        [batch] = [call.args[0] for call in rag_service.add_history_items.await_args_list]
+        assert batch[0].result == result
+    finally:
+        await engine.dispose()
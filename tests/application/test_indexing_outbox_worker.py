@@ -0,0 +1,80 @@
+from pathlib import Path
+from time import time_ns
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+from src.application.indexing_outbox_worker import IndexingOutboxWorker
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.models import NS_PER_DAY, ModelResponse, UserPrompt
+from src.rag.port import RAGService
+
+HISTORY_ID = uuid4()
+
+
+async def test_outbox_is_filled_with_the_items_and_drained_with_retries(tmp_path: Path):
+    # Setup
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_repo = AsyncSqlalchemyHistoryRepo(engine)
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    rag_service = AsyncMock(spec=RAGService)
+    rag_service.add_history_items.side_effect = [RuntimeError("embedder unavailable"), None, None]
+    worker = IndexingOutboxWorker(history_repo, rag_service, batch_size=2, min_backoff_s=0)
+    created_at = time_ns()
+    prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at - NS_PER_DAY + i, prompt=f"prompt {i}")
+        for i in range(3)
+    ]
+    response = ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, response="response")
+
+    try:
+        # Execute - only the UserPrompts are enqueued, in the transaction of the items
+        await history_repo.add_history_items([*prompts, response])
+        stats_before = await history_repo.get_outbox_stats()
+        await worker.drain()
+        await worker.drain()
+
+        # Assert - a failed batch ends the drain and is retried, every prompt is indexed, oldest first
+        assert (stats_before.depth, stats_before.oldest_created_at) == (3, prompts[0].created_at)
+        indexed_batches = [call.args[0] for call in rag_service.add_history_items.await_args_list]
+        assert [[item.id for item in batch] for batch in indexed_batches] == [
+            [prompts[0].id, prompts[1].id],
+            [prompts[0].id, prompts[1].id],
+            [prompts[2].id],
+        ]
+        assert (worker.stats.n_indexed, worker.stats.n_failed_attempts) == (3, 2)
+        assert (await history_repo.get_outbox_stats()).depth == 0
+
+        # Deleted items take their entries with them
+        await history_repo.add_history_items(
+            [UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, prompt="deleted")]
+        )
+        await history_repo.delete_items(HISTORY_ID, created_before=created_at + 2)
+        assert (await history_repo.get_outbox_stats()).depth == 0
+    finally:
+        await engine.dispose()
+
+
+async def test_disabled_outbox_enqueues_nothing(tmp_path: Path):
+    # Setup - e.g., RAG turned off or indexing inline after an entry was enqueued
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_repo = AsyncSqlalchemyHistoryRepo(engine)
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    await history_repo.add_history_items([UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=1, prompt="a")])
+
+    try:
+        # Execute
+        await history_repo.set_outbox_enabled(False)
+        await history_repo.add_history_items([UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=2, prompt="b")])
+        depth_disabled = (await history_repo.get_outbox_stats()).depth
+        await history_repo.set_outbox_enabled(True)
+        await history_repo.add_history_items([UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=3, prompt="c")])
+
+        # Assert - the left over entry is dropped, enqueuing resumes once enabled
+        assert depth_disabled == 0
+        assert [entry.history_item.created_at for entry in await history_repo.get_outbox_entries()] == [3]
+    finally:
+        await engine.dispose()
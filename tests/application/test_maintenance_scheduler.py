@@ -0,0 +1,77 @@
+import asyncio
+from typing import AsyncIterator
+
+from src.application.maintenance_scheduler import MaintenanceJob, MaintenanceScheduler
+
+
+async def create_stream(events: list[str], n_items: int = 3, delay_s: float = 0.05) -> AsyncIterator[int]:
+    for i in range(n_items):
+        events.append(f"item {i}")
+        await asyncio.sleep(delay_s)
+        yield i
+
+
+async def test_jobs_run_in_idle_gaps_only():
+    # Setup
+    events: list[str] = []
+
+    async def job() -> str:
+        events.append("job")
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def failing_job():
+        raise RuntimeError("database is locked")
+
+    scheduler = MaintenanceScheduler(
+        jobs=[MaintenanceJob("job", job, interval_s=3600), MaintenanceJob("failing job", failing_job, interval_s=3600)],
+        idle_delay_s=0.05,
+    )
+
+    try:
+        # Execute - a run starts before the idle delay has passed
+        scheduler.start()
+        items = [item async for item in scheduler.hold_off_during(create_stream(events))]
+        await asyncio.sleep(0.2)
+
+        # Assert - the jobs only run after the run, their durations are reported
+        assert items == [0, 1, 2]
+        assert events == ["item 0", "item 1", "item 2", "job"]
+        assert scheduler.last_runs["job"].result == "done"
+        assert scheduler.last_runs["job"].duration_ms >= 10
+        # A failing job is reported and does not stop the others
+        assert scheduler.last_runs["failing job"].error == "database is locked"
+    finally:
+        await scheduler.stop()
+
+
+async def test_run_waits_for_running_job():
+    # Setup
+    events: list[str] = []
+    job_started = asyncio.Event()
+    job_may_end = asyncio.Event()
+
+    async def slow_job():
+        job_started.set()
+        await job_may_end.wait()
+        events.append("job")
+
+    async def start_run() -> int:
+        return await anext(scheduler.hold_off_during(create_stream(events, delay_s=0)))
+
+    scheduler = MaintenanceScheduler(jobs=[MaintenanceJob("slow job", slow_job, interval_s=3600)], idle_delay_s=0)
+
+    try:
+        # Execute
+        scheduler.start()
+        await job_started.wait()
+        run = asyncio.create_task(start_run())
+        await asyncio.sleep(0.05)
+
+        # Assert - the run only starts once the job is done
+        assert events == []
+        job_may_end.set()
+        assert await run == 0
+        assert events == ["job", "item 0"]
+    finally:
+        await scheduler.stop()
@@ -0,0 +1,130 @@
+from pathlib import Path
+from time import time_ns
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+from sqlalchemy import func, select
+
+from src.application.retention_use_case import RetentionUseCase
+from src.config.models import RetentionConfig, RetentionRuleConfig
+from src.core.database import create_db_and_tables, get_engine, get_session
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.async_sqlalchemy.models import HistoryBlobDb
+from src.history.models import NS_PER_DAY, HistoryItem, HistoryItemKind, ThinkingStep, ToolCall, ToolResult, UserPrompt
+from src.history.service import HistoryService
+from src.rag.port import RAGService
+
+HISTORY_ID = uuid4()
+
+
+def create_turn(created_at: int) -> list[HistoryItem]:
+    turn_id = uuid4()
+    return [
+        UserPrompt(id=turn_id, history_id=HISTORY_ID, created_at=created_at, prompt="prompt", turn_id=turn_id),
+        ThinkingStep(
+            id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, thoughts="thoughts", turn_id=turn_id
+        ),
+        ToolCall(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 2,
+            tool_call_id=f"call_{created_at}",
+            tool_name="read_logs",
+            args=None,
+            turn_id=turn_id,
+        ),
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 3,
+            tool_call_id=f"call_{created_at}",
+            tool_name="read_logs",
+            is_retry=False,
+            result="ERR-4711 " * 100,  # Stored as a blob, shared by all turns
+            turn_id=turn_id,
+        ),
+    ]
+
+
+async def test_retention_rules_and_size_cap(tmp_path: Path):
+    # Setup
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_repo = AsyncSqlalchemyHistoryRepo(engine, blob_threshold_bytes=100)
+    history_service = HistoryService(history_repo)
+    rag_service = AsyncMock(spec=RAGService)
+    config = RetentionConfig(
+        rules=(
+            RetentionRuleConfig(kind="thinking_step", max_age_days=30),
+            RetentionRuleConfig(kind="tool_result", max_age_days=90),
+        ),
+        max_items_per_history=None,
+        batch_size=2,
+    )
+    now = time_ns()
+    # Turns of 100, 60 and 0 days ago, oldest first
+    turns = [create_turn(now - days * NS_PER_DAY) for days in [100, 60, 0]]
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    await history_repo.add_history_items([item for turn in turns for item in turn])
+
+    try:
+        # Execute
+        n_deleted = await RetentionUseCase(history_service, config, rag_service=rag_service).execute(HISTORY_ID)
+        n_deleted_again = await RetentionUseCase(history_service, config, rag_service=rag_service).execute(HISTORY_ID)
+
+        # Assert - ThinkingSteps older than 30 days and ToolResults older than 90 days are gone, ToolCalls are kept
+        assert n_deleted == 3
+        assert n_deleted_again == 0
+        remaining_items = await history_repo.get_items_page(HISTORY_ID)
+        assert remaining_items == [turns[0][0], turns[0][2], turns[1][0], turns[1][2], turns[1][3], *turns[2]]
+        # Every deleted batch is mirrored in the RAG index, up to its newest item
+        rag_service.delete_history_items.assert_any_await(
+            HISTORY_ID, turns[1][1].created_at + 1, [HistoryItemKind.THINKING_STEP]
+        )
+        rag_service.delete_history_items.assert_any_await(
+            HISTORY_ID, turns[0][3].created_at + 1, [HistoryItemKind.TOOL_RESULT]
+        )
+
+        # Execute - the size cap keeps the most recent items only
+        capped_config = RetentionConfig(rules=(), max_items_per_history=5, batch_size=2)
+        n_capped = await RetentionUseCase(history_service, capped_config).execute(HISTORY_ID)
+
+        # Assert - the shared blob is kept as long as an item references it
+        assert n_capped == len(remaining_items) - 5
+        assert await history_repo.get_items_page(HISTORY_ID) == remaining_items[-5:]
+        async with get_session(engine) as session:
+            n_blobs = (await session.execute(select(func.count()).select_from(HistoryBlobDb))).scalar_one()
+        assert n_blobs == 1
+        await history_service.delete_history_items(HISTORY_ID, created_before=now + NS_PER_DAY)
+        async with get_session(engine) as session:
+            n_blobs = (await session.execute(select(func.count()).select_from(HistoryBlobDb))).scalar_one()
+        assert n_blobs == 0
+    finally:
+        await engine.dispose()
+
+
+async def test_size_cap_keeps_items_created_at_the_same_ns(tmp_path: Path):
+    # Setup - 3 items of the same `created_at`, ordered by their ids
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_repo = AsyncSqlalchemyHistoryRepo(engine)
+    history_service = HistoryService(history_repo)
+    created_at = time_ns()
+    user_prompts = sorted(
+        (UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, prompt="prompt") for _ in range(3)),
+        key=lambda user_prompt: user_prompt.id,
+    )
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    await history_repo.add_history_items(user_prompts)
+    config = RetentionConfig(rules=(), max_items_per_history=2, batch_size=10)
+
+    try:
+        # Execute
+        n_deleted = await RetentionUseCase(history_service, config).execute(HISTORY_ID)
+
+        # Assert - only the oldest by (created_at, id) is deleted
+        assert n_deleted == 1
+        assert await history_repo.get_items_page(HISTORY_ID) == user_prompts[1:]
+    finally:
+        await engine.dispose()
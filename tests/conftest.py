@@ -5,6 +5,7 @@ from unittest.mock import AsyncMock, MagicMock
 import pytest
 
 from src.core.database import SessionContext, create_db_and_tables, get_engine, get_session
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
 from src.history.port import HistoryRepo
 
 
@@ -15,7 +16,7 @@ def as_mock(obj: Any) -> MagicMock:
 @asynccontextmanager
 async def get_test_session() -> SessionContext:
     engine = get_engine()
-    await create_db_and_tables(engine)
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
 
     async with get_session(engine) as session:
         yield session
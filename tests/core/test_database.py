@@ -1,10 +1,19 @@
+from pathlib import Path
 from uuid import uuid4
 
 import pytest
 from sqlalchemy import delete, select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlmodel import col
 
+from src.config.models import SqliteProfile
+from src.core.database import (
+    create_db_and_tables,
+    get_engine,
+    get_session,
+    get_sqlite_pragmas,
+    get_sqlite_profile_mismatches,
+)
 from src.history.async_sqlalchemy.models import HistoryDb, HistoryItemDb
 from tests.conftest import get_test_session
 
@@ -44,3 +53,42 @@ async def test_delete_history_with_items_raises_exc():
     with pytest.raises(IntegrityError):
         async with get_test_session() as session:
             await session.delete(history)
+
+
+async def test_profile_pragmas_are_applied_per_connection(tmp_path: Path):
+    # Setup
+    profile = SqliteProfile(mmap_size=1024 * 1024, cache_size=-1024)
+    engine = get_engine(tmp_path / "database.db", profile=profile)
+    await create_db_and_tables(engine)
+    read_engine = get_engine(tmp_path / "database.db", profile=profile, read_only=True)
+
+    try:
+        # Execute
+        pragmas = await get_sqlite_pragmas(engine)
+        read_pragmas = await get_sqlite_pragmas(read_engine)
+
+        # Assert
+        assert pragmas["journal_mode"] == "wal"
+        assert pragmas["foreign_keys"] == 1
+        assert get_sqlite_profile_mismatches(pragmas, profile) == {}
+        assert get_sqlite_profile_mismatches(read_pragmas, profile) == {}
+        assert read_pragmas["query_only"] == 1
+    finally:
+        await engine.dispose()
+        await read_engine.dispose()
+
+
+async def test_read_engine_rejects_writes(tmp_path: Path):
+    # Setup
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine)
+    read_engine = get_engine(tmp_path / "database.db", read_only=True)
+
+    try:
+        # Execute & Assert
+        with pytest.raises(OperationalError):
+            async with get_session(read_engine) as session:
+                session.add(HistoryDb(id=uuid4()))
+    finally:
+        await engine.dispose()
+        await read_engine.dispose()
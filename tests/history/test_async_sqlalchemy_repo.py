@@ -1,14 +1,25 @@
+from dataclasses import replace
 from time import time_ns
 from uuid import uuid4
 
 import pytest
-from sqlalchemy import delete
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlmodel import col
 
 from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
-from src.history.async_sqlalchemy.models import HistoryDb, HistoryItemDb
-from src.history.models import UserPrompt
+from src.history.async_sqlalchemy.models import HistoryBlobDb, HistoryDb, HistoryItemDb
+from src.history.models import (
+    ConversationSummary,
+    DeferredPayload,
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    ModelResponse,
+    ThinkingStep,
+    ToolResult,
+    UserPrompt,
+)
 from tests.conftest import get_test_session
 from tests.history.utils import compare_user_prompt
 
@@ -57,3 +68,314 @@ async def test_history_repo_ops(history_repo: AsyncSqlalchemyHistoryRepo):
 
     # Teardown
     await reset_database()
+
+
+async def test_get_last_n_items(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    # Creating twice must not fail
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+
+    created_at = time_ns()
+    test_user_prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i, prompt=f"test prompt {i}")
+        for i in range(5)
+    ]
+    for test_user_prompt in test_user_prompts:
+        await history_repo.add_history_item(test_user_prompt)
+
+    # Execute
+    last_items = await history_repo.get_last_n_items(HISTORY_ID, 3)
+
+    # Assert - chronological order, only the tail
+    assert len(last_items) == 3
+    for item, test_user_prompt in zip(last_items, test_user_prompts[-3:]):
+        assert isinstance(item, UserPrompt)
+        compare_user_prompt(item, test_user_prompt)
+    assert await history_repo.get_last_n_items(HISTORY_ID, 0) == []
+    assert len(await history_repo.get_last_n_items(HISTORY_ID, 10)) == 5
+
+    # Teardown
+    await reset_database()
+
+
+async def test_add_history_items(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+
+    created_at = time_ns()
+    test_user_prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i, prompt=f"test prompt {i}")
+        for i in range(3)
+    ]
+
+    # Execute
+    await history_repo.add_history_items(test_user_prompts)
+    await history_repo.add_history_items([])
+
+    # Assert
+    items = await history_repo.get_last_n_items(HISTORY_ID, 10)
+    assert len(items) == 3
+    for item, test_user_prompt in zip(items, test_user_prompts):
+        assert isinstance(item, UserPrompt)
+        compare_user_prompt(item, test_user_prompt)
+
+    # Teardown
+    await reset_database()
+
+
+async def test_get_items_page(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup - items sharing a created_at are ordered by id
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    test_user_prompts = sorted(
+        [
+            UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i // 2, prompt=f"test prompt {i}")
+            for i in range(7)
+        ],
+        key=lambda item: (item.created_at, item.id.hex),
+    )
+    await history_repo.add_history_items(test_user_prompts)
+
+    # Execute
+    pages: list[list[HistoryItem]] = []
+    after: HistoryItemKey | None = None
+    while page := await history_repo.get_items_page(HISTORY_ID, after=after, limit=3):
+        pages.append(page)
+        after = (page[-1].created_at, page[-1].id)
+    since_items = await history_repo.get_items_page(HISTORY_ID, since=created_at + 2)
+
+    # Assert
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [item.id for page in pages for item in page] == [item.id for item in test_user_prompts]
+    assert [item.id for item in since_items] == [item.id for item in test_user_prompts[4:]]
+
+    # Teardown
+    await reset_database()
+
+
+async def test_query_items(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup - alternating prompts and responses
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    history_items: list[HistoryItem] = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i, prompt=f"prompt {i}")
+        if i % 2 == 0
+        else ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i, response=f"response {i}")
+        for i in range(10)
+    ]
+    await history_repo.add_history_items(history_items)
+
+    # Execute
+    responses = await history_repo.query_items(HISTORY_ID, kinds=[HistoryItemKind.MODEL_RESPONSE])
+    window = await history_repo.query_items(HISTORY_ID, since=created_at + 3, until=created_at + 7)
+    last_prompts = await history_repo.query_items(
+        HISTORY_ID, kinds=[HistoryItemKind.USER_PROMPT], until=created_at + 8, limit=2, newest_first=True
+    )
+    no_tool_calls = await history_repo.query_items(HISTORY_ID, kinds=[HistoryItemKind.TOOL_CALL])
+
+    # Assert - `since` is inclusive, `until` is exclusive
+    assert responses == history_items[1::2]
+    assert window == history_items[3:7]
+    assert last_prompts == [history_items[6], history_items[4]]
+    assert no_tool_calls == []
+
+    # Teardown
+    await reset_database()
+
+
+async def test_get_last_n_turns(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup - three turns, each with a thinking step and a response
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    turns: list[list[HistoryItem]] = []
+    for i in range(3):
+        turn_id = uuid4()
+        turns.append(
+            [
+                UserPrompt(
+                    id=turn_id,
+                    history_id=HISTORY_ID,
+                    created_at=created_at + 3 * i,
+                    prompt=f"prompt {i}",
+                    turn_id=turn_id,
+                ),
+                ThinkingStep(
+                    id=uuid4(),
+                    history_id=HISTORY_ID,
+                    created_at=created_at + 3 * i + 1,
+                    thoughts=f"thoughts {i}",
+                    turn_id=turn_id,
+                ),
+                ModelResponse(
+                    id=uuid4(),
+                    history_id=HISTORY_ID,
+                    created_at=created_at + 3 * i + 2,
+                    response=f"response {i}",
+                    turn_id=turn_id,
+                ),
+            ]
+        )
+    await history_repo.add_history_items([item for turn in turns for item in turn])
+
+    # Execute
+    last_turns = await history_repo.get_last_n_turns(HISTORY_ID, 2)
+    all_kinds_last_turn = await history_repo.get_last_n_turns(HISTORY_ID, 1, kinds=list(HistoryItemKind))
+
+    # Assert - complete turns, without thinking steps by default
+    assert [item.id for item in last_turns] == [turns[1][0].id, turns[1][2].id, turns[2][0].id, turns[2][2].id]
+    assert [item.id for item in all_kinds_last_turn] == [item.id for item in turns[2]]
+    assert all(item.turn_id == turns[2][0].id for item in all_kinds_last_turn)
+
+    # Teardown
+    await reset_database()
+
+
+async def test_get_last_item_of_kind(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    summaries = [
+        ConversationSummary(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 2 * i,
+            summary=f"summary {i}",
+            covers_until=created_at + 2 * i - 1,
+        )
+        for i in range(2)
+    ]
+    await history_repo.add_history_items(
+        [
+            summaries[0],
+            summaries[1],
+            UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 5, prompt="test prompt"),
+        ]
+    )
+
+    # Execute
+    last_summary = await history_repo.get_last_item_of_kind(HISTORY_ID, HistoryItemKind.CONVERSATION_SUMMARY)
+    no_tool_call = await history_repo.get_last_item_of_kind(HISTORY_ID, HistoryItemKind.TOOL_CALL)
+
+    # Assert
+    assert last_summary == summaries[1]
+    assert no_tool_call is None
+
+    # Teardown
+    await reset_database()
+
+
+async def test_search_items(history_repo: AsyncSqlalchemyHistoryRepo):
+    # Setup
+    await reset_database()
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    user_prompt = UserPrompt(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=created_at,
+        prompt="Why does config_loader.py fail with ERR-4711?",
+    )
+    model_response = ModelResponse(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=created_at + 1,
+        response="The loader fails because the file is missing.",
+    )
+    tool_result = ToolResult(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=created_at + 2,
+        tool_call_id="call_1",
+        tool_name="read_logs",
+        is_retry=False,
+        result={"error": "ERR-4711 in config_loader.py"},
+    )
+    thinking_step = ThinkingStep(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=created_at + 3,
+        thoughts="ERR-4711 again",
+    )
+    await history_repo.add_history_items([user_prompt, model_response, tool_result, thinking_step])
+
+    # Execute
+    error_code_hits = await history_repo.search_items(HISTORY_ID, "ERR-4711")
+    file_name_hits = await history_repo.search_items(HISTORY_ID, 'config_loader.py "missing')
+    no_hits = await history_repo.search_items(uuid4(), "ERR-4711")
+
+    # Assert - ThinkingSteps are not indexed, punctuation is matched literally
+    assert {hit.item.id for hit in error_code_hits} == {user_prompt.id, tool_result.id}
+    assert all("[ERR-4711]" in hit.snippet for hit in error_code_hits)
+    assert {hit.item.id for hit in file_name_hits} == {user_prompt.id, model_response.id, tool_result.id}
+    assert no_hits == []
+
+    # Teardown
+    await reset_database()
+
+
+async def test_large_payloads_are_stored_as_blobs(engine: AsyncEngine):
+    # Setup
+    await reset_database()
+    history_repo = AsyncSqlalchemyHistoryRepo(engine, blob_threshold_bytes=1024)
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    large_result = {"lines": [f"ERR-4711 in line {i}" for i in range(200)]}
+    turn_id = uuid4()
+    tool_results = [
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + i,
+            tool_call_id=f"call_{i}",
+            tool_name="read_logs",
+            is_retry=False,
+            result=large_result,
+            turn_id=turn_id,
+        )
+        for i in range(2)
+    ]
+    thinking_step = ThinkingStep(
+        id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 2, thoughts="x" * 2000, turn_id=turn_id
+    )
+    small_result = replace(tool_results[0], id=uuid4(), created_at=created_at + 3, result="small")
+    await history_repo.add_history_items([*tool_results, thinking_step])
+    await history_repo.add_history_item(small_result)
+
+    # Execute
+    last_items = await history_repo.get_last_n_items(HISTORY_ID, 4)
+    hits = await history_repo.search_items(HISTORY_ID, "ERR-4711")
+    page = await history_repo.get_items_page(HISTORY_ID)
+    resolved_page = await history_repo.resolve_deferred_payloads(page)
+
+    # Assert - identical payloads are stored once, the previews of results are searchable
+    assert last_items == [*tool_results, thinking_step, small_result]
+    assert {hit.item.id for hit in hits} == {tool_result.id for tool_result in tool_results}
+    # Reads outside of the context window defer the payloads to their preview
+    deferred_result = hits[0].item.result  # type: ignore
+    assert isinstance(deferred_result, DeferredPayload)
+    assert deferred_result.startswith('{"lines": ["ERR-4711 in line 0"')
+    assert [isinstance(item, ThinkingStep) and isinstance(item.thoughts, DeferredPayload) for item in page] == [
+        False,
+        False,
+        True,
+        False,
+    ]
+    assert resolved_page == last_items
+    async with get_test_session() as session:
+        contents = (
+            await session.execute(select(col(HistoryItemDb.content)).where(col(HistoryItemDb.history_id) == HISTORY_ID))
+        ).scalars()
+        blob_hashes = {content.get("result_blob") or content.get("thoughts_blob") for content in contents}
+        ref_counts = (await session.execute(select(col(HistoryBlobDb.ref_count)))).scalars().all()
+    assert len(blob_hashes - {None}) == 2
+    assert sorted(ref_counts) == [1, 2]
+
+    # Teardown
+    await reset_database()
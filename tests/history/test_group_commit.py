@@ -0,0 +1,179 @@
+import asyncio
+from time import time_ns
+from uuid import uuid4
+
+import pytest
+
+from src.history.group_commit import GroupCommitHistoryWriter
+from src.history.models import ToolCall, ToolResult, UserPrompt
+from src.history.port import HistoryRepo
+from tests.conftest import as_mock
+
+HISTORY_ID = uuid4()
+
+
+def create_tool_call(tool_call_id: str) -> ToolCall:
+    return ToolCall(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        tool_call_id=tool_call_id,
+        tool_name="dummy_tool",
+        args={"input": "test"},
+    )
+
+
+def create_tool_result(tool_call_id: str) -> ToolResult:
+    return ToolResult(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        tool_call_id=tool_call_id,
+        tool_name="dummy_tool",
+        is_retry=False,
+        result="test",
+    )
+
+
+@pytest.fixture
+def writer(mock_history_repo: HistoryRepo):
+    return GroupCommitHistoryWriter(history_repo=mock_history_repo, flush_window_s=60)
+
+
+async def test_flush_writes_one_batch(writer: GroupCommitHistoryWriter, mock_history_repo: HistoryRepo):
+    # Setup
+    test_user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="test prompt")
+    tool_call = create_tool_call("call-1")
+    tool_result = create_tool_result("call-1")
+
+    # Execute
+    for item in [test_user_prompt, tool_call, tool_result]:
+        await writer.add(item)
+    as_mock(mock_history_repo.add_history_items).assert_not_called()
+    await writer.flush(final=True)
+
+    # Assert
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with([test_user_prompt, tool_call, tool_result])
+    assert writer.n_buffered_items == 0
+
+
+async def test_tool_call_is_held_back_until_its_result(
+    writer: GroupCommitHistoryWriter,
+    mock_history_repo: HistoryRepo,
+):
+    # Setup
+    tool_call = create_tool_call("call-1")
+    tool_result = create_tool_result("call-1")
+
+    # Execute & Assert - a ToolCall on its own is never written
+    await writer.add(tool_call)
+    await writer.flush()
+    as_mock(mock_history_repo.add_history_items).assert_not_called()
+
+    # ...but together with its ToolResult
+    await writer.add(tool_result)
+    await writer.flush()
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with([tool_call, tool_result])
+
+
+async def test_items_after_a_held_back_tool_call_wait_for_it(
+    writer: GroupCommitHistoryWriter,
+    mock_history_repo: HistoryRepo,
+):
+    # Setup - parallel tool calls, the second one finishes first
+    slow_tool_call = create_tool_call("call-1")
+    fast_tool_call = create_tool_call("call-2")
+    fast_tool_result = create_tool_result("call-2")
+    slow_tool_result = create_tool_result("call-1")
+
+    # Execute & Assert - nothing newer than the held back ToolCall is written before it
+    for item in [slow_tool_call, fast_tool_call, fast_tool_result]:
+        await writer.add(item)
+    await writer.flush()
+    as_mock(mock_history_repo.add_history_items).assert_not_called()
+
+    # ...all of them in chronological order once it is complete
+    await writer.add(slow_tool_result)
+    await writer.flush()
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with(
+        [slow_tool_call, fast_tool_call, fast_tool_result, slow_tool_result]
+    )
+
+
+async def test_final_flush_discards_orphan_tool_calls(
+    writer: GroupCommitHistoryWriter,
+    mock_history_repo: HistoryRepo,
+):
+    await writer.add(create_tool_call("call-1"))
+    await writer.flush(final=True)
+
+    as_mock(mock_history_repo.add_history_items).assert_not_called()
+    assert writer.n_buffered_items == 0
+
+
+async def test_flushes_after_window(mock_history_repo: HistoryRepo):
+    # Setup
+    writer = GroupCommitHistoryWriter(history_repo=mock_history_repo, flush_window_s=0.01)
+    test_user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="test prompt")
+
+    # Execute
+    await writer.add(test_user_prompt)
+    await asyncio.sleep(0.05)
+
+    # Assert
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with([test_user_prompt])
+
+
+async def test_failed_flush_keeps_items(writer: GroupCommitHistoryWriter, mock_history_repo: HistoryRepo):
+    # Setup
+    test_user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="test prompt")
+    as_mock(mock_history_repo.add_history_items).side_effect = [RuntimeError("database is locked"), None]
+    await writer.add(test_user_prompt)
+
+    # Execute & Assert
+    with pytest.raises(RuntimeError):
+        await writer.flush()
+    assert writer.n_buffered_items == 1
+    await writer.flush()
+    as_mock(mock_history_repo.add_history_items).assert_called_with([test_user_prompt])
+
+
+async def test_failed_timer_flush_is_logged_and_keeps_items(
+    mock_history_repo: HistoryRepo, caplog: pytest.LogCaptureFixture
+):
+    # Setup
+    writer = GroupCommitHistoryWriter(history_repo=mock_history_repo, flush_window_s=0.01)
+    test_user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="test prompt")
+    as_mock(mock_history_repo.add_history_items).side_effect = [RuntimeError("database is locked"), None]
+
+    # Execute
+    await writer.add(test_user_prompt)
+    await asyncio.sleep(0.05)
+
+    # Assert
+    assert "database is locked" in caplog.text
+    assert writer.n_buffered_items == 1
+    await writer.flush(final=True)
+    as_mock(mock_history_repo.add_history_items).assert_called_with([test_user_prompt])
+
+
+async def test_final_flush_waits_for_a_flushing_timer(mock_history_repo: HistoryRepo):
+    # Setup - the timer's commit is in flight when the run ends
+    writer = GroupCommitHistoryWriter(history_repo=mock_history_repo, flush_window_s=0.01)
+    test_user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="test prompt")
+    commit_started = asyncio.Event()
+
+    async def add_history_items(items: list[object]):
+        commit_started.set()
+        await asyncio.sleep(0.05)
+
+    as_mock(mock_history_repo.add_history_items).side_effect = add_history_items
+    await writer.add(test_user_prompt)
+    await commit_started.wait()
+
+    # Execute
+    await writer.flush(final=True)
+
+    # Assert - written once, not again by the final flush
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with([test_user_prompt])
+    assert writer.n_buffered_items == 0
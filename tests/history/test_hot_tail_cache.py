@@ -0,0 +1,107 @@
+from time import time_ns
+from uuid import uuid4
+
+from src.history.hot_tail_cache import HotTailCache, estimate_history_item_size
+from src.history.models import CONTEXT_HISTORY_ITEM_KINDS, ModelResponse, ThinkingStep, UserPrompt
+
+HISTORY_ID = uuid4()
+
+
+def create_user_prompts(n: int, prompt: str = "test prompt") -> list[UserPrompt]:
+    created_at = time_ns()
+    return [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i, prompt=f"{prompt} {i}")
+        for i in range(n)
+    ]
+
+
+def test_serves_windows_that_fit():
+    # Setup
+    cache = HotTailCache(max_items_per_history=5, max_bytes_per_history=1024 * 1024, max_histories=2)
+    test_user_prompts = create_user_prompts(7)
+
+    # Execute & Assert - cold
+    assert cache.get_last_n(HISTORY_ID, 3) is None
+    cache.warm(HISTORY_ID, test_user_prompts[-5:])
+
+    # Warm, the window fits
+    assert cache.get_last_n(HISTORY_ID, 3) == test_user_prompts[-3:]
+    # The window is larger than the tail, and the tail is not the complete history
+    assert cache.get_last_n(HISTORY_ID, 6) is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+
+def test_complete_history_serves_any_window():
+    # Setup
+    cache = HotTailCache(max_items_per_history=5, max_bytes_per_history=1024 * 1024, max_histories=2)
+    test_user_prompts = create_user_prompts(2)
+
+    # Execute
+    cache.warm(HISTORY_ID, test_user_prompts[:1])
+    cache.append(test_user_prompts[1])
+
+    # Assert
+    assert cache.get_last_n(HISTORY_ID, 10) == test_user_prompts
+
+
+def test_bounded_by_items_and_bytes():
+    # Setup
+    test_user_prompts = create_user_prompts(4, prompt="x" * 1000)
+    max_bytes = 2 * estimate_history_item_size(test_user_prompts[0])
+    cache = HotTailCache(max_items_per_history=3, max_bytes_per_history=max_bytes, max_histories=2)
+
+    # Execute
+    cache.warm(HISTORY_ID, [])
+    for test_user_prompt in test_user_prompts:
+        cache.append(test_user_prompt)
+
+    # Assert - evicted down to the byte budget, no longer complete
+    assert cache.get_last_n(HISTORY_ID, 2) == test_user_prompts[-2:]
+    assert cache.get_last_n(HISTORY_ID, 3) is None
+
+
+def test_evicts_least_recently_used_history():
+    # Setup
+    cache = HotTailCache(max_items_per_history=5, max_bytes_per_history=1024 * 1024, max_histories=2)
+    history_ids = [uuid4() for _ in range(3)]
+
+    # Execute
+    cache.warm(history_ids[0], [])
+    cache.warm(history_ids[1], [])
+    cache.get_last_n(history_ids[0], 1)
+    cache.warm(history_ids[2], [])
+
+    # Assert
+    assert cache.is_warm(history_ids[0])
+    assert not cache.is_warm(history_ids[1])
+    assert cache.is_warm(history_ids[2])
+    assert cache.stats.evicted_histories == 1
+
+
+def test_serves_complete_turns():
+    # Setup
+    cache = HotTailCache(max_items_per_history=3, max_bytes_per_history=1024 * 1024, max_histories=2)
+    test_user_prompt, older_user_prompt = create_user_prompts(2)
+    thinking_step = ThinkingStep(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        thoughts="thoughts",
+        turn_id=test_user_prompt.id,
+    )
+    model_response = ModelResponse(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        response="response",
+        turn_id=test_user_prompt.id,
+    )
+
+    # Execute
+    cache.warm(HISTORY_ID, [older_user_prompt, test_user_prompt, thinking_step])
+    cache.append(model_response)
+
+    # Assert - the last turn is fully cached, the one before is not anymore
+    assert cache.get_last_n_turns(HISTORY_ID, 1, CONTEXT_HISTORY_ITEM_KINDS) == [test_user_prompt, model_response]
+    assert cache.get_last_n_turns(HISTORY_ID, 2, CONTEXT_HISTORY_ITEM_KINDS) is None
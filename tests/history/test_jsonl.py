@@ -0,0 +1,91 @@
+from pathlib import Path
+from time import time_ns
+from uuid import uuid4
+
+import pytest
+
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.jsonl import export_history_jsonl, import_history_jsonl
+from src.history.models import (
+    ConversationSummary,
+    HistoryItem,
+    ModelResponse,
+    ThinkingStep,
+    ToolCall,
+    ToolResult,
+    UserPrompt,
+)
+from src.history.service import HistoryService
+
+HISTORY_ID = uuid4()
+
+
+def create_history_items() -> list[HistoryItem]:
+    created_at = time_ns()
+    turn_id = uuid4()
+    return [
+        UserPrompt(id=turn_id, history_id=HISTORY_ID, created_at=created_at, prompt="prompt", turn_id=turn_id),
+        ThinkingStep(
+            id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, thoughts="thoughts", turn_id=turn_id
+        ),
+        ToolCall(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 2,
+            tool_call_id="call_1",
+            tool_name="tool",
+            args={"query": "äöü"},
+            turn_id=turn_id,
+        ),
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 3,
+            tool_call_id="call_1",
+            tool_name="tool",
+            is_retry=False,
+            result=["result", 1],
+            turn_id=turn_id,
+        ),
+        ModelResponse(
+            id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 4, response="response", turn_id=turn_id
+        ),
+        ConversationSummary(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 5,
+            summary="summary",
+            covers_until=created_at,
+        ),
+    ]
+
+
+@pytest.mark.parametrize("file_name", ["history.jsonl", "history.jsonl.gz"])
+async def test_export_and_import_roundtrip(tmp_path: Path, file_name: str):
+    # Setup
+    source_engine = get_engine(tmp_path / "source.db")
+    target_engine = get_engine(tmp_path / "target.db")
+    await create_db_and_tables(source_engine, migrations=HISTORY_MIGRATIONS)
+    await create_db_and_tables(target_engine, migrations=HISTORY_MIGRATIONS)
+    source_repo = AsyncSqlalchemyHistoryRepo(source_engine)
+    target_repo = AsyncSqlalchemyHistoryRepo(target_engine)
+    history_items = create_history_items()
+    await source_repo.create_history_if_not_exists(HISTORY_ID)
+    await source_repo.add_history_items(history_items)
+    path = tmp_path / file_name
+
+    try:
+        # Execute
+        n_exported = await export_history_jsonl(HistoryService(source_repo), HISTORY_ID, path, batch_size=4)
+        n_imported = await import_history_jsonl(target_repo, path, batch_size=4)
+        # Importing again skips the existing items
+        n_reimported = await import_history_jsonl(target_repo, path, batch_size=4)
+
+        # Assert
+        assert n_exported == n_imported == n_reimported == len(history_items)
+        assert await target_repo.get_items_page(HISTORY_ID) == history_items
+    finally:
+        await source_engine.dispose()
+        await target_engine.dispose()
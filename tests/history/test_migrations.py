@@ -0,0 +1,166 @@
+import json
+from dataclasses import replace
+from pathlib import Path
+from time import time_ns
+from uuid import uuid4
+
+from sqlalchemy import text
+
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.models import ToolCall, ToolResult
+
+HISTORY_ID = uuid4()
+
+
+async def test_upgrades_database_without_turn_ids(tmp_path: Path):
+    # Setup - the schema from before turns were tracked
+    engine = get_engine(tmp_path / "database.db")
+    created_at = time_ns()
+    prompt_id, response_id = uuid4(), uuid4()
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE history (id CHAR(32) PRIMARY KEY, created_at BIGINT NOT NULL)"))
+        await conn.execute(
+            text(
+                "CREATE TABLE history_items (id CHAR(32) PRIMARY KEY, history_id CHAR(32) NOT NULL "
+                "REFERENCES history (id), created_at BIGINT NOT NULL, kind VARCHAR NOT NULL, content JSON NOT NULL)"
+            )
+        )
+        await conn.execute(
+            text("INSERT INTO history VALUES (:id, :created_at)"), [{"id": HISTORY_ID.hex, "created_at": created_at}]
+        )
+        await conn.execute(
+            text("INSERT INTO history_items VALUES (:id, :history_id, :created_at, :kind, :content)"),
+            [
+                {
+                    "id": prompt_id.hex,
+                    "history_id": HISTORY_ID.hex,
+                    "created_at": created_at,
+                    "kind": "user_prompt",
+                    "content": '{"prompt": "test prompt"}',
+                },
+                {
+                    "id": response_id.hex,
+                    "history_id": HISTORY_ID.hex,
+                    "created_at": created_at + 1,
+                    "kind": "model_response",
+                    "content": '{"response": "test response"}',
+                },
+            ],
+        )
+
+    try:
+        # Execute
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        # Running again is a no-op
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+
+        # Assert - existing items are assigned to the turn of the latest UserPrompt before them
+        async with engine.connect() as conn:
+            schema_version = (await conn.execute(text("PRAGMA user_version"))).scalar_one()
+        assert schema_version == len(HISTORY_MIGRATIONS)
+        history_repo = AsyncSqlalchemyHistoryRepo(engine)
+        items = await history_repo.get_last_n_turns(HISTORY_ID, 1)
+        assert [item.id for item in items] == [prompt_id, response_id]
+        assert all(item.turn_id == prompt_id for item in items)
+        # ... and existing items are added to the full-text index
+        hits = await history_repo.search_items(HISTORY_ID, "response")
+        assert [hit.item.id for hit in hits] == [response_id]
+    finally:
+        await engine.dispose()
+
+
+async def test_backfills_typed_tool_columns(tmp_path: Path):
+    # Setup - tool items written before the typed columns existed, one of them stored as a blob
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_repo = AsyncSqlalchemyHistoryRepo(engine, blob_threshold_bytes=100)
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    tool_call = ToolCall(
+        id=uuid4(), history_id=HISTORY_ID, created_at=created_at, tool_call_id="call_1", tool_name="read", args={}
+    )
+    orphan_tool_call = replace(tool_call, id=uuid4(), created_at=created_at + 1, tool_call_id="call_2")
+    tool_result = ToolResult(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=created_at + 2,
+        tool_call_id="call_1",
+        tool_name="read",
+        is_retry=False,
+        result={"lines": ["äöü", 1]},
+    )
+    # Without a ToolCall, i.e., not part of the tool stats
+    large_tool_result = replace(
+        tool_result, id=uuid4(), created_at=created_at + 3, tool_call_id="call_3", result={"lines": ["äöü"] * 50}
+    )
+    await history_repo.add_history_items([tool_call, orphan_tool_call, tool_result, large_tool_result])
+    async with engine.begin() as conn:
+        written_lengths = (
+            await conn.execute(text("SELECT content_length FROM history_items ORDER BY created_at"))
+        ).all()
+        await conn.execute(
+            text("UPDATE history_items SET tool_call_id = NULL, tool_name = NULL, content_length = NULL")
+        )
+        # Before `_add_typed_columns`, the 4th migration
+        await conn.execute(text("PRAGMA user_version = 3"))
+
+    try:
+        # Execute
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+
+        # Assert - the backfill matches what the mapper writes (for blobs as well), pairing works in SQL
+        async with engine.connect() as conn:
+            lengths = (await conn.execute(text("SELECT content_length FROM history_items ORDER BY created_at"))).all()
+        assert lengths == written_lengths
+        assert await history_repo.get_orphan_tool_calls(HISTORY_ID) == [orphan_tool_call]
+        [tool_stats] = await history_repo.get_tool_stats(HISTORY_ID)
+        assert (tool_stats.tool_name, tool_stats.n_calls, tool_stats.n_results, tool_stats.n_orphan_calls) == (
+            "read",
+            2,
+            1,
+            1,
+        )
+        assert tool_stats.mean_result_length == len(json.dumps(tool_result.result, separators=(",", ":")))
+    finally:
+        await engine.dispose()
+
+
+async def test_counts_existing_blob_references(tmp_path: Path):
+    # Setup - blobs written before their references were counted, one shared by two results
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_repo = AsyncSqlalchemyHistoryRepo(engine, blob_threshold_bytes=100)
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    tool_results = [
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + i,
+            tool_call_id=f"call_{i}",
+            tool_name="read",
+            is_retry=False,
+            result=result,
+        )
+        for i, result in enumerate(["ERR-4711 " * 100, "ERR-4711 " * 100, "ERR-4712 " * 100])
+    ]
+    await history_repo.add_history_items(tool_results)
+    async with engine.begin() as conn:
+        await conn.execute(text("UPDATE history_blobs SET ref_count = 0"))
+        # Before `_count_blob_references`, the 6th migration
+        await conn.execute(text("PRAGMA user_version = 5"))
+
+    try:
+        # Execute
+        await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+        await history_repo.delete_items(HISTORY_ID, created_before=created_at + 1)
+
+        # Assert - the shared blob is kept for the remaining result
+        async with engine.connect() as conn:
+            ref_counts = (await conn.execute(text("SELECT ref_count FROM history_blobs ORDER BY ref_count"))).all()
+        assert [ref_count for (ref_count,) in ref_counts] == [1, 1]
+        assert await history_repo.get_last_n_items(HISTORY_ID, 3) == tool_results[1:]
+    finally:
+        await engine.dispose()
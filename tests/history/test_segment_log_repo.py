@@ -0,0 +1,200 @@
+from dataclasses import replace
+from pathlib import Path
+from time import time_ns
+from uuid import uuid4
+
+import pytest
+
+from src.config.models import HistoryConfig, RetentionConfig, SegmentLogConfig
+from src.core.exceptions import InvalidConfigurationError
+from src.history.models import HistoryItem, HistoryItemKind, ModelResponse, ToolCall, ToolResult, ToolStats, UserPrompt
+from src.history.port import PrunableHistoryRepo
+from src.history.segment_log.adapter import SegmentLogHistoryRepo
+from src.history.segment_log.log import SEGMENT_SUFFIX
+from tests.history.utils import compare_user_prompt
+
+HISTORY_ID = uuid4()
+
+
+def create_turns(n_turns: int, created_at: int) -> list[HistoryItem]:
+    history_items: list[HistoryItem] = []
+    for i in range(n_turns):
+        turn_id = uuid4()
+        history_items.append(
+            UserPrompt(
+                id=turn_id,
+                history_id=HISTORY_ID,
+                created_at=created_at + 2 * i,
+                prompt=f"prompt {i}",
+                turn_id=turn_id,
+            )
+        )
+        history_items.append(
+            ModelResponse(
+                id=uuid4(),
+                history_id=HISTORY_ID,
+                created_at=created_at + 2 * i + 1,
+                response=f"response {i}",
+                turn_id=turn_id,
+            )
+        )
+    return history_items
+
+
+@pytest.fixture
+def history_repo(tmp_path: Path):
+    history_repo = SegmentLogHistoryRepo(tmp_path, max_segment_bytes=1024, index_every_n_records=4)
+    yield history_repo
+    history_repo.close()
+
+
+async def test_segment_log_repo_ops(history_repo: SegmentLogHistoryRepo, tmp_path: Path):
+    # Setup
+    history = await history_repo.get_or_create_history(HISTORY_ID)
+    assert history.items == []
+    history_items = create_turns(50, time_ns())
+
+    # Execute
+    # Batches are appended in chronological order, existing items are skipped
+    await history_repo.add_history_items(history_items[:50][::-1])
+    await history_repo.add_history_items(history_items[40:], skip_existing=True)
+
+    # Assert
+    # The small segment size forces rotations
+    assert len(list((tmp_path / HISTORY_ID.hex).glob(f"*{SEGMENT_SUFFIX}"))) > 1
+    assert (await history_repo.get_or_create_history(HISTORY_ID)).items == history_items
+    assert await history_repo.get_last_n_items(HISTORY_ID, 3) == history_items[-3:]
+    assert await history_repo.get_last_n_turns(HISTORY_ID, 2) == history_items[-4:]
+    assert await history_repo.get_last_item_of_kind(HISTORY_ID, HistoryItemKind.USER_PROMPT) == history_items[-2]
+    assert await history_repo.get_last_item_of_kind(HISTORY_ID, HistoryItemKind.TOOL_CALL) is None
+    page = await history_repo.get_items_page(
+        HISTORY_ID, after=(history_items[40].created_at, history_items[40].id), limit=5
+    )
+    assert page == history_items[41:46]
+    page = await history_repo.get_items_page(HISTORY_ID, since=history_items[70].created_at, limit=5)
+    assert page == history_items[70:75]
+    window = await history_repo.query_items(
+        HISTORY_ID,
+        kinds=[HistoryItemKind.MODEL_RESPONSE],
+        since=history_items[20].created_at,
+        until=history_items[30].created_at,
+    )
+    assert window == history_items[21:30:2]
+    last_prompts = await history_repo.query_items(
+        HISTORY_ID, kinds=[HistoryItemKind.USER_PROMPT], until=history_items[90].created_at, limit=2, newest_first=True
+    )
+    assert last_prompts == [history_items[88], history_items[86]]
+    hits = await history_repo.search_items(HISTORY_ID, "prompt 42")
+    assert hits[0].item == history_items[84]
+    assert hits[0].snippet == "[prompt] 42"
+
+    # Adding to a missing history fails like the foreign key of the database
+    with pytest.raises(ValueError):
+        await history_repo.add_history_item(replace(history_items[0], history_id=uuid4()))
+
+
+async def test_segment_log_repo_recovers_incomplete_append(tmp_path: Path):
+    # Setup
+    history_repo = SegmentLogHistoryRepo(tmp_path)
+    history_items = create_turns(2, time_ns())
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    await history_repo.add_history_items(history_items)
+    history_repo.close()
+    segment_path = next((tmp_path / HISTORY_ID.hex).glob(f"*{SEGMENT_SUFFIX}"))
+    segment_size = segment_path.stat().st_size
+    # A crash in the middle of an append leaves an incomplete record
+    with open(segment_path, "ab") as file:
+        file.write(b"\x40\x00\x00\x00\x00\x00\x00\x00incomplete")
+
+    # Execute
+    history_repo = SegmentLogHistoryRepo(tmp_path)
+    history = await history_repo.get_or_create_history(HISTORY_ID)
+    await history_repo.add_history_items(create_turns(1, time_ns()))
+    history_repo.close()
+
+    # Assert
+    assert segment_path.stat().st_size > segment_size
+    assert len(history.items) == len(history_items)
+    assert isinstance(history.items[0], UserPrompt) and isinstance(history_items[0], UserPrompt)
+    compare_user_prompt(history.items[0], history_items[0])
+    history_repo = SegmentLogHistoryRepo(tmp_path)
+    assert len(await history_repo.get_last_n_items(HISTORY_ID, 10)) == len(history_items) + 2
+    history_repo.close()
+
+
+async def test_segment_log_repo_reads_only_complete_appends(history_repo: SegmentLogHistoryRepo, tmp_path: Path):
+    # Setup
+    history_items = create_turns(2, time_ns())
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    await history_repo.add_history_items(history_items)
+    segment_path = sorted((tmp_path / HISTORY_ID.hex).glob(f"*{SEGMENT_SUFFIX}"))[-1]
+
+    # Execute - an append in another thread has written the first bytes of its records
+    with open(segment_path, "ab") as file:
+        file.write(b"\x40\x00\x00\x00\x00\x00\x00\x00half a rec")
+    last_items = await history_repo.get_last_n_items(HISTORY_ID, 10)
+    all_items = (await history_repo.get_or_create_history(HISTORY_ID)).items
+
+    # Assert
+    assert last_items == history_items
+    assert all_items == history_items
+
+
+def test_segment_log_does_not_support_retention(history_repo: SegmentLogHistoryRepo, tmp_path: Path):
+    # Setup
+    segment_log_config = SegmentLogConfig(path=tmp_path, max_segment_bytes=1024, fsync=False)
+    retention_config = RetentionConfig(rules=(), max_items_per_history=10, batch_size=10)
+
+    # Execute & Assert - the log is append-only, i.e., the combination is refused with the config
+    assert not isinstance(history_repo, PrunableHistoryRepo)
+    with pytest.raises(InvalidConfigurationError):
+        HistoryConfig(
+            group_commit_window_s=None,
+            hot_tail_cache=None,
+            segment_log=segment_log_config,
+            blob_storage=None,
+            retention=retention_config,
+        )
+
+
+async def test_segment_log_repo_tool_stats(history_repo: SegmentLogHistoryRepo):
+    # Setup - a call with a retried result and an orphan call
+    created_at = time_ns()
+    tool_calls = [
+        ToolCall(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + i,
+            tool_call_id=f"call_{i}",
+            tool_name="read_logs",
+            args={"path": "äöü"},
+        )
+        for i in range(2)
+    ]
+    tool_results = [
+        ToolResult(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=created_at + 2 + i,
+            tool_call_id="call_0",
+            tool_name="read_logs",
+            is_retry=i == 0,
+            result=result,
+        )
+        for i, result in enumerate(["ERR-4711", {"lines": ["äöü"]}])
+    ]
+    await history_repo.create_history_if_not_exists(HISTORY_ID)
+    await history_repo.add_history_items([*tool_calls, *tool_results])
+
+    # Execute
+    all_tool_stats = await history_repo.get_tool_stats(HISTORY_ID)
+    orphan_tool_calls = await history_repo.get_orphan_tool_calls(HISTORY_ID)
+
+    # Assert - the lengths as in the database, see `get_payload_length`
+    mean_result_length = (len("ERR-4711") + len('{"lines":["\\u00e4\\u00f6\\u00fc"]}')) / 2
+    assert all_tool_stats == [
+        ToolStats(
+            tool_name="read_logs", n_calls=2, n_results=2, n_orphan_calls=1, mean_result_length=mean_result_length
+        )
+    ]
+    assert orphan_tool_calls == [tool_calls[1]]
@@ -1,9 +1,11 @@
+from dataclasses import replace
 from time import time_ns
 from uuid import uuid4
 
 import pytest
 
-from src.history.models import History, UserPrompt
+from src.history.hot_tail_cache import HotTailCache
+from src.history.models import ConversationSummary, History, ToolCall, UserPrompt
 from src.history.port import HistoryRepo
 from src.history.service import HistoryService
 from tests.conftest import as_mock
@@ -60,3 +62,139 @@ async def test_add_history_item(
 
     # Assert
     as_mock(mock_history_repo.add_history_item).assert_called_once_with(test_user_prompt)
+
+
+async def test_get_last_n_history_items(
+    history_service: HistoryService,
+    mock_history_repo: HistoryRepo,
+):
+    # Setup
+    test_user_prompt = UserPrompt(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=time_ns(),
+        prompt="test prompt",
+    )
+    as_mock(mock_history_repo.get_last_n_items).return_value = [test_user_prompt]
+
+    # Execute
+    history_items = await history_service.get_last_n_history_items(HISTORY_ID, 5)
+
+    # Assert - the tail is read directly, the history is never loaded (or created) on the read path
+    as_mock(mock_history_repo.get_last_n_items).assert_called_once_with(HISTORY_ID, 5)
+    as_mock(mock_history_repo.get_or_create_history).assert_not_called()
+    assert list(history_items) == [test_user_prompt]
+
+
+async def test_add_history_item_with_group_commit(mock_history_repo: HistoryRepo):
+    # Setup
+    history_service = HistoryService(history_repo=mock_history_repo, group_commit_window_s=60)
+    test_user_prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt=f"test prompt {i}") for i in range(2)
+    ]
+
+    # Execute
+    for test_user_prompt in test_user_prompts:
+        await history_service.add_history_item(test_user_prompt)
+    await history_service.flush_history_items(final=True)
+
+    # Assert - written in one batch instead of item by item
+    as_mock(mock_history_repo.add_history_item).assert_not_called()
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with(test_user_prompts)
+
+
+async def test_get_last_n_history_items_with_hot_tail_cache(mock_history_repo: HistoryRepo):
+    # Setup
+    hot_tail_cache = HotTailCache(max_items_per_history=100, max_bytes_per_history=1024 * 1024, max_histories=2)
+    history_service = HistoryService(history_repo=mock_history_repo, hot_tail_cache=hot_tail_cache)
+    test_user_prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt=f"test prompt {i}") for i in range(3)
+    ]
+    as_mock(mock_history_repo.get_last_n_items).return_value = test_user_prompts[:2]
+
+    # Execute - the first read warms the cache with a single tail query
+    history_items = await history_service.get_last_n_history_items(HISTORY_ID, 5)
+    await history_service.add_history_item(test_user_prompts[2])
+    history_items_after_write = await history_service.get_last_n_history_items(HISTORY_ID, 5)
+
+    # Assert - steady-state reads are served from memory, including the written item
+    as_mock(mock_history_repo.get_last_n_items).assert_called_once_with(HISTORY_ID, 100)
+    assert list(history_items) == test_user_prompts[:2]
+    assert list(history_items_after_write) == test_user_prompts
+    assert hot_tail_cache.stats.hits == 1
+    assert hot_tail_cache.stats.misses == 1
+
+
+async def test_iter_history_items(
+    history_service: HistoryService,
+    mock_history_repo: HistoryRepo,
+):
+    # Setup
+    test_user_prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt=f"test prompt {i}") for i in range(3)
+    ]
+    as_mock(mock_history_repo.get_items_page).side_effect = [test_user_prompts[:2], test_user_prompts[2:]]
+
+    # Execute
+    batches = [batch async for batch in history_service.iter_history_items(HISTORY_ID, batch_size=2)]
+
+    # Assert - the next page starts after the last key of the previous one, a short page ends the walk
+    assert batches == [test_user_prompts[:2], test_user_prompts[2:]]
+    last_key = (test_user_prompts[1].created_at, test_user_prompts[1].id)
+    as_mock(mock_history_repo.get_items_page).assert_called_with(HISTORY_ID, after=last_key, since=None, limit=2)
+
+
+async def test_get_unsummarized_turns(
+    history_service: HistoryService,
+    mock_history_repo: HistoryRepo,
+):
+    # Setup - the summary covers the first of two turns
+    created_at = time_ns()
+    user_prompts = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i, prompt=f"prompt {i}") for i in range(2)
+    ]
+    summary = ConversationSummary(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=created_at + 2,
+        summary="test summary",
+        covers_until=user_prompts[0].created_at,
+    )
+    as_mock(mock_history_repo.get_last_item_of_kind).return_value = summary
+    as_mock(mock_history_repo.get_last_n_turns).return_value = user_prompts
+
+    # Execute
+    first_summary, first_items = await history_service.get_unsummarized_turns(HISTORY_ID, max_n_turns=3)
+    new_summary = replace(summary, id=uuid4(), covers_until=user_prompts[1].created_at)
+    await history_service.add_history_item(new_summary)
+    second_summary, second_items = await history_service.get_unsummarized_turns(HISTORY_ID, max_n_turns=3)
+
+    # Assert - the latest summary is read once and then kept up to date by the writes
+    assert first_summary == summary
+    assert first_items == [user_prompts[1]]
+    assert second_summary == new_summary
+    assert second_items == []
+    as_mock(mock_history_repo.get_last_item_of_kind).assert_called_once()
+
+
+async def test_discarded_tool_calls_are_dropped_from_the_hot_tail_cache(mock_history_repo: HistoryRepo):
+    # Setup - a warm cache and a run that ends with a ToolCall without ToolResult
+    hot_tail_cache = HotTailCache(max_items_per_history=100, max_bytes_per_history=1024 * 1024, max_histories=2)
+    history_service = HistoryService(
+        history_repo=mock_history_repo, hot_tail_cache=hot_tail_cache, group_commit_window_s=60
+    )
+    test_user_prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="test prompt")
+    test_tool_call = ToolCall(
+        id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), tool_call_id="call-1", tool_name="tool", args=None
+    )
+    as_mock(mock_history_repo.get_last_n_items).return_value = []
+    await history_service.get_last_n_history_items(HISTORY_ID, 5)
+
+    # Execute
+    await history_service.add_history_items([test_user_prompt, test_tool_call])
+    await history_service.flush_history_items(final=True)
+    history_items = await history_service.get_last_n_history_items(HISTORY_ID, 5)
+
+    # Assert - the cache agrees with what was written
+    as_mock(mock_history_repo.add_history_items).assert_called_once_with([test_user_prompt])
+    assert list(history_items) == [test_user_prompt]
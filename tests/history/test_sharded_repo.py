@@ -0,0 +1,216 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+from uuid import uuid4
+
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.sharded import ShardedAsyncSqlalchemyHistoryRepo, get_shard_name
+from src.history.models import (
+    HistoryItem,
+    HistoryItemKey,
+    HistoryItemKind,
+    ModelResponse,
+    ThinkingStep,
+    ToolCall,
+    ToolResult,
+    ToolStats,
+    UserPrompt,
+)
+
+HISTORY_ID = uuid4()
+
+
+def to_ns(year: int, month: int, day: int, hour: int = 0) -> int:
+    return int(datetime(year, month, day, hour, tzinfo=timezone.utc).timestamp()) * 1_000_000_000
+
+
+def get_key(history_item: HistoryItem) -> HistoryItemKey:
+    return (history_item.created_at, history_item.id)
+
+
+def create_turn(created_at: int, response_created_at: int | None = None) -> list[HistoryItem]:
+    turn_id = uuid4()
+    response_created_at = response_created_at or created_at + 2
+    return [
+        UserPrompt(id=turn_id, history_id=HISTORY_ID, created_at=created_at, prompt="prompt", turn_id=turn_id),
+        ThinkingStep(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, thoughts="hmm", turn_id=turn_id),
+        ModelResponse(
+            id=uuid4(), history_id=HISTORY_ID, created_at=response_created_at, response="ERR-4711", turn_id=turn_id
+        ),
+    ]
+
+
+async def test_sharded_repo_routes_by_month(tmp_path: Path):
+    # Setup - three months, the last turn of January is answered in February
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path)
+    turns = [
+        create_turn(to_ns(2025, 1, 10)),
+        create_turn(to_ns(2025, 1, 31, 23), response_created_at=to_ns(2025, 2, 1, 1)),
+        create_turn(to_ns(2025, 2, 10)),
+        create_turn(to_ns(2025, 3, 10)),
+    ]
+    history_items = sorted((item for turn in turns for item in turn), key=lambda item: item.created_at)
+
+    try:
+        # Execute
+        await history_repo.add_history_items(history_items)
+
+        # Assert
+        assert history_repo.shard_names == ["2025-01", "2025-02", "2025-03"]
+        assert {path.name for path in tmp_path.glob("*.db")} == {
+            f"history-{name}.db" for name in ["2025-01", "2025-02", "2025-03"]
+        }
+        assert (await history_repo.get_or_create_history(HISTORY_ID)).items == history_items
+        assert await history_repo.get_last_n_items(HISTORY_ID, 4) == history_items[-4:]
+        assert await history_repo.get_last_n_items(HISTORY_ID, 100) == history_items
+        # The turn crossing the month boundary is complete
+        context_kinds = [HistoryItemKind.USER_PROMPT, HistoryItemKind.MODEL_RESPONSE]
+        last_turns = await history_repo.get_last_n_turns(HISTORY_ID, 3, kinds=context_kinds)
+        assert last_turns == [item for turn in turns[1:] for item in turn if not isinstance(item, ThinkingStep)]
+        assert await history_repo.get_last_item_of_kind(HISTORY_ID, HistoryItemKind.THINKING_STEP) == turns[3][1]
+        # Pages continue in the next shards
+        page = await history_repo.get_items_page(HISTORY_ID, after=get_key(history_items[4]), limit=4)
+        assert page == history_items[5:9]
+        page = await history_repo.get_items_page(HISTORY_ID, since=to_ns(2025, 2, 1), limit=100)
+        assert page == [item for item in history_items if get_shard_name(item.created_at) >= "2025-02"]
+        # Time ranges only open the shards they overlap
+        responses = await history_repo.query_items(
+            HISTORY_ID, kinds=[HistoryItemKind.MODEL_RESPONSE], since=to_ns(2025, 1, 20), until=to_ns(2025, 3, 1)
+        )
+        assert responses == [turns[1][2], turns[2][2]]
+        last_prompts = await history_repo.query_items(
+            HISTORY_ID, kinds=[HistoryItemKind.USER_PROMPT], limit=2, newest_first=True
+        )
+        assert last_prompts == [turns[3][0], turns[2][0]]
+        hits = await history_repo.search_items(HISTORY_ID, "ERR-4711", limit=3)
+        assert len(hits) == 3
+        assert await history_repo.get_nth_last_item_key(HISTORY_ID, 7) == get_key(history_items[-7])
+
+        # Deleting walks the shards oldest first
+        deleted_keys = await history_repo.delete_items(HISTORY_ID, created_before=to_ns(2025, 2, 15), limit=5)
+        assert deleted_keys == [get_key(item) for item in history_items[:5]]
+        assert await history_repo.get_items_page(HISTORY_ID) == history_items[5:]
+    finally:
+        await history_repo.close()
+
+
+async def test_sharded_repo_opens_past_shards_read_only(tmp_path: Path):
+    # Setup - shards written in an earlier session
+    turns = [create_turn(to_ns(2025, month, 10)) for month in [1, 2, 3]]
+    history_items = [item for turn in turns for item in turn]
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path)
+    try:
+        await history_repo.add_history_items(history_items)
+    finally:
+        await history_repo.close()
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path, search_max_shards=2)
+
+    try:
+        # Execute
+        items = await history_repo.get_items_page(HISTORY_ID)
+        hits = await history_repo.search_items(HISTORY_ID, "ERR-4711")
+        writer_engines_after_reads = history_repo.writer_engines
+        await history_repo.delete_items(HISTORY_ID, created_before=to_ns(2025, 2, 1))
+
+        # Assert - reads open no writer, a write opens one for its shard only
+        assert items == history_items
+        assert writer_engines_after_reads == []
+        assert {hit.item.id for hit in hits} == {turns[1][2].id, turns[2][2].id}
+        assert len(history_repo.writer_engines) == 1
+        assert await history_repo.get_items_page(HISTORY_ID) == history_items[3:]
+    finally:
+        await history_repo.close()
+
+
+async def test_sharded_repo_pairs_tool_calls_across_shards(tmp_path: Path):
+    # Setup - a call at the end of January answered in February, and an orphan call of an interrupted run
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path)
+    turn_id = uuid4()
+    prompt = UserPrompt(
+        id=turn_id, history_id=HISTORY_ID, created_at=to_ns(2025, 1, 31, 23), prompt="prompt", turn_id=turn_id
+    )
+    tool_calls = [
+        ToolCall(
+            id=uuid4(),
+            history_id=HISTORY_ID,
+            created_at=prompt.created_at + i + 1,
+            tool_call_id=f"call_{i}",
+            tool_name="read_logs",
+            args={},
+            turn_id=turn_id,
+        )
+        for i in range(2)
+    ]
+    tool_result = ToolResult(
+        id=uuid4(),
+        history_id=HISTORY_ID,
+        created_at=to_ns(2025, 2, 1, 1),
+        tool_call_id="call_0",
+        tool_name="read_logs",
+        is_retry=False,
+        result="ERR-4711",
+        turn_id=turn_id,
+    )
+
+    try:
+        # Execute
+        await history_repo.add_history_items([prompt, *tool_calls, tool_result])
+        all_tool_stats = await history_repo.get_tool_stats(HISTORY_ID)
+        orphan_tool_calls = await history_repo.get_orphan_tool_calls(HISTORY_ID)
+
+        # Assert
+        assert all_tool_stats == [
+            ToolStats(tool_name="read_logs", n_calls=2, n_results=1, n_orphan_calls=1, mean_result_length=8)
+        ]
+        assert orphan_tool_calls == [tool_calls[1]]
+    finally:
+        await history_repo.close()
+
+
+async def test_sharded_repo_polls_only_the_shards_with_outbox_entries(tmp_path: Path):
+    # Setup - prompts enqueued in an earlier session
+    turns = [create_turn(to_ns(2025, month, 10)) for month in [1, 2, 3]]
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path)
+    try:
+        await history_repo.add_history_items([item for turn in turns for item in turn])
+    finally:
+        await history_repo.close()
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path)
+
+    try:
+        # Execute - drain the outbox, then a new prompt
+        entries = await history_repo.get_outbox_entries()
+        await history_repo.complete_outbox_entries(entries)
+        await history_repo.get_outbox_stats()
+        new_turn = create_turn(to_ns(2025, 3, 11))
+        await history_repo.add_history_items(new_turn)
+        get_shard_stats = AsyncSqlalchemyHistoryRepo.get_outbox_stats
+        with patch.object(AsyncSqlalchemyHistoryRepo, "get_outbox_stats", autospec=True) as shard_stats:
+            shard_stats.side_effect = get_shard_stats
+            new_entries = await history_repo.get_outbox_entries()
+            stats = await history_repo.get_outbox_stats()
+
+        # Assert - the entries of all months are found once, afterwards only the written shard is polled
+        assert [entry.history_item.id for entry in entries] == [turn[0].id for turn in turns]
+        assert [entry.history_item.id for entry in new_entries] == [new_turn[0].id]
+        assert stats.depth == 1
+        assert shard_stats.await_count == 1
+    finally:
+        await history_repo.close()
+
+
+async def test_sharded_repo_disabled_outbox_enqueues_nothing(tmp_path: Path):
+    # Setup
+    history_repo = ShardedAsyncSqlalchemyHistoryRepo(tmp_path)
+    await history_repo.add_history_items(create_turn(to_ns(2025, 1, 10)))
+
+    try:
+        # Execute
+        await history_repo.set_outbox_enabled(False)
+        await history_repo.add_history_items(create_turn(to_ns(2025, 1, 11)) + create_turn(to_ns(2025, 2, 10)))
+
+        # Assert - no new entries, and none are left over
+        assert await history_repo.get_outbox_entries() == []
+        assert (await history_repo.get_outbox_stats()).depth == 0
+    finally:
+        await history_repo.close()
@@ -0,0 +1,143 @@
+import random
+import string
+from uuid import uuid4
+
+import pytest
+
+from src.history.models import HistoryItemKind
+from src.rag.chunking import (
+    THREAD_MIN_CHARS,
+    CharChunker,
+    StructureChunker,
+    chunk_rag_docs,
+    chunk_rag_docs_async,
+    estimate_tokens,
+)
+from src.rag.qdrant.models import QdrantRAGItem
+
+SEEDS = range(40)
+WORDS = ["the", "agent", "called", "tool", "ERR-4711", "résumé", "src/main.py", "v1.2.3", "x", "configuration"]
+
+
+def random_sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(1, 25))
+    return " ".join(words).capitalize() + rng.choice([".", "!", "?", ".)", ""])
+
+
+def random_code_block(rng: random.Random) -> str:
+    lines = [f"    x_{i} = call({i}, {'abc' * rng.randint(0, 5)!r})" for i in range(rng.randint(1, 40))]
+    # Blank lines within a block do not end it
+    if rng.random() < 0.3:
+        lines.insert(rng.randint(0, len(lines)), "")
+    return "\n".join(["```python", *lines, "```"])
+
+
+def random_document(rng: random.Random, with_long_words: bool) -> tuple[str, list[str]]:
+    """Paragraphs of sentences, hard-wrapped or not, code blocks and odd whitespace. Returns the code blocks too."""
+    blocks: list[str] = []
+    code_blocks: list[str] = []
+    for _ in range(rng.randint(1, 30)):
+        kind = rng.random()
+        if kind < 0.2:
+            code_blocks.append(random_code_block(rng))
+            blocks.append(code_blocks[-1])
+        elif kind < 0.25 and with_long_words:
+            blocks.append("".join(rng.choices(string.ascii_letters + "+/=-", k=rng.randint(100, 3000))))
+        else:
+            separator = rng.choice([" ", "\n", "  ", "\t"])
+            blocks.append(separator.join(random_sentence(rng) for _ in range(rng.randint(1, 20))))
+    text = "".join(block + rng.choice(["\n\n", "\n \n\n", "\n\n\n  "]) for block in blocks)
+    return rng.choice(["", " ", "\n"]) + text, code_blocks
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_structure_chunks_cover_the_text_within_the_budget(seed: int):
+    # Setup
+    rng = random.Random(seed)
+    with_long_words = seed % 2 == 0
+    text, code_blocks = random_document(rng, with_long_words)
+    max_tokens = rng.choice([8, 40, 200, 1000])
+    overlap_tokens = rng.randint(0, max_tokens // 4)
+    chunker = StructureChunker(max_tokens, overlap_tokens)
+
+    # Execute
+    spans = chunker.get_spans(text)
+    chunks = chunker.chunk(text)
+
+    # Assert - in order without gaps, from the start to the very end
+    assert chunks == [text[start:end] for start, end in spans]
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert start < next_start <= end < next_end
+        assert estimate_tokens(text[next_start:end]) <= overlap_tokens
+    assert all(estimate_tokens(chunk) <= max_tokens for chunk in chunks)
+    # Chunks end at whitespace, i.e., at a paragraph, sentence, line or word, unless a word is too long
+    if not with_long_words and max_tokens >= 40:
+        assert all(text[end - 1].isspace() for _, end in spans[:-1])
+    # Code blocks that fit are never split
+    for code_block in code_blocks:
+        if estimate_tokens(code_block) <= max_tokens:
+            assert any(code_block in chunk for chunk in chunks)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_char_chunks_keep_the_tail(seed: int):
+    # Setup
+    rng = random.Random(seed)
+    text = "".join(rng.choices(string.printable, k=rng.randint(0, 2000)))
+    max_chars = rng.randint(2, 300)
+    chunker = CharChunker(max_chars, overlap_chars=rng.randint(0, max_chars - 1))
+
+    # Execute
+    chunks = chunker.chunk(text)
+
+    # Assert - the chunks overlap and the last one ends with the text
+    assert all(len(chunk) <= max_chars for chunk in chunks)
+    assert chunks[0] == text[: len(chunks[0])]
+    assert text.endswith(chunks[-1])
+    position = 0
+    for chunk in chunks:
+        start = text.index(chunk, max(position - max_chars, 0))
+        assert start <= position
+        position = start + len(chunk)
+    assert position == len(text)
+
+
+def test_structure_chunks_end_at_paragraphs_then_sentences():
+    # Setup - each paragraph fits, both together do not
+    first = "The agent called the tool. It failed with ERR-4711.\n\n"
+    second = "The second attempt worked. The result was stored. Nothing else happened here."
+    chunker = StructureChunker(max_tokens=estimate_tokens(second) - 1, overlap_tokens=5)
+
+    # Execute
+    chunks = chunker.chunk(first + second)
+
+    # Assert - the long paragraph is split at a sentence, the overlap is the sentence before
+    assert chunks == [
+        first,
+        "The second attempt worked. The result was stored. ",
+        "The result was stored. Nothing else happened here.",
+    ]
+
+
+async def test_large_documents_are_chunked_in_a_thread():
+    # Setup
+    rng = random.Random(0)
+    text = " ".join(random_sentence(rng) for _ in range(THREAD_MIN_CHARS // 50))
+    rag_doc = QdrantRAGItem(
+        history_item_id=uuid4(),
+        history_id=uuid4(),
+        created_at=0,
+        kind=HistoryItemKind.USER_PROMPT,
+        text=text,
+        chunk_index=0,
+    )
+    chunker = StructureChunker(max_tokens=500, overlap_tokens=50)
+
+    # Execute
+    rag_docs = await chunk_rag_docs_async([rag_doc], chunker)
+
+    # Assert
+    assert len(text) >= THREAD_MIN_CHARS
+    assert rag_docs == chunk_rag_docs([rag_doc], chunker)
+    assert [rag_doc.chunk_index for rag_doc in rag_docs] == list(range(len(rag_docs)))
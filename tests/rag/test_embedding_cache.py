@@ -0,0 +1,79 @@
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from openai.types.create_embedding_response import Usage
+
+from src.rag.embedding_cache import FLOAT32_BYTES, EmbeddingCache, EmbeddingCacheClient
+
+DIMENSIONS = 4
+
+
+def embed(text: str) -> list[float]:
+    return [len(text) + i / 4 for i in range(DIMENSIONS)]
+
+
+async def create_embeddings(input: list[str], model: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        data=[SimpleNamespace(embedding=embed(text)) for text in input],
+        usage=Usage(prompt_tokens=len(input), total_tokens=len(input)),
+    )
+
+
+async def test_only_misses_are_embedded_remotely(tmp_path: Path):
+    # Setup
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.side_effect = create_embeddings
+    cache = EmbeddingCache(tmp_path, max_bytes=1024 * 1024)
+    client = EmbeddingCacheClient(openai_client, cache)
+
+    # Execute - a duplicate within the call and a text embedded before
+    await client.embeddings.create(input="a", model="embedder")
+    response = await client.embeddings.create(input=["bb", "a", "bb"], model="embedder")
+
+    # Assert
+    assert [result.embedding for result in response.data] == [embed("bb"), embed("a"), embed("bb")]
+    assert [call.kwargs["input"] for call in openai_client.embeddings.create.await_args_list] == [["a"], ["bb"]]
+    assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+    # The cache is persistent, a different model is a miss
+    cache.close()
+    cache = EmbeddingCache(tmp_path, max_bytes=1024 * 1024)
+    assert cache.get_many("embedder", ["a", "bb"]) == [embed("a"), embed("bb")]
+    assert cache.get_many("other embedder", ["a"]) == [None]
+    cache.close()
+
+
+def test_least_recently_used_embeddings_are_evicted(tmp_path: Path):
+    # Setup - room for 2 embeddings
+    cache = EmbeddingCache(tmp_path, max_bytes=2 * DIMENSIONS * FLOAT32_BYTES)
+    cache.put_many("embedder", ["a", "bb"], [embed("a"), embed("bb")])
+
+    # Execute
+    cache.get_many("embedder", ["a"])
+    cache.put_many("embedder", ["ccc"], [embed("ccc")])
+
+    # Assert - "bb" is evicted and its row reused
+    assert cache.get_many("embedder", ["a", "bb", "ccc"]) == [embed("a"), None, embed("ccc")]
+    assert cache.stats.evictions == 1
+    assert cache.n_bytes == 2 * DIMENSIONS * FLOAT32_BYTES
+    assert (tmp_path / "index.db").exists()
+    with pytest.raises(ValueError):
+        cache.put_many("embedder", ["dddd"], [[0.0]])
+    cache.close()
+
+
+def test_hits_are_written_on_close(tmp_path: Path):
+    # Setup - room for 2 embeddings, "a" is used after "bb"
+    cache = EmbeddingCache(tmp_path, max_bytes=2 * DIMENSIONS * FLOAT32_BYTES)
+    cache.put_many("embedder", ["a", "bb"], [embed("a"), embed("bb")])
+    cache.get_many("embedder", ["a"])
+    cache.close()
+
+    # Execute
+    cache = EmbeddingCache(tmp_path, max_bytes=2 * DIMENSIONS * FLOAT32_BYTES)
+    cache.put_many("embedder", ["ccc"], [embed("ccc")])
+
+    # Assert - the hit outlived the cache, i.e., "bb" is the least recently used
+    assert cache.get_many("embedder", ["a", "bb", "ccc"]) == [embed("a"), None, embed("ccc")]
+    cache.close()
@@ -0,0 +1,133 @@
+import hashlib
+from dataclasses import replace
+from pathlib import Path
+from time import time_ns
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+
+from src.config.models import EmbedderConfig, NumpyIndexConfig
+from src.history.models import HistoryItemKind, ModelResponse, UserPrompt
+from src.rag.numpy_index.service import NumpyRAGService
+from src.rag.numpy_index.store import VectorStore
+from src.rag.port import RAGHistoryItem
+
+HISTORY_ID = uuid4()
+EMBEDDER_CONFIG = EmbedderConfig(
+    base_url="http://embedder",
+    api_key="key",
+    model_name="embedder",
+    chunk_max_chars=100,
+    chunk_overlap_chars=10,
+    structure_chunker=None,
+    max_batch_size=2048,
+    max_batch_chars=600_000,
+)
+
+
+def payload(created_at: int, kind: str = "user_prompt") -> dict[str, object]:
+    return {"created_at": created_at, "kind": kind}
+
+
+def test_store_is_exact_persistent_and_compacted(tmp_path: Path):
+    # Setup
+    store = VectorStore(tmp_path, dimensions=3)
+    store.upsert(
+        ["a", "b", "c"],
+        [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [1.0, 1.0, 0.0]],
+        [payload(1), payload(2, "model_response"), payload(3)],
+    )
+
+    # Execute - an overwrite, a delete by kind, and a reopened store
+    store.upsert(["a"], [[0.0, 0.0, 5.0]], [payload(1)])
+    store.delete(created_before=3, kinds=["model_response"])
+    store.close()
+    store = VectorStore(tmp_path, dimensions=3)
+
+    # Assert - normalized, i.e., the cosine similarity ranks
+    assert store.n_points == 2
+    assert [result["created_at"] for result in store.search([0.0, 1.0, 0.1], top_k=10)] == [3, 1]
+    # The deleted row is reused, compacting keeps the points
+    store.upsert(["d"], [[0.0, 1.0, 0.0]], [payload(4)])
+    store.delete(created_before=2)
+    store.compact()
+    assert [result["created_at"] for result in store.search([0.0, 1.0, 0.0], top_k=2)] == [4, 3]
+    assert store.get_existing_point_ids(["a", "c", "d"]) == {"c", "d"}
+    store.close()
+    with pytest.raises(ValueError):
+        VectorStore(tmp_path, dimensions=3, dtype="float16")
+
+
+def test_compact_moves_the_last_rows_into_the_gaps(tmp_path: Path):
+    # Setup - the first two of four points are deleted
+    store = VectorStore(tmp_path, dimensions=3)
+    vectors = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [1.0, 1.0, 1.0]]
+    store.upsert(["a", "b", "c", "d"], vectors, [payload(created_at) for created_at in range(4)])
+    store.delete(created_before=2)
+
+    # Execute
+    store.compact()
+    store.close()
+    store = VectorStore(tmp_path, dimensions=3)
+
+    # Assert - the moved points keep their vectors, a new point is appended
+    assert store.n_points == 2
+    assert store.search([0.0, 0.0, 1.0], top_k=1) == [payload(2)]
+    assert store.search([1.0, 1.0, 1.0], top_k=1) == [payload(3)]
+    store.upsert(["e"], [[0.0, 1.0, 0.0]], [payload(4)])
+    assert store.n_points == 3
+    assert store.search([0.0, 1.0, 0.0], top_k=1) == [payload(4)]
+    store.close()
+
+
+def embed(text: str) -> list[float]:
+    return [byte / 255 for byte in hashlib.sha256(text.encode()).digest()[:8]]
+
+
+async def create_embeddings(input: str | list[str], model: str) -> SimpleNamespace:
+    texts = [input] if isinstance(input, str) else input
+    return SimpleNamespace(data=[SimpleNamespace(embedding=embed(text)) for text in texts])
+
+
+async def test_service_finds_the_indexed_items(tmp_path: Path):
+    # Setup
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.side_effect = create_embeddings
+    rag_service = await NumpyRAGService.create(
+        config=EMBEDDER_CONFIG,
+        numpy_index_config=NumpyIndexConfig(path=tmp_path, dtype="float16"),
+        openai_client=openai_client,
+        history_id=HISTORY_ID,
+    )
+    created_at = time_ns()
+    prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, prompt="ERR-4711 in the logs")
+    response = ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, response="fixed")
+
+    # Execute
+    await rag_service.add_history_items([prompt, response])
+    await rag_service.add_history_items([prompt])
+    system_prompt = await rag_service.search_for_user_prompt(
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 2, prompt="ERR-4711 in the logs"),
+        top_k=1,
+    )
+    await rag_service.delete_history_items(
+        HISTORY_ID, created_before=created_at + 2, kinds=[HistoryItemKind.USER_PROMPT]
+    )
+    system_prompt_after_delete = await rag_service.search_for_user_prompt(prompt, top_k=1)
+
+    # Assert - the same text is the most similar, deleted points are not found
+    assert "<user_prompt" in system_prompt.prompt and "ERR-4711 in the logs" in system_prompt.prompt
+    assert "<model_response" in system_prompt_after_delete.prompt
+
+    # Execute - a response of 3 chunks, indexed again as a single one, e.g., after the chunking changed
+    long_response = ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 3, response="x " * 135)
+    await rag_service.add_history_items([long_response])
+    n_points = rag_service._store.n_points  # type: ignore
+    short_response: RAGHistoryItem = replace(long_response, response="short")
+    await rag_service.add_history_items([short_response])
+
+    # Assert - its stale chunks are deleted
+    assert rag_service._store.n_points == n_points - 2  # type: ignore
+    rag_service.close()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+from functools import partial
+from pathlib import Path
+from time import time_ns
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+from qdrant_client import AsyncQdrantClient
+
+from src.config.models import EmbedderConfig, HybridSearchConfig, QdrantConfig
+from src.history.models import ModelResponse, UserPrompt
+from src.rag.port import RAGHistoryItem
+from src.rag.qdrant.service import QdrantRAGService, get_point_id
+
+HISTORY_ID = uuid4()
+MS = 1_000_000  # In ns
+EMBEDDER_CONFIG = EmbedderConfig(
+    base_url="http://embedder",
+    api_key="key",
+    model_name="embedder",
+    chunk_max_chars=100,
+    chunk_overlap_chars=10,
+    structure_chunker=None,
+    max_batch_size=2048,
+    max_batch_chars=600_000,
+)
+
+
+def embed(text: str) -> list[float]:
+    return [byte / 255 for byte in hashlib.sha256(text.encode()).digest()[:8]]
+
+
+async def create_embeddings(input: list[str], model: str) -> SimpleNamespace:
+    return SimpleNamespace(data=[SimpleNamespace(embedding=embed(text)) for text in input])
+
+
+async def test_upserts_are_batched_and_idempotent():
+    # Setup - an embedded Qdrant and a fake embedder
+    qdrant_client = AsyncQdrantClient(location=":memory:")
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.side_effect = create_embeddings
+    rag_service = await QdrantRAGService.create(
+        config=EMBEDDER_CONFIG,
+        qdrant_config=QdrantConfig(upsert_batch_size=2, wait_for_upserts=True, hybrid_search=None),
+        qdrant_client=qdrant_client,
+        openai_client=openai_client,
+        history_service=AsyncMock(),
+        history_id=HISTORY_ID,
+    )
+    created_at = time_ns()
+    prompt = "ERR-4711 " * 30
+    history_items: list[RAGHistoryItem] = [
+        UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at, prompt=prompt),
+        ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 1, response="fixed"),
+    ]
+    upsert = AsyncMock(wraps=qdrant_client.upsert)
+    qdrant_client.upsert = upsert
+
+    try:
+        # Execute - indexing the same items twice
+        await rag_service.add_history_items(history_items)
+        await rag_service.add_history_items(history_items)
+
+        # Assert - the prompt's 270 chars are 3 overlapping chunks, the chunks of a call are upserted in batches
+        assert [len(call.kwargs["points"].ids) for call in upsert.await_args_list] == [2, 2, 2, 2]
+        points, _ = await qdrant_client.scroll(f"history-{HISTORY_ID}", limit=100)
+        assert len(points) == 4
+        assert {str(point.id) for point in points} == {
+            str(get_point_id(history_items[0].id, 0)),
+            str(get_point_id(history_items[0].id, 1)),
+            str(get_point_id(history_items[0].id, 2)),
+            str(get_point_id(history_items[1].id, 0)),
+        }
+        chunk_payloads = sorted(
+            (point.payload or {} for point in points if point.payload and point.payload["kind"] == "user_prompt"),
+            key=lambda payload: payload["chunk_index"],
+        )
+        assert [payload["text"] for payload in chunk_payloads] == [prompt[0:100], prompt[90:190], prompt[180:270]]
+
+        # Execute - the prompt indexed again as a single chunk, e.g., after the chunking changed
+        short_prompt = UserPrompt(id=history_items[0].id, history_id=HISTORY_ID, created_at=created_at, prompt="ERR")
+        await rag_service.add_history_items([short_prompt])
+
+        # Assert - its stale chunks are deleted
+        points, _ = await qdrant_client.scroll(f"history-{HISTORY_ID}", limit=100)
+        assert {str(point.id) for point in points} == {
+            str(get_point_id(history_items[0].id, 0)),
+            str(get_point_id(history_items[1].id, 0)),
+        }
+    finally:
+        await qdrant_client.close()
+
+
+async def test_embedded_qdrant_persists_the_points(tmp_path: Path):
+    # Setup - an embedded Qdrant on disk, i.e., without a server
+    qdrant_client = AsyncQdrantClient(path=str(tmp_path))
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.side_effect = create_embeddings
+    create_rag_service = partial(
+        QdrantRAGService.create,
+        config=EMBEDDER_CONFIG,
+        qdrant_config=QdrantConfig(upsert_batch_size=2, wait_for_upserts=True, hybrid_search=None),
+        openai_client=openai_client,
+        history_service=AsyncMock(),
+        history_id=HISTORY_ID,
+    )
+    rag_service = await create_rag_service(qdrant_client=qdrant_client)
+    prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=time_ns(), prompt="ERR-4711")
+
+    # Execute - indexing, and searching after a restart
+    await rag_service.add_history_items([prompt])
+    await qdrant_client.close()
+    qdrant_client = AsyncQdrantClient(path=str(tmp_path))
+    rag_service = await create_rag_service(qdrant_client=qdrant_client)
+    system_prompt = await rag_service.search_for_user_prompt(prompt, top_k=1)
+
+    # Assert
+    assert '<user_prompt when="today">\n\tERR-4711' in system_prompt.prompt
+    await qdrant_client.close()
+
+
+async def test_hybrid_search_finds_exact_tokens(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    # Setup - responses whose (fake) embeddings are unrelated to their texts, 1 ms apart (the embedded Qdrant
+    # compares `created_at` as a float)
+    qdrant_client = AsyncQdrantClient(location=":memory:")
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.side_effect = create_embeddings
+    hybrid_search_config = HybridSearchConfig(tokenizer_path=tmp_path, prefetch_limit=50)
+    create_rag_service = partial(
+        QdrantRAGService.create,
+        config=EMBEDDER_CONFIG,
+        qdrant_client=qdrant_client,
+        openai_client=openai_client,
+        history_service=AsyncMock(),
+    )
+    hybrid_rag_service = await create_rag_service(
+        qdrant_config=QdrantConfig(upsert_batch_size=8, wait_for_upserts=True, hybrid_search=hybrid_search_config),
+        history_id=HISTORY_ID,
+    )
+    created_at = time_ns()
+    history_items: list[RAGHistoryItem] = [
+        ModelResponse(
+            id=uuid4(), history_id=HISTORY_ID, created_at=created_at + i * MS, response=f"Note {i} on the weather"
+        )
+        for i in range(20)
+    ]
+    history_items[13] = ModelResponse(
+        id=uuid4(), history_id=HISTORY_ID, created_at=created_at, response="The deploy failed with ERR-4711."
+    )
+    prompt = UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 20 * MS, prompt="Why 4711 again?")
+
+    try:
+        # Execute
+        await hybrid_rag_service.add_history_items(history_items)
+        system_prompt = await hybrid_rag_service.search_for_user_prompt(prompt, top_k=1)
+        # Upserting points again does not count them again, deleting them takes them out
+        await hybrid_rag_service.add_history_items(history_items[:5])
+        n_docs_after_upsert = json.loads((tmp_path / f"history-{HISTORY_ID}.json").read_text())["n_docs"]
+        await hybrid_rag_service.delete_history_items(HISTORY_ID, created_before=created_at + MS + MS // 2)
+        # A collection created before the hybrid search
+        legacy_history_id = uuid4()
+        await create_rag_service(
+            qdrant_config=QdrantConfig(upsert_batch_size=8, wait_for_upserts=True, hybrid_search=None),
+            history_id=legacy_history_id,
+        )
+        legacy_rag_service = await create_rag_service(
+            qdrant_config=QdrantConfig(upsert_batch_size=8, wait_for_upserts=True, hybrid_search=hybrid_search_config),
+            history_id=legacy_history_id,
+        )
+        await legacy_rag_service.add_history_items(
+            [ModelResponse(id=uuid4(), history_id=legacy_history_id, created_at=created_at, response="ERR-4711")]
+        )
+        legacy_system_prompt = await legacy_rag_service.search_for_user_prompt(prompt, top_k=1)
+
+        # Assert - the compound's part matches, the tokenizer is persisted
+        assert "The deploy failed with ERR-4711." in system_prompt.prompt
+        assert "weather" not in system_prompt.prompt
+        tokenizer_state = json.loads((tmp_path / f"history-{HISTORY_ID}.json").read_text())
+        assert n_docs_after_upsert == 20
+        # The first two responses and the one with the exact token
+        assert tokenizer_state["n_docs"] == 17
+        # The legacy collection is searched dense-only
+        assert "has no sparse vectors" in caplog.text
+        assert "ERR-4711" in legacy_system_prompt.prompt
+    finally:
+        await qdrant_client.close()
@@ -0,0 +1,119 @@
+import hashlib
+from pathlib import Path
+from time import time_ns
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+from qdrant_client import AsyncQdrantClient
+
+from src.config.models import EmbedderConfig, QdrantConfig
+from src.core.database import create_db_and_tables, get_engine
+from src.history.async_sqlalchemy.adapter import AsyncSqlalchemyHistoryRepo
+from src.history.async_sqlalchemy.migrations import HISTORY_MIGRATIONS
+from src.history.models import HistoryItem, ModelResponse, ThinkingStep, UserPrompt
+from src.history.service import HistoryService
+from src.rag.port import RAGHistoryItem
+from src.rag.qdrant.reindexer import load_checkpoint, reindex_history
+from src.rag.qdrant.service import QdrantRAGService
+
+HISTORY_ID = uuid4()
+EMBEDDER_CONFIG = EmbedderConfig(
+    base_url="http://embedder",
+    api_key="key",
+    model_name="embedder",
+    chunk_max_chars=100,
+    chunk_overlap_chars=10,
+    structure_chunker=None,
+    max_batch_size=2,
+    max_batch_chars=600_000,
+)
+
+
+def embed(text: str) -> list[float]:
+    return [byte / 255 for byte in hashlib.sha256(text.encode()).digest()[:8]]
+
+
+async def create_embeddings(input: list[str], model: str) -> SimpleNamespace:
+    return SimpleNamespace(data=[SimpleNamespace(embedding=embed(text)) for text in input])
+
+
+async def test_reindex_resumes_from_the_checkpoint_without_embedding_existing_points(tmp_path: Path):
+    # Setup - 3 pages of a UserPrompt, a ThinkingStep (not indexed) and a ModelResponse each
+    engine = get_engine(tmp_path / "database.db")
+    await create_db_and_tables(engine, migrations=HISTORY_MIGRATIONS)
+    history_service = HistoryService(AsyncSqlalchemyHistoryRepo(engine))
+    await history_service.create_history_if_not_exists(HISTORY_ID)
+    created_at = time_ns()
+    history_items: list[HistoryItem] = []
+    for i in range(3):
+        history_items += [
+            UserPrompt(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 3 * i, prompt=f"prompt {i}"),
+            ThinkingStep(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 3 * i + 1, thoughts="thoughts"),
+            ModelResponse(id=uuid4(), history_id=HISTORY_ID, created_at=created_at + 3 * i + 2, response=f"{i}"),
+        ]
+    await history_service.add_history_items(history_items)
+    qdrant_client = AsyncQdrantClient(location=":memory:")
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.side_effect = create_embeddings
+    rag_service = await QdrantRAGService.create(
+        config=EMBEDDER_CONFIG,
+        qdrant_config=QdrantConfig(upsert_batch_size=64, wait_for_upserts=True, hybrid_search=None),
+        qdrant_client=qdrant_client,
+        openai_client=openai_client,
+        history_service=history_service,
+        history_id=HISTORY_ID,
+    )
+    checkpoint_path = tmp_path / "checkpoint.json"
+    # The first page is indexed, the second one fails after its points were upserted
+    index_history_items = rag_service.index_history_items
+    n_calls = 0
+
+    async def fail_on_second_page(history_items: list[RAGHistoryItem], skip_existing: bool = False) -> int:
+        nonlocal n_calls
+        n_calls += 1
+        n_embedded_chunks = await index_history_items(history_items, skip_existing=skip_existing)
+        if n_calls == 2:
+            raise RuntimeError("connection reset")
+        return n_embedded_chunks
+
+    try:
+        # Execute - an interrupted run, and a resumed one that skips the points of the failed page
+        rag_service.index_history_items = fail_on_second_page
+        with pytest.raises(RuntimeError):
+            await reindex_history(history_service, rag_service, HISTORY_ID, checkpoint_path, page_size=3, concurrency=1)
+        checkpoint = load_checkpoint(checkpoint_path, HISTORY_ID)
+        openai_client.embeddings.create.reset_mock()
+        rag_service.index_history_items = index_history_items
+        progress: list[int] = []
+        stats = await reindex_history(
+            history_service,
+            rag_service,
+            HISTORY_ID,
+            checkpoint_path,
+            page_size=3,
+            concurrency=2,
+            skip_existing=True,
+            on_progress=lambda stats: progress.append(stats.n_items),
+        )
+
+        # Assert - only the last page is embedded, within the batch size of the provider
+        assert checkpoint == (history_items[2].created_at, history_items[2].id)
+        embedded_texts = [call.kwargs["input"] for call in openai_client.embeddings.create.await_args_list]
+        assert embedded_texts == [["prompt 2", "2"]]
+        assert (stats.n_items, stats.n_indexed_items, stats.n_embedded_chunks) == (6, 4, 2)
+        assert progress == [3, 6]
+        assert load_checkpoint(checkpoint_path, HISTORY_ID) == (history_items[-1].created_at, history_items[-1].id)
+        points, _ = await qdrant_client.scroll(f"history-{HISTORY_ID}", limit=100)
+        assert len(points) == 6
+        # A recreated collection is empty, its dimensions are kept
+        await rag_service.recreate_collection()
+        assert (await qdrant_client.count(f"history-{HISTORY_ID}")).count == 0
+        first_prompt = history_items[0]
+        assert isinstance(first_prompt, UserPrompt)
+        await rag_service.add_history_items([first_prompt])
+        assert (await qdrant_client.count(f"history-{HISTORY_ID}")).count == 1
+    finally:
+        await qdrant_client.close()
+        await engine.dispose()